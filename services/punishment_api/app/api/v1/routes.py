@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import time
+import uuid
 from datetime import date
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Sequence
 
-from fastapi import APIRouter, BackgroundTasks, Body, File, Header, HTTPException, Query, UploadFile
-from fastapi.responses import JSONResponse
+import numpy as np
+from fastapi import APIRouter, Body, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 
+from ...core.config import settings
 from ...core.i18n import normalize_lang
 from ...core.tags import (
     TAG_CALC,
@@ -21,15 +26,42 @@ from ...core.tags import (
     TAG_VERDICT_GET,
     TAG_WORKFLOW,
 )
+from ...domain.services.ai_analysis_provider import get_ai_provider
 from ...domain.services.ai_analysis_service import (
     ANALYSIS_TYPE_DISPLAY,
     build_risk_analysis_response,
+    enqueue_analysis,
+    get_scheduler,
     run_analysis,
     start_analysis,
 )
+from ...domain.services.article_catalog import ArticleCatalog, describe_article, get_article_catalog
 from ...domain.services.article_parser import ArticleParser, parse_article
+from ...domain.services.article_sanctions import get_sanction_index
+from ...domain.services.article_search import get_article_search
 from ...domain.services.calculator import calculate_from_json
-from ...domain.services.speech_service import run_speech, start_speech
+from ...domain.services.document_ingest import (
+    ArchiveLimits,
+    IngestError,
+    IngestFailure,
+    IngestLimits,
+    IngestResult,
+    MultipartUploadReceiver,
+    ingest_archive,
+    ingest_spools,
+)
+from ...domain.services.embeddings import embed_text, embed_texts, get_vectorizer
+from ...domain.services.norms_index import find_norms
+from ...domain.services.speech_service import enqueue_speech, run_speech, start_speech
+from ...domain.services.upload_session_service import (
+    assemble_session,
+    is_archive_session,
+    load_open_session,
+    receive_chunk,
+    session_progress,
+    validate_session_files,
+)
+from ...domain.services.vector_index import SearchQuery, get_verdict_index, reload_verdict_index
 from ...infrastructure.loaders.reference_loader import get_reference_service
 from ...infrastructure.mock_data import (
     MOCK_ACQUITTALS,
@@ -43,8 +75,21 @@ from ...infrastructure.mock_data import (
     get_verdict_response,
 )
 from ...infrastructure.storage.ai_analysis_storage import get_analysis_store
+from ...infrastructure.storage.backup import get_backup_job
+from ...infrastructure.storage.blob_store import BlobRefError, get_blob_store
 from ...infrastructure.storage.calculation_storage import get_calculation_store
+from ...infrastructure.storage.codec import codec_stats
+from ...infrastructure.storage.job_queue import get_job_store
+from ...infrastructure.storage.retention import get_retention_job
+from ...infrastructure.storage.stores import get_stores
 from ...infrastructure.storage.speech_storage import get_speech_store
+from ...infrastructure.storage.upload_sessions import (
+    SESSION_COMMITTED,
+    SESSION_COMMITTING,
+    UploadSession,
+    UploadSessionStore,
+    get_upload_session_store,
+)
 from ...schemas.ai_analysis_schemas import (
     AnalyzeMaterialsRequest,
     AnalyzeMaterialsResponse,
@@ -52,6 +97,7 @@ from ...schemas.ai_analysis_schemas import (
     AnalyzeRisksResponse,
     AnalyzeSimilarVerdictsRequest,
     AnalyzeVerdictRequest,
+    AnalysisSchedulerResponse,
     AnalysisStatusResponse,
     CaseAnalysesResponse,
     GenericAnalyzeResponse,
@@ -75,15 +121,27 @@ from ...schemas.case_schemas import (
     VerdictResponse,
 )
 from ...schemas.schemas import (
+    ArticleBulkRequest,
+    ArticleBulkResponse,
+    ArticleCatalogResponse,
     ArticleInfoResponse,
+    ArticleSanctionsQuery,
+    ArticleSanctionsResponse,
+    ArticleSuggestResponse,
+    BackupRunResponse,
     CalculateRequest,
     CalculateResponse,
     ErrorResponse,
     HealthResponse,
     ReferenceReloadResponse,
     ReferenceStatusResponse,
+    RetentionRunResponse,
+    StorageStatusResponse,
+    VectorizeBatchRequest,
+    VectorizeBatchResponse,
     VectorizeRequest,
     VectorizeResponse,
+    VerdictIndexStatusResponse,
     WorkflowResponse,
 )
 from ...schemas.speech_schemas import (
@@ -93,86 +151,117 @@ from ...schemas.speech_schemas import (
     SpeechVersionContentResponse,
     SpeechVersionsResponse,
 )
+from ...schemas.upload_schemas import (
+    UploadChunkResponse,
+    UploadSessionCreateRequest,
+    UploadSessionDeletedResponse,
+    UploadSessionResponse,
+)
 router = APIRouter()
 
 
-_SEVERITY_NAMES = {
-    0: "MINOR",
-    1: "SMALL",
-    2: "MEDIUM",
-    3: "SERIOUS",
-    4: "ESPECIALLY_SERIOUS",
-}
-
-_EXCLUDED_MARKERS = (
-    "(Исключена)",
-    "(Исключен",
-    "(8A:;NG5=0)",
-    "(8A:;NG5=",
-    "Исключена",
-    "Исключен",
-)
+def _validate_erdr(value: str) -> bool:
+    return bool(value and value.isdigit() and len(value) == 15)
 
 
-def _parse_severity(value: str) -> str:
-    try:
-        severity = int(str(value).strip())
-    except ValueError:
-        severity = 0
-    severity = max(0, min(severity, 4))
-    return _SEVERITY_NAMES.get(severity, "MINOR")
-
-
-def _parse_float(value: str) -> float:
-    if value is None:
-        return 0.0
-    text = str(value).strip()
-    if not text:
-        return 0.0
-    clean = "".join(ch for ch in text if ch.isdigit() or ch in ".-")
-    if not clean or clean in {"-", ".", "-.", ".-"}:
-        return 0.0
+def _validate_upload_id(value: str) -> bool:
     try:
-        return float(clean)
+        return str(uuid.UUID(value)) == value
     except ValueError:
-        return 0.0
+        return False
 
 
-def _is_excluded(stat: str) -> bool:
-    if not stat:
-        return False
-    return any(marker in stat for marker in _EXCLUDED_MARKERS)
+def _error(message: str, status_code: int = 400) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "error": message})
 
 
-def _validate_erdr(value: str) -> bool:
-    return bool(value and value.isdigit() and len(value) == 15)
+def _submit_materials_analysis(
+    erdr_number: str,
+    data: Dict[str, Any],
+    mode: str,
+    trusted_blobs: Sequence[str] = (),
+) -> AnalyzeMaterialsResponse | JSONResponse:
+    try:
+        analysis = start_analysis(erdr_number, "materials", input_params=data, trusted_blobs=trusted_blobs)
+    except BlobRefError as exc:
+        return _error(str(exc))
+
+    if mode in ("sync", "both"):
+        run_analysis(analysis.id)
+
+    if mode == "async":
+        enqueue_analysis(analysis.id)
+        return AnalyzeMaterialsResponse(
+            erdr_number=erdr_number,
+            analysis_id=analysis.id,
+            task_id=analysis.task_id or "",
+            status=analysis.status,
+            poll_url=f"/api/analysis/{analysis.id}/status/",
+        )
+
+    updated = get_analysis_store().get_analysis(analysis.id)
+    result = updated.result if updated else {}
+    return AnalyzeMaterialsResponse(
+        erdr_number=erdr_number,
+        analysis_id=analysis.id,
+        task_id=analysis.task_id or "",
+        status="completed",
+        poll_url=f"/api/analysis/{analysis.id}/status/",
+        result=result,
+    )
 
 
-def _vectorize_text(text: str, dim: int = 128) -> list[float]:
-    import hashlib
-    import random
+def _submit_ingested_materials(
+    erdr_number: str,
+    results: list[IngestResult],
+    mode: str,
+) -> AnalyzeMaterialsResponse | JSONResponse:
+    files = [result.report() for result in results]
+    failures = [result for result in results if isinstance(result, IngestFailure)]
+    if failures:
+        return JSONResponse(
+            status_code=failures[0].status_code,
+            content={"success": False, "error": failures[0].error, "files": files},
+        )
+    data = {"erdr_number": erdr_number, "documents": [doc.as_document() for doc in results], "mode": mode}
+    response = _submit_materials_analysis(erdr_number, data, mode, [doc.blob.hash for doc in results])
+    if isinstance(response, AnalyzeMaterialsResponse):
+        response.files = files
+    return response
 
-    seed = int(hashlib.md5(text.encode("utf-8", errors="ignore")).hexdigest()[:8], 16)
-    rng = random.Random(seed)
-    return [round(rng.uniform(-1, 1), 6) for _ in range(dim)]
 
+# Запас на заголовки и границы multipart сверх размера самого архива.
+_MULTIPART_OVERHEAD = 64 * 1024
 
-def _ensure_text_file(file: UploadFile) -> str:
-    filename = (file.filename or "").lower()
-    if file.content_type and not file.content_type.startswith("text/"):
-        if not filename.endswith(".txt"):
-            raise ValueError("Недопустимый формат документа, требуется текст")
+_ARCHIVE_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
 
-    raw = file.file.read()
-    if not raw:
-        return ""
-    try:
-        return raw.decode("utf-8")
-    except UnicodeDecodeError:
-        try:
-            return raw.decode("cp1251")
-        except UnicodeDecodeError as exc:
-            raise ValueError("Недопустимый формат документа, требуется текст") from exc
+_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                }
+            }
+        },
+    }
+}
 
 
 @router.get(
@@ -216,14 +305,54 @@ def reference_status() -> ReferenceStatusResponse:
 def reference_reload() -> ReferenceReloadResponse:
     ref = get_reference_service()
     ref.reload()
+    # Индексы и каталог по справочнику перестраиваются сразу, а не первым запросом.
+    get_article_search()
+    get_article_catalog()
+    get_sanction_index()
     return ReferenceReloadResponse(status="reloaded", count=ref.count, source=ref.source)
 
 
+@router.get(
+    "/storage/status",
+    response_model=StorageStatusResponse,
+    tags=[TAG_SERVICE],
+    summary="Storage status",
+)
+def storage_status() -> StorageStatusResponse:
+    return StorageStatusResponse(
+        compression=codec_stats(),
+        stores={name: store.storage_stats() for name, store in get_stores().items()},
+        retention=get_retention_job().status(),
+        backup=get_backup_job().status(),
+        blobs=get_blob_store().storage_stats(),
+    )
+
+
+@router.post(
+    "/storage/retention/run",
+    response_model=RetentionRunResponse,
+    tags=[TAG_SERVICE],
+    summary="Run retention policies now",
+)
+def storage_retention_run() -> RetentionRunResponse:
+    return RetentionRunResponse(report=get_retention_job().run_once())
+
+
+@router.post(
+    "/storage/backup/run",
+    response_model=BackupRunResponse,
+    tags=[TAG_SERVICE],
+    summary="Run online backup now",
+)
+def storage_backup_run() -> BackupRunResponse:
+    return BackupRunResponse(report=get_backup_job().run_once())
+
+
 @router.post(
     "/api/vectorize/",
     response_model=VectorizeResponse,
     tags=[TAG_VECTOR],
-    summary="Vectorize case report (mock)",
+    summary="Vectorize case report (local hashing TF-IDF embedding)",
     responses={400: {"model": ErrorResponse}},
 )
 def vectorize(payload: VectorizeRequest) -> VectorizeResponse | JSONResponse:
@@ -234,9 +363,37 @@ def vectorize(payload: VectorizeRequest) -> VectorizeResponse | JSONResponse:
     report_text = str(data.get("report_text") or "").strip()
     if not report_text:
         return JSONResponse(status_code=400, content={"success": False, "error": "report_text обязателен"})
-    vector = _vectorize_text(report_text)
-    model = data.get("vector_model") or "mock-embedding-v1"
-    return VectorizeResponse(vector_model=model, vector=vector)
+    vector = embed_text(report_text)
+    return VectorizeResponse(vector_model=get_vectorizer().model, vector=np.round(vector, 6).tolist())
+
+
+@router.post(
+    "/api/vectorize/batch/",
+    response_model=VectorizeBatchResponse,
+    tags=[TAG_VECTOR],
+    summary="Vectorize many case reports in one call",
+    responses={400: {"model": ErrorResponse}, 413: {"model": ErrorResponse}},
+)
+def vectorize_batch(payload: VectorizeBatchRequest) -> VectorizeBatchResponse | JSONResponse:
+    started = time.perf_counter()
+    reports = [str(text or "").strip() for text in payload.reports]
+    if not reports:
+        return _error("reports обязателен")
+    if len(reports) > settings.vectorize_batch_max_items:
+        return _error(f"Слишком много справок: не более {settings.vectorize_batch_max_items}", 413)
+    if sum(len(text.encode("utf-8", errors="surrogatepass")) for text in reports) > settings.vectorize_batch_max_bytes:
+        return _error(f"Суммарный объём справок превышает {settings.vectorize_batch_max_bytes} байт", 413)
+    empty = [index for index, text in enumerate(reports) if not text]
+    if empty:
+        return _error(f"Пустой report_text в позициях: {empty[:20]}")
+    matrix, cached = embed_texts(reports)
+    return VectorizeBatchResponse(
+        vector_model=get_vectorizer().model,
+        dim=matrix.shape[1],
+        vectors=np.round(matrix, 6).tolist(),
+        cached=cached,
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+    )
 
 
 @router.post(
@@ -336,26 +493,135 @@ def article_info(q: str = Query(default="")) -> ArticleInfoResponse | JSONRespon
             content={"success": False, "error": f'Статья "{query}" не найдена'},
         )
 
-    name = article.stat.strip() if article.stat else ArticleParser.to_display_name(
-        parsed.article,
-        parsed.part,
-        parsed.paragraph,
-    )
+    info = describe_article(article, effective_from, effective_to)
+    if not info["name"]:
+        info["name"] = ArticleParser.to_display_name(parsed.article, parsed.part, parsed.paragraph)
+    return ArticleInfoResponse(article=info)
 
-    return ArticleInfoResponse(
-        article={
-            "code": article.article_code,
-            "name": name,
-            "severity": _parse_severity(article.hard),
-            "imprisonment_min": _parse_float(article.fs1r64_01n),
-            "imprisonment_max": _parse_float(article.fs1r64_01x),
-            "is_excluded": _is_excluded(article.stat),
-            "effective_from": effective_from,
-            "effective_to": effective_to,
-        }
+
+def _resolve_article(query: str, catalog: ArticleCatalog) -> Dict[str, Any]:
+    if not query:
+        return {"query": query, "found": False, "error": "Пустой запрос"}
+    parsed = parse_article(query)
+    article = catalog.by_code.get(parsed.code) if parsed and parsed.code else None
+    if article is None:
+        return {"query": query, "found": False, "error": f'Статья "{query}" не найдена'}
+    if not article["name"]:
+        article = {**article, "name": ArticleParser.to_display_name(parsed.article, parsed.part, parsed.paragraph)}
+    return {"query": query, "found": True, "article": article}
+
+
+@router.post(
+    "/api/articles/bulk/",
+    response_model=ArticleBulkResponse,
+    tags=[TAG_CALC],
+    summary="Article info for many queries in one call",
+    responses={400: {"model": ErrorResponse}, 413: {"model": ErrorResponse}},
+)
+def articles_bulk(payload: ArticleBulkRequest) -> ArticleBulkResponse | JSONResponse:
+    if not payload.queries:
+        return _error("queries обязателен")
+    if len(payload.queries) > settings.article_bulk_max_items:
+        return _error(f"Слишком много запросов: не более {settings.article_bulk_max_items}", 413)
+    # Действующие редакции берутся из каталога версии справочника; повторы разбираются один раз.
+    catalog = get_article_catalog()
+    resolved: Dict[str, Dict[str, Any]] = {}
+    items = []
+    for raw in payload.queries:
+        query = str(raw or "").strip()
+        if query not in resolved:
+            resolved[query] = _resolve_article(query, catalog)
+        items.append(resolved[query])
+    return ArticleBulkResponse(count=len(items), found=sum(item["found"] for item in items), items=items)
+
+
+def _accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in {"gzip", "*"}:
+            return params.replace(" ", "") not in {"q=0", "q=0.0", "q=0.00", "q=0.000"}
+    return False
+
+
+@router.get(
+    "/api/articles/catalog/",
+    response_model=ArticleCatalogResponse,
+    tags=[TAG_CALC],
+    summary="All current articles (cacheable, ETag)",
+    responses={304: {"description": "Каталог не изменился (If-None-Match)"}},
+)
+def articles_catalog(
+    accept_encoding: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+) -> Response:
+    catalog = get_article_catalog()
+    compressed = _accepts_gzip(accept_encoding)
+    headers = {
+        "ETag": catalog.gzip_etag if compressed else catalog.etag,
+        "Cache-Control": f"public, max-age={settings.article_catalog_max_age}",
+        "Vary": "Accept-Encoding",
+    }
+    if catalog.matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=catalog.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+
+@router.post(
+    "/api/articles/sanctions/",
+    response_model=ArticleSanctionsResponse,
+    tags=[TAG_CALC],
+    summary="Articles matching sanction predicates (limits, severity, punishment kinds)",
+    responses={400: {"model": ErrorResponse}},
+)
+def articles_sanctions(payload: ArticleSanctionsQuery) -> ArticleSanctionsResponse | JSONResponse:
+    started = time.perf_counter()
+    limit = payload.limit or settings.article_sanctions_limit
+    if limit > settings.article_sanctions_max_limit:
+        return _error(f"limit должен быть в диапазоне 1..{settings.article_sanctions_max_limit}")
+    index = get_sanction_index()
+    try:
+        total, articles = index.query(
+            payload.where,
+            include_excluded=payload.include_excluded,
+            order_by=payload.order_by,
+            descending=payload.descending,
+            offset=payload.offset,
+            limit=limit,
+            max_conditions=settings.article_sanctions_max_conditions,
+        )
+    except ValueError as exc:
+        return _error(str(exc))
+    return ArticleSanctionsResponse(
+        version=index.version,
+        total=total,
+        offset=payload.offset,
+        count=len(articles),
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+        articles=articles,
     )
 
 
+@router.get(
+    "/api/articles/suggest/",
+    response_model=ArticleSuggestResponse,
+    tags=[TAG_CALC],
+    summary="Article typeahead by code prefix or name",
+    responses={400: {"model": ErrorResponse}},
+)
+def article_suggest(q: str = Query(default=""), limit: Optional[int] = Query(default=None)) -> ArticleSuggestResponse | JSONResponse:
+    query = q.strip()
+    if not query:
+        return _error("Параметр q не указан")
+    limit = limit or settings.article_suggest_limit
+    if not 1 <= limit <= settings.article_suggest_max_limit:
+        return _error(f"limit должен быть в диапазоне 1..{settings.article_suggest_max_limit}")
+    items = get_article_search().search(query, limit)
+    return ArticleSuggestResponse(query=query, count=len(items), items=items)
+
+
 # =============================================================================
 # Case / external data (mock)
 # =============================================================================
@@ -401,7 +667,7 @@ def similar_verdicts(
     "/api/case/{case_id}/verdicts/similar/",
     response_model=SimilarVerdictFilesResponse,
     tags=[TAG_SIMILAR],
-    summary="Similar verdicts (vector search mock)",
+    summary="Similar verdicts (vector search)",
     responses={400: {"model": ErrorResponse}},
 )
 def similar_verdicts_vector(
@@ -446,6 +712,24 @@ def similar_verdicts_vector(
 
     min_similarity = req.min_similarity or 0.0
     limit = req.limit or 10
+    index = get_verdict_index()
+    if index is not None and index.size:
+        if req.vector_model and req.vector_model != index.vector_model:
+            return _error(f"vector_model {req.vector_model} не совпадает с моделью индекса {index.vector_model}")
+        query = SearchQuery(
+            limit=limit,
+            min_similarity=min_similarity,
+            decision=req.decision,
+            limit_guilty=req.limit_guilty,
+            limit_acquittal=req.limit_acquittal,
+        )
+        try:
+            found = index.search(req.case_vector, query)
+        except ValueError as exc:
+            return _error(str(exc))
+        return SimilarVerdictFilesResponse(case_id=case_id, count=len(found), verdicts=found)
+
+    # Корпус ещё не построен: демонстрационный список.
     verdicts = [v for v in MOCK_SIMILAR_VERDICT_FILES if v.get("similarity", 0) >= min_similarity]
 
     if req.decision:
@@ -465,6 +749,28 @@ def similar_verdicts_vector(
     )
 
 
+@router.get(
+    "/api/verdicts/index/",
+    response_model=VerdictIndexStatusResponse,
+    tags=[TAG_SIMILAR],
+    summary="Similar-verdict vector index status",
+)
+def verdict_index_status() -> VerdictIndexStatusResponse:
+    index = get_verdict_index()
+    return VerdictIndexStatusResponse(loaded=index is not None, index=index.stats() if index else None)
+
+
+@router.post(
+    "/api/verdicts/index/reload/",
+    response_model=VerdictIndexStatusResponse,
+    tags=[TAG_SIMILAR],
+    summary="Reload similar-verdict vector index from disk",
+)
+def verdict_index_reload() -> VerdictIndexStatusResponse:
+    index = reload_verdict_index()
+    return VerdictIndexStatusResponse(loaded=index is not None, index=index.stats() if index else None)
+
+
 @router.get(
     "/api/case/{case_id}/acquittals/",
     response_model=AcquittalsResponse,
@@ -509,7 +815,7 @@ def norms(
     "/api/case/{erdr}/norms/",
     response_model=NormsResponse,
     tags=[TAG_NORMS],
-    summary="Norms by report (mock)",
+    summary="Norms by report (BM25 over local decree corpus)",
     responses={400: {"model": ErrorResponse}},
 )
 def norms_by_report(erdr: str, payload: dict = Body(default_factory=dict)) -> NormsResponse | JSONResponse:
@@ -525,6 +831,11 @@ def norms_by_report(erdr: str, payload: dict = Body(default_factory=dict)) -> No
     if not req.report_text:
         return JSONResponse(status_code=400, content={"success": False, "error": "report_text обязателен"})
 
+    found = find_norms(" ".join(filter(None, [req.report_text, req.similar_verdicts_summary])))
+    if found is not None:
+        return NormsResponse(case_id=erdr, count=len(found), norms=found)
+
+    # Индекс НПА ещё не построен: демонстрационный список.
     return NormsResponse(
         case_id=erdr,
         count=len(MOCK_NORMS),
@@ -635,64 +946,262 @@ def latest_report(erdr: str) -> ReportLatestResponse | JSONResponse:
     response_model=AnalyzeMaterialsResponse,
     tags=[TAG_MATERIALS],
     summary="Analyze materials (upload text files)",
-    responses={400: {"model": ErrorResponse}},
+    responses={400: {"model": ErrorResponse}, 413: {"model": ErrorResponse}},
+    openapi_extra=_UPLOAD_OPENAPI,
+)
+async def analyze_materials_upload(
+    case_id: str,
+    request: Request,
+    mode: str = Query(default="async"),
+) -> AnalyzeMaterialsResponse | JSONResponse:
+    if not _validate_erdr(case_id):
+        return _error("Неверный формат номера ЕРДР")
+    mode = (mode or "async").lower()
+    if mode not in ("async", "sync", "both"):
+        return _error("Недопустимый режим mode")
+
+    # Тело читается потоком: лимиты проверяются до того, как загрузка придёт целиком.
+    limits = IngestLimits.from_settings()
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limits.max_request_bytes:
+        return _error(f"Размер загрузки превышает {limits.max_request_bytes} байт", 413)
+    try:
+        receiver = MultipartUploadReceiver(request.headers.get("content-type", ""), limits)
+        spools = await receiver.receive(request.stream())
+    except IngestError as exc:
+        return _error(str(exc), exc.status_code)
+    try:
+        if not spools:
+            return _error("Документы не переданы")
+        results = await run_in_threadpool(ingest_spools, spools, get_blob_store())
+    finally:
+        receiver.close()
+    return await run_in_threadpool(_submit_ingested_materials, case_id, results, mode)
+
+
+@router.post(
+    "/api/case/{case_id}/analyze-materials/archive/",
+    response_model=AnalyzeMaterialsResponse,
+    tags=[TAG_MATERIALS],
+    summary="Analyze materials (upload zip/tar archive)",
+    responses={400: {"model": ErrorResponse}, 413: {"model": ErrorResponse}},
+    openapi_extra=_ARCHIVE_OPENAPI,
 )
-def analyze_materials_upload(
+async def analyze_materials_archive(
     case_id: str,
-    files: list[UploadFile] = File(...),
+    request: Request,
     mode: str = Query(default="async"),
-    background_tasks: BackgroundTasks = None,
 ) -> AnalyzeMaterialsResponse | JSONResponse:
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     if not _validate_erdr(case_id):
+        return _error("Неверный формат номера ЕРДР")
+    mode = (mode or "async").lower()
+    if mode not in ("async", "sync", "both"):
+        return _error("Недопустимый режим mode")
+
+    limits = ArchiveLimits.from_settings()
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limits.max_archive_bytes + _MULTIPART_OVERHEAD:
+        return _error(f"Размер архива превышает {limits.max_archive_bytes} байт", 413)
+    receive_limits = IngestLimits(
+        max_files=1,
+        max_file_bytes=limits.max_archive_bytes,
+        max_request_bytes=limits.max_archive_bytes + _MULTIPART_OVERHEAD,
+        spool_threshold_bytes=limits.spool_threshold_bytes,
+    )
+    try:
+        receiver = MultipartUploadReceiver(
+            request.headers.get("content-type", ""),
+            receive_limits,
+            field_name="file",
+            validate=None,
+        )
+        spools = await receiver.receive(request.stream())
+    except IngestError as exc:
+        if exc.code == "too_many_files":
+            return _error("Ожидается один архив")
+        return _error(str(exc), exc.status_code)
+    try:
+        if not spools:
+            return _error("Архив не передан")
+        documents, warnings = await run_in_threadpool(ingest_archive, spools[0], get_blob_store(), limits)
+    except IngestError as exc:
+        return _error(str(exc), exc.status_code)
+    finally:
+        receiver.close()
+    if not documents:
         return JSONResponse(
             status_code=400,
-            content={"success": False, "error": "Неверный формат номера ЕРДР"},
+            content={"success": False, "error": "В архиве нет текстовых документов", "warnings": warnings},
         )
-    if not files:
-        return JSONResponse(status_code=400, content={"success": False, "error": "Документы не переданы"})
-    if len(files) > 100:
-        return JSONResponse(status_code=400, content={"success": False, "error": "Слишком много документов"})
+    response = await run_in_threadpool(_submit_ingested_materials, case_id, documents, mode)
+    if isinstance(response, AnalyzeMaterialsResponse):
+        response.warnings = warnings
+    return response
 
-    documents = []
-    for file in files:
-        try:
-            text = _ensure_text_file(file)
-        except ValueError as exc:
-            return JSONResponse(status_code=400, content={"success": False, "error": str(exc)})
-        documents.append({"name": file.filename or "document.txt", "text": text})
 
-    mode = (mode or "async").lower()
-    if mode not in ("async", "sync", "both"):
-        return JSONResponse(status_code=400, content={"success": False, "error": "Недопустимый режим mode"})
+@router.post(
+    "/api/case/{case_id}/uploads/",
+    response_model=UploadSessionResponse,
+    tags=[TAG_MATERIALS],
+    summary="Create resumable upload session for case materials",
+    responses={400: {"model": ErrorResponse}, 413: {"model": ErrorResponse}},
+)
+def create_upload_session(case_id: str, payload: UploadSessionCreateRequest) -> UploadSessionResponse | JSONResponse:
+    if not _validate_erdr(case_id):
+        return _error("Неверный формат номера ЕРДР")
+    files = [item.model_dump() for item in payload.files]
+    chunk_size = payload.chunk_size or settings.upload_session_chunk_bytes
+    try:
+        validate_session_files(files, chunk_size)
+    except IngestError as exc:
+        return _error(str(exc), exc.status_code)
+    store = get_upload_session_store()
+    session = store.create(case_id, files, chunk_size, settings.upload_session_ttl_seconds)
+    return UploadSessionResponse(**session_progress(store, session))
 
-    data = {"erdr_number": case_id, "documents": documents, "mode": mode}
-    analysis = start_analysis(case_id, "materials", input_params=data)
 
-    if mode in ("sync", "both"):
-        run_analysis(analysis.id)
+@router.put(
+    "/api/uploads/{upload_id}/files/{file_index}/chunks/{chunk_index}",
+    response_model=UploadChunkResponse,
+    tags=[TAG_MATERIALS],
+    summary="Upload one chunk (raw request body)",
+    responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}, 409: {"model": ErrorResponse}, 413: {"model": ErrorResponse}},
+    openapi_extra={"requestBody": {"required": True, "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}}}},
+)
+async def upload_chunk(
+    upload_id: str,
+    file_index: int,
+    chunk_index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(default=None, alias="X-Chunk-SHA256"),
+) -> UploadChunkResponse | JSONResponse:
+    if not _validate_upload_id(upload_id):
+        return _error("Сессия загрузки не найдена", 404)
+    store = get_upload_session_store()
+    session = load_open_session(store, upload_id)
+    if session is None:
+        return _error("Сессия загрузки не найдена", 404)
+    if session.status == SESSION_COMMITTED:
+        return _error("Сессия загрузки уже зафиксирована", 409)
+    if session.status == SESSION_COMMITTING:
+        # Части уже собираются в файлы: подмена части сейчас испортила бы сборку.
+        return _error("Сессия загрузки фиксируется", 409)
+    try:
+        chunk = await receive_chunk(store, session, file_index, chunk_index, request.stream(), x_chunk_sha256)
+    except IngestError as exc:
+        return _error(str(exc), exc.status_code)
+    return UploadChunkResponse(upload_id=upload_id, file_index=file_index, chunk_index=chunk_index, **chunk)
 
-    if mode == "async":
-        background_tasks.add_task(run_analysis, analysis.id)
+
+@router.get(
+    "/api/uploads/{upload_id}/",
+    response_model=UploadSessionResponse,
+    tags=[TAG_MATERIALS],
+    summary="Upload session progress (received chunk ranges)",
+    responses={404: {"model": ErrorResponse}},
+)
+def get_upload_session(upload_id: str) -> UploadSessionResponse | JSONResponse:
+    if not _validate_upload_id(upload_id):
+        return _error("Сессия загрузки не найдена", 404)
+    store = get_upload_session_store()
+    session = load_open_session(store, upload_id)
+    if session is None:
+        return _error("Сессия загрузки не найдена", 404)
+    return UploadSessionResponse(**session_progress(store, session))
+
+
+@router.delete(
+    "/api/uploads/{upload_id}/",
+    response_model=UploadSessionDeletedResponse,
+    tags=[TAG_MATERIALS],
+    summary="Abort upload session",
+    responses={404: {"model": ErrorResponse}},
+)
+def delete_upload_session(upload_id: str) -> UploadSessionDeletedResponse | JSONResponse:
+    if not _validate_upload_id(upload_id) or not get_upload_session_store().delete(upload_id):
+        return _error("Сессия загрузки не найдена", 404)
+    return UploadSessionDeletedResponse(upload_id=upload_id)
+
+
+@router.post(
+    "/api/uploads/{upload_id}/commit/",
+    response_model=AnalyzeMaterialsResponse,
+    tags=[TAG_MATERIALS],
+    summary="Commit upload session and start materials analysis",
+    responses={400: {"model": ErrorResponse}, 404: {"model": ErrorResponse}, 409: {"model": ErrorResponse}},
+)
+def commit_upload_session(upload_id: str, mode: str = Query(default="async")) -> AnalyzeMaterialsResponse | JSONResponse:
+    mode = (mode or "async").lower()
+    if mode not in ("async", "sync", "both"):
+        return _error("Недопустимый режим mode")
+    if not _validate_upload_id(upload_id):
+        return _error("Сессия загрузки не найдена", 404)
+    store = get_upload_session_store()
+    session = load_open_session(store, upload_id)
+    if session is None:
+        return _error("Сессия загрузки не найдена", 404)
+    if session.status == SESSION_COMMITTED and session.analysis_id:
+        # Повторный commit (например, после обрыва ответа) возвращает уже запущенный анализ.
+        record = get_analysis_store().get_analysis(session.analysis_id)
         return AnalyzeMaterialsResponse(
-            erdr_number=case_id,
-            analysis_id=analysis.id,
-            task_id=analysis.task_id or "",
-            status=analysis.status,
-            poll_url=f"/api/analysis/{analysis.id}/status/",
+            erdr_number=session.case_id,
+            analysis_id=session.analysis_id,
+            task_id=(record.task_id if record else None) or "",
+            status=record.status if record else "unknown",
+            poll_url=f"/api/analysis/{session.analysis_id}/status/",
+            result=record.result if record and record.status == "completed" else None,
+        )
+    progress = session_progress(store, session)
+    if not progress["complete"]:
+        missing = {item["index"]: item["missing"] for item in progress["files"] if item["missing"]}
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "error": "Получены не все части", "missing": missing},
         )
+    if not store.begin_commit(upload_id):
+        return _error("Сессия загрузки уже фиксируется", 409)
+    try:
+        return _commit_session(store, session, mode)
+    except Exception:
+        # Непредвиденная ошибка не должна оставлять сессию в committing до истечения TTL.
+        store.reopen(upload_id)
+        raise
+
+
+def _commit_session(store: UploadSessionStore, session: UploadSession, mode: str) -> AnalyzeMaterialsResponse | JSONResponse:
+    upload_id = session.id
+    try:
+        spools = assemble_session(store, session)
+    except IngestError as exc:
+        store.reopen(upload_id)
+        return _error(str(exc), exc.status_code)
+    warnings = None
+    try:
+        if is_archive_session(session):
+            results, warnings = ingest_archive(spools[0], get_blob_store(), ArchiveLimits.from_settings())
+            if not results:
+                store.reopen(upload_id)
+                return JSONResponse(
+                    status_code=400,
+                    content={"success": False, "error": "В архиве нет текстовых документов", "warnings": warnings},
+                )
+        else:
+            results = ingest_spools(spools, get_blob_store())
+    except IngestError as exc:
+        store.reopen(upload_id)
+        return _error(str(exc), exc.status_code)
+    finally:
+        for spool in spools:
+            spool.close()
+    response = _submit_ingested_materials(session.case_id, results, mode)
+    if not isinstance(response, AnalyzeMaterialsResponse):
+        store.reopen(upload_id)
+        return response
+    response.warnings = warnings
+    store.mark_committed(upload_id, response.analysis_id)
+    return response
+
 
-    updated = get_analysis_store().get_analysis(analysis.id)
-    result = updated.result if updated else {}
-    return AnalyzeMaterialsResponse(
-        erdr_number=case_id,
-        analysis_id=analysis.id,
-        task_id=analysis.task_id or "",
-        status="completed",
-        poll_url=f"/api/analysis/{analysis.id}/status/",
-        result=result,
-    )
 @router.post(
     "/api/case/{case_id}/analyze-materials/",
     response_model=AnalyzeMaterialsResponse,
@@ -703,12 +1212,9 @@ def analyze_materials_upload(
 def analyze_materials(
     case_id: str,
     payload: AnalyzeMaterialsRequest = Body(default_factory=AnalyzeMaterialsRequest),
-    background_tasks: BackgroundTasks = None,
     x_user_id: Optional[str] = Header(default=None, alias="X-User-ID"),
 ) -> AnalyzeMaterialsResponse | JSONResponse:
     _ = x_user_id
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     data = payload.model_dump() if hasattr(payload, "model_dump") else payload.dict()
     erdr_number = (data.get("erdr_number") or case_id or "").strip()
     if data.get("erdr_number") and erdr_number != case_id:
@@ -736,31 +1242,7 @@ def analyze_materials(
         return JSONResponse(status_code=400, content={"success": False, "error": "Недопустимый режим mode"})
 
     data["erdr_number"] = erdr_number
-    analysis = start_analysis(erdr_number, "materials", input_params=data)
-
-    if mode in ("sync", "both"):
-        run_analysis(analysis.id)
-
-    if mode == "async":
-        background_tasks.add_task(run_analysis, analysis.id)
-        return AnalyzeMaterialsResponse(
-            erdr_number=erdr_number,
-            analysis_id=analysis.id,
-            task_id=analysis.task_id or "",
-            status=analysis.status,
-            poll_url=f"/api/analysis/{analysis.id}/status/",
-        )
-
-    updated = get_analysis_store().get_analysis(analysis.id)
-    result = updated.result if updated else {}
-    return AnalyzeMaterialsResponse(
-        erdr_number=erdr_number,
-        analysis_id=analysis.id,
-        task_id=analysis.task_id or "",
-        status="completed",
-        poll_url=f"/api/analysis/{analysis.id}/status/",
-        result=result,
-    )
+    return _submit_materials_analysis(erdr_number, data, mode)
 
 
 @router.post(
@@ -773,12 +1255,9 @@ def analyze_materials(
 def analyze_risks(
     case_id: str,
     payload: AnalyzeRisksRequest = Body(default_factory=AnalyzeRisksRequest),
-    background_tasks: BackgroundTasks = None,
     x_user_id: Optional[str] = Header(default=None, alias="X-User-ID"),
 ) -> AnalyzeRisksResponse | JSONResponse:
     _ = x_user_id
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     data = payload.model_dump() if hasattr(payload, "model_dump") else payload.dict()
     erdr_number = (data.get("erdr_number") or case_id or "").strip()
     if data.get("erdr_number") and erdr_number != case_id:
@@ -804,13 +1283,16 @@ def analyze_risks(
         return JSONResponse(status_code=400, content={"success": False, "error": "Недопустимый режим mode"})
 
     data["erdr_number"] = erdr_number
-    analysis = start_analysis(erdr_number, "risk_analysis", input_params=data)
+    try:
+        analysis = start_analysis(erdr_number, "risk_analysis", input_params=data)
+    except BlobRefError as exc:
+        return _error(str(exc))
 
     if mode in ("sync", "both"):
         run_analysis(analysis.id)
 
     if mode == "async":
-        background_tasks.add_task(run_analysis, analysis.id)
+        enqueue_analysis(analysis.id)
         return AnalyzeRisksResponse(
             erdr_number=erdr_number,
             analysis_id=analysis.id,
@@ -840,12 +1322,9 @@ def analyze_risks(
 def analyze_verdicts(
     case_id: str,
     payload: dict = Body(default_factory=dict),
-    background_tasks: BackgroundTasks = None,
     x_user_id: Optional[str] = Header(default=None, alias="X-User-ID"),
 ) -> SimilarVerdictsAnalyzeResponse | JSONResponse:
     _ = x_user_id
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     try:
         req = AnalyzeSimilarVerdictsRequest(**payload)
     except Exception as exc:
@@ -856,7 +1335,10 @@ def analyze_verdicts(
     if mode not in ("async", "sync"):
         return JSONResponse(status_code=400, content={"success": False, "error": "mode должен быть async или sync"})
 
-    analysis = start_analysis(case_id, "similar_verdicts", input_params=data)
+    try:
+        analysis = start_analysis(case_id, "similar_verdicts", input_params=data)
+    except BlobRefError as exc:
+        return _error(str(exc))
 
     if mode == "sync":
         run_analysis(analysis.id)
@@ -873,7 +1355,7 @@ def analyze_verdicts(
             result=updated.result if updated else None,
         )
 
-    background_tasks.add_task(run_analysis, analysis.id)
+    enqueue_analysis(analysis.id)
     return SimilarVerdictsAnalyzeResponse(
         analysis_id=analysis.id,
         case_id=case_id,
@@ -894,12 +1376,9 @@ def analyze_verdicts(
 def analyze_verdict(
     case_id: str,
     payload: dict = Body(default_factory=dict),
-    background_tasks: BackgroundTasks = None,
     x_user_id: Optional[str] = Header(default=None, alias="X-User-ID"),
 ) -> VerdictAnalyzeResponse | JSONResponse:
     _ = x_user_id
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     try:
         req = AnalyzeVerdictRequest(**payload)
     except Exception as exc:
@@ -918,7 +1397,10 @@ def analyze_verdict(
     if mode not in ("async", "sync"):
         return JSONResponse(status_code=400, content={"success": False, "error": "mode должен быть async или sync"})
 
-    analysis = start_analysis(case_id, "verdict_analysis", input_params=data)
+    try:
+        analysis = start_analysis(case_id, "verdict_analysis", input_params=data)
+    except BlobRefError as exc:
+        return _error(str(exc))
 
     if mode == "sync":
         run_analysis(analysis.id)
@@ -935,7 +1417,7 @@ def analyze_verdict(
             result=updated.result if updated else None,
         )
 
-    background_tasks.add_task(run_analysis, analysis.id)
+    enqueue_analysis(analysis.id)
     return VerdictAnalyzeResponse(
         analysis_id=analysis.id,
         case_id=case_id,
@@ -947,6 +1429,22 @@ def analyze_verdict(
     )
 
 
+@router.get(
+    "/api/analysis/scheduler/",
+    response_model=AnalysisSchedulerResponse,
+    tags=[TAG_SERVICE],
+    summary="Analysis scheduler statistics",
+)
+def analysis_scheduler() -> AnalysisSchedulerResponse:
+    provider = get_ai_provider()
+    provider_stats = provider.stats() if hasattr(provider, "stats") else {"model": f"{provider.name}/{provider.model}"}
+    return AnalysisSchedulerResponse(
+        scheduler=get_scheduler().stats(),
+        queue=get_job_store().counts(),
+        provider=provider_stats,
+    )
+
+
 @router.get(
     "/api/analysis/{analysis_id}/status/",
     response_model=AnalysisStatusResponse,
@@ -1066,13 +1564,12 @@ def case_risks(case_id: str) -> RiskAnalysisResponse | JSONResponse:
 def analyze_risks_legacy(
     case_id: str,
     payload: dict = Body(default_factory=dict),
-    background_tasks: BackgroundTasks = None,
 ) -> GenericAnalyzeResponse:
     try:
         req = AnalyzeRisksRequest(**payload)
     except Exception as exc:
         return JSONResponse(status_code=400, content={"success": False, "error": str(exc)})
-    return analyze_risks(case_id, req, background_tasks)
+    return analyze_risks(case_id, req)
 
 
 @router.post(
@@ -1084,9 +1581,8 @@ def analyze_risks_legacy(
 def analyze_verdict_legacy(
     case_id: str,
     payload: dict = Body(default_factory=dict),
-    background_tasks: BackgroundTasks = None,
 ) -> GenericAnalyzeResponse:
-    return analyze_verdict(case_id, payload, background_tasks)
+    return analyze_verdict(case_id, payload)
 
 
 # =============================================================================
@@ -1102,11 +1598,8 @@ def analyze_verdict_legacy(
 )
 def generate_async(
     payload: GenerateSpeechRequest,
-    background_tasks: BackgroundTasks = None,
     x_user_id: Optional[str] = Header(default=None, alias="X-User-ID"),
 ) -> GenerateSpeechResponse:
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     data = payload.model_dump() if hasattr(payload, "model_dump") else payload.dict()
     mode = str(data.get("mode") or "async").strip().lower()
     if mode not in ("async", "sync"):
@@ -1131,7 +1624,7 @@ def generate_async(
             content=content,
         )
 
-    background_tasks.add_task(run_speech, speech_id, data)
+    enqueue_speech(speech_id, data)
     return GenerateSpeechResponse(
         speech_id=speech_id,
         task_id=f"task-{speech_id}",
@@ -1250,10 +1743,7 @@ def speech_version_content(speech_id: str, version_number: int) -> SpeechVersion
 def workflow(
     case_id: str,
     payload: Dict[str, Any] = Body(default_factory=dict),
-    background_tasks: BackgroundTasks = None,
 ):
-    if background_tasks is None:
-        background_tasks = BackgroundTasks()
     # 1. Calculate punishment
     aNakaz, structured = calculate_from_json(payload)
 
@@ -1291,7 +1781,7 @@ def workflow(
             **speech_params,
         }
         speech_id = start_speech(case_id, speech_payload)
-        background_tasks.add_task(run_speech, speech_id, speech_payload)
+        enqueue_speech(speech_id, speech_payload)
         response.update(
             {
                 "speech_id": speech_id,
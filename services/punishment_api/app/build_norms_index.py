@@ -0,0 +1,37 @@
+"""Построение индекса нормативных постановлений (BM25) для POST /api/case/{erdr}/norms/.
+
+Запуск: ``python -m services.punishment_api.app.build_norms_index /data/npa.jsonl``.
+Источник — JSONL с полями title, subtitle, summary, text или каталог *.txt (первая
+строка — title, вторая — subtitle). Индекс пишется новым поколением в NORMS_INDEX_DIR;
+запущенные HTTP-процессы подхватывают его без перезапуска (NORMS_INDEX_AUTORELOAD).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from pathlib import Path
+
+from .core.logging import setup_logging
+from .domain.services.norms_index import build_norms_index, norms_index_dir, read_decrees
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Punishment API normative decrees index builder")
+    parser.add_argument("source", type=Path, help="JSONL-файл или каталог с текстами НПА")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    started = time.perf_counter()
+    decrees = read_decrees(args.source)
+    logger.info("Indexing %d decrees into %s", len(decrees), norms_index_dir())
+    index = build_norms_index(decrees)
+    print(json.dumps({**index.stats(), "build_ms": round((time.perf_counter() - started) * 1000, 3)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
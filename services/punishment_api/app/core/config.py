@@ -4,13 +4,24 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal, Optional
 
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 BASE_DIR = Path(__file__).resolve().parents[2]
 PROJECT_ROOT = Path(__file__).resolve().parents[4]
 
 
+class RetentionRule(BaseModel):
+    """Правило хранения: строки таблицы старше max_age_days удаляются или архивируются."""
+
+    table: Literal["calculations", "analyses", "speeches"]
+    max_age_days: float
+    status: Optional[str] = None
+    action: Literal["delete", "archive"] = "delete"
+
+
 class Settings(BaseSettings):
     """Настройки FastAPI-сервиса."""
 
@@ -24,6 +35,178 @@ class Settings(BaseSettings):
 
     reference_file_path: str = str(PROJECT_ROOT / "справочник_УК_обновленный_2025_06_07_1.txt")
     data_dir: str = "/tmp/punishment_api_data"
+    # Подсказки статей GET /api/articles/suggest/: размер выдачи по умолчанию и предел limit.
+    article_suggest_limit: int = 10
+    article_suggest_max_limit: int = 50
+    # POST /api/articles/bulk/: предел запросов в пакете; GET /api/articles/catalog/: max-age
+    # для клиентов (после него клиент переспрашивает с If-None-Match и получает 304).
+    article_bulk_max_items: int = 1000
+    article_catalog_max_age: int = 300
+    # POST /api/articles/sanctions/: размер страницы по умолчанию, предел limit и число условий.
+    article_sanctions_limit: int = 50
+    article_sanctions_max_limit: int = 500
+    article_sanctions_max_conditions: int = 64
+
+    # Сжатие крупных JSON-колонок (input_params, payload, result, versions).
+    storage_compression_enabled: bool = False
+    storage_compression_threshold: int = 4096
+    storage_compression_level: int = 6
+    # /storage/status считает размеры колонок по последним N строкам, а не по всей таблице.
+    storage_stats_sample_rows: int = 10000
+
+    # Отложенная (write-behind) запись истории расчётов пачками.
+    calculation_write_behind: bool = False
+    calculation_write_queue_size: int = 10000
+    calculation_write_batch_size: int = 256
+    calculation_write_max_latency_ms: int = 50
+
+    # Фоновая очистка по правилам хранения, например
+    # RETENTION_RULES='[{"table": "analyses", "status": "failed", "max_age_days": 30}]'.
+    retention_enabled: bool = False
+    retention_rules: list[RetentionRule] = []
+    retention_interval_seconds: int = 3600
+    retention_batch_size: int = 500
+    retention_batch_pause_ms: int = 20
+    retention_vacuum_pages: int = 1000
+
+    # Онлайн-бэкапы баз (sqlite3 backup API); по умолчанию в DATA_DIR/backups.
+    backup_enabled: bool = False
+    backup_dir: Optional[str] = None
+    backup_interval_seconds: int = 86400
+    backup_pages_per_step: int = 256
+    backup_step_sleep_ms: int = 10
+    backup_keep: int = 7
+    # Перезапусков копирования из-за записи в базу, после которых она копируется одним шагом.
+    backup_max_restarts: int = 3
+
+    # Очередь фоновых задач (анализы, речи). JOB_WORKERS=0 — задачи выполняют
+    # только отдельные процессы `python -m services.punishment_api.app.worker`.
+    job_workers: int = 2
+    job_lease_seconds: int = 300
+    job_max_attempts: int = 3
+    job_poll_interval_ms: int = 500
+    job_backoff_base_seconds: float = 2.0
+    job_backoff_max_seconds: float = 300.0
+    # Через сколько вернуть в очередь анализ, для которого нет свободного слота планировщика.
+    job_busy_retry_ms: int = 200
+
+    # Планировщик ИИ-анализов: общий лимит одновременных анализов, лимиты по типу
+    # (ANALYSIS_TYPE_CONCURRENCY='{"materials": 1}'), слоты только для синхронных
+    # запросов, лимит пакетного класса и число документов, с которого анализ
+    # материалов считается пакетным.
+    analysis_max_concurrency: int = 4
+    analysis_type_concurrency: dict[str, int] = {"materials": 2}
+    analysis_interactive_reserved: int = 1
+    analysis_batch_concurrency: int = 1
+    analysis_batch_min_documents: int = 20
+
+    # Кеш результатов ИИ-анализов по содержимому входа (в ai_analysis.db).
+    analysis_cache_enabled: bool = True
+    analysis_cache_ttl_seconds: int = 7 * 86400
+    analysis_cache_max_entries: int = 10000
+    analysis_cache_max_bytes: int = 256 * 1024 * 1024
+
+    # Сколько синхронный запрос ждёт результат одинакового анализа/речи, уже
+    # выполняемого другим запросом или воркером.
+    single_flight_wait_seconds: float = 300.0
+
+    # Хранилище документов по содержимому: строки входа анализа от BLOB_MIN_BYTES
+    # хранятся один раз в data_dir/blobs; блобы без ссылок удаляются после периода ожидания.
+    blob_store_enabled: bool = True
+    blob_min_bytes: int = 1024
+    blob_gc_grace_seconds: int = 3600
+
+    # Потоковый приём загрузок материалов: лимиты проверяются по мере поступления байт,
+    # файл крупнее UPLOAD_SPOOL_THRESHOLD_BYTES спулится на диск, а не в память.
+    upload_max_files: int = 100
+    upload_max_file_bytes: int = 50 * 1024 * 1024
+    upload_max_request_bytes: int = 512 * 1024 * 1024
+    upload_spool_threshold_bytes: int = 1024 * 1024
+    # Потоки общего пула декодирования и нормализации загруженных файлов.
+    upload_decode_workers: int = 4
+    # Загрузка материалов zip/tar-архивом: размер архива, число записей, текстовых
+    # документов и общий распакованный объём.
+    archive_max_bytes: int = 512 * 1024 * 1024
+    archive_max_entries: int = 5000
+    archive_max_documents: int = 2000
+    archive_max_uncompressed_bytes: int = 2 * 1024 * 1024 * 1024
+    # Возобновляемые загрузки по частям (upload sessions): части хранятся в
+    # data_dir/uploads до commit; незафиксированная сессия удаляется через TTL.
+    upload_session_chunk_bytes: int = 8 * 1024 * 1024
+    upload_session_max_chunk_bytes: int = 64 * 1024 * 1024
+    # Не больше частей на файл: слишком мелкий chunk_size раздувает статус и число файлов.
+    upload_session_max_chunks_per_file: int = 10000
+    upload_session_max_bytes: int = 2 * 1024 * 1024 * 1024
+    upload_session_ttl_seconds: int = 86400
+
+    # Локальные эмбеддинги справок (хешированные n-граммы, TF-IDF): размерность вектора,
+    # LRU векторов по хешу текста и предельный размер пакета /api/vectorize/batch/ (число
+    # справок и суммарный объём текста в байтах UTF-8).
+    embedding_dim: int = 128
+    embedding_cache_size: int = 20000
+    vectorize_batch_max_items: int = 1000
+    vectorize_batch_max_bytes: int = 8 * 1024 * 1024
+
+    # Индекс похожих приговоров (хранилище в VERDICT_INDEX_DIR, по умолчанию data_dir/verdict_index):
+    # exact — полный перебор умножением матрицы на вектор, ivf — грубый квантизатор
+    # (nlist центроидов, 0 — по размеру корпуса, просматриваются nprobe списков),
+    # auto — ivf начиная с VERDICT_IVF_MIN_VECTORS векторов.
+    verdict_index_dir: str = ""
+    verdict_index_mode: Literal["exact", "ivf", "auto"] = "auto"
+    verdict_ivf_min_vectors: int = 50000
+    verdict_ivf_nlist: int = 0
+    verdict_ivf_nprobe: int = 16
+    # Хранилище векторов корпуса: сегменты float16 или int8 (с масштабом на строку),
+    # открываемые np.memmap; после добавления сегменты сливаются, если их больше
+    # VECTOR_STORE_MAX_SEGMENTS. Смена манифеста другим процессом перечитывается на лету:
+    # манифест проверяется не чаще интервала, новый индекс строится в фоновом потоке.
+    vector_store_dtype: Literal["float16", "int8", "float32"] = "float16"
+    vector_store_max_segments: int = 8
+    verdict_index_autoreload: bool = True
+    verdict_index_autoreload_interval_seconds: float = 5.0
+    # Загрузка корпуса приговоров (app.ingest_verdicts): процессов векторизации
+    # (0 — по числу CPU), строк в одном записываемом сегменте и длина куска текста,
+    # векторы кусков усредняются в вектор приговора.
+    verdict_ingest_workers: int = 0
+    verdict_ingest_write_batch: int = 20000
+    verdict_ingest_chunk_chars: int = 4000
+
+    # Поиск НПА по справке (BM25 по индексу в NORMS_INDEX_DIR, по умолчанию
+    # data_dir/norms_index): top-k, параметры BM25, предел терминов запроса (берутся
+    # самые редкие) и доля лучшей оценки, начиная с которой relevance = high.
+    # Пока индекс не построен, POST /norms/ отдаёт демонстрационный список.
+    norms_index_dir: str = ""
+    norms_top_k: int = 10
+    norms_bm25_k1: float = 1.2
+    norms_bm25_b: float = 0.75
+    norms_max_query_terms: int = 64
+    norms_high_relevance_ratio: float = 0.6
+    norms_index_autoreload: bool = True
+
+    # Провайдер ИИ-анализов: mock (эвристики) или http (OpenAI-совместимый
+    # /chat/completions). Для http: дедлайн вызова вместе с повторами, пул соединений,
+    # token bucket и лимит одновременных запросов на модель, автомат (circuit breaker).
+    ai_provider: Literal["mock", "http"] = "mock"
+    ai_http_base_url: str = "http://127.0.0.1:8090/v1"
+    ai_http_model: str = "default"
+    ai_http_api_key: Optional[str] = None
+    ai_http_timeout_seconds: float = 120.0
+    ai_http_max_connections: int = 32
+    ai_http_rate_per_second: float = 0.0
+    ai_http_burst: int = 4
+    ai_http_max_concurrency: int = 8
+    ai_http_max_attempts: int = 4
+    ai_http_backoff_base_seconds: float = 0.5
+    ai_http_backoff_max_seconds: float = 10.0
+    ai_http_breaker_threshold: int = 5
+    ai_http_breaker_cooldown_seconds: float = 30.0
+
+    # Map-reduce анализ материалов: бюджет чанка и лимит на задачу в оценочных
+    # токенах (символы / MATERIALS_CHARS_PER_TOKEN), число параллельных чанков.
+    materials_chunk_tokens: int = 6000
+    materials_max_tokens_per_job: int = 200000
+    materials_map_concurrency: int = 4
+    materials_chars_per_token: float = 3.5
 
     model_config = SettingsConfigDict(
         env_file=str(BASE_DIR / ".env"),
@@ -1,7 +1,14 @@
 from __future__ import annotations
 
+import threading
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Protocol
+
+from ...core.config import settings
+
+# Версия шаблонов промптов (prompts/PROMPTS.md). Меняется при любой правке промптов:
+# входит в ключ кеша результатов, чтобы старые ответы не выдавались за новые.
+PROMPT_VERSION = "2"
 
 
 @dataclass(frozen=True)
@@ -10,9 +17,26 @@ class AIProviderResult:
     content: Dict[str, Any]
 
 
+class AIProvider(Protocol):
+    """Интерфейс провайдера ИИ-анализов; name/model/prompt_version входят в ключ кеша."""
+
+    name: str
+    model: str
+    prompt_version: str
+
+    def analyze_materials(self, documents_text: List[str], case_info: Optional[Dict[str, Any]] = None) -> AIProviderResult: ...
+
+    def analyze_risks(self, case_data: Optional[Dict[str, Any]] = None, materials_analysis: Optional[Dict[str, Any]] = None) -> AIProviderResult: ...
+
+    def analyze_similar_verdicts(self, verdicts_text: List[str], case_info: Optional[Dict[str, Any]] = None) -> AIProviderResult: ...
+
+    def analyze_verdict(self, verdict_text: str, context: Optional[Dict[str, Any]] = None) -> AIProviderResult: ...
+
+
 class MockAIProvider:
     name = "mock"
     model = "heuristic-v1"
+    prompt_version = PROMPT_VERSION
 
     def analyze_materials(self, documents_text: List[str], case_info: Optional[Dict[str, Any]] = None) -> AIProviderResult:
         case_info = case_info or {}
@@ -212,3 +236,31 @@ class MockAIProvider:
             },
         }
         return AIProviderResult(model=f"{self.name}/{self.model}", content=content)
+
+
+_PROVIDER: Optional[AIProvider] = None
+_PROVIDER_LOCK = threading.Lock()
+
+
+def get_ai_provider() -> AIProvider:
+    """Провайдер по настройке AI_PROVIDER: mock (по умолчанию) или http."""
+
+    global _PROVIDER
+    with _PROVIDER_LOCK:
+        if _PROVIDER is None:
+            if settings.ai_provider == "http":
+                from .http_provider import HttpAIProvider
+
+                _PROVIDER = HttpAIProvider.from_settings(settings)
+            else:
+                _PROVIDER = MockAIProvider()
+        return _PROVIDER
+
+
+def close_ai_provider() -> None:
+    global _PROVIDER
+    with _PROVIDER_LOCK:
+        provider, _PROVIDER = _PROVIDER, None
+    close = getattr(provider, "close", None)
+    if close is not None:
+        close()
@@ -1,10 +1,36 @@
 from __future__ import annotations
 
+import logging
+import threading
 import time
-from typing import Any, Dict, Optional
-
-from .ai_analysis_provider import MockAIProvider
-from ...infrastructure.storage.ai_analysis_storage import AnalysisRecord, get_analysis_store
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Any, Container, Deque, Dict, Iterator, List, Mapping, Optional
+
+from .ai_analysis_provider import AIProvider, get_ai_provider
+from .materials_pipeline import document_hash, run_materials_pipeline
+from .single_flight import input_fingerprint, wait_until_settled
+from ...core.config import settings
+from ...infrastructure.storage.ai_analysis_storage import (
+    IN_FLIGHT_STATUSES,
+    AnalysisRecord,
+    analysis_blob_owner,
+    get_analysis_store,
+)
+from ...infrastructure.storage.blob_store import check_blob_refs, get_blob_store
+from ...infrastructure.storage.job_queue import get_job_store
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND_ANALYSIS = "analysis"
+
+# Классы приоритета в порядке убывания: синхронные запросы пользователя,
+# обычные асинхронные анализы и крупные пакетные анализы материалов.
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_ASYNC = "async"
+PRIORITY_BATCH = "batch"
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_ASYNC, PRIORITY_BATCH)
 
 
 ANALYSIS_TYPE_DISPLAY = {
@@ -15,25 +41,149 @@ ANALYSIS_TYPE_DISPLAY = {
 }
 
 
-def start_analysis(case_id: str, analysis_type: str, input_params: Optional[Dict[str, Any]] = None) -> AnalysisRecord:
+def analysis_cache_key(analysis_type: str, input_params: Optional[Dict[str, Any]], provider: Any) -> str:
+    """sha256 от нормализованного входа, типа анализа, модели и версии промптов.
+
+    Тот же ключ служит хешем входа для дедупликации одновременных запросов.
+    """
+
+    return input_fingerprint(
+        {
+            "analysis_type": analysis_type,
+            "model": f"{provider.name}/{provider.model}",
+            "prompt_version": provider.prompt_version,
+            "input": input_params or {},
+        }
+    )
+
+
+def start_analysis(
+    case_id: str,
+    analysis_type: str,
+    input_params: Optional[Dict[str, Any]] = None,
+    *,
+    trusted_blobs: Container[str] = (),
+) -> AnalysisRecord:
+    """Создаёт анализ или присоединяет запрос к идущему анализу дела с тем же входом.
+
+    Новый анализ при попадании в кеш результатов сразу завершён. Крупные тексты входа
+    сохраняются в хранилище блобов, строка анализа хранит только ссылки на них.
+    Ссылки {"$blob": ...} во входе допустимы только на trusted_blobs — документы,
+    загруженные сервером в этом же запросе; иначе BlobRefError.
+    """
+
+    check_blob_refs(input_params, trusted_blobs)
     store = get_analysis_store()
-    task_id = f"task-{case_id}-{analysis_type}"
-    return store.create_analysis(case_id, analysis_type, input_params=input_params, task_id=task_id)
+    key = analysis_cache_key(analysis_type, input_params, get_ai_provider())
+    task_id = f"task-{case_id}-{analysis_type}-{key[:12]}"
+    stored_params, blob_hashes = input_params, []
+    if settings.blob_store_enabled:
+        stored_params, blob_hashes = get_blob_store().externalize(input_params or {}, min_bytes=settings.blob_min_bytes)
+    record, attached = store.create_or_attach(case_id, analysis_type, stored_params, task_id, key)
+    if not attached and blob_hashes:
+        get_blob_store().add_refs(analysis_blob_owner(record.id), blob_hashes)
+    if not attached and _complete_from_cache(store, record, key):
+        record = store.get_analysis(record.id) or record
+    return record
+
+
+def _complete_from_cache(store: Any, record: AnalysisRecord, key: str) -> bool:
+    if not settings.analysis_cache_enabled:
+        return False
+    started = time.time()
+    hit = store.cache_lookup(key, record.analysis_type)
+    if hit is None:
+        return False
+    store.complete_from_cache(record.id, key, hit["ai_model"], int((time.time() - started) * 1000))
+    return True
+
 
+def analysis_priority(record: AnalysisRecord) -> str:
+    """Класс приоритета фонового анализа: крупный анализ материалов — пакетный."""
+
+    if record.analysis_type == "materials":
+        documents = (record.input_params or {}).get("documents") or []
+        if len(documents) >= settings.analysis_batch_min_documents:
+            return PRIORITY_BATCH
+    return PRIORITY_ASYNC
+
+
+def enqueue_analysis(analysis_id: str, priority: Optional[str] = None) -> None:
+    """Ставит анализ в очередь фоновых задач (см. job_worker)."""
+
+    record = get_analysis_store().get_analysis(analysis_id)
+    # Завершён из кеша или уже выполняется/ждёт в очереди по запросу-близнецу.
+    if record and record.status != "pending":
+        return
+    job_store = get_job_store()
+    if job_store.has_active(JOB_KIND_ANALYSIS, analysis_id):
+        return
+    if priority is None:
+        priority = analysis_priority(record) if record else PRIORITY_ASYNC
+    job_store.enqueue(
+        JOB_KIND_ANALYSIS,
+        analysis_id,
+        {"analysis_id": analysis_id, "priority": priority},
+        priority=PRIORITY_CLASSES.index(priority),
+    )
+
+
+def run_analysis(
+    analysis_id: str,
+    *,
+    final_attempt: bool = True,
+    priority: str = PRIORITY_INTERACTIVE,
+    wait: bool = True,
+    takeover: bool = False,
+    wait_for_slot: bool = True,
+) -> None:
+    """Выполняет анализ и сохраняет результат.
+
+    Выполнение ждёт слот планировщика (см. AnalysisScheduler): синхронные запросы
+    идут с priority=interactive, задачи очереди — с классом, заданным при постановке.
+    Если анализ уже выполняет другой вызов, при wait=True функция ждёт общего
+    результата, иначе сразу возвращается. takeover=True (повтор задачи) забирает
+    анализ, оставшийся в processing после падения воркера. wait_for_slot=False
+    (воркер очереди) вместо ожидания слота бросает SchedulerBusy.
+    При final_attempt=False ошибка провайдера не фиксируется как failed: анализ
+    возвращается в pending, а исключение пробрасывается, чтобы очередь повторила задачу.
+    """
 
-def run_analysis(analysis_id: str) -> None:
     store = get_analysis_store()
     record = store.get_analysis(analysis_id)
-    if not record:
+    if not record or record.status == "completed":
         return
 
-    store.update_analysis(analysis_id, status="processing")
+    provider = get_ai_provider()
+    key = record.input_hash or analysis_cache_key(record.analysis_type, record.input_params, provider)
+    # Пока задача ждала в очереди, такой же анализ мог завершиться.
+    if _complete_from_cache(store, record, key):
+        return
+    with get_scheduler().slot(record.analysis_type, priority, record.case_id, blocking=wait_for_slot):
+        owner = store.mark_processing(analysis_id, takeover=takeover)
+        if owner:
+            _run_admitted(store, record, provider, key, final_attempt)
+    if not owner and wait:
+        wait_until_settled(
+            lambda: store.get_analysis(analysis_id),
+            IN_FLIGHT_STATUSES,
+            timeout=settings.single_flight_wait_seconds,
+        )
 
-    provider = MockAIProvider()
+
+def _run_admitted(
+    store: Any,
+    record: AnalysisRecord,
+    provider: AIProvider,
+    key: str,
+    final_attempt: bool,
+) -> None:
+    analysis_id = record.id
     started = time.time()
 
     try:
-        result = _execute_provider(provider, record)
+        record = replace(record, input_params=get_blob_store().resolve(record.input_params))
+        result = _execute_provider(provider, record, store)
         processing_time_ms = int((time.time() - started) * 1000)
         store.update_analysis(
             analysis_id,
@@ -43,22 +193,255 @@ def run_analysis(analysis_id: str) -> None:
             processing_time_ms=processing_time_ms,
         )
     except Exception as exc:
+        if not final_attempt:
+            store.update_analysis(analysis_id, status="pending", error_message=str(exc))
+            raise
         store.update_analysis(
             analysis_id,
             status="failed",
             error_message=str(exc),
         )
+        return
+
+    if settings.analysis_cache_enabled:
+        try:
+            store.cache_put(
+                key,
+                record.analysis_type,
+                result["model"],
+                result["content"],
+                ttl_seconds=settings.analysis_cache_ttl_seconds,
+                max_entries=settings.analysis_cache_max_entries,
+                max_bytes=settings.analysis_cache_max_bytes,
+            )
+        except Exception:
+            logger.exception("Failed to cache result of analysis %s", analysis_id)
+
+
+class _Waiter:
+    __slots__ = ("analysis_type", "priority", "case_id", "enqueued_at", "admitted")
+
+    def __init__(self, analysis_type: str, priority: str, case_id: str):
+        self.analysis_type = analysis_type
+        self.priority = priority
+        self.case_id = case_id
+        self.enqueued_at = time.perf_counter()
+        self.admitted = False
+
+
+class SchedulerBusy(RuntimeError):
+    """Свободного слота нет, а ждать его не нужно (slot(..., blocking=False))."""
+
+
+class AnalysisScheduler:
+    """Раздаёт слоты выполнения анализов с учётом приоритета, типа и дела.
+
+    Ограничения одновременно выполняемых анализов:
+    - общий лимит max_concurrency, из которого interactive_reserved слотов
+      доступны только интерактивным (синхронным) запросам;
+    - лимит по типу анализа (type_limits, например materials: 2);
+    - отдельный лимит для пакетного класса (batch_concurrency).
+    Свободный слот получает ожидающий с наивысшим приоритетом; внутри класса
+    дела обслуживаются по кругу, чтобы одно дело с сотней документов не
+    вытесняло остальные. Если первый по приоритету упирается в лимит своего типа,
+    слот отдаётся следующему подходящему.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int,
+        type_limits: Optional[Mapping[str, int]] = None,
+        interactive_reserved: int = 0,
+        batch_concurrency: Optional[int] = None,
+        stats_window: int = 1000,
+    ):
+        self._max = max(1, max_concurrency)
+        self._type_limits = {k: max(1, v) for k, v in (type_limits or {}).items()}
+        shared = max(1, self._max - max(0, interactive_reserved))
+        self._class_limits = {
+            PRIORITY_INTERACTIVE: self._max,
+            PRIORITY_ASYNC: shared,
+            PRIORITY_BATCH: min(shared, batch_concurrency or shared),
+        }
+        self._cond = threading.Condition()
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {
+            cls: OrderedDict() for cls in PRIORITY_CLASSES
+        }
+        self._running_total = 0
+        self._running_class = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._running_type: Dict[str, int] = {}
+        self._waits: Dict[str, Deque[float]] = {cls: deque(maxlen=stats_window) for cls in PRIORITY_CLASSES}
+        self._counters = {
+            cls: {"waiting": 0, "max_waiting": 0, "admitted": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+            for cls in PRIORITY_CLASSES
+        }
+
+    @contextmanager
+    def slot(self, analysis_type: str, priority: str, case_id: str, *, blocking: bool = True) -> Iterator[None]:
+        """Слот выполнения; при blocking=False — SchedulerBusy, если слот не выдан сразу.
+
+        Воркер очереди не должен спать в ожидании слота: пока он ждёт, задачи более
+        высокого приоритета остаются невзятыми.
+        """
+
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+        waiter = _Waiter(analysis_type, priority, case_id)
+        with self._cond:
+            self._queues[priority].setdefault(case_id, deque()).append(waiter)
+            counters = self._counters[priority]
+            counters["waiting"] += 1
+            counters["max_waiting"] = max(counters["max_waiting"], counters["waiting"])
+            self._dispatch()
+            if not waiter.admitted and not blocking:
+                self._withdraw(waiter)
+                raise SchedulerBusy(f"Нет свободного слота для {analysis_type} ({priority})")
+            while not waiter.admitted:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running_total -= 1
+                self._running_class[priority] -= 1
+                self._running_type[analysis_type] -= 1
+                self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            classes = {}
+            for cls in PRIORITY_CLASSES:
+                counters = self._counters[cls]
+                waits = sorted(self._waits[cls])
+                admitted = counters["admitted"]
+                classes[cls] = {
+                    "limit": self._class_limits[cls],
+                    "running": self._running_class[cls],
+                    "waiting": counters["waiting"],
+                    "max_waiting": counters["max_waiting"],
+                    "admitted": admitted,
+                    "wait_ms_avg": round(counters["wait_ms_total"] / admitted, 3) if admitted else 0.0,
+                    "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+                    "wait_ms_max": round(counters["wait_ms_max"], 3),
+                }
+            return {
+                "limits": {"max_concurrency": self._max, "types": dict(self._type_limits)},
+                "running": self._running_total,
+                "classes": classes,
+                "types": {t: n for t, n in self._running_type.items() if n},
+            }
+
+    def _can_run(self, waiter: _Waiter) -> bool:
+        type_limit = self._type_limits.get(waiter.analysis_type, self._max)
+        return (
+            self._running_total < self._max
+            and self._running_class[waiter.priority] < self._class_limits[waiter.priority]
+            and self._running_type.get(waiter.analysis_type, 0) < type_limit
+        )
+
+    def _dispatch(self) -> None:
+        admitted = False
+        while self._running_total < self._max:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            waiter.admitted = True
+            admitted = True
+            waited_ms = (time.perf_counter() - waiter.enqueued_at) * 1000
+            counters = self._counters[waiter.priority]
+            counters["waiting"] -= 1
+            counters["admitted"] += 1
+            counters["wait_ms_total"] += waited_ms
+            counters["wait_ms_max"] = max(counters["wait_ms_max"], waited_ms)
+            self._waits[waiter.priority].append(waited_ms)
+            self._running_total += 1
+            self._running_class[waiter.priority] += 1
+            self._running_type[waiter.analysis_type] = self._running_type.get(waiter.analysis_type, 0) + 1
+        if admitted:
+            self._cond.notify_all()
+
+    def _withdraw(self, waiter: _Waiter) -> None:
+        pending = self._queues[waiter.priority][waiter.case_id]
+        pending.remove(waiter)
+        if not pending:
+            del self._queues[waiter.priority][waiter.case_id]
+        self._counters[waiter.priority]["waiting"] -= 1
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for cls in PRIORITY_CLASSES:
+            queue = self._queues[cls]
+            for case_id in list(queue):
+                pending = queue[case_id]
+                if not self._can_run(pending[0]):
+                    continue
+                waiter = pending.popleft()
+                # Дело уходит в конец круга, даже если у него остались ожидающие.
+                del queue[case_id]
+                if pending:
+                    queue[case_id] = pending
+                return waiter
+        return None
+
+
+_SCHEDULER: Optional[AnalysisScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> AnalysisScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = AnalysisScheduler(
+                max_concurrency=settings.analysis_max_concurrency,
+                type_limits=settings.analysis_type_concurrency,
+                interactive_reserved=settings.analysis_interactive_reserved,
+                batch_concurrency=settings.analysis_batch_concurrency,
+            )
+        return _SCHEDULER
 
 
-def _execute_provider(provider: MockAIProvider, record: AnalysisRecord) -> Dict[str, Any]:
+def _execute_materials(provider: AIProvider, record: AnalysisRecord, store: Any) -> Dict[str, Any]:
+    """Анализ материалов с переиспользованием частичных анализов неизменённых документов дела."""
+
+    payload = record.input_params or {}
+    documents = [doc for doc in payload.get("documents") or [] if isinstance(doc, dict)]
+    # Частичные анализы зависят от модели, промптов и нарезки на чанки.
+    variant = input_fingerprint(
+        {
+            "model": f"{provider.name}/{provider.model}",
+            "prompt_version": provider.prompt_version,
+            "chunk_tokens": settings.materials_chunk_tokens,
+            "chars_per_token": settings.materials_chars_per_token,
+        }
+    )[:16]
+    hashes = [document_hash(str(doc.get("text") or "")) for doc in documents]
+    known = store.load_material_partials(record.case_id, variant, hashes)
+
+    def save_partial(doc_hash: str, name: str, model: Optional[str], parts: List[Dict[str, Any]]) -> None:
+        store.save_material_partial(record.case_id, variant, doc_hash, name, model, parts)
+
+    result = run_materials_pipeline(
+        provider,
+        documents,
+        {"erdr_number": payload.get("erdr_number")},
+        chunk_tokens=settings.materials_chunk_tokens,
+        max_tokens=settings.materials_max_tokens_per_job,
+        concurrency=settings.materials_map_concurrency,
+        chars_per_token=settings.materials_chars_per_token,
+        doc_hashes=hashes,
+        known_partials=known,
+        on_document=save_partial,
+    )
+    store.prune_material_partials(record.case_id, hashes)
+    return result
+
+
+def _execute_provider(provider: AIProvider, record: AnalysisRecord, store: Any) -> Dict[str, Any]:
     payload = record.input_params or {}
 
     if record.analysis_type == "materials":
-        documents = payload.get("documents") or []
-        texts = [doc.get("text", "") for doc in documents if isinstance(doc, dict)]
-        case_info = {"erdr_number": payload.get("erdr_number")}
-        result = provider.analyze_materials(texts, case_info)
-        return {"model": result.model, "content": result.content}
+        return _execute_materials(provider, record, store)
 
     if record.analysis_type == "risk_analysis":
         case_data = {
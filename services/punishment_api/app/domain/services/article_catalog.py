@@ -0,0 +1,179 @@
+"""Сведения о статьях справочника УК и производные от него структуры.
+
+Здесь — разбор полей записи (тяжесть, сроки, отметка об исключении) и кеш структур,
+построенных по справочнику (индексы поиска, каталог): структура строится целиком по
+снимку одной загрузки и подменяется одной ссылкой, когда меняется версия справочника.
+Читатели всегда видят либо старую, либо новую структуру, без промежуточных состояний.
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import threading
+from datetime import date
+from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+from ...infrastructure.loaders.reference_loader import ArticleRecord, get_reference_service
+
+SEVERITY_NAMES = {
+    0: "MINOR",
+    1: "SMALL",
+    2: "MEDIUM",
+    3: "SERIOUS",
+    4: "ESPECIALLY_SERIOUS",
+}
+
+EXCLUDED_MARKERS = (
+    "(Исключена)",
+    "(Исключен",
+    "(8A:;NG5=0)",
+    "(8A:;NG5=",
+    "Ш8сключ5н",
+    "Исключена",
+    "Исключен",
+)
+
+
+def parse_severity(value: str) -> str:
+    try:
+        severity = int(str(value).strip())
+    except ValueError:
+        severity = 0
+    severity = max(0, min(severity, 4))
+    return SEVERITY_NAMES.get(severity, "MINOR")
+
+
+def parse_float(value: str) -> float:
+    if value is None:
+        return 0.0
+    text = str(value).strip()
+    if not text:
+        return 0.0
+    clean = "".join(ch for ch in text if ch.isdigit() or ch in ".-")
+    if not clean or clean in {"-", ".", "-.", ".-"}:
+        return 0.0
+    try:
+        return float(clean)
+    except ValueError:
+        return 0.0
+
+
+def is_excluded(stat: str) -> bool:
+    if not stat:
+        return False
+    return any(marker in stat for marker in EXCLUDED_MARKERS)
+
+
+def display_stat(stat: str) -> str:
+    """«ст.188Э1 ч.1» -> «ст.188-1 ч.1»: дефис в поле stat после сдвига кодировки читается как «Э»."""
+
+    return stat.replace("Э", "-").strip()
+
+
+def current_record(records: List[ArticleRecord]) -> Tuple[ArticleRecord, Optional[date], Optional[date]]:
+    """Действующая редакция и её период — то же, что get_with_range(code, date.max)."""
+
+    record = max(enumerate(records), key=lambda item: (item[1].d_izm or date.min, item[0]))[1]
+    return record, record.d_izm, None
+
+
+def describe_article(record: ArticleRecord, effective_from: Optional[date], effective_to: Optional[date]) -> Dict[str, Any]:
+    """Поля ArticleInfo по записи справочника и периоду действия редакции."""
+
+    return {
+        "code": record.article_code,
+        "name": record.stat.strip() if record.stat else "",
+        "severity": parse_severity(record.hard),
+        "imprisonment_min": parse_float(record.fs1r64_01n),
+        "imprisonment_max": parse_float(record.fs1r64_01x),
+        "is_excluded": is_excluded(record.stat),
+        "effective_from": effective_from,
+        "effective_to": effective_to,
+    }
+
+
+T = TypeVar("T")
+
+
+class ReferenceDerived(Generic[T]):
+    """Значение, построенное по снимку справочника и перестраиваемое при смене его версии."""
+
+    def __init__(self, builder: Callable[[str, Dict[str, List[ArticleRecord]]], T]):
+        self._builder = builder
+        self._lock = threading.Lock()
+        self._value: Optional[Tuple[str, T]] = None
+
+    def get(self) -> T:
+        version, records = get_reference_service().snapshot()
+        cached = self._value
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with self._lock:
+            cached = self._value
+            if cached is None or cached[0] != version:
+                cached = (version, self._builder(version, records))
+                self._value = cached
+        return cached[1]
+
+
+class ArticleCatalog:
+    """Действующие редакции всех статей: словарь по коду и готовые тела ответа каталога.
+
+    JSON сериализуется и сжимается gzip один раз на версию справочника; ETag — версия
+    (хеш файла), у сжатого представления свой суффикс, как требует строгое сравнение.
+    """
+
+    def __init__(self, version: str, articles: List[Dict[str, Any]]):
+        self.version = version
+        self.articles = articles
+        self.by_code = {article["code"]: article for article in articles}
+        payload = {
+            "success": True,
+            "version": version,
+            "count": len(articles),
+            "articles": [
+                {
+                    **article,
+                    "effective_from": _iso(article["effective_from"]),
+                    "effective_to": _iso(article["effective_to"]),
+                }
+                for article in articles
+            ],
+        }
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # mtime=0: одинаковые данные дают одинаковые байты во всех процессах.
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = f'"{version}"'
+        self.gzip_etag = f'"{version}-gzip"'
+
+    @classmethod
+    def build(cls, version: str, records: Dict[str, List[ArticleRecord]]) -> "ArticleCatalog":
+        articles = [describe_article(*current_record(records[code])) for code in sorted(records)]
+        return cls(version, articles)
+
+    def matches(self, if_none_match: Optional[str], etag: str) -> bool:
+        """If-None-Match совпадает с ETag отдаваемого представления (сравнение слабое, по RFC 9110).
+
+        Тег другого представления не даёт 304: у клиента закэшировано не то тело.
+        """
+
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+
+def _iso(value: Optional[date]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+_CATALOG: ReferenceDerived[ArticleCatalog] = ReferenceDerived(ArticleCatalog.build)
+
+
+def get_article_catalog() -> ArticleCatalog:
+    """Каталог текущей версии справочника (перестраивается при её смене)."""
+
+    return _CATALOG.get()
@@ -0,0 +1,300 @@
+"""Выборка статей по санкциям: предикаты над пределами наказаний, тяжестью и видами наказаний.
+
+Индекс строится по действующим редакциям один раз на версию справочника. Числовые поля
+(пределы fs1r64_*/fs1r65_02*, тяжесть hard, prest) — массивы float с NaN там, где
+предела нет, и заранее посчитанный порядок сортировки: условие «≤ 5» — один
+searchsorted по отсортированным значениям и срез порядка. Виды наказаний (fs1r64,
+fs1r65_o, fs1r65_n) — битовые маски по статьям. Условия объединяются and/or/not
+поэлементными операциями над булевыми масками, без циклов по записям.
+
+Условие — {"field": ..., "op": ..., "value": ...}; составное — {"and": [...]},
+{"or": [...]} или {"not": {...}}. Пример: «лишение свободы не более 5 лет и штраф
+допускается» — {"and": [{"field": "imprisonment_max", "op": "le", "value": 5},
+{"field": "punishments", "op": "has", "value": "fine"}]}.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ...infrastructure.loaders.reference_loader import ArticleRecord
+from .article_catalog import SEVERITY_NAMES, ReferenceDerived, current_record, describe_article, is_excluded
+
+# Основные наказания (FS1R64) и дополнительные (FS1R65), см. API_FIELDS.md.
+PUNISHMENTS = {
+    "imprisonment": "01",
+    "death_penalty": "02",
+    "life_imprisonment": "03",
+    "fine": "05",
+    "correctional_work": "06",
+    "community_service": "09",
+    "restriction_of_freedom": "11",
+    "arrest": "12",
+}
+ADDITIONAL_PUNISHMENTS = {
+    "deprivation_of_rank": "01",
+    "deprivation_of_right": "02",
+    "position_ban": "04",
+    "confiscation": "05",
+    "activity_ban": "22",
+}
+
+# Пределы: лишение свободы и ограничение свободы — годы, штраф и исправительные работы — МРП,
+# обязательные работы — часы, арест — сутки, лишение права — годы.
+LIMIT_FIELDS = {
+    "imprisonment_min": "fs1r64_01n",
+    "imprisonment_max": "fs1r64_01x",
+    "fine_min": "fs1r64_05n",
+    "fine_max": "fs1r64_05x",
+    "correctional_work_min": "fs1r64_06n",
+    "correctional_work_max": "fs1r64_06x",
+    "community_service_min": "fs1r64_09n",
+    "community_service_max": "fs1r64_09x",
+    "restriction_of_freedom_min": "fs1r64_11n",
+    "restriction_of_freedom_max": "fs1r64_11x",
+    "arrest_min": "fs1r64_12n",
+    "arrest_max": "fs1r64_12x",
+    "deprivation_of_right_min": "fs1r65_02n",
+    "deprivation_of_right_max": "fs1r65_02x",
+}
+# severity — hard (0..4, названия как в ArticleInfo; NaN, если hard не заполнен); prest: 1 — преступление, 2 — уголовный проступок.
+NUMERIC_FIELDS = (*LIMIT_FIELDS, "severity", "prest")
+# punishments — допускаемые основные, additional_mandatory — обязательные дополнительные,
+# additional — допускаемые дополнительные (обязательные или по усмотрению суда).
+SET_FIELDS = {
+    "punishments": PUNISHMENTS,
+    "additional_mandatory": ADDITIONAL_PUNISHMENTS,
+    "additional": ADDITIONAL_PUNISHMENTS,
+}
+RANGE_OPS = ("eq", "ne", "lt", "le", "gt", "ge", "between")
+SET_OPS = ("has", "has_any", "has_all", "has_none")
+
+_SEVERITY_LEVELS = {name: level for level, name in SEVERITY_NAMES.items()}
+
+
+def parse_limit(value: str) -> float:
+    """Предел из поля справочника; NaN — предела нет или он кратный («20xN»: в 20 раз от суммы)."""
+
+    text = str(value or "").strip()
+    if not text or "x" in text.lower():
+        return float("nan")
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        return float("nan")
+
+
+def parse_severity_level(value: str) -> float:
+    """Тяжесть 0..4 из hard; NaN — hard пуст или не число (статья не попадает в сравнения)."""
+
+    try:
+        return float(max(0, min(int(str(value or "").strip()), 4)))
+    except ValueError:
+        return float("nan")
+
+
+def parse_codes(value: str) -> List[str]:
+    """«05,06,01» -> ["05", "06", "01"]; одиночная цифра дополняется нулём («2» -> «02»)."""
+
+    return [code.strip().zfill(2) for code in str(value or "").split(",") if code.strip()]
+
+
+def _bits(codes: Sequence[str], names: Dict[str, str]) -> int:
+    bits = 0
+    for position, code in enumerate(names.values()):
+        if code in codes:
+            bits |= 1 << position
+    return bits
+
+
+class SanctionIndex:
+    def __init__(self, version: str, articles: List[Dict[str, Any]], numeric: Dict[str, np.ndarray], sets: Dict[str, np.ndarray], excluded: np.ndarray):
+        self.version = version
+        self.articles = articles
+        self._numeric = numeric
+        self._sets = sets
+        self._excluded = excluded
+        # Порядок по возрастанию (NaN в конце) и отсортированные значения для searchsorted.
+        self._ascending = {field: np.argsort(values, kind="stable") for field, values in numeric.items()}
+        self._sorted = {field: values[self._ascending[field]] for field, values in numeric.items()}
+        self._valid = {field: int(np.count_nonzero(~np.isnan(values))) for field, values in numeric.items()}
+
+    @property
+    def size(self) -> int:
+        return len(self.articles)
+
+    @classmethod
+    def build(cls, version: str, records: Dict[str, List[ArticleRecord]]) -> "SanctionIndex":
+        articles: List[Dict[str, Any]] = []
+        numeric: Dict[str, List[float]] = {field: [] for field in NUMERIC_FIELDS}
+        sets: Dict[str, List[int]] = {field: [] for field in SET_FIELDS}
+        excluded: List[bool] = []
+        for code in sorted(records):
+            record, effective_from, effective_to = current_record(records[code])
+            limits = {field: parse_limit(getattr(record, attribute)) for field, attribute in LIMIT_FIELDS.items()}
+            info = describe_article(record, effective_from, effective_to)
+            main = parse_codes(record.fs1r64)
+            mandatory = parse_codes(record.fs1r65_o)
+            optional = parse_codes(record.fs1r65_n)
+            for field, value in limits.items():
+                numeric[field].append(value)
+            numeric["severity"].append(parse_severity_level(record.hard))
+            numeric["prest"].append(parse_limit(record.prest))
+            sets["punishments"].append(_bits(main, PUNISHMENTS))
+            sets["additional_mandatory"].append(_bits(mandatory, ADDITIONAL_PUNISHMENTS))
+            sets["additional"].append(_bits(mandatory + optional, ADDITIONAL_PUNISHMENTS))
+            excluded.append(is_excluded(record.stat))
+            articles.append(
+                {
+                    **info,
+                    "title": record.name,
+                    "prest": record.prest.strip(),
+                    "punishments": [name for name, value in PUNISHMENTS.items() if value in main],
+                    "additional_mandatory": [name for name, value in ADDITIONAL_PUNISHMENTS.items() if value in mandatory],
+                    "additional_optional": [
+                        name for name, value in ADDITIONAL_PUNISHMENTS.items() if value in optional and value not in mandatory
+                    ],
+                    "limits": {field: None if np.isnan(value) else value for field, value in limits.items()},
+                }
+            )
+        return cls(
+            version,
+            articles,
+            {field: np.asarray(values, dtype=np.float64) for field, values in numeric.items()},
+            {field: np.asarray(values, dtype=np.int64) for field, values in sets.items()},
+            np.asarray(excluded, dtype=bool),
+        )
+
+    def query(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        *,
+        include_excluded: bool = False,
+        order_by: str = "code",
+        descending: bool = False,
+        offset: int = 0,
+        limit: int = 50,
+        max_conditions: int = 64,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """(сколько статей подходит, страница статей); ValueError — некорректное условие."""
+
+        budget = [max_conditions]
+        mask = self._evaluate(where, budget) if where else np.ones(self.size, dtype=bool)
+        if not include_excluded:
+            mask &= ~self._excluded
+        if order_by == "code":
+            rows = np.flatnonzero(mask)
+            if descending:
+                rows = rows[::-1]
+        elif order_by in self._numeric:
+            order = self._ascending[order_by]
+            valid = self._valid[order_by]
+            if descending:
+                # NaN (предела нет) остаются в конце и при обратном порядке.
+                order = np.concatenate((order[:valid][::-1], order[valid:]))
+            rows = order[mask[order]]
+        else:
+            raise ValueError(f"Нельзя сортировать по полю {order_by}")
+        page = rows[offset : offset + limit].tolist()
+        return int(len(rows)), [self.articles[row] for row in page]
+
+    def _evaluate(self, node: Any, budget: List[int]) -> np.ndarray:
+        if not isinstance(node, dict) or not node:
+            raise ValueError("Условие должно быть объектом")
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise ValueError("Слишком много условий")
+        if "and" in node or "or" in node:
+            key = "and" if "and" in node else "or"
+            parts = node[key]
+            if len(node) != 1 or not isinstance(parts, list) or not parts:
+                raise ValueError(f"{key} — непустой список условий")
+            masks = [self._evaluate(part, budget) for part in parts]
+            return np.logical_and.reduce(masks) if key == "and" else np.logical_or.reduce(masks)
+        if "not" in node:
+            if len(node) != 1:
+                raise ValueError("not — одно условие")
+            return ~self._evaluate(node["not"], budget)
+        return self._leaf(node.get("field"), node.get("op"), node.get("value"))
+
+    def _leaf(self, field: Any, op: Any, value: Any) -> np.ndarray:
+        if not isinstance(field, str):
+            raise ValueError("field — название поля (строка)")
+        if not isinstance(op, str):
+            raise ValueError("op — название операции (строка)")
+        if field in self._numeric:
+            if op not in RANGE_OPS:
+                raise ValueError(f"Для поля {field} допустимы операции: {', '.join(RANGE_OPS)}")
+            return self._range(field, op, value)
+        if field in self._sets:
+            if op not in SET_OPS:
+                raise ValueError(f"Для поля {field} допустимы операции: {', '.join(SET_OPS)}")
+            return self._contains(field, op, value)
+        if field == "excluded":
+            if op != "eq" or not isinstance(value, bool):
+                raise ValueError("excluded сравнивается только eq с true/false")
+            return self._excluded.copy() if value else ~self._excluded
+        raise ValueError(f"Неизвестное поле: {field}")
+
+    def _number(self, field: str, value: Any) -> float:
+        if field == "severity" and isinstance(value, str) and value in _SEVERITY_LEVELS:
+            return float(_SEVERITY_LEVELS[value])
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Значение для поля {field} должно быть числом")
+        # NaN/Infinity (JSON-парсер их принимает) searchsorted поставил бы за последним пределом.
+        number = float(value) if abs(value) < 1e308 else math.inf
+        if not math.isfinite(number):
+            raise ValueError(f"Значение для поля {field} должно быть конечным числом")
+        return number
+
+    def _range(self, field: str, op: str, value: Any) -> np.ndarray:
+        values = self._sorted[field]
+        valid = self._valid[field]
+        if op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise ValueError("between — список из двух чисел [от, до]")
+            low, high = self._number(field, value[0]), self._number(field, value[1])
+        else:
+            low = high = self._number(field, value)
+        head = values[:valid]
+        if op in ("lt", "le"):
+            start, end = 0, int(np.searchsorted(head, high, side="left" if op == "lt" else "right"))
+        elif op in ("gt", "ge"):
+            start, end = int(np.searchsorted(head, low, side="right" if op == "gt" else "left")), valid
+        else:
+            start, end = int(np.searchsorted(head, low, side="left")), int(np.searchsorted(head, high, side="right"))
+        mask = np.zeros(self.size, dtype=bool)
+        mask[self._ascending[field][start:end]] = True
+        if op == "ne":
+            # Статьи без предела не сравниваются ни в какую сторону.
+            mask = ~mask
+            mask[self._ascending[field][valid:]] = False
+        return mask
+
+    def _contains(self, field: str, op: str, value: Any) -> np.ndarray:
+        names = SET_FIELDS[field]
+        wanted = [value] if op == "has" else value
+        if not isinstance(wanted, list) or not wanted or not all(isinstance(name, str) for name in wanted):
+            raise ValueError(f"{op} — {'название' if op == 'has' else 'список названий'} наказаний")
+        unknown = [name for name in wanted if name not in names]
+        if unknown:
+            raise ValueError(f"Неизвестные наказания для {field}: {', '.join(unknown)}; допустимы: {', '.join(names)}")
+        bits = _bits([names[name] for name in wanted], names)
+        column = self._sets[field]
+        if op == "has_all":
+            return (column & bits) == bits
+        if op == "has_none":
+            return (column & bits) == 0
+        return (column & bits) != 0
+
+
+_INDEX: ReferenceDerived[SanctionIndex] = ReferenceDerived(SanctionIndex.build)
+
+
+def get_sanction_index() -> SanctionIndex:
+    """Индекс санкций текущей версии справочника (перестраивается при её смене)."""
+
+    return _INDEX.get()
@@ -0,0 +1,175 @@
+"""Подсказки статей по мере ввода: префиксное дерево по кодам и триграммы по названиям.
+
+Индекс строится по действующим редакциям справочника (исключённые статьи не попадают)
+один раз на версию справочника. «ст. 18», «188-1», «1880» ищутся по дереву: ключи —
+номер статьи («188», «188-1») и семизначный код, в каждом узле заранее лежат номера
+записей в порядке выдачи, так что ответ — спуск по символам запроса и срез списка.
+Список узла ограничен node_capacity; если его не хватило (фильтр по части, большой
+limit), записи добираются обходом поддерева.
+«кража» ищется по триграммам слов названия: доля триграмм запроса, найденных в
+названии, считается np.bincount по спискам триграмм, слабые совпадения отсекаются.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ...infrastructure.loaders.reference_loader import ArticleRecord
+from .article_catalog import ReferenceDerived, current_record, display_stat, is_excluded
+
+_STAT_RE = re.compile(r"ст\.\s*(\d+)(?:-(\d+))?(?:\s*ч\.\s*(\d+(?:-\d+)?))?")
+_CODE_QUERY_RE = re.compile(r"^(?:статья|статьи|ст)?\.?\s*(\d{1,3}(?:-\d{0,2})?|\d{4,7})(?:\s*ч(?:асть|\.)?\s*(\d{0,2}))?$")
+_NON_WORD = re.compile(r"[^0-9a-zа-я]+")
+
+# Доля триграмм запроса, которая должна найтись в названии.
+MIN_NAME_SCORE = 0.6
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def trigrams(text: str, *, typing: bool = False) -> List[str]:
+    """Различные триграммы слов текста с пробелами по краям слова (« кр», «жа »).
+
+    typing — последнее слово набирается и может быть неполным: без триграммы его конца.
+    """
+
+    grams: Dict[str, None] = {}
+    words = _NON_WORD.sub(" ", text.lower().replace("ё", "е")).split()
+    for position, word in enumerate(words):
+        padded = f" {word}" if typing and position == len(words) - 1 else f" {word} "
+        for start in range(len(padded) - 2):
+            grams.setdefault(padded[start : start + 3])
+    return list(grams)
+
+
+@dataclass
+class _Node:
+    children: Dict[str, "_Node"] = field(default_factory=dict)
+    ids: List[int] = field(default_factory=list)
+    # Записи, чей ключ заканчивается в этом узле, и признак, что ids обрезан по ёмкости.
+    terminal: List[int] = field(default_factory=list)
+    truncated: bool = False
+
+
+class ArticleSearchIndex:
+    def __init__(self, entries: List[Dict[str, Any]], *, version: str = "", node_capacity: int = 100):
+        self.entries = entries
+        self.version = version
+        self._root = _Node()
+        grams: Dict[str, List[int]] = {}
+        self._name_sizes = np.zeros(len(entries), dtype=np.float32)
+        for position, entry in enumerate(entries):
+            for key in (entry["article"], entry["code"]):
+                self._insert(key, position, node_capacity)
+            entry_grams = trigrams(entry["name"])
+            self._name_sizes[position] = len(entry_grams)
+            for gram in entry_grams:
+                grams.setdefault(gram, []).append(position)
+        self._grams = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in grams.items()}
+
+    def _insert(self, key: str, position: int, capacity: int) -> None:
+        node = self._root
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+            # Записи вставляются в порядке выдачи, поэтому список в узле уже упорядочен.
+            if node.ids and node.ids[-1] == position:
+                continue
+            if len(node.ids) < capacity:
+                node.ids.append(position)
+            else:
+                node.truncated = True
+        if not node.terminal or node.terminal[-1] != position:
+            node.terminal.append(position)
+
+    @classmethod
+    def build(cls, version: str, records: Dict[str, List[ArticleRecord]]) -> "ArticleSearchIndex":
+        entries: List[Tuple[Tuple[int, int, str, str], Dict[str, Any]]] = []
+        for code, versions in records.items():
+            record, _, _ = current_record(versions)
+            if is_excluded(record.stat):
+                continue
+            stat = display_stat(record.stat)
+            match = _STAT_RE.match(stat)
+            if match is None:
+                continue
+            number, sub, part = match.groups()
+            article = f"{number}-{sub}" if sub else number
+            entry = {"code": code, "stat": stat, "name": record.name, "article": article, "part": part}
+            entries.append(((int(number), int(sub or 0), part or "", code), entry))
+        entries.sort(key=lambda item: item[0])
+        return cls([entry for _, entry in entries], version=version)
+
+    @property
+    def size(self) -> int:
+        return len(self.entries)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        text = normalize_query(query)
+        if not text:
+            return []
+        code_query = _CODE_QUERY_RE.match(text)
+        if code_query:
+            return self._by_code(code_query.group(1), code_query.group(2), limit)
+        return self._by_name(text, limit)
+
+    def _by_code(self, prefix: str, part: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        node: Optional[_Node] = self._root
+        for char in prefix:
+            node = node.children.get(char) if node else None
+        if node is None:
+            return []
+        found = self._collect(node.ids, part, limit)
+        if len(found) < limit and node.truncated:
+            found = self._collect(sorted(self._subtree(node)), part, limit)
+        return found
+
+    def _collect(self, positions: List[int], part: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        found = []
+        for position in positions:
+            entry = self.entries[position]
+            if part and not (entry["part"] or "").startswith(part):
+                continue
+            found.append({**entry, "match": "code", "score": 1.0})
+            if len(found) >= limit:
+                break
+        return found
+
+    def _subtree(self, node: _Node) -> set[int]:
+        if not node.truncated:
+            return set(node.ids)
+        positions = set(node.terminal)
+        for child in node.children.values():
+            positions |= self._subtree(child)
+        return positions
+
+    def _by_name(self, text: str, limit: int) -> List[Dict[str, Any]]:
+        grams = trigrams(text, typing=True)
+        query_grams = [self._grams[gram] for gram in grams if gram in self._grams]
+        if not query_grams:
+            return []
+        hits = np.bincount(np.concatenate(query_grams), minlength=self.size).astype(np.float32)
+        scores = hits / len(grams)
+        candidates = np.flatnonzero(scores >= MIN_NAME_SCORE)
+        if not len(candidates):
+            return []
+        # Больше совпавших триграмм, затем более короткое название, затем порядок статей.
+        order = np.lexsort((candidates, self._name_sizes[candidates], -scores[candidates]))[:limit]
+        return [
+            {**self.entries[position], "match": "name", "score": round(float(scores[position]), 3)}
+            for position in candidates[order].tolist()
+        ]
+
+
+_INDEX: ReferenceDerived[ArticleSearchIndex] = ReferenceDerived(ArticleSearchIndex.build)
+
+
+def get_article_search() -> ArticleSearchIndex:
+    """Индекс подсказок текущей версии справочника (перестраивается при её смене)."""
+
+    return _INDEX.get()
@@ -0,0 +1,520 @@
+"""Потоковый приём загружаемых документов дела с ограниченным расходом памяти.
+
+Байты каждого файла по мере поступления пишутся во временный спул (в памяти до порога,
+дальше на диск), по пути считаются размер и sha256 и проверяются лимиты — превышение
+обрывает приём сразу. Затем файлы параллельно декодируются по частям (кодировка
+определяется по первой порции), нормализуются и записываются в хранилище блобов как
+UTF-8 текст.
+"""
+
+from __future__ import annotations
+
+import codecs
+import hashlib
+import re
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import IO, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from ...core.config import settings
+from ...infrastructure.storage.blob_store import BlobRef, BlobStore
+
+_CHUNK_SIZE = 1 << 16
+
+NOT_TEXT_ERROR = "Недопустимый формат документа, требуется текст"
+
+
+class IngestError(ValueError):
+    """Ошибка приёма загрузки; status_code — HTTP-статус ответа (413 — превышен лимит)."""
+
+    def __init__(self, message: str, status_code: int = 400, *, code: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+
+@dataclass(frozen=True)
+class IngestLimits:
+    max_files: int
+    max_file_bytes: int
+    max_request_bytes: int
+    spool_threshold_bytes: int
+
+    @classmethod
+    def from_settings(cls) -> "IngestLimits":
+        return cls(
+            max_files=settings.upload_max_files,
+            max_file_bytes=settings.upload_max_file_bytes,
+            max_request_bytes=settings.upload_max_request_bytes,
+            spool_threshold_bytes=settings.upload_spool_threshold_bytes,
+        )
+
+
+class RawSpool:
+    """Сырые байты одного файла: считает размер и sha256, проверяет лимиты при записи."""
+
+    def __init__(self, name: str, limits: IngestLimits):
+        self.name = name
+        self.size = 0
+        self._limits = limits
+        self._digest = hashlib.sha256()
+        self._file = tempfile.SpooledTemporaryFile(max_size=limits.spool_threshold_bytes)
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.size += len(data)
+        if self.size > self._limits.max_file_bytes:
+            raise IngestError(
+                f"Документ {self.name} превышает допустимый размер {self._limits.max_file_bytes} байт",
+                status_code=413,
+            )
+        self._digest.update(data)
+        self._file.write(data)
+
+    def fileobj(self) -> IO[bytes]:
+        """Спул как файл для чтения с начала (например, для zipfile)."""
+
+        self._file.seek(0)
+        return self._file  # type: ignore[return-value]
+
+    def chunks(self, chunk_size: int = _CHUNK_SIZE) -> Iterator[bytes]:
+        self._file.seek(0)
+        while chunk := self._file.read(chunk_size):
+            yield chunk
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self._file, "_rolled", False))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+@dataclass(frozen=True)
+class IngestedDocument:
+    name: str
+    blob: BlobRef
+    raw_bytes: int
+    raw_sha256: str
+    encoding: str
+    elapsed_ms: float = 0.0
+
+    def as_document(self) -> Dict[str, Any]:
+        return {"name": self.name, "text": self.blob.as_param()}
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "ok": True,
+            "encoding": self.encoding,
+            "raw_bytes": self.raw_bytes,
+            "text_bytes": self.blob.size,
+            "sha256": self.blob.hash,
+            "elapsed_ms": round(self.elapsed_ms, 3),
+        }
+
+
+@dataclass(frozen=True)
+class IngestFailure:
+    name: str
+    error: str
+    status_code: int
+    elapsed_ms: float = 0.0
+
+    def report(self) -> Dict[str, Any]:
+        return {"name": self.name, "ok": False, "error": self.error, "elapsed_ms": round(self.elapsed_ms, 3)}
+
+
+IngestResult = Union[IngestedDocument, IngestFailure]
+
+
+# Управляющие символы удаляются (кроме \t и \n), экзотические пробелы заменяются обычным.
+_NORMALIZE_TABLE: Dict[int, Optional[str]] = {
+    code: None for code in [*range(0x00, 0x20), 0x7F, *range(0x80, 0xA0)] if code not in (0x09, 0x0A)
+}
+_NORMALIZE_TABLE.update({0x0B: "\n", 0x0C: "\n", 0x200B: None, 0x2060: None, 0xFEFF: None})
+_NORMALIZE_TABLE.update({code: " " for code in (0xA0, *range(0x2000, 0x200B), 0x202F, 0x205F, 0x3000)})
+_TRAILING_SPACES = re.compile(r"[ \t]+\n")
+_TAIL_SPACES = re.compile(r"[ \t]+\Z")
+
+
+class TextNormalizer:
+    """Потоковая нормализация текста.
+
+    Переводы строк приводятся к \\n, управляющие символы и пробелы в конце строк
+    удаляются. Хвост порции, который может продолжиться в следующей (\\r перед \\n,
+    пробелы перед переводом строки), придерживается до следующего вызова.
+    """
+
+    def __init__(self) -> None:
+        self._carry = ""
+
+    def feed(self, text: str) -> str:
+        text = self._carry + text
+        self._carry = ""
+        if text.endswith("\r"):
+            text, self._carry = text[:-1], "\r"
+        text = text.replace("\r\n", "\n").replace("\r", "\n").translate(_NORMALIZE_TABLE)
+        text = _TRAILING_SPACES.sub("\n", text)
+        tail = _TAIL_SPACES.search(text)
+        if tail:
+            self._carry = tail.group() + self._carry
+            text = text[: tail.start()]
+        return text
+
+    def finish(self) -> str:
+        # Пробелы в конце документа отбрасываются, одиночный \r — перевод строки.
+        carry, self._carry = self._carry, ""
+        return "\n" if carry.endswith("\r") else ""
+
+
+def detect_encoding(head: bytes) -> str:
+    """Кодировка по первой порции: BOM, иначе UTF-8, если порция им декодируется, иначе cp1251."""
+
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        # Порция может оборваться посреди многобайтного символа — это не ошибка.
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return "cp1251"
+    return "utf-8"
+
+
+def decode_to_blob(spool: RawSpool, store: BlobStore) -> IngestedDocument:
+    """Декодирует и нормализует файл по частям и пишет текст в хранилище блобов.
+
+    Если UTF-8, определённая по первой порции, ломается дальше в файле, файл
+    перечитывается из спула как cp1251 — как при прежнем декодировании целиком.
+    """
+
+    started = time.perf_counter()
+    head = next(spool.chunks(), b"")
+    encoding = detect_encoding(head)
+    try:
+        blob = _decode_with(spool, store, encoding)
+    except UnicodeDecodeError:
+        if encoding == "cp1251":
+            raise IngestError(NOT_TEXT_ERROR)
+        encoding = "cp1251"
+        try:
+            blob = _decode_with(spool, store, encoding)
+        except UnicodeDecodeError as exc:
+            raise IngestError(NOT_TEXT_ERROR) from exc
+    return IngestedDocument(
+        name=spool.name,
+        blob=blob,
+        raw_bytes=spool.size,
+        raw_sha256=spool.sha256,
+        encoding=encoding,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
+
+def _decode_with(spool: RawSpool, store: BlobStore, encoding: str) -> BlobRef:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    normalizer = TextNormalizer()
+    with store.writer() as writer:
+        for chunk in spool.chunks():
+            writer.write(normalizer.feed(decoder.decode(chunk)).encode("utf-8"))
+        tail = normalizer.feed(decoder.decode(b"", final=True)) + normalizer.finish()
+        writer.write(tail.encode("utf-8"))
+        return writer.commit()
+
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _decode_pool() -> ThreadPoolExecutor:
+    """Общий для всех запросов пул декодирования: одновременные загрузки не множат потоки."""
+
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(
+                max_workers=max(1, settings.upload_decode_workers),
+                thread_name_prefix="upload-decode",
+            )
+        return _POOL
+
+
+def ingest_spools(spools: Sequence[RawSpool], store: BlobStore) -> List[IngestResult]:
+    """Декодирует файлы параллельно; результаты — в порядке файлов, ошибки — по каждому файлу."""
+
+    futures = [_decode_pool().submit(_ingest_one, spool, store) for spool in spools]
+    return [future.result() for future in futures]
+
+
+def _ingest_one(spool: RawSpool, store: BlobStore) -> IngestResult:
+    started = time.perf_counter()
+    try:
+        return decode_to_blob(spool, store)
+    except IngestError as exc:
+        return IngestFailure(spool.name, str(exc), exc.status_code, (time.perf_counter() - started) * 1000)
+
+
+@dataclass(frozen=True)
+class ArchiveLimits:
+    max_archive_bytes: int
+    max_entries: int
+    max_documents: int
+    max_uncompressed_bytes: int
+    max_member_bytes: int
+    spool_threshold_bytes: int
+
+    @classmethod
+    def from_settings(cls) -> "ArchiveLimits":
+        return cls(
+            max_archive_bytes=settings.archive_max_bytes,
+            max_entries=settings.archive_max_entries,
+            max_documents=settings.archive_max_documents,
+            max_uncompressed_bytes=settings.archive_max_uncompressed_bytes,
+            max_member_bytes=settings.upload_max_file_bytes,
+            spool_threshold_bytes=settings.upload_spool_threshold_bytes,
+        )
+
+
+ARCHIVE_TEXT_SUFFIXES = (".txt",)
+
+
+def ingest_archive(
+    archive: RawSpool,
+    store: BlobStore,
+    limits: ArchiveLimits,
+) -> Tuple[List[IngestedDocument], List[Dict[str, Any]]]:
+    """Потоково извлекает текстовые файлы zip/tar-архива и декодирует их параллельно.
+
+    Члены архива читаются по одному в спулы (на диск архив не распаковывается) и сразу
+    уходят в пул декодирования; одновременно в работе не больше двух спулов на поток
+    пула, поэтому память ограничена независимо от числа файлов. Нетекстовые файлы,
+    слишком крупные и недекодируемые файлы пропускаются с предупреждением; превышение
+    лимитов на число записей, документов и распакованный объём прерывает разбор.
+    """
+
+    member_limits = IngestLimits(
+        max_files=limits.max_documents,
+        max_file_bytes=limits.max_member_bytes,
+        max_request_bytes=limits.max_uncompressed_bytes,
+        spool_threshold_bytes=limits.spool_threshold_bytes,
+    )
+    slots = threading.BoundedSemaphore(2 * max(1, settings.upload_decode_workers))
+    futures = []
+    warnings: List[Dict[str, Any]] = []
+    entries = documents = unpacked = 0
+
+    def release(future: Any) -> None:
+        slots.release()
+
+    try:
+        for name, open_member in _archive_members(archive):
+            entries += 1
+            if entries > limits.max_entries:
+                raise IngestError(f"В архиве больше {limits.max_entries} записей", status_code=413)
+            if not name.lower().endswith(ARCHIVE_TEXT_SUFFIXES):
+                warnings.append({"name": name, "warning": "Пропущен: не текстовый файл"})
+                continue
+            documents += 1
+            if documents > limits.max_documents:
+                raise IngestError(f"В архиве больше {limits.max_documents} документов", status_code=413)
+            spool = RawSpool(name, member_limits)
+            oversized = False
+            try:
+                with open_member() as member:
+                    while chunk := member.read(_CHUNK_SIZE):
+                        unpacked += len(chunk)
+                        if unpacked > limits.max_uncompressed_bytes:
+                            raise IngestError(
+                                f"Распакованный объём архива превышает {limits.max_uncompressed_bytes} байт",
+                                status_code=413,
+                            )
+                        if spool.size + len(chunk) > limits.max_member_bytes:
+                            oversized = True
+                            break
+                        spool.write(chunk)
+            except (RuntimeError, NotImplementedError) as exc:
+                # Зашифрованный член zip-архива или неподдерживаемое сжатие.
+                spool.close()
+                warnings.append({"name": name, "warning": f"Пропущен: {exc}"})
+                continue
+            except BaseException:
+                spool.close()
+                raise
+            if oversized:
+                spool.close()
+                warnings.append(
+                    {"name": name, "warning": f"Пропущен: размер больше {limits.max_member_bytes} байт"}
+                )
+                continue
+            slots.acquire()
+            future = _decode_pool().submit(_ingest_and_close, spool, store)
+            future.add_done_callback(release)
+            futures.append(future)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as exc:
+        raise IngestError("Повреждённый архив") from exc
+    finally:
+        results = [future.result() for future in futures]
+
+    ingested: List[IngestedDocument] = []
+    for result in results:
+        if isinstance(result, IngestFailure):
+            warnings.append({"name": result.name, "warning": f"Пропущен: {result.error}"})
+        else:
+            ingested.append(result)
+    return ingested, warnings
+
+
+def _archive_members(archive: RawSpool) -> Iterator[Tuple[str, Callable[[], IO[bytes]]]]:
+    """(имя, открыть) для файлов архива по порядку; каталоги и ссылки пропускаются."""
+
+    fileobj = archive.fileobj()
+    if zipfile.is_zipfile(fileobj):
+        with zipfile.ZipFile(archive.fileobj()) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, (lambda info=info: zf.open(info))
+        return
+    fileobj.seek(0)
+    try:
+        # Потоковый режим "r|*": члены читаются последовательно, без произвольного доступа.
+        tar = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.TarError as exc:
+        raise IngestError("Ожидается zip или tar архив") from exc
+    with tar:
+        for member in tar:
+            if member.isfile():
+                yield member.name, (lambda member=member: tar.extractfile(member))
+
+
+def _ingest_and_close(spool: RawSpool, store: BlobStore) -> IngestResult:
+    try:
+        return _ingest_one(spool, store)
+    finally:
+        spool.close()
+
+
+def check_text_upload(filename: str, content_type: Optional[str]) -> None:
+    """Файл принимается, если это text/* или .txt (как и раньше)."""
+
+    if content_type and not content_type.startswith("text/"):
+        if not filename.lower().endswith(".txt"):
+            raise IngestError(NOT_TEXT_ERROR)
+
+
+class MultipartUploadReceiver:
+    """Разбирает multipart/form-data потоком и раскладывает файлы поля field_name по спулам.
+
+    Лимиты (число файлов, размер файла и всего запроса) проверяются по мере поступления
+    байт; остальные поля формы пропускаются.
+    """
+
+    def __init__(
+        self,
+        content_type: str,
+        limits: IngestLimits,
+        *,
+        field_name: str = "files",
+        validate: Optional[Callable[[str, Optional[str]], None]] = check_text_upload,
+    ):
+        mime, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if mime != b"multipart/form-data" or not boundary:
+            raise IngestError("Ожидается multipart/form-data")
+        self._limits = limits
+        self._field_name = field_name
+        self._validate = validate
+        self.spools: List[RawSpool] = []
+        self.received_bytes = 0
+        self._current: Optional[RawSpool] = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+
+    async def receive(self, stream: AsyncIterator[bytes]) -> List[RawSpool]:
+        try:
+            async for chunk in stream:
+                self._count(len(chunk))
+                self._parser.write(chunk)
+            self._parser.finalize()
+        except BaseException:
+            self.close()
+            raise
+        return self.spools
+
+    def close(self) -> None:
+        for spool in self.spools:
+            spool.close()
+        if self._current is not None and self._current not in self.spools:
+            self._current.close()
+
+    def _count(self, size: int) -> None:
+        self.received_bytes += size
+        if self.received_bytes > self._limits.max_request_bytes:
+            raise IngestError(
+                f"Размер загрузки превышает {self._limits.max_request_bytes} байт",
+                status_code=413,
+            )
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._current = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        field = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if field != self._field_name or filename is None:
+            return
+        if len(self.spools) >= self._limits.max_files:
+            raise IngestError("Слишком много документов", code="too_many_files")
+        name = filename.decode("utf-8", "replace") or "document.txt"
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        if self._validate is not None:
+            self._validate(name, content_type)
+        self._current = RawSpool(name, self._limits)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._current is not None:
+            self._current.write(data[start:end])
+
+    def _on_part_end(self) -> None:
+        if self._current is not None:
+            self.spools.append(self._current)
+            self._current = None
@@ -0,0 +1,296 @@
+"""Локальные эмбеддинги справок: хешированные n-граммы символов и слов с TF-IDF.
+
+Весь пакет текстов обрабатывается несколькими векторными операциями NumPy: тексты
+склеиваются в один массив кодов символов, хеши всех n-грамм считаются через префиксные
+суммы полиномиального хеша (по модулю 2^64), признаки раскладываются по 2^18 корзинам,
+взвешиваются сублинейным TF и IDF и проецируются в dim измерений со случайным знаком.
+Результат детерминирован, не требует сети, GPU и обучения. IDF корзин необязателен:
+его считает ``ingest_verdicts --fit-idf`` по выборке корпуса и сохраняет в
+data_dir/embeddings/idf.npy; без файла признаки взвешиваются только сублинейным TF.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ...core.config import settings
+
+MODEL_NAME = "hashing-tfidf-v1"
+
+_BUCKET_BITS = 18
+_BUCKETS = 1 << _BUCKET_BITS
+_CHAR_NGRAMS = (3, 4, 5)
+
+_BASE = 0x100000001B3
+_BASE_INV = pow(_BASE, -1, 1 << 64)
+# Соль типа признака: одинаковые строки-символьные n-граммы и слова не совпадают.
+_SALT_WORD = 0x9E3779B97F4A7C15
+_SALT_BIGRAM = 0xC2B2AE3D27D4EB4F
+_SALT_PROJECTION = 0x165667B19E3779F9
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё -> е, всё кроме букв и цифр — одиночный пробел; пробел по краям."""
+
+    return " " + _NON_WORD.sub(" ", text.lower().replace("ё", "е")).strip() + " "
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """Финализатор splitmix64: равномерно перемешивает биты хеша."""
+
+    z = values ^ (values >> np.uint64(30))
+    z = z * np.uint64(0xBF58476D1CE4E5B9)
+    z = z ^ (z >> np.uint64(27))
+    z = z * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class _Powers:
+    """Степени основания и обратного к нему по модулю 2^64, растущие по мере надобности."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.forward = np.ones(1, dtype=np.uint64)
+        self.inverse = np.ones(1, dtype=np.uint64)
+
+    def ensure(self, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        forward, inverse = self.forward, self.inverse
+        if len(forward) >= length:
+            return forward, inverse
+        with self._lock:
+            size = max(length, 2 * len(self.forward))
+            with np.errstate(over="ignore"):
+                forward = np.cumprod(np.full(size, _BASE, dtype=np.uint64), dtype=np.uint64)
+                inverse = np.cumprod(np.full(size, _BASE_INV, dtype=np.uint64), dtype=np.uint64)
+            self.forward = np.concatenate(([np.uint64(1)], forward[:-1]))
+            self.inverse = np.concatenate(([np.uint64(1)], inverse[:-1]))
+            return self.forward, self.inverse
+
+
+_POWERS = _Powers()
+
+
+class HashingVectorizer:
+    """Эмбеддинг текста фиксированной размерности без словаря и обучения.
+
+    idf — необязательные веса корзин (см. fit_idf); без них все признаки равноправны.
+    """
+
+    def __init__(self, dim: int = 128, idf: Optional[np.ndarray] = None):
+        if dim <= 0:
+            raise ValueError("dim должен быть положительным")
+        if idf is not None and idf.shape != (_BUCKETS,):
+            raise ValueError(f"idf должен иметь форму ({_BUCKETS},)")
+        self.dim = dim
+        self.idf = None if idf is None else idf.astype(np.float32)
+        buckets = _mix(np.arange(_BUCKETS, dtype=np.uint64) ^ np.uint64(_SALT_PROJECTION))
+        self._projection = (buckets % np.uint64(dim)).astype(np.int64)
+        self._signs = np.where(buckets >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        self.model = MODEL_NAME if self.idf is None else f"{MODEL_NAME}-idf-{self._idf_digest()}"
+
+    def _idf_digest(self) -> str:
+        assert self.idf is not None
+        return hashlib.blake2b(self.idf.tobytes(), digest_size=4).hexdigest()
+
+    def transform(self, texts: Sequence[str]) -> np.ndarray:
+        """Матрица (len(texts), dim) float32 с L2-нормированными строками."""
+
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        docs, buckets = self._features(texts)
+        if not len(buckets):
+            return out
+        keys, counts = np.unique(docs * _BUCKETS + buckets, return_counts=True)
+        docs, buckets = keys // _BUCKETS, keys % _BUCKETS
+        weights = (1.0 + np.log(counts)).astype(np.float32) * self._signs[buckets]
+        if self.idf is not None:
+            weights *= self.idf[buckets]
+        flat = np.bincount(docs * self.dim + self._projection[buckets], weights=weights, minlength=len(texts) * self.dim)
+        out[:] = flat.reshape(len(texts), self.dim)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    def fit_idf(self, texts: Sequence[str]) -> "HashingVectorizer":
+        """Новый векторизатор с IDF корзин, посчитанным по корпусу texts."""
+
+        return self.with_idf(self.document_frequencies(texts), len(texts))
+
+    def document_frequencies(self, texts: Sequence[str]) -> np.ndarray:
+        """В скольких текстах встречается каждая корзина; корпус считается пачками и складывается."""
+
+        docs, buckets = self._features(texts)
+        present = np.unique(docs * _BUCKETS + buckets) % _BUCKETS
+        return np.bincount(present, minlength=_BUCKETS)
+
+    def with_idf(self, df: np.ndarray, documents: int) -> "HashingVectorizer":
+        idf = np.log((1.0 + documents) / (1.0 + df)) + 1.0
+        return HashingVectorizer(self.dim, idf.astype(np.float32))
+
+    def _features(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Номер документа и корзина каждого признака пакета (с повторами)."""
+
+        normalized = [normalize_text(text) for text in texts]
+        lengths = np.fromiter((len(text) for text in normalized), dtype=np.int64, count=len(normalized))
+        codes = np.frombuffer("".join(normalized).encode("utf-32-le"), dtype="<u4").astype(np.uint64)
+        total = len(codes)
+        doc_of = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+        forward, inverse = _POWERS.ensure(total + 1)
+        # prefix[i] = sum(codes[k] * BASE^k, k < i); хеш отрезка [s, e) = (prefix[e] - prefix[s]) * BASE^-s.
+        prefix = np.zeros(total + 1, dtype=np.uint64)
+        np.cumsum(codes * forward[:total], out=prefix[1:])
+
+        def segment(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+            return (prefix[ends] - prefix[starts]) * inverse[starts]
+
+        doc_parts: List[np.ndarray] = []
+        hash_parts: List[np.ndarray] = []
+        for n in _CHAR_NGRAMS:
+            if total < n:
+                continue
+            starts = np.arange(total - n + 1, dtype=np.int64)
+            starts = starts[doc_of[starts] == doc_of[starts + n - 1]]
+            doc_parts.append(doc_of[starts])
+            hash_parts.append(segment(starts, starts + n) ^ np.uint64(n))
+
+        space = codes == np.uint64(32)
+        word_starts = np.flatnonzero(~space[1:] & space[:-1]) + 1
+        word_ends = np.flatnonzero(~space[:-1] & space[1:]) + 1
+        if len(word_starts):
+            word_docs = doc_of[word_starts]
+            doc_parts.append(word_docs)
+            hash_parts.append(segment(word_starts, word_ends) ^ np.uint64(_SALT_WORD))
+            same_doc = word_docs[:-1] == word_docs[1:]
+            doc_parts.append(word_docs[:-1][same_doc])
+            hash_parts.append(segment(word_starts[:-1][same_doc], word_ends[1:][same_doc]) ^ np.uint64(_SALT_BIGRAM))
+
+        if not hash_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        buckets = (_mix(np.concatenate(hash_parts)) & np.uint64(_BUCKETS - 1)).astype(np.int64)
+        return np.concatenate(doc_parts), buckets
+
+    def save_idf(self, path: Path) -> None:
+        if self.idf is None:
+            raise ValueError("IDF не посчитан")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npy")
+        np.save(tmp, self.idf)
+        tmp.replace(path)
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8", errors="surrogatepass"), digest_size=16).digest()
+
+
+class VectorCache:
+    """LRU векторов по хешу содержимого текста и модели."""
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Tuple[str, bytes], np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._items.get((model, key))
+            if vector is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end((model, key))
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, key: bytes, vector: np.ndarray) -> None:
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._items[(model, key)] = vector
+            self._items.move_to_end((model, key))
+            while len(self._items) > self._max_entries:
+                self._items.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "max_entries": self._max_entries, "hits": self.hits, "misses": self.misses}
+
+
+def idf_path() -> Path:
+    return Path(settings.data_dir) / "embeddings" / "idf.npy"
+
+
+_VECTORIZER: Optional[HashingVectorizer] = None
+_CACHE: Optional[VectorCache] = None
+_INIT_LOCK = threading.Lock()
+
+
+def get_vectorizer() -> HashingVectorizer:
+    """Векторизатор процесса; IDF подхватывается из data_dir/embeddings/idf.npy, если он есть."""
+
+    global _VECTORIZER
+    if _VECTORIZER is None:
+        with _INIT_LOCK:
+            if _VECTORIZER is None:
+                path = idf_path()
+                idf = np.load(path) if path.exists() else None
+                _VECTORIZER = HashingVectorizer(settings.embedding_dim, idf)
+    return _VECTORIZER
+
+
+def set_vectorizer(vectorizer: Optional[HashingVectorizer]) -> None:
+    """Подменяет векторизатор процесса (после подсчёта IDF); None — перечитать idf.npy."""
+
+    global _VECTORIZER
+    with _INIT_LOCK:
+        _VECTORIZER = vectorizer
+
+
+def get_vector_cache() -> VectorCache:
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = VectorCache(settings.embedding_cache_size)
+    return _CACHE
+
+
+def embed_texts(texts: Sequence[str]) -> Tuple[np.ndarray, int]:
+    """Векторы текстов (строки матрицы) и число взятых из кеша; промахи считаются одним пакетом."""
+
+    vectorizer = get_vectorizer()
+    cache = get_vector_cache()
+    keys = [text_key(text) for text in texts]
+    out = np.zeros((len(texts), vectorizer.dim), dtype=np.float32)
+    missing: List[int] = []
+    for row, key in enumerate(keys):
+        vector = cache.get(vectorizer.model, key)
+        if vector is None:
+            missing.append(row)
+        else:
+            out[row] = vector
+    if missing:
+        # Повторы внутри пакета векторизуются один раз.
+        unique: "OrderedDict[bytes, int]" = OrderedDict()
+        for row in missing:
+            unique.setdefault(keys[row], row)
+        matrix = vectorizer.transform([texts[row] for row in unique.values()])
+        # Копии строк: вид на строку держал бы в кеше всю матрицу пакета.
+        fresh = {key: row.copy() for key, row in zip(unique.keys(), matrix)}
+        for key, vector in fresh.items():
+            cache.put(vectorizer.model, key, vector)
+        for row in missing:
+            out[row] = fresh[keys[row]]
+    return out, len(texts) - len(missing)
+
+
+def embed_text(text: str) -> np.ndarray:
+    return embed_texts([text])[0][0]
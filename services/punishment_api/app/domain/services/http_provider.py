@@ -0,0 +1,405 @@
+"""HTTP-провайдер ИИ-анализов (OpenAI-совместимый /chat/completions) на asyncio + httpx."""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Coroutine, Dict, List, Optional, TypeVar
+
+import httpx
+
+from .ai_analysis_provider import PROMPT_VERSION, AIProviderResult
+from ..prompts import PROMPT_BUILDERS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Ответы, после которых имеет смысл повторить запрос.
+_RETRYABLE_STATUS = frozenset({408, 409, 425, 429, 500, 502, 503, 504})
+
+
+class ProviderError(RuntimeError):
+    """Провайдер не вернул пригодный ответ."""
+
+
+class ProviderUnavailableError(ProviderError):
+    """Автомат (circuit breaker) разомкнут: вызовы отклоняются без запроса к upstream."""
+
+
+class TokenBucket:
+    """Ограничение частоты запросов: rate токенов в секунду, не больше capacity подряд.
+
+    Используется только из цикла событий провайдера, поэтому без блокировок.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = max(1.0, capacity)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> float:
+        """Ждёт токен; возвращает время ожидания в секундах."""
+
+        if self._rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return waited
+            delay = (1 - self._tokens) / self._rate
+            waited += delay
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """closed -> open после threshold ошибок подряд; через cooldown — одна пробная попытка."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int, cooldown_seconds: float):
+        self._threshold = max(1, threshold)
+        self._cooldown = cooldown_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened_count = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self._cooldown:
+                return False
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self._failures >= self._threshold:
+            if self.state != self.OPEN:
+                self.opened_count += 1
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Пробная попытка завершилась без вердикта (например, ошибка клиента 4xx)."""
+
+        self._probe_in_flight = False
+
+
+class HttpAIProvider:
+    """Провайдер поверх HTTP API модели.
+
+    Запросы выполняются в собственном цикле событий (отдельный поток), поэтому пул
+    keep-alive соединений httpx общий для всех воркеров и синхронных запросов.
+    Для каждого вызова действует общий дедлайн timeout_seconds, включая повторы.
+    На модель — token bucket (rate_per_second/burst) и лимит одновременных запросов.
+    Повторы — с экспоненциальной задержкой и полным джиттером (учитывается Retry-After);
+    после breaker_threshold ошибок подряд автомат размыкается на breaker_cooldown_seconds.
+    """
+
+    name = "http"
+    prompt_version = PROMPT_VERSION
+
+    def __init__(
+        self,
+        *,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        timeout_seconds: float = 120.0,
+        connect_timeout_seconds: float = 5.0,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        rate_per_second: float = 0.0,
+        burst: int = 1,
+        max_concurrency: int = 8,
+        max_attempts: int = 4,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 10.0,
+        breaker_threshold: int = 5,
+        breaker_cooldown_seconds: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.model = model
+        self._base_url = base_url.rstrip("/")
+        self._api_key = api_key
+        self._timeout = timeout_seconds
+        self._connect_timeout = connect_timeout_seconds
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        )
+        self._rate = rate_per_second
+        self._burst = burst
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_attempts = max(1, max_attempts)
+        self._backoff_base = backoff_base_seconds
+        self._backoff_max = backoff_max_seconds
+        self._breaker = CircuitBreaker(breaker_threshold, breaker_cooldown_seconds)
+        self._transport = transport
+
+        self._start_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, Any] = {
+            "calls": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "attempts": 0,
+            "retries": 0,
+            "rejected_open_circuit": 0,
+            "rate_limited_wait_ms": 0.0,
+            "latency_ms_total": 0.0,
+            "in_flight": 0,
+        }
+
+    @classmethod
+    def from_settings(cls, config: Any) -> "HttpAIProvider":
+        return cls(
+            base_url=config.ai_http_base_url,
+            model=config.ai_http_model,
+            api_key=config.ai_http_api_key,
+            timeout_seconds=config.ai_http_timeout_seconds,
+            max_connections=config.ai_http_max_connections,
+            rate_per_second=config.ai_http_rate_per_second,
+            burst=config.ai_http_burst,
+            max_concurrency=config.ai_http_max_concurrency,
+            max_attempts=config.ai_http_max_attempts,
+            backoff_base_seconds=config.ai_http_backoff_base_seconds,
+            backoff_max_seconds=config.ai_http_backoff_max_seconds,
+            breaker_threshold=config.ai_http_breaker_threshold,
+            breaker_cooldown_seconds=config.ai_http_breaker_cooldown_seconds,
+        )
+
+    # --- Интерфейс AIProvider ---------------------------------------------------
+
+    def analyze_materials(self, documents_text: List[str], case_info: Optional[Dict[str, Any]] = None) -> AIProviderResult:
+        case_info = case_info or {}
+        documents = [{"name": f"document_{i + 1}", "text": text} for i, text in enumerate(documents_text)]
+        prompt = PROMPT_BUILDERS["materials"](case_info.get("erdr_number"), documents)
+        return self.complete(prompt, analysis_type="materials")
+
+    def analyze_risks(self, case_data: Optional[Dict[str, Any]] = None, materials_analysis: Optional[Dict[str, Any]] = None) -> AIProviderResult:
+        case_data = case_data or {}
+        prompt = PROMPT_BUILDERS["risk_analysis"](
+            case_data.get("report_text") or (materials_analysis or {}).get("report_text") or "",
+            case_data.get("similar_verdicts_summary"),
+            case_data.get("norms_summary"),
+        )
+        return self.complete(prompt, analysis_type="risk_analysis")
+
+    def analyze_similar_verdicts(self, verdicts_text: List[str], case_info: Optional[Dict[str, Any]] = None) -> AIProviderResult:
+        verdicts = [{"text": text} for text in verdicts_text]
+        prompt = PROMPT_BUILDERS["similar_verdicts"](case_info or {}, verdicts)
+        return self.complete(prompt, analysis_type="similar_verdicts")
+
+    def analyze_verdict(self, verdict_text: str, context: Optional[Dict[str, Any]] = None) -> AIProviderResult:
+        context = context or {}
+        prompt = PROMPT_BUILDERS["verdict_analysis"](
+            verdict_text,
+            context.get("original_request"),
+            context.get("speech_text"),
+            context.get("risk_analysis_result"),
+            context.get("draft_type"),
+        )
+        return self.complete(prompt, analysis_type="verdict_analysis")
+
+    # --- Выполнение -----------------------------------------------------------
+
+    def complete(self, prompt: Dict[str, str], *, analysis_type: str, model: Optional[str] = None) -> AIProviderResult:
+        """Синхронный вызов из потока воркера или запроса."""
+
+        return self.submit(prompt, analysis_type=analysis_type, model=model).result()
+
+    def submit(
+        self,
+        prompt: Dict[str, str],
+        *,
+        analysis_type: str,
+        model: Optional[str] = None,
+    ) -> "concurrent.futures.Future[AIProviderResult]":
+        """Ставит вызов в цикл провайдера; удобно для параллельных запросов из одного потока."""
+
+        return self._run(self.acomplete(prompt, analysis_type=analysis_type, model=model))
+
+    async def acomplete(
+        self,
+        prompt: Dict[str, str],
+        *,
+        analysis_type: str,
+        model: Optional[str] = None,
+    ) -> AIProviderResult:
+        model = model or self.model
+        body = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": prompt["system"]},
+                {"role": "user", "content": prompt["user"]},
+            ],
+            "response_format": {"type": "json_object"},
+            "metadata": {"analysis_type": analysis_type},
+        }
+        started = time.perf_counter()
+        self._stats["calls"] += 1
+        self._stats["in_flight"] += 1
+        try:
+            data = await self._post_with_retry(body, model)
+            content = self._parse_content(data)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._stats["in_flight"] -= 1
+            self._stats["latency_ms_total"] += (time.perf_counter() - started) * 1000
+        self._stats["succeeded"] += 1
+        return AIProviderResult(model=f"{self.name}/{data.get('model') or model}", content=content)
+
+    async def _post_with_retry(self, body: Dict[str, Any], model: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._timeout
+        bucket = self._buckets.setdefault(model, TokenBucket(self._rate, self._burst))
+        semaphore = self._semaphores.setdefault(model, asyncio.Semaphore(self._max_concurrency))
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(1, self._max_attempts + 1):
+            if not self._breaker.allow():
+                self._stats["rejected_open_circuit"] += 1
+                raise ProviderUnavailableError("Провайдер временно недоступен (circuit open)") from last_error
+            # Пробная попытка полуоткрытого автомата освобождается в finally: отмена
+            # (CancelledError) или неожиданная ошибка не оставят автомат закрытым для всех.
+            probe = self._breaker.state == CircuitBreaker.HALF_OPEN
+            try:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                retry_after: Optional[float] = None
+                self._stats["attempts"] += 1
+                try:
+                    async with asyncio.timeout(remaining):
+                        async with semaphore:
+                            self._stats["rate_limited_wait_ms"] += await bucket.acquire() * 1000
+                            response = await self._client.post("/chat/completions", json=body)
+                except (httpx.TransportError, TimeoutError) as exc:
+                    last_error = exc
+                else:
+                    if response.status_code < 400:
+                        self._breaker.record_success()
+                        return response.json()
+                    if response.status_code not in _RETRYABLE_STATUS:
+                        raise ProviderError(f"HTTP {response.status_code}: {response.text[:200]}")
+                    last_error = ProviderError(f"HTTP {response.status_code}")
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+
+                self._breaker.record_failure()
+            finally:
+                if probe:
+                    self._breaker.release()
+            if attempt == self._max_attempts:
+                break
+            delay = random.uniform(0, min(self._backoff_max, self._backoff_base * 2 ** (attempt - 1)))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if loop.time() + delay >= deadline:
+                break
+            self._stats["retries"] += 1
+            logger.warning("Provider attempt %d failed (%s), retry in %.2fs", attempt, last_error, delay)
+            await asyncio.sleep(delay)
+
+        raise ProviderError(f"Провайдер не ответил: {last_error}") from last_error
+
+    @staticmethod
+    def _parse_content(data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            content = data["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as exc:
+            raise ProviderError("Неожиданный формат ответа провайдера") from exc
+        if isinstance(content, dict):
+            return content
+        try:
+            parsed = json.loads(content)
+        except (TypeError, ValueError) as exc:
+            raise ProviderError("Провайдер вернул не JSON") from exc
+        if not isinstance(parsed, dict):
+            raise ProviderError("Провайдер вернул не JSON-объект")
+        return parsed
+
+    def _run(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _ensure_loop(self) -> None:
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="ai-http-provider", daemon=True)
+            thread.start()
+            self._loop, self._thread = loop, thread
+            asyncio.run_coroutine_threadsafe(self._open_client(), loop).result()
+
+    async def _open_client(self) -> None:
+        headers = {"Authorization": f"Bearer {self._api_key}"} if self._api_key else {}
+        self._client = httpx.AsyncClient(
+            base_url=self._base_url,
+            headers=headers,
+            limits=self._limits,
+            timeout=httpx.Timeout(self._timeout, connect=self._connect_timeout),
+            transport=self._transport,
+        )
+
+    def close(self) -> None:
+        with self._start_lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), loop).result()
+            self._client = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        done = stats["succeeded"] + stats["failed"]
+        stats["latency_ms_avg"] = round(stats.pop("latency_ms_total") / done, 3) if done else 0.0
+        stats["rate_limited_wait_ms"] = round(stats["rate_limited_wait_ms"], 3)
+        stats["circuit"] = {"state": self._breaker.state, "opened": self._breaker.opened_count}
+        stats["model"] = f"{self.name}/{self.model}"
+        return stats
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,201 @@
+"""Пул воркеров, выполняющих задачи из очереди: ИИ-анализы и генерацию речей."""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .ai_analysis_service import JOB_KIND_ANALYSIS, PRIORITY_ASYNC, SchedulerBusy, run_analysis
+from .speech_service import JOB_KIND_SPEECH, run_speech
+from ...core.config import settings
+from ...infrastructure.storage.job_queue import JobDeferred, JobRecord, JobStore, get_job_store
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[JobRecord], None]
+
+
+def _handle_analysis(job: JobRecord) -> None:
+    try:
+        run_analysis(
+            job.payload.get("analysis_id") or job.ref_id,
+            final_attempt=job.is_last_attempt,
+            priority=job.payload.get("priority") or PRIORITY_ASYNC,
+            wait=False,
+            takeover=job.attempts > 1,
+            wait_for_slot=False,
+        )
+    except SchedulerBusy as exc:
+        # Слоты класса заняты: воркер свободен для других задач, эта вернётся позже.
+        raise JobDeferred(str(exc), settings.job_busy_retry_ms / 1000) from exc
+
+
+def _handle_speech(job: JobRecord) -> None:
+    run_speech(
+        job.ref_id,
+        job.payload.get("payload") or {},
+        final_attempt=job.is_last_attempt,
+        wait=False,
+        takeover=job.attempts > 1,
+    )
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    JOB_KIND_ANALYSIS: _handle_analysis,
+    JOB_KIND_SPEECH: _handle_speech,
+}
+
+
+def retry_delay(attempts: int, base_seconds: float, max_seconds: float) -> float:
+    """Экспоненциальная задержка повтора с джиттером (половина — случайная)."""
+
+    delay = min(max_seconds, base_seconds * (2 ** max(0, attempts - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class JobWorkerPool:
+    def __init__(
+        self,
+        store: JobStore,
+        *,
+        workers: int,
+        lease_seconds: float,
+        poll_interval_ms: int,
+        backoff_base_seconds: float,
+        backoff_max_seconds: float,
+        handlers: Optional[Dict[str, JobHandler]] = None,
+    ):
+        self._store = store
+        self._workers = max(0, workers)
+        self._lease = max(1.0, float(lease_seconds))
+        self._poll = max(10, poll_interval_ms) / 1000
+        self._backoff_base = backoff_base_seconds
+        self._backoff_max = backoff_max_seconds
+        self._handlers = dict(handlers or JOB_HANDLERS)
+        self._prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._stats = {"completed": 0, "retried": 0, "failed": 0, "recovered": 0, "deferred": 0, "busy": 0}
+
+    def start(self) -> None:
+        if self._threads or not self._workers:
+            return
+        self._stop.clear()
+        self._add_stat("recovered", self._store.recover_expired_leases())
+        for n in range(self._workers):
+            thread = threading.Thread(
+                target=self._loop,
+                args=(f"{self._prefix}:{n}",),
+                name=f"job-worker-{n}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_pending(self, max_jobs: Optional[int] = None) -> int:
+        """Выполняет готовые задачи в текущем потоке, пока очередь не опустеет."""
+
+        self._add_stat("recovered", self._store.recover_expired_leases())
+        worker_id = f"{self._prefix}:inline"
+        done = 0
+        while max_jobs is None or done < max_jobs:
+            job = self._store.claim(worker_id, self._lease, self._handlers)
+            if job is None:
+                break
+            self._process(worker_id, job)
+            done += 1
+        return done
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["workers"] = len(self._threads)
+        stats["queue"] = self._store.counts()
+        return stats
+
+    def _add_stat(self, key: str, value: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _loop(self, worker_id: str) -> None:
+        next_recovery = time.monotonic() + self._lease
+        while not self._stop.is_set():
+            if time.monotonic() >= next_recovery:
+                self._add_stat("recovered", self._store.recover_expired_leases())
+                next_recovery = time.monotonic() + self._lease
+            try:
+                job = self._store.claim(worker_id, self._lease, self._handlers)
+            except Exception:
+                logger.exception("Job claim failed")
+                job = None
+            if job is None:
+                self._store.wait_for_job(self._poll)
+                continue
+            self._process(worker_id, job)
+
+    def _process(self, worker_id: str, job: JobRecord) -> None:
+        handler = self._handlers[job.kind]
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat,
+            args=(job.id, worker_id, heartbeat_stop),
+            name=f"job-heartbeat-{job.id[:8]}",
+            daemon=True,
+        )
+        heartbeat.start()
+        self._add_stat("busy")
+        try:
+            handler(job)
+        except JobDeferred as exc:
+            self._store.defer(job.id, worker_id, exc.delay)
+            self._add_stat("deferred")
+        except Exception as exc:
+            if job.is_last_attempt:
+                logger.exception("Job %s (%s) failed permanently", job.id, job.kind)
+                self._store.fail(job.id, worker_id, str(exc), None)
+                self._add_stat("failed")
+            else:
+                delay = retry_delay(job.attempts, self._backoff_base, self._backoff_max)
+                logger.warning("Job %s (%s) failed, retry in %.1fs: %s", job.id, job.kind, delay, exc)
+                self._store.fail(job.id, worker_id, str(exc), delay)
+                self._add_stat("retried")
+        else:
+            self._store.complete(job.id, worker_id)
+            self._add_stat("completed")
+        finally:
+            self._add_stat("busy", -1)
+            heartbeat_stop.set()
+            heartbeat.join()
+
+    def _heartbeat(self, job_id: str, worker_id: str, stop: threading.Event) -> None:
+        while not stop.wait(self._lease / 3):
+            self._store.extend_lease(job_id, worker_id, self._lease)
+
+
+_POOL: Optional[JobWorkerPool] = None
+
+
+def get_worker_pool(workers: Optional[int] = None) -> JobWorkerPool:
+    global _POOL
+    if _POOL is None:
+        _POOL = JobWorkerPool(
+            get_job_store(),
+            workers=settings.job_workers if workers is None else workers,
+            lease_seconds=settings.job_lease_seconds,
+            poll_interval_ms=settings.job_poll_interval_ms,
+            backoff_base_seconds=settings.job_backoff_base_seconds,
+            backoff_max_seconds=settings.job_backoff_max_seconds,
+        )
+    return _POOL
@@ -0,0 +1,349 @@
+"""Map-reduce анализ материалов: документы режутся на чанки по оценке токенов,
+чанки анализируются параллельно, частичные справки сводятся в одну.
+
+Частичные анализы привязаны к хешу содержимого документа, поэтому при повторной загрузке
+дела заново анализируются только новые и изменённые документы."""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Container, Dict, List, Mapping, Optional, Sequence
+
+from .ai_analysis_provider import AIProvider, AIProviderResult
+from .single_flight import input_fingerprint
+
+
+@dataclass(frozen=True)
+class MaterialsChunk:
+    """Часть одного документа, анализируемая отдельным map-вызовом."""
+
+    index: int
+    document: str
+    doc_hash: str
+    part: int
+    part_count: int
+    text: str
+    tokens: int
+
+    @property
+    def name(self) -> str:
+        if self.part_count == 1:
+            return self.document
+        return f"{self.document} (часть {self.part}/{self.part_count})"
+
+
+def document_hash(text: str) -> str:
+    """Хеш содержимого документа; незначимые различия (CRLF, краевые пробелы, NFC) не учитываются."""
+
+    return input_fingerprint(text)
+
+
+def estimate_tokens(text: str, chars_per_token: float) -> int:
+    """Грубая оценка числа токенов по длине текста."""
+
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Режет текст на куски до max_chars: по абзацам, затем по строкам, затем по символам."""
+
+    if len(text) <= max_chars:
+        return [text]
+    units: List[str] = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for line in paragraph.split("\n"):
+            if len(line) <= max_chars:
+                units.append(line)
+            else:
+                units.extend(line[i : i + max_chars] for i in range(0, len(line), max_chars))
+    return _pack(units, "\n\n", max_chars)
+
+
+def _pack(units: Sequence[str], separator: str, max_chars: int) -> List[str]:
+    packed: List[str] = []
+    current = ""
+    for unit in units:
+        joined = f"{current}{separator}{unit}" if current else unit
+        if len(joined) <= max_chars:
+            current = joined
+            continue
+        if current:
+            packed.append(current)
+        current = unit
+    if current:
+        packed.append(current)
+    return packed
+
+
+def build_chunks(
+    documents: Sequence[Dict[str, Any]],
+    *,
+    chunk_tokens: int,
+    max_tokens: int,
+    chars_per_token: float,
+    skip_hashes: Container[str] = (),
+    doc_hashes: Optional[Sequence[str]] = None,
+) -> tuple[List[MaterialsChunk], List[str]]:
+    """Режет документы на чанки не больше chunk_tokens.
+
+    Чанк не смешивает документы, поэтому частичный анализ относится к одному документу и
+    переиспользуется при следующей загрузке дела. Документы из skip_hashes (уже
+    проанализированные) и повторы в наборе пропускаются; doc_hashes — заранее посчитанные
+    хеши документов. Документы, не помещающиеся в
+    лимит max_tokens, не анализируются и возвращаются вторым элементом.
+    """
+
+    max_chars = max(1, int(chunk_tokens * chars_per_token))
+    chunks: List[MaterialsChunk] = []
+    skipped: List[str] = []
+    seen = set()
+    total = 0
+    for position, doc in enumerate(documents):
+        name = _document_name(doc, position)
+        text = str(doc.get("text") or "")
+        doc_hash = doc_hashes[position] if doc_hashes is not None else document_hash(text)
+        if doc_hash in seen or doc_hash in skip_hashes:
+            continue
+        seen.add(doc_hash)
+        pieces = split_text(text, max_chars)
+        tokens = [estimate_tokens(piece, chars_per_token) for piece in pieces]
+        if total + sum(tokens) > max_tokens:
+            skipped.append(name)
+            continue
+        total += sum(tokens)
+        for number, (piece, piece_tokens) in enumerate(zip(pieces, tokens), start=1):
+            chunks.append(
+                MaterialsChunk(
+                    index=len(chunks),
+                    document=name,
+                    doc_hash=doc_hash,
+                    part=number,
+                    part_count=len(pieces),
+                    text=piece,
+                    tokens=piece_tokens,
+                )
+            )
+    return chunks, skipped
+
+
+def run_materials_pipeline(
+    provider: AIProvider,
+    documents: Sequence[Dict[str, Any]],
+    case_info: Optional[Dict[str, Any]],
+    *,
+    chunk_tokens: int,
+    max_tokens: int,
+    concurrency: int,
+    chars_per_token: float,
+    doc_hashes: Optional[Sequence[str]] = None,
+    known_partials: Optional[Mapping[str, Dict[str, Any]]] = None,
+    on_document: Optional[Callable[[str, str, Optional[str], List[Dict[str, Any]]], None]] = None,
+) -> Dict[str, Any]:
+    """Map: справка по каждому чанку параллельно; reduce: сводная справка по частичным.
+
+    known_partials — ранее полученные частичные анализы {doc_hash: {"ai_model", "parts"}};
+    такие документы на map-шаг не отправляются. on_document(doc_hash, name, model, parts)
+    вызывается, как только готовы все части нового документа. Лимит max_tokens ограничивает
+    и объём документов на map-шаге, и каждый reduce-вызов: краткие частичные справки, не
+    помещающиеся в лимит, сводятся по уровням (см. reduce_digests). Время каждого чанка
+    пишется в result["pipeline"]["chunks"].
+    """
+
+    started = time.perf_counter()
+    known = dict(known_partials or {})
+    hashes = list(doc_hashes) if doc_hashes is not None else [document_hash(str(doc.get("text") or "")) for doc in documents]
+    chunks, skipped = build_chunks(
+        documents,
+        chunk_tokens=chunk_tokens,
+        max_tokens=max_tokens,
+        chars_per_token=chars_per_token,
+        skip_hashes=known,
+        doc_hashes=hashes,
+    )
+
+    map_started = time.perf_counter()
+    fresh: Dict[str, Dict[str, Any]] = {}
+    timings: Dict[int, float] = {}
+    if chunks:
+        remaining = Counter(chunk.doc_hash for chunk in chunks)
+        results: Dict[int, AIProviderResult] = {}
+        workers = max(1, min(concurrency, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="materials-map") as pool:
+            futures = {pool.submit(_map_chunk, provider, chunk, case_info): chunk for chunk in chunks}
+            try:
+                for future in as_completed(futures):
+                    chunk = futures[future]
+                    results[chunk.index], timings[chunk.index] = future.result()
+                    remaining[chunk.doc_hash] -= 1
+                    if remaining[chunk.doc_hash]:
+                        continue
+                    parts = [c for c in chunks if c.doc_hash == chunk.doc_hash]
+                    fresh[chunk.doc_hash] = {
+                        "ai_model": results[chunk.index].model,
+                        "parts": [results[c.index].content for c in parts],
+                    }
+                    if on_document is not None:
+                        on_document(chunk.doc_hash, chunk.document, results[chunk.index].model, fresh[chunk.doc_hash]["parts"])
+            except BaseException:
+                # Ошибка одного чанка обрывает анализ: ещё не начатые чанки не тратят вызовы провайдера.
+                for pending in futures:
+                    pending.cancel()
+                raise
+    map_ms = (time.perf_counter() - map_started) * 1000
+
+    # Частичные анализы в порядке документов дела: новые и переиспользованные вперемешку.
+    partials: List[tuple[str, Dict[str, Any]]] = []
+    model: Optional[str] = None
+    analyzed: Dict[str, str] = {}
+    for position, (doc, doc_hash) in enumerate(zip(documents, hashes)):
+        entry = fresh.get(doc_hash) or known.get(doc_hash)
+        if entry is None or doc_hash in analyzed:
+            continue
+        name = _document_name(doc, position)
+        analyzed[doc_hash] = name
+        model = model or entry.get("ai_model")
+        parts = entry.get("parts") or []
+        for number, content in enumerate(parts, start=1):
+            label = name if len(parts) == 1 else f"{name} (часть {number}/{len(parts)})"
+            partials.append((label, content))
+
+    reduce_ms = 0.0
+    reduce_tokens = 0
+    reduce_levels = 0
+    if len(partials) > 1:
+        digests = [_partial_digest(number, label, content) for number, (label, content) in enumerate(partials, start=1)]
+        reduce_started = time.perf_counter()
+        result, reduce_levels, reduce_tokens = reduce_digests(
+            provider, digests, case_info, max_tokens=max_tokens, chars_per_token=chars_per_token
+        )
+        reduce_ms = (time.perf_counter() - reduce_started) * 1000
+        model = result.model
+        content = _merge(result.content, [content for _, content in partials])
+    elif partials:
+        content = dict(partials[0][1])
+    else:
+        result = provider.analyze_materials([], case_info)
+        model = result.model
+        content = dict(result.content)
+
+    content["documents_analyzed"] = len(analyzed)
+    content["pipeline"] = {
+        "chunk_count": len(chunks),
+        "chunk_token_budget": chunk_tokens,
+        "token_cap": max_tokens,
+        "map_tokens": sum(chunk.tokens for chunk in chunks),
+        "reduce_tokens": reduce_tokens,
+        "reduce_levels": reduce_levels,
+        "new_documents": len(fresh),
+        "reused_documents": sum(1 for doc_hash in analyzed if doc_hash not in fresh),
+        "skipped_documents": skipped,
+        "truncated": bool(skipped),
+        "map_ms": round(map_ms, 3),
+        "reduce_ms": round(reduce_ms, 3),
+        "total_ms": round((time.perf_counter() - started) * 1000, 3),
+        "chunks": [
+            {
+                "index": chunk.index,
+                "document": chunk.name,
+                "tokens": chunk.tokens,
+                "elapsed_ms": round(timings.get(chunk.index, 0.0), 3),
+            }
+            for chunk in chunks
+        ],
+    }
+    return {"model": model, "content": content}
+
+
+def _document_name(doc: Dict[str, Any], position: int) -> str:
+    return str(doc.get("name") or f"document_{position + 1}")
+
+
+def _map_chunk(
+    provider: AIProvider,
+    chunk: MaterialsChunk,
+    case_info: Optional[Dict[str, Any]],
+) -> tuple[AIProviderResult, float]:
+    started = time.perf_counter()
+    result = provider.analyze_materials([chunk.text], case_info)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def reduce_digests(
+    provider: AIProvider,
+    digests: Sequence[str],
+    case_info: Optional[Dict[str, Any]],
+    *,
+    max_tokens: int,
+    chars_per_token: float,
+) -> tuple[AIProviderResult, int, int]:
+    """Сводит частичные справки так, чтобы ни один вызов не превышал max_tokens.
+
+    Справка длиннее половины лимита обрезается, поэтому в группу входят минимум две и
+    число справок на каждом уровне сокращается. Группы одного уровня сводятся в
+    промежуточные справки, пока всё не поместится в один вызов.
+    Возвращает (итоговый результат, число уровней, токенов отправлено на reduce).
+    """
+
+    max_chars = max(1, int(max(1, max_tokens // 2) * chars_per_token))
+    current = [digest[:max_chars] for digest in digests]
+    levels = 0
+    sent = 0
+    while True:
+        levels += 1
+        tokens = [estimate_tokens(digest, chars_per_token) for digest in current]
+        if sum(tokens) <= max_tokens or len(current) <= 2:
+            sent += sum(tokens)
+            return provider.analyze_materials(list(current), case_info), levels, sent
+        groups: List[List[str]] = [[]]
+        used = 0
+        for digest, digest_tokens in zip(current, tokens):
+            if groups[-1] and used + digest_tokens > max_tokens:
+                groups.append([])
+                used = 0
+            groups[-1].append(digest)
+            used += digest_tokens
+        reduced: List[str] = []
+        for number, group in enumerate(groups, start=1):
+            if len(group) == 1:
+                reduced.append(group[0])
+                continue
+            sent += sum(estimate_tokens(digest, chars_per_token) for digest in group)
+            result = provider.analyze_materials(group, case_info)
+            reduced.append(_partial_digest(number, f"сводка уровня {levels}", result.content)[:max_chars])
+        current = reduced
+
+
+def _partial_digest(number: int, label: str, content: Dict[str, Any]) -> str:
+    lines = [f"Фрагмент {number} ({label})"]
+    if content.get("summary"):
+        lines.append(f"Справка: {content['summary']}")
+    if content.get("key_facts"):
+        lines.append(f"Факты: {content['key_facts']}")
+    for title, key in (("Риски", "risks"), ("Рекомендации", "recommendations")):
+        items = [str(item) for item in content.get(key) or []]
+        if items:
+            lines.append(f"{title}: " + "; ".join(items))
+    return "\n".join(lines)
+
+
+def _merge(reduced: Dict[str, Any], partials: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Сводная справка reduce-шага, дополненная рисками и рекомендациями всех чанков."""
+
+    merged = dict(reduced)
+    for key in ("risks", "recommendations"):
+        seen: Dict[str, Any] = {}
+        for source in (reduced, *partials):
+            for item in source.get(key) or []:
+                seen.setdefault(str(item), item)
+        merged[key] = list(seen.values())
+    if not merged.get("key_facts"):
+        facts = [str(p["key_facts"]) for p in partials if p.get("key_facts")]
+        merged["key_facts"] = "\n".join(facts)
+    return merged
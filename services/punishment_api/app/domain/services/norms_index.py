@@ -0,0 +1,291 @@
+"""Поиск нормативных постановлений (НПА) по тексту справки: BM25 по инвертированному индексу.
+
+Токенизатор: нижний регистр, ё -> е, слова из букв и цифр (номера статей сохраняются),
+без стоп-слов; у кириллических слов отсекается самое длинное словоизменительное
+окончание, если остаётся основа не короче трёх букв («хищениях», «хищения» -> «хищен»).
+Постинги терминов — массивы номеров документов и частот, открытые в память; запрос
+складывает вклады BM25 своих терминов через np.bincount и берёт top-k argpartition.
+Длинная справка ограничивается max_query_terms терминами с наибольшим IDF: частые
+слова почти не влияют на ранжирование, но дают самые длинные списки.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ...core.config import settings
+from ...infrastructure.storage.inverted_index import InvertedArrays, InvertedIndexStore
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+_STOPWORDS = frozenset(
+    """
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже
+    для до его ее ей если есть еще же за и из или им их к как какой когда кто ли либо между
+    мы на над не нет него нее ни них но о об от по под после при про с со так также такой
+    там то того тоже только том тот у уже чем что чтобы эти этим это этого этой этом этот
+    """.split()
+)
+
+# Окончания существительных, прилагательных, причастий и глаголов по длине; длинные
+# проверяются первыми.
+_SUFFIXES = """
+    иями ями ами иях ием ого его ому ему ыми ими ией ость ости остью ться ется ится ают яют
+    ует ешь ишь ала ила ыла ена ено ены ая яя ое ее ые ие ии ый ий ой ей ом ем ам ям ах ях
+    ию ия ью ть ов ев ую юю ут ют ат ят ет ит а я о е ы и у ю ь
+""".split()
+_SUFFIXES_BY_LENGTH = tuple(
+    (length, frozenset(suffix for suffix in _SUFFIXES if len(suffix) == length))
+    for length in sorted({len(suffix) for suffix in _SUFFIXES}, reverse=True)
+)
+_MIN_STEM = 3
+
+
+@lru_cache(maxsize=1 << 18)
+def stem(word: str) -> str:
+    if len(word) <= _MIN_STEM + 1 or not _CYRILLIC_RE.match(word):
+        return word
+    for length, suffixes in _SUFFIXES_BY_LENGTH:
+        if len(word) - length >= _MIN_STEM and word[-length:] in suffixes:
+            return word[:-length]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Термины текста в порядке появления (с повторами)."""
+
+    words = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return [stem(word) for word in words if word not in _STOPWORDS and (len(word) > 1 or word.isdigit())]
+
+
+def _decree_text(doc: Dict[str, Any]) -> str:
+    return " ".join(str(doc.get(key) or "") for key in ("title", "subtitle", "summary", "text"))
+
+
+def _public(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Полный текст нужен только для индексации; в docs.json — то, что отдаёт API
+    # (subtitle в ответе обязателен, у НПА без подзаголовка он пустой).
+    public = {key: doc[key] for key in ("id", "title", "summary") if doc.get(key) is not None}
+    return {**public, "subtitle": str(doc.get("subtitle") or "")}
+
+
+class NormsIndex:
+    """BM25 (k1, b) по постингам InvertedArrays."""
+
+    def __init__(self, arrays: InvertedArrays, *, k1: float = 1.2, b: float = 0.75):
+        self.arrays = arrays
+        self.k1 = k1
+        self.b = b
+        doc_len = np.asarray(arrays.doc_len, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if len(doc_len) else 1.0
+        # Знаменатель BM25 без tf считается один раз при загрузке.
+        self._norm = (k1 * (1 - b + b * doc_len / max(avgdl, 1e-9))).astype(np.float32)
+        counts = np.diff(np.asarray(arrays.offsets))
+        self._idf = np.log1p((self.size - counts + 0.5) / (counts + 0.5)).astype(np.float32)
+
+    @property
+    def size(self) -> int:
+        return len(self.arrays.docs)
+
+    @property
+    def generation(self) -> int:
+        return self.arrays.generation
+
+    @classmethod
+    def build(cls, decrees: Iterable[Dict[str, Any]], store: InvertedIndexStore, **options: Any) -> "NormsIndex":
+        """Строит индекс по НПА (title, subtitle, summary, text), сохраняет новым поколением."""
+
+        docs: List[Dict[str, Any]] = []
+        vocabulary: Dict[str, int] = {}
+        term_ids: List[np.ndarray] = []
+        doc_ids: List[np.ndarray] = []
+        tfs: List[np.ndarray] = []
+        lengths: List[int] = []
+        for doc in decrees:
+            if not doc.get("title"):
+                raise ValueError("У НПА должен быть title")
+            tokens = tokenize(_decree_text(doc))
+            counts = Counter(tokens)
+            term_ids.append(np.fromiter((vocabulary.setdefault(term, len(vocabulary)) for term in counts), dtype=np.int64, count=len(counts)))
+            tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            doc_ids.append(np.full(len(counts), len(docs), dtype=np.int32))
+            lengths.append(len(tokens))
+            docs.append(_public({**doc, "id": str(doc.get("id") or len(docs))}))
+
+        terms = sorted(vocabulary)
+        # Номера терминов — по алфавиту, постинги — по (термин, документ).
+        remap = np.empty(len(terms), dtype=np.int64)
+        remap[[vocabulary[term] for term in terms]] = np.arange(len(terms))
+        all_terms = remap[np.concatenate(term_ids)] if term_ids else np.empty(0, dtype=np.int64)
+        all_docs = np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int32)
+        all_tf = np.concatenate(tfs) if tfs else np.empty(0, dtype=np.float32)
+        order = np.lexsort((all_docs, all_terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_terms, minlength=len(terms)), out=offsets[1:])
+        store.write(
+            terms,
+            offsets,
+            all_docs[order],
+            all_tf[order],
+            np.asarray(lengths, dtype=np.float32),
+            docs,
+            {"tokenizer": "ru-light-v1"},
+        )
+        arrays = store.load()
+        assert arrays is not None
+        return cls(arrays, **options)
+
+    def search(self, text: str, limit: int = 10, *, max_query_terms: int = 64) -> List[Tuple[int, float]]:
+        """(номер документа, оценка BM25) по убыванию оценки; пусто, если нет общих терминов."""
+
+        counts = Counter(tokenize(text))
+        known = [(self.arrays.terms[term], count) for term, count in counts.items() if term in self.arrays.terms]
+        if not known or not self.size:
+            return []
+        ids = np.asarray([term for term, _ in known], dtype=np.int64)
+        weights = self._idf[ids] * (1 + np.log(np.asarray([count for _, count in known], dtype=np.float32)))
+        if len(ids) > max_query_terms:
+            keep = np.argpartition(-self._idf[ids], max_query_terms - 1)[:max_query_terms]
+            ids, weights = ids[keep], weights[keep]
+
+        offsets = self.arrays.offsets
+        docs_parts: List[np.ndarray] = []
+        score_parts: List[np.ndarray] = []
+        for term, weight in zip(ids.tolist(), weights.tolist()):
+            start, end = int(offsets[term]), int(offsets[term + 1])
+            docs = self.arrays.postings_docs[start:end]
+            tf = self.arrays.postings_tf[start:end]
+            docs_parts.append(docs)
+            score_parts.append(weight * tf * (self.k1 + 1) / (tf + self._norm[docs]))
+        scores = np.bincount(np.concatenate(docs_parts), weights=np.concatenate(score_parts), minlength=self.size)
+        take = min(limit, int(np.count_nonzero(scores)))
+        if take <= 0:
+            return []
+        best = np.argpartition(-scores, take - 1)[:take]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(row), float(scores[row])) for row in best]
+
+    def find(self, text: str, limit: int = 10, *, max_query_terms: int = 64, high_ratio: float = 0.6) -> List[Dict[str, Any]]:
+        """НПА для ответа API: relevance high — оценка не ниже high_ratio от лучшей, иначе medium."""
+
+        found = self.search(text, limit, max_query_terms=max_query_terms)
+        if not found:
+            return []
+        best = found[0][1]
+        return [
+            {**self.arrays.docs[row], "relevance": "high" if score >= high_ratio * best else "medium", "score": round(score, 4)}
+            for row, score in found
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "terms": len(self.arrays.terms),
+            "postings": int(len(self.arrays.postings_docs)),
+            "generation": self.generation,
+            "array_bytes": self.arrays.nbytes,
+            "k1": self.k1,
+            "b": self.b,
+        }
+
+
+def read_decrees(source: Path) -> List[Dict[str, Any]]:
+    """НПА из JSONL (по объекту на строку) или каталога *.txt (первая строка — title, вторая — subtitle)."""
+
+    source = Path(source)
+    if source.is_dir():
+        decrees = []
+        for path in sorted(source.rglob("*.txt")):
+            text = path.read_text(encoding="utf-8", errors="replace").strip()
+            lines = [line.strip() for line in text.splitlines() if line.strip()]
+            if not lines:
+                continue
+            decrees.append(
+                {
+                    "id": path.relative_to(source).as_posix(),
+                    "title": lines[0],
+                    "subtitle": lines[1] if len(lines) > 1 else "",
+                    "text": text,
+                }
+            )
+        return decrees
+    with source.open(encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def norms_index_dir() -> Path:
+    return Path(settings.norms_index_dir or Path(settings.data_dir) / "norms_index")
+
+
+_INDEX: Optional[NormsIndex] = None
+_LOADED = False
+# Поколение на диске, с которым сверялся процесс; индекс, подменённый set_norms_index,
+# перечитывается только когда на диске появится новое поколение.
+_SEEN_GENERATION = 0
+_INDEX_LOCK = threading.Lock()
+
+
+def _disk_generation() -> int:
+    current = InvertedIndexStore(norms_index_dir()).current()
+    return int(current["generation"]) if current else 0
+
+
+def load_norms_index() -> Optional[NormsIndex]:
+    arrays = InvertedIndexStore(norms_index_dir()).load()
+    if arrays is None:
+        return None
+    return NormsIndex(arrays, k1=settings.norms_bm25_k1, b=settings.norms_bm25_b)
+
+
+def get_norms_index() -> Optional[NormsIndex]:
+    """Индекс НПА процесса; None, если он не построен. Новое поколение на диске подхватывается."""
+
+    global _INDEX, _LOADED, _SEEN_GENERATION
+    if _LOADED and settings.norms_index_autoreload and _disk_generation() != _SEEN_GENERATION:
+        _LOADED = False
+    if not _LOADED:
+        with _INDEX_LOCK:
+            if not _LOADED:
+                _SEEN_GENERATION = _disk_generation()
+                _INDEX = load_norms_index()
+                _LOADED = True
+    return _INDEX
+
+
+def set_norms_index(index: Optional[NormsIndex]) -> None:
+    """Подменяет индекс процесса (после перестройки или в тестах)."""
+
+    global _INDEX, _LOADED, _SEEN_GENERATION
+    with _INDEX_LOCK:
+        _INDEX = index
+        _SEEN_GENERATION = _disk_generation()
+        _LOADED = True
+
+
+def find_norms(text: str, limit: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+    """НПА по тексту справки; None — индекс не построен (вызывающий решает, чем ответить)."""
+
+    index = get_norms_index()
+    if index is None or not index.size:
+        return None
+    return index.find(
+        text,
+        limit or settings.norms_top_k,
+        max_query_terms=settings.norms_max_query_terms,
+        high_ratio=settings.norms_high_relevance_ratio,
+    )
+
+
+def build_norms_index(decrees: Sequence[Dict[str, Any]]) -> NormsIndex:
+    index = NormsIndex.build(decrees, InvertedIndexStore(norms_index_dir()), k1=settings.norms_bm25_k1, b=settings.norms_bm25_b)
+    set_norms_index(index)
+    return index
@@ -0,0 +1,61 @@
+"""Общие части дедупликации одинаковых запросов: нормализация входа и ожидание результата."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import unicodedata
+from typing import Any, Callable, Container, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Параметры запроса, не влияющие на результат генерации.
+_TRANSPORT_PARAMS = frozenset({"mode"})
+
+
+def normalize_input(value: Any) -> Any:
+    """Приводит входные параметры к каноническому виду.
+
+    Строки — NFC, без краевых пробелов и с переводами строк \\n; пустые значения
+    (None) и транспортные параметры (mode) отбрасываются. Порядок списков сохраняется.
+    """
+
+    if isinstance(value, dict):
+        return {
+            str(k): normalize_input(v)
+            for k, v in value.items()
+            if v is not None and k not in _TRANSPORT_PARAMS
+        }
+    if isinstance(value, (list, tuple)):
+        return [normalize_input(v) for v in value]
+    if isinstance(value, str):
+        return unicodedata.normalize("NFC", value.replace("\r\n", "\n")).strip()
+    return value
+
+
+def input_fingerprint(material: Any) -> str:
+    """sha256 канонического JSON от нормализованного значения."""
+
+    canonical = json.dumps(normalize_input(material), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def wait_until_settled(
+    load: Callable[[], Optional[T]],
+    in_flight: Container[str],
+    *,
+    timeout: float,
+    poll_interval: float = 0.05,
+) -> Optional[T]:
+    """Ждёт, пока запись, выполняемая другим вызовом, выйдет из статусов in_flight.
+
+    Возвращает последнюю прочитанную запись (по таймауту — возможно, ещё незавершённую).
+    """
+
+    deadline = time.monotonic() + timeout
+    record = load()
+    while record is not None and record.status in in_flight and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        record = load()
+    return record
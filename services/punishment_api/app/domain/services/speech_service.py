@@ -4,21 +4,59 @@ import time
 import uuid
 from typing import Any, Dict, Optional
 
-from ...infrastructure.storage.speech_storage import get_speech_store
+from .single_flight import input_fingerprint, wait_until_settled
+from ...core.config import settings
+from ...infrastructure.storage.job_queue import get_job_store
+from ...infrastructure.storage.speech_storage import IN_FLIGHT_STATUSES, get_speech_store
+
+JOB_KIND_SPEECH = "speech"
 
 
 def start_speech(case_id: Optional[str], payload: Dict[str, Any], created_by: Optional[str] = None) -> str:
+    """Создаёт речь или возвращает id уже генерируемой речи с тем же входом."""
+
     store = get_speech_store()
-    speech = store.create_speech(case_id, created_by=created_by)
+    input_hash = input_fingerprint({"case_id": case_id, "payload": payload})
+    speech, _attached = store.create_or_attach(case_id, created_by, input_hash)
     return speech.id
 
 
-def run_speech(speech_id: str, payload: Dict[str, Any]) -> None:
+def enqueue_speech(speech_id: str, payload: Dict[str, Any]) -> None:
+    """Ставит генерацию речи в очередь фоновых задач (см. job_worker)."""
+
+    record = get_speech_store().get_speech(speech_id)
+    if record and record.status != "pending":
+        return
+    job_store = get_job_store()
+    if job_store.has_active(JOB_KIND_SPEECH, speech_id):
+        return
+    job_store.enqueue(JOB_KIND_SPEECH, speech_id, {"speech_id": speech_id, "payload": payload})
+
+
+def run_speech(
+    speech_id: str,
+    payload: Dict[str, Any],
+    *,
+    final_attempt: bool = True,
+    wait: bool = True,
+    takeover: bool = False,
+) -> None:
+    """Генерирует речь; если её уже генерирует другой вызов — ждёт результата (wait=True)."""
+
     store = get_speech_store()
     record = store.get_speech(speech_id)
     if not record:
         return
 
+    if not store.mark_processing(speech_id, takeover=takeover):
+        if wait:
+            wait_until_settled(
+                lambda: store.get_speech(speech_id),
+                IN_FLIGHT_STATUSES,
+                timeout=settings.single_flight_wait_seconds,
+            )
+        return
+
     start = time.time()
     try:
         content = _render_mock_speech(payload)
@@ -35,6 +73,9 @@ def run_speech(speech_id: str, payload: Dict[str, Any]) -> None:
         }
         store.add_version(speech_id, version, status="draft")
     except Exception as exc:
+        if not final_attempt:
+            store.update_speech(speech_id, status="pending", error_message=str(exc))
+            raise
         store.update_speech(speech_id, status="failed", error_message=str(exc))
 
 
@@ -0,0 +1,172 @@
+"""Возобновляемая загрузка материалов по частям: проверка сессии, приём частей, сборка файлов.
+
+Клиент создаёт сессию со списком файлов, присылает части в любом порядке (повтор части
+перезаписывает её), узнаёт по статусу, каких частей не хватает, и фиксирует сессию. При
+фиксации части каждого файла потоком собираются в спул с подсчётом sha256, после чего
+файлы проходят тот же приём, что и обычная загрузка (или архив).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ...core.config import settings
+from ...infrastructure.storage.upload_sessions import (
+    UploadSession,
+    UploadSessionStore,
+    missing_ranges,
+    received_ranges,
+)
+from .document_ingest import ArchiveLimits, IngestError, IngestLimits, RawSpool
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+def is_archive_name(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_archive_session(session: UploadSession) -> bool:
+    return len(session.files) == 1 and is_archive_name(str(session.files[0]["name"]))
+
+
+def validate_session_files(files: List[Dict[str, Any]], chunk_size: int) -> None:
+    """Проверяет набор файлов сессии теми же лимитами, что и загрузку одним запросом."""
+
+    if not files:
+        raise IngestError("Документы не переданы")
+    if not 0 < chunk_size <= settings.upload_session_max_chunk_bytes:
+        raise IngestError(f"Размер части должен быть от 1 до {settings.upload_session_max_chunk_bytes} байт")
+    limit = settings.upload_session_max_chunks_per_file
+    for item in files:
+        if -(-int(item["size"]) // chunk_size) > limit:
+            raise IngestError(f"{item['name']}: больше {limit} частей, увеличьте chunk_size")
+    total = sum(int(item["size"]) for item in files)
+    if total > settings.upload_session_max_bytes:
+        raise IngestError(f"Размер загрузки превышает {settings.upload_session_max_bytes} байт", 413)
+    if len(files) == 1 and is_archive_name(str(files[0]["name"])):
+        if total > settings.archive_max_bytes:
+            raise IngestError(f"Размер архива превышает {settings.archive_max_bytes} байт", 413)
+        return
+    if len(files) > settings.upload_max_files:
+        raise IngestError(f"Слишком много файлов: не более {settings.upload_max_files}", 413)
+    for item in files:
+        name = str(item["name"])
+        if not name.lower().endswith(".txt"):
+            raise IngestError(f"{name}: ожидается .txt или один zip/tar архив")
+        if int(item["size"]) > settings.upload_max_file_bytes:
+            raise IngestError(
+                f"Документ {name} превышает допустимый размер {settings.upload_max_file_bytes} байт",
+                status_code=413,
+            )
+
+
+def load_open_session(store: UploadSessionStore, upload_id: str) -> Optional[UploadSession]:
+    """Сессия, если она существует и не просрочена."""
+
+    session = store.get(upload_id)
+    if session is None or session.expires_at < time.time():
+        return None
+    return session
+
+
+def check_chunk_address(session: UploadSession, file_index: int, chunk_index: int) -> int:
+    """Возвращает ожидаемый размер части или бросает IngestError для неверного адреса."""
+
+    if not 0 <= file_index < len(session.files):
+        raise IngestError("Неверный номер файла", 404)
+    if not 0 <= chunk_index < session.chunk_count(file_index):
+        raise IngestError("Неверный номер части", 404)
+    return session.expected_chunk_size(file_index, chunk_index)
+
+
+async def receive_chunk(
+    store: UploadSessionStore,
+    session: UploadSession,
+    file_index: int,
+    chunk_index: int,
+    stream: AsyncIterator[bytes],
+    expected_sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Пишет часть потоком во временный файл; размер и sha256 проверяются до замены прежней части."""
+
+    expected = check_chunk_address(session, file_index, chunk_index)
+    digest = hashlib.sha256()
+    with store.chunk_writer(session.id, file_index, chunk_index) as writer:
+        async for data in stream:
+            if writer.size + len(data) > expected:
+                raise IngestError(f"Часть больше ожидаемых {expected} байт", 413)
+            digest.update(data)
+            writer.write(data)
+        if writer.size != expected:
+            raise IngestError(f"Размер части {writer.size} байт, ожидается {expected}")
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            raise IngestError("Контрольная сумма части не совпадает")
+        writer.commit()
+    return {"size": expected, "sha256": digest.hexdigest()}
+
+
+def session_progress(store: UploadSessionStore, session: UploadSession) -> Dict[str, Any]:
+    files = []
+    complete = True
+    for index, item in enumerate(session.files):
+        received = store.received_chunks(session.id, index)
+        count = session.chunk_count(index)
+        missing = missing_ranges(received, count)
+        complete = complete and not missing
+        files.append(
+            {
+                "index": index,
+                "name": item["name"],
+                "size": int(item["size"]),
+                "chunk_count": count,
+                "received": received_ranges(received),
+                "missing": missing,
+                "missing_count": sum(last - first + 1 for first, last in missing),
+                "received_bytes": sum(session.expected_chunk_size(index, chunk) for chunk in received),
+            }
+        )
+    return {
+        "upload_id": session.id,
+        "case_id": session.case_id,
+        "status": session.status,
+        "chunk_size": session.chunk_size,
+        "expires_at": datetime.fromtimestamp(session.expires_at, tz=timezone.utc).isoformat(),
+        "files": files,
+        "complete": complete,
+        "analysis_id": session.analysis_id,
+        "poll_url": f"/api/analysis/{session.analysis_id}/status/" if session.analysis_id else None,
+    }
+
+
+def assemble_session(store: UploadSessionStore, session: UploadSession) -> List[RawSpool]:
+    """Собирает файлы сессии в спулы, потоком считая sha256 и сверяя его с заявленным."""
+
+    threshold = (ArchiveLimits if is_archive_session(session) else IngestLimits).from_settings().spool_threshold_bytes
+    spools: List[RawSpool] = []
+    try:
+        for index, item in enumerate(session.files):
+            name = str(item["name"])
+            limits = IngestLimits(
+                max_files=1,
+                max_file_bytes=int(item["size"]),
+                max_request_bytes=int(item["size"]),
+                spool_threshold_bytes=threshold,
+            )
+            spool = RawSpool(name, limits)
+            spools.append(spool)
+            for data in store.iter_file(session, index):
+                spool.write(data)
+            if spool.size != int(item["size"]):
+                raise IngestError(f"Размер файла {name}: {spool.size} байт, заявлено {item['size']}")
+            declared = item.get("sha256")
+            if declared and spool.sha256 != str(declared).lower():
+                raise IngestError(f"Контрольная сумма файла {name} не совпадает")
+    except BaseException:
+        for spool in spools:
+            spool.close()
+        raise
+    return spools
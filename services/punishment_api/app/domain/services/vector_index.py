@@ -0,0 +1,348 @@
+"""Поиск похожих приговоров по векторам справок внутри процесса.
+
+Матрица векторов корпуса L2-нормирована, поэтому косинусная близость — скалярное
+произведение. Точный режим считает его для всего корпуса одним умножением матрицы на
+вектор; режим IVF сначала выбирает nprobe ближайших центроидов грубого квантизатора
+(сферический k-means) и считает близость только для их списков. Отбор top-k с учётом
+decision, limit_guilty и limit_acquittal делается argpartition по каждому решению и
+слиянием кандидатов через кучу, без цикла Python по корпусу.
+"""
+
+from __future__ import annotations
+
+import heapq
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ...core.config import settings
+from ...infrastructure.storage.vector_store import DECISIONS, VectorStore, decision_codes
+
+logger = logging.getLogger(__name__)
+
+_DECISION_CODES = {name: code for code, name in enumerate(DECISIONS)}
+
+INDEX_MODES = ("exact", "ivf", "auto")
+
+_ASSIGN_BLOCK = 1 << 16
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """Параметры отбора: как в POST /verdicts/similar/ (квоты — только без decision)."""
+
+    limit: int = 10
+    min_similarity: float = 0.0
+    decision: Optional[str] = None
+    limit_guilty: Optional[int] = None
+    limit_acquittal: Optional[int] = None
+
+    def quotas(self) -> Optional[Dict[int, int]]:
+        """Сколько строк взять по каждому коду решения; None — без разбивки по решениям."""
+
+        if self.decision:
+            return {_DECISION_CODES[self.decision]: self.limit}
+        if self.limit_guilty is None and self.limit_acquittal is None:
+            return None
+        return {
+            _DECISION_CODES["guilty"]: self.limit_guilty or 0,
+            _DECISION_CODES["acquittal"]: self.limit_acquittal or 0,
+        }
+
+
+def select_top(rows: np.ndarray, scores: np.ndarray, decisions: np.ndarray, query: SearchQuery) -> List[Tuple[int, float]]:
+    """Лучшие (строка, близость) по убыванию близости с учётом порога и квот по решениям."""
+
+    keep = scores >= query.min_similarity
+    rows, scores = rows[keep], scores[keep]
+    quotas = query.quotas()
+    if quotas is None:
+        groups = [(rows, scores, query.limit)]
+    else:
+        codes = decisions[rows]
+        groups = [(rows[codes == code], scores[codes == code], quota) for code, quota in quotas.items() if quota > 0]
+
+    heap: List[Tuple[float, int]] = []
+    for group_rows, group_scores, quota in groups:
+        take = min(quota, query.limit, len(group_rows))
+        if take <= 0:
+            continue
+        best = np.argpartition(-group_scores, take - 1)[:take] if take < len(group_rows) else np.arange(len(group_rows))
+        for row, score in zip(group_rows[best].tolist(), group_scores[best].tolist()):
+            if len(heap) < query.limit:
+                heapq.heappush(heap, (score, -row))
+            elif score > heap[0][0]:
+                heapq.heapreplace(heap, (score, -row))
+    return [(-neg_row, score) for score, neg_row in sorted(heap, reverse=True)]
+
+
+class ExactSearcher:
+    mode = "exact"
+
+    def __init__(self, vectors: np.ndarray):
+        self._vectors = vectors
+
+    def candidates(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self._vectors @ query
+        return np.arange(len(scores)), scores
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode}
+
+
+class IVFSearcher:
+    """Инвертированные списки по центроидам сферического k-means."""
+
+    mode = "ivf"
+
+    def __init__(self, vectors: np.ndarray, *, nlist: int = 0, nprobe: int = 16, iterations: int = 8, seed: int = 0):
+        self._vectors = vectors
+        count = len(vectors)
+        self.nlist = max(1, min(count, nlist or int(math.sqrt(count)), 4096))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+        rng = np.random.default_rng(seed)
+        started = time.perf_counter()
+        sample_size = min(count, self.nlist * 32)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+        self.centroids = _spherical_kmeans(sample, self.nlist, iterations, rng)
+        assign = np.concatenate(
+            [
+                np.argmax(np.asarray(vectors[start : start + _ASSIGN_BLOCK], dtype=np.float32) @ self.centroids.T, axis=1)
+                for start in range(0, count, _ASSIGN_BLOCK)
+            ]
+        )
+        self._order = np.argsort(assign, kind="stable")
+        self._offsets = np.searchsorted(assign[self._order], np.arange(self.nlist + 1))
+        self.train_ms = round((time.perf_counter() - started) * 1000, 3)
+
+    def candidates(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        probe = np.argpartition(-(self.centroids @ query), self.nprobe - 1)[: self.nprobe]
+        rows = np.concatenate([self._order[self._offsets[c] : self._offsets[c + 1]] for c in probe])
+        rows.sort()
+        return rows, np.asarray(self._vectors[rows], dtype=np.float32) @ query
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = np.diff(self._offsets)
+        return {
+            "mode": self.mode,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "largest_list": int(sizes.max()) if len(sizes) else 0,
+            "train_ms": self.train_ms,
+        }
+
+
+def _spherical_kmeans(sample: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        clusters, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        centroids[clusters] = normalize_rows(sums)
+    return centroids
+
+
+class VerdictIndex:
+    """Векторы корпуса приговоров, их метаданные и стратегия поиска."""
+
+    def __init__(
+        self,
+        vectors: Any,
+        metadata: Sequence[Dict[str, Any]],
+        *,
+        vector_model: str,
+        decisions: Optional[np.ndarray] = None,
+        generation: int = 0,
+        mode: str = "auto",
+        ivf_min_vectors: int = 50000,
+        nlist: int = 0,
+        nprobe: int = 16,
+    ):
+        if len(vectors) != len(metadata):
+            raise ValueError("Число векторов и записей метаданных не совпадает")
+        if mode not in INDEX_MODES:
+            raise ValueError(f"Неизвестный режим индекса: {mode}")
+        self.vectors = vectors
+        self.metadata = metadata
+        self.vector_model = vector_model
+        self.generation = generation
+        self.decisions = decisions if decisions is not None else decision_codes([item.get("decision") for item in metadata])
+        if mode == "auto":
+            mode = "ivf" if len(vectors) >= ivf_min_vectors else "exact"
+        self._searcher = (
+            IVFSearcher(vectors, nlist=nlist, nprobe=nprobe) if mode == "ivf" and len(vectors) else ExactSearcher(vectors)
+        )
+
+    @classmethod
+    def build(cls, records: Sequence[Dict[str, Any]], vectorizer: Any, *, batch_size: int = 1024, **options: Any) -> "VerdictIndex":
+        """Индекс по записям приговоров с полем text; векторизатор — HashingVectorizer."""
+
+        vectors = np.zeros((len(records), vectorizer.dim), dtype=np.float32)
+        for start in range(0, len(records), batch_size):
+            batch = records[start : start + batch_size]
+            vectors[start : start + len(batch)] = vectorizer.transform([str(item.get("text") or "") for item in batch])
+        return cls(vectors, list(records), vector_model=vectorizer.model, **options)
+
+    @property
+    def size(self) -> int:
+        return len(self.metadata)
+
+    @property
+    def dim(self) -> int:
+        return int(self.vectors.shape[1]) if self.vectors.ndim == 2 else 0
+
+    def search(self, vector: Sequence[float], query: SearchQuery) -> List[Dict[str, Any]]:
+        """Метаданные найденных приговоров с полем similarity, по убыванию близости."""
+
+        q = np.asarray(vector, dtype=np.float32)
+        if q.shape != (self.dim,):
+            raise ValueError(f"Размерность case_vector ({q.size}) не совпадает с индексом ({self.dim})")
+        norm = float(np.linalg.norm(q))
+        if norm == 0:
+            raise ValueError("case_vector не должен быть нулевым")
+        rows, scores = self._searcher.candidates(q / norm)
+        top = select_top(rows, scores, self.decisions, query)
+        get_many = getattr(self.metadata, "get_many", None)
+        items = get_many([row for row, _ in top]) if get_many else [self.metadata[row] for row, _ in top]
+        return [{**item, "similarity": round(score, 4)} for item, (_, score) in zip(items, top)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "dim": self.dim,
+            "vector_model": self.vector_model,
+            "generation": self.generation,
+            **self._searcher.stats(),
+        }
+
+    @classmethod
+    def from_store(cls, store: VectorStore, **options: Any) -> Optional["VerdictIndex"]:
+        """Индекс поверх отображённых в память сегментов хранилища; None, если оно пусто."""
+
+        snapshot = store.snapshot()
+        if snapshot is None:
+            return None
+        return cls(
+            snapshot.vectors,
+            snapshot.metadata,
+            vector_model=snapshot.vector_model,
+            decisions=snapshot.decisions,
+            generation=snapshot.generation,
+            **options,
+        )
+
+
+def verdict_index_dir() -> Path:
+    return Path(settings.verdict_index_dir or Path(settings.data_dir) / "verdict_index")
+
+
+_STORE: Optional[VectorStore] = None
+_INDEX: Optional[VerdictIndex] = None
+_LOADED = False
+_INDEX_LOCK = threading.Lock()
+
+
+def get_verdict_store() -> VectorStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = VectorStore(verdict_index_dir())
+    return _STORE
+
+
+def load_verdict_index() -> Optional[VerdictIndex]:
+    return VerdictIndex.from_store(
+        get_verdict_store(),
+        mode=settings.verdict_index_mode,
+        ivf_min_vectors=settings.verdict_ivf_min_vectors,
+        nlist=settings.verdict_ivf_nlist,
+        nprobe=settings.verdict_ivf_nprobe,
+    )
+
+
+_RELOADING: Optional[threading.Thread] = None
+_NEXT_CHECK = 0.0
+
+
+def _reload_in_background() -> None:
+    """Строит индекс нового манифеста в отдельном потоке и подменяет им текущий."""
+
+    global _RELOADING
+
+    def run() -> None:
+        global _RELOADING
+        try:
+            index = load_verdict_index()
+            set_verdict_index(index)
+            logger.info("Verdict index reloaded: generation %s", index.generation if index else 0)
+        except Exception:
+            logger.exception("Verdict index reload failed")
+        finally:
+            with _INDEX_LOCK:
+                _RELOADING = None
+
+    with _INDEX_LOCK:
+        if _RELOADING is not None:
+            return
+        _RELOADING = threading.Thread(target=run, name="verdict-index-reload", daemon=True)
+        _RELOADING.start()
+
+
+def get_verdict_index() -> Optional[VerdictIndex]:
+    """Индекс корпуса процесса; None, если корпус ещё не построен.
+
+    Если другой процесс (загрузка корпуса) сменил манифест хранилища, новый индекс
+    строится в фоне (для IVF это k-means по всему корпусу), а запросы до подмены
+    обслуживает прежний. Манифест проверяется не чаще VERDICT_INDEX_AUTORELOAD_INTERVAL_SECONDS.
+    """
+
+    global _INDEX, _LOADED, _NEXT_CHECK
+    if _LOADED and settings.verdict_index_autoreload:
+        now = time.monotonic()
+        if now >= _NEXT_CHECK:
+            _NEXT_CHECK = now + settings.verdict_index_autoreload_interval_seconds
+            manifest = get_verdict_store().manifest()
+            generation = int(manifest["generation"]) if manifest else 0
+            if generation != (_INDEX.generation if _INDEX is not None else 0):
+                _reload_in_background()
+    if not _LOADED:
+        with _INDEX_LOCK:
+            if not _LOADED:
+                _INDEX = load_verdict_index()
+                _LOADED = True
+    return _INDEX
+
+
+def wait_verdict_reload(timeout: Optional[float] = None) -> None:
+    """Ждёт завершения фоновой перестройки индекса, если она идёт."""
+
+    thread = _RELOADING
+    if thread is not None:
+        thread.join(timeout)
+
+
+def set_verdict_index(index: Optional[VerdictIndex]) -> None:
+    """Подменяет индекс процесса целиком (после перестройки корпуса)."""
+
+    global _INDEX, _LOADED
+    with _INDEX_LOCK:
+        _INDEX = index
+        _LOADED = True
+
+
+def reload_verdict_index() -> Optional[VerdictIndex]:
+    index = load_verdict_index()
+    set_verdict_index(index)
+    return index
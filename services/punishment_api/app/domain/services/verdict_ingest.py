@@ -0,0 +1,347 @@
+"""Загрузка корпуса приговоров из каталога текстовых файлов в хранилище векторов.
+
+Файлы обходятся в стабильном порядке (отсортированные относительные пути) и
+раздаются пачками пулу процессов. Процесс читает файл, извлекает регулярными
+выражениями статью, решение и дату, режет текст на куски и векторизует их одним
+пакетом; вектор приговора — нормированное среднее векторов кусков. Главный
+процесс копит результаты и пишет их в хранилище крупными сегментами, после каждого
+сегмента сохраняя контрольную точку — последний записанный путь списка. Прерванный
+запуск продолжается с контрольной точки; файлы с уже известными хранилищу id не
+читаются, поэтому сбой между записью сегмента и контрольной точкой безопасен.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ...infrastructure.storage.vector_store import VectorStore
+from .document_ingest import detect_encoding
+from .embeddings import HashingVectorizer, get_vectorizer, idf_path, set_vectorizer
+from .materials_pipeline import split_text
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUFFIXES = (".txt",)
+CHECKPOINT_NAME = "ingest_checkpoint.json"
+
+_ARTICLE_RE = re.compile(
+    r"(?:ст\.|статьи|статье|статьей|статьёй|статья)\s*(\d{1,3}(?:-\d{1,2})?)"
+    r"(?:\s*(?:ч\.|части|часть)\s*(\d{1,2}))?",
+    re.IGNORECASE,
+)
+_ARTICLE_PART_FIRST_RE = re.compile(
+    r"(?:ч\.|части|часть)\s*(\d{1,2})\s*(?:ст\.|статьи)\s*(\d{1,3}(?:-\d{1,2})?)",
+    re.IGNORECASE,
+)
+# Порядок важен: оправдательная формулировка и возврат прокурору проверяются раньше
+# «признать виновным», который может встречаться в тексте по соучастникам.
+_DECISION_RES = (
+    ("acquittal", re.compile(r"оправда(?:ть|н[ао]?)\b|оправдательный\s+приговор", re.IGNORECASE)),
+    ("return", re.compile(r"возвратить\s+(?:уголовное\s+дело\s+)?прокурору", re.IGNORECASE)),
+    ("guilty", re.compile(r"призна(?:ть|н[ао]?)\s+виновн|обвинительный\s+приговор", re.IGNORECASE)),
+)
+_MONTHS = {
+    "января": 1,
+    "февраля": 2,
+    "марта": 3,
+    "апреля": 4,
+    "мая": 5,
+    "июня": 6,
+    "июля": 7,
+    "августа": 8,
+    "сентября": 9,
+    "октября": 10,
+    "ноября": 11,
+    "декабря": 12,
+}
+_DATE_RE = re.compile(
+    r"\b(\d{1,2})(?:\.(\d{1,2})\.|\s+(" + "|".join(_MONTHS) + r")\s+)(\d{4})\b",
+    re.IGNORECASE,
+)
+
+
+def extract_article(text: str) -> Optional[str]:
+    """Первая квалификация в тексте: «188 ч.2» или «188», иначе None."""
+
+    head = _ARTICLE_PART_FIRST_RE.search(text)
+    found = _ARTICLE_RE.search(text)
+    if head and (found is None or head.start() < found.start()):
+        return f"{head.group(2)} ч.{head.group(1)}"
+    if found is None:
+        return None
+    return f"{found.group(1)} ч.{found.group(2)}" if found.group(2) else found.group(1)
+
+
+def extract_decision(text: str) -> Optional[str]:
+    """guilty, acquittal или return по резолютивной части (последним 4000 символам)."""
+
+    tail = text[-4000:]
+    for decision, pattern in _DECISION_RES:
+        if pattern.search(tail):
+            return decision
+    return None
+
+
+def extract_date(text: str) -> Optional[str]:
+    """Первая корректная дата в шапке приговора в формате YYYY-MM-DD."""
+
+    for match in _DATE_RE.finditer(text[:2000]):
+        day, month, month_name, year = match.groups()
+        number = int(month) if month else _MONTHS[month_name.lower()]
+        if 1 <= int(day) <= 31 and 1 <= number <= 12 and 1900 <= int(year) <= 2100:
+            return f"{int(year):04d}-{number:02d}-{int(day):02d}"
+    return None
+
+
+def read_text_file(path: Path) -> str:
+    raw = path.read_bytes()
+    return raw.decode(detect_encoding(raw[:65536]), errors="replace").replace("\r\n", "\n").strip()
+
+
+def list_corpus_files(root: Path) -> List[str]:
+    """Относительные пути текстовых файлов корпуса в стабильном порядке."""
+
+    found: List[str] = []
+    for directory, dirs, files in os.walk(root):
+        dirs.sort()
+        base = Path(directory).relative_to(root)
+        found.extend((base / name).as_posix() for name in sorted(files) if name.lower().endswith(TEXT_SUFFIXES))
+    found.sort()
+    return found
+
+
+def record_id(relative: str) -> str:
+    return f"corpus:{relative}"
+
+
+_WORKER_VECTORIZER: Optional[HashingVectorizer] = None
+
+
+def _init_worker(dim: int, idf: Optional[np.ndarray]) -> None:
+    global _WORKER_VECTORIZER
+    _WORKER_VECTORIZER = HashingVectorizer(dim, idf)
+
+
+def process_files(root: str, paths: Sequence[str], chunk_chars: int) -> Tuple[np.ndarray, List[Dict[str, Any]], int]:
+    """Векторы и метаданные пачки файлов; третье значение — число пропущенных (пустых, нечитаемых)."""
+
+    vectorizer = _WORKER_VECTORIZER
+    if vectorizer is None:
+        raise RuntimeError("Векторизатор процесса не инициализирован")
+    records: List[Dict[str, Any]] = []
+    chunks: List[str] = []
+    owners: List[int] = []
+    skipped = 0
+    for relative in paths:
+        try:
+            text = read_text_file(Path(root) / relative)
+        except OSError as exc:
+            logger.warning("Cannot read %s: %s", relative, exc)
+            skipped += 1
+            continue
+        if not text:
+            skipped += 1
+            continue
+        pieces = split_text(text, chunk_chars)
+        chunks.extend(pieces)
+        owners.extend([len(records)] * len(pieces))
+        records.append(
+            {
+                "id": record_id(relative),
+                "file_name": Path(relative).name,
+                "mime": "text/plain",
+                "source": "corpus",
+                "decision": extract_decision(text),
+                "article": extract_article(text),
+                "date": extract_date(text),
+                "text": text,
+            }
+        )
+    vectors = np.zeros((len(records), vectorizer.dim), dtype=np.float32)
+    if chunks:
+        np.add.at(vectors, np.asarray(owners), vectorizer.transform(chunks))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors, records, skipped
+
+
+def fit_corpus_idf(source: Path, *, sample: int, batch: int = 256) -> HashingVectorizer:
+    """Векторизатор с IDF по равномерной выборке до sample файлов корпуса.
+
+    Частоты копятся пачками по batch текстов, так что память не зависит от размера выборки.
+    Модель с IDF отличается от модели без него, поэтому IDF считают до первой загрузки в
+    хранилище (см. use_idf).
+    """
+
+    source = Path(source)
+    paths = list_corpus_files(source)
+    if sample < len(paths):
+        paths = [paths[int(i)] for i in np.linspace(0, len(paths) - 1, sample)]
+    base = HashingVectorizer(get_vectorizer().dim)
+    df: Optional[np.ndarray] = None
+    documents = 0
+    for offset in range(0, len(paths), batch):
+        texts = [text for text in (read_text_file(source / relative) for relative in paths[offset : offset + batch]) if text]
+        if not texts:
+            continue
+        counts = base.document_frequencies(texts)
+        df = counts if df is None else df + counts
+        documents += len(texts)
+    if df is None:
+        raise ValueError(f"В каталоге {source} нет текстов для подсчёта IDF")
+    vectorizer = base.with_idf(df, documents)
+    logger.info("IDF fitted on %d documents: model %s", documents, vectorizer.model)
+    return vectorizer
+
+
+def use_idf(vectorizer: HashingVectorizer, store: VectorStore) -> None:
+    """Сохраняет IDF в idf.npy и делает векторизатор векторизатором процесса.
+
+    Хранилище с векторами другой модели не смешивается с новой: ValueError.
+    """
+
+    stored = store.stats()["vector_model"]
+    if stored and stored != vectorizer.model:
+        raise ValueError(f"Хранилище {store.root} уже содержит векторы модели {stored}; IDF считают до первой загрузки")
+    vectorizer.save_idf(idf_path())
+    set_vectorizer(vectorizer)
+
+
+@dataclass
+class IngestReport:
+    files: int = 0
+    already_indexed: int = 0
+    processed: int = 0
+    added: int = 0
+    skipped: int = 0
+    resumed_after: Optional[str] = None
+    segments_written: int = 0
+    elapsed_ms: float = 0.0
+    decisions: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**self.__dict__, "decisions": dict(self.decisions)}
+
+
+def _checkpoint_path(store: VectorStore) -> Path:
+    return store.root / CHECKPOINT_NAME
+
+
+def load_checkpoint(store: VectorStore, source: Path) -> Optional[str]:
+    """Последний записанный путь незавершённой загрузки каталога source; None — начать сначала."""
+
+    path = _checkpoint_path(store)
+    if not path.exists():
+        return None
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if data.get("source") != str(source.resolve()) or data.get("completed"):
+        return None
+    return data.get("last_path")
+
+
+def save_checkpoint(store: VectorStore, source: Path, last_path: Optional[str], report: IngestReport, *, completed: bool = False) -> None:
+    path = _checkpoint_path(store)
+    tmp = path.with_suffix(".tmp")
+    payload = {
+        "source": str(source.resolve()),
+        "last_path": last_path,
+        "completed": completed,
+        "updated_at": time.time(),
+        "report": report.as_dict(),
+    }
+    tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def ingest_corpus(
+    source: Path,
+    store: VectorStore,
+    *,
+    workers: int = 0,
+    files_per_task: int = 64,
+    write_batch: int = 20000,
+    chunk_chars: int = 4000,
+    dtype: str = "float16",
+    max_segments: int = 0,
+    restart: bool = False,
+) -> IngestReport:
+    """Загружает каталог source в store; restart — игнорировать контрольную точку.
+
+    Файлы, id которых уже есть в хранилище, не читаются: повторный запуск по
+    пополненному каталогу обрабатывает только новые приговоры.
+    """
+
+    started = time.perf_counter()
+    source = Path(source)
+    if not source.is_dir():
+        raise ValueError(f"Каталог корпуса не найден: {source}")
+    vectorizer = get_vectorizer()
+    paths = list_corpus_files(source)
+    report = IngestReport(files=len(paths))
+    report.resumed_after = None if restart else load_checkpoint(store, source)
+    if report.resumed_after is not None:
+        paths = paths[bisect.bisect_right(paths, report.resumed_after) :]
+    known = store.known_ids([record_id(relative) for relative in paths])
+    todo = [relative for relative in paths if record_id(relative) not in known]
+    report.already_indexed = report.files - len(todo)
+
+    pending_vectors: List[np.ndarray] = []
+    pending_records: List[Dict[str, Any]] = []
+
+    def flush(last_path: Optional[str], *, completed: bool = False) -> None:
+        if pending_records:
+            added = store.append(
+                np.concatenate(pending_vectors),
+                pending_records,
+                vector_model=vectorizer.model,
+                dtype=dtype,
+                max_segments=max_segments,
+            )
+            report.added += added
+            report.segments_written += 1 if added else 0
+            pending_vectors.clear()
+            pending_records.clear()
+        save_checkpoint(store, source, last_path, report, completed=completed)
+        logger.info("Corpus ingest: %d/%d files processed, %d added", report.processed, len(todo), report.added)
+
+    def collect(last_path: str, future: "Future[Tuple[np.ndarray, List[Dict[str, Any]], int]]") -> None:
+        vectors, records, skipped = future.result()
+        report.skipped += skipped
+        report.processed += len(records) + skipped
+        for record in records:
+            key = record["decision"] or "unknown"
+            report.decisions[key] = report.decisions.get(key, 0) + 1
+        pending_vectors.append(vectors)
+        pending_records.extend(records)
+        if len(pending_records) >= write_batch:
+            flush(last_path)
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    size = max(1, files_per_task)
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(vectorizer.dim, vectorizer.idf)) as pool:
+            # Не больше 2*workers пачек в полёте: память не растёт вместе с корпусом, а
+            # результаты забираются по порядку, так что контрольная точка — префикс списка.
+            in_flight: Deque[Tuple[str, Future]] = deque()
+            for offset in range(0, len(todo), size):
+                batch = todo[offset : offset + size]
+                in_flight.append((batch[-1], pool.submit(process_files, str(source), batch, chunk_chars)))
+                while len(in_flight) >= 2 * workers:
+                    collect(*in_flight.popleft())
+            while in_flight:
+                collect(*in_flight.popleft())
+    flush(todo[-1] if todo else report.resumed_after, completed=True)
+    report.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+    return report
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import hashlib
+import re
 from dataclasses import dataclass
 from datetime import date, timedelta
 from pathlib import Path
@@ -8,6 +10,9 @@ from typing import Optional
 
 from ...core.config import settings
 
+_LOST_CAPITAL_R = re.compile(r"  (?=[а-яё])")
+_SHIFTED_PARENS = re.compile(r"Ш([^ШЩ]{1,80})Щ")
+
 
 @dataclass(frozen=True)
 class ArticleRecord:
@@ -35,6 +40,7 @@ class ArticleRecord:
     fs1r65_02x: str
     fl1u: str
     d_izm: Optional[date]
+    name: str = ""
 
 
 class ReferenceService:
@@ -49,6 +55,7 @@ class ReferenceService:
         self._lock = Lock()
         self._file_path = Path(file_path) if file_path else None
         self._records: dict[str, list[ArticleRecord]] = {}
+        self._version = ""
         self._loaded = False
         self._source = "unknown"
         self._ensure_loaded()
@@ -62,8 +69,8 @@ class ReferenceService:
             self._source = "file"
 
     def reload(self) -> None:
+        # Прежние записи остаются доступны, пока новые не разобраны целиком.
         with self._lock:
-            self._records = {}
             self._loaded = False
         self._ensure_loaded()
 
@@ -77,6 +84,20 @@ class ReferenceService:
             return str(self._file_path)
         return "(default)"
 
+    @property
+    def version(self) -> str:
+        """Хеш содержимого файла справочника: меняется только вместе с данными."""
+
+        self._ensure_loaded()
+        return self._version
+
+    def snapshot(self) -> tuple[str, dict[str, list[ArticleRecord]]]:
+        """Версия и записи одной загрузки; словарь после загрузки не изменяется."""
+
+        self._ensure_loaded()
+        with self._lock:
+            return self._version, self._records
+
     @property
     def count(self) -> int:
         self._ensure_loaded()
@@ -132,13 +153,17 @@ class ReferenceService:
     def _load_from_file(self) -> None:
         file_path = self._get_file_path()
         if not file_path.exists():
+            self._records, self._version = {}, ""
             return
         content = self._read_file(file_path)
-        self._parse_content(content)
+        records: dict[str, list[ArticleRecord]] = {}
+        self._parse_content(content, records)
+        self._records = records
 
     def _read_file(self, file_path: Path) -> str:
         with open(file_path, "rb") as f:
             raw_data = f.read()
+        self._version = hashlib.blake2b(raw_data, digest_size=16).hexdigest()
 
         lines = raw_data.split(b"\n")
         decoded_lines: list[str] = []
@@ -200,7 +225,7 @@ class ReferenceService:
         except UnicodeDecodeError:
             return bytes(restored).decode("cp1251", errors="replace")
 
-    def _parse_content(self, content: str) -> None:
+    def _parse_content(self, content: str, records: dict[str, list[ArticleRecord]]) -> None:
         lines = content.splitlines()
         if not lines:
             return
@@ -208,9 +233,9 @@ class ReferenceService:
         for line in lines[1:]:
             if not line.strip():
                 continue
-            self._parse_row(line, header)
+            self._parse_row(line, header, records)
 
-    def _parse_row(self, line: str, header: list[str]) -> None:
+    def _parse_row(self, line: str, header: list[str], records: dict[str, list[ArticleRecord]]) -> None:
         fields = line.split("\t")
         row = {col: (fields[i].strip() if i < len(fields) else "") for i, col in enumerate(header)}
 
@@ -243,9 +268,19 @@ class ReferenceService:
             fs1r65_02x=row.get("fs1r65_02x", "").strip(),
             fl1u=row.get("fl1u", "").strip(),
             d_izm=_parse_date(row.get("d_izm", "").strip()),
+            name=_restore_name(row.get("p1_1", "")),
         )
 
-        self._records.setdefault(code, []).append(record)
+        records.setdefault(code, []).append(record)
+
+
+def _restore_name(value: str) -> str:
+    # После сдвига кодировки текстового поля запятая читается как «Ь», скобки — как «Ш»/«Щ»,
+    # а «Р» (0xD0 -> 0x20) совпадает с пробелом: в начале названия теряется при strip,
+    # внутри даёт двойной пробел.
+    value = _LOST_CAPITAL_R.sub(" Р", value.strip().replace("Ь", ","))
+    value = _SHIFTED_PARENS.sub(r"(\1)", value)
+    return "Р" + value if value[:1].islower() else value
 
 
 def _parse_date(value: str) -> Optional[date]:
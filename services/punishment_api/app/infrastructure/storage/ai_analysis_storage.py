@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import json
 import sqlite3
 import threading
+import time
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -10,6 +10,146 @@ from pathlib import Path
 from typing import Any, Dict, Iterable, Optional
 
 from ...core.config import settings
+from .codec import column_stats, database_stats, decode_json, encode_json
+from .migrations import INCREMENTAL_VACUUM_STATEMENTS, Migration, apply_migrations
+
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="analyses table",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS analyses (
+                id TEXT PRIMARY KEY,
+                case_id TEXT NOT NULL,
+                analysis_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                input_params TEXT,
+                result TEXT,
+                error_message TEXT,
+                ai_model TEXT,
+                processing_time_ms INTEGER,
+                task_id TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_analyses_case ON analyses(case_id)",
+            "CREATE INDEX IF NOT EXISTS idx_analyses_type ON analyses(analysis_type)",
+            "CREATE INDEX IF NOT EXISTS idx_analyses_status ON analyses(status)",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="composite indexes for case lookups ordered by created_at",
+        statements=(
+            # list_analyses / latest_completed_risk / report/latest: equality on
+            # case_id, analysis_type, status and ORDER BY created_at DESC LIMIT n.
+            """
+            CREATE INDEX IF NOT EXISTS idx_analyses_case_type_status_created
+            ON analyses(case_id, analysis_type, status, created_at)
+            """,
+            # list_analyses by case only (and by case + status).
+            """
+            CREATE INDEX IF NOT EXISTS idx_analyses_case_created
+            ON analyses(case_id, created_at)
+            """,
+            # Prefix of both composite indexes above.
+            "DROP INDEX IF EXISTS idx_analyses_case",
+        ),
+    ),
+    Migration(
+        version=3,
+        description="retention scans by status and age",
+        statements=(
+            """
+            CREATE INDEX IF NOT EXISTS idx_analyses_status_created
+            ON analyses(status, created_at)
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at)",
+            "DROP INDEX IF EXISTS idx_analyses_status",
+        ),
+    ),
+    Migration(
+        version=4,
+        description="incremental auto_vacuum",
+        statements=INCREMENTAL_VACUUM_STATEMENTS,
+        transactional=False,
+    ),
+    Migration(
+        version=5,
+        description="content-addressed result cache",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_cache (
+                key TEXT PRIMARY KEY,
+                analysis_type TEXT NOT NULL,
+                ai_model TEXT,
+                result TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache(last_used_at)",
+            # Анализ, завершённый из кеша, хранит ссылку на запись кеша вместо копии результата.
+            "ALTER TABLE analyses ADD COLUMN cache_key TEXT",
+            """
+            CREATE INDEX IF NOT EXISTS idx_analyses_cache_key
+            ON analyses(cache_key) WHERE cache_key IS NOT NULL
+            """,
+        ),
+    ),
+    Migration(
+        version=6,
+        description="input hash for single-flight deduplication",
+        # Поиск идёт по idx_analyses_case_type_status_created; незавершённых
+        # анализов по делу немного, поэтому отдельный индекс не нужен.
+        statements=("ALTER TABLE analyses ADD COLUMN input_hash TEXT",),
+    ),
+    Migration(
+        version=7,
+        description="per-document partial analyses of case materials",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS materials_partials (
+                case_id TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                doc_hash TEXT NOT NULL,
+                name TEXT,
+                ai_model TEXT,
+                parts TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                PRIMARY KEY (case_id, variant, doc_hash)
+            )
+            """,
+        ),
+    ),
+)
+
+IN_FLIGHT_STATUSES = ("pending", "processing")
+
+IN_FLIGHT_BY_INPUT_SQL = """
+    SELECT * FROM analyses
+    WHERE case_id = ? AND analysis_type = ? AND status IN ('pending', 'processing') AND input_hash = ?
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+LATEST_COMPLETED_RISK_SQL = """
+    SELECT * FROM analyses
+    WHERE case_id = ? AND analysis_type = 'risk_analysis' AND status = 'completed'
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+
+def analysis_blob_owner(analysis_id: str) -> str:
+    """Имя владельца ссылок на блобы входа анализа (см. blob_store)."""
+
+    return f"analysis:{analysis_id}"
+
 
 def _utc_now() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -29,14 +169,22 @@ class AnalysisRecord:
     task_id: Optional[str]
     created_at: str
     updated_at: str
+    cache_key: Optional[str] = None
+    input_hash: Optional[str] = None
 
 
 class AnalysisStore:
     def __init__(self, db_path: str):
         self._db_path = Path(db_path)
         self._lock = threading.Lock()
+        self.schema_version = 0
+        self._cache_counters: Dict[str, Dict[str, int]] = {}
         self._ensure_db()
 
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
     def _connect(self) -> sqlite3.Connection:
         conn = sqlite3.connect(self._db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
@@ -45,33 +193,7 @@ class AnalysisStore:
     def _ensure_db(self) -> None:
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
         with self._connect() as conn:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS analyses (
-                    id TEXT PRIMARY KEY,
-                    case_id TEXT NOT NULL,
-                    analysis_type TEXT NOT NULL,
-                    status TEXT NOT NULL,
-                    input_params TEXT,
-                    result TEXT,
-                    error_message TEXT,
-                    ai_model TEXT,
-                    processing_time_ms INTEGER,
-                    task_id TEXT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-                """
-            )
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_analyses_case ON analyses(case_id)"
-            )
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_analyses_type ON analyses(analysis_type)"
-            )
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_analyses_status ON analyses(status)"
-            )
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
 
     def create_analysis(
         self,
@@ -79,35 +201,89 @@ class AnalysisStore:
         analysis_type: str,
         input_params: Optional[Dict[str, Any]] = None,
         task_id: Optional[str] = None,
+        input_hash: Optional[str] = None,
     ) -> AnalysisRecord:
-        analysis_id = str(uuid.uuid4())
-        now = _utc_now()
-        input_params = input_params or {}
         with self._lock, self._connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO analyses (
-                    id, case_id, analysis_type, status, input_params,
-                    result, error_message, ai_model, processing_time_ms,
-                    task_id, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            analysis_id = self._insert(conn, case_id, analysis_type, input_params, task_id, input_hash)
+        return self.get_analysis(analysis_id)
+
+    def create_or_attach(
+        self,
+        case_id: str,
+        analysis_type: str,
+        input_params: Optional[Dict[str, Any]],
+        task_id: Optional[str],
+        input_hash: str,
+    ) -> tuple[AnalysisRecord, bool]:
+        """Возвращает незавершённый анализ дела с тем же входом или создаёт новый.
+
+        Второй элемент — True, если запрос присоединён к уже идущему анализу.
+        Проверка и вставка идут в одной транзакции BEGIN IMMEDIATE.
+        """
+
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(IN_FLIGHT_BY_INPUT_SQL, (case_id, analysis_type, input_hash)).fetchone()
+            if row is None:
+                analysis_id = self._insert(conn, case_id, analysis_type, input_params, task_id, input_hash)
+            conn.commit()
+            if row is not None:
+                return self._load_records(conn, [row])[0], True
+        return self.get_analysis(analysis_id), False
+
+    def mark_processing(self, analysis_id: str, *, takeover: bool = False) -> bool:
+        """Атомарно переводит pending -> processing; False, если анализ уже выполняет другой.
+
+        takeover=True забирает и анализ в processing (повтор задачи после падения воркера).
+        """
+
+        statuses = IN_FLIGHT_STATUSES if takeover else ("pending",)
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"""
+                UPDATE analyses SET status = 'processing', updated_at = ?
+                WHERE id = ? AND status IN ({', '.join('?' * len(statuses))})
                 """,
-                (
-                    analysis_id,
-                    case_id,
-                    analysis_type,
-                    "pending",
-                    json.dumps(input_params, ensure_ascii=False),
-                    json.dumps({}, ensure_ascii=False),
-                    None,
-                    None,
-                    None,
-                    task_id,
-                    now,
-                    now,
-                ),
+                (_utc_now(), analysis_id, *statuses),
             )
-        return self.get_analysis(analysis_id)
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _insert(
+        conn: sqlite3.Connection,
+        case_id: str,
+        analysis_type: str,
+        input_params: Optional[Dict[str, Any]],
+        task_id: Optional[str],
+        input_hash: Optional[str],
+    ) -> str:
+        analysis_id = str(uuid.uuid4())
+        now = _utc_now()
+        conn.execute(
+            """
+            INSERT INTO analyses (
+                id, case_id, analysis_type, status, input_params,
+                result, error_message, ai_model, processing_time_ms,
+                task_id, created_at, updated_at, input_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                analysis_id,
+                case_id,
+                analysis_type,
+                "pending",
+                encode_json(input_params or {}),
+                encode_json({}),
+                None,
+                None,
+                None,
+                task_id,
+                now,
+                now,
+                input_hash,
+            ),
+        )
+        return analysis_id
 
     def update_analysis(
         self,
@@ -125,8 +301,8 @@ class AnalysisStore:
             updates.append("status = ?")
             params.append(status)
         if result is not None:
-            updates.append("result = ?")
-            params.append(json.dumps(result, ensure_ascii=False))
+            updates.append("result = ?, cache_key = NULL")
+            params.append(encode_json(result))
         if error_message is not None:
             updates.append("error_message = ?")
             params.append(error_message)
@@ -154,9 +330,9 @@ class AnalysisStore:
                 "SELECT * FROM analyses WHERE id = ?",
                 (analysis_id,),
             ).fetchone()
-        if not row:
-            return None
-        return self._row_to_record(row)
+            if not row:
+                return None
+            return self._load_records(conn, [row])[0]
 
     def list_analyses(
         self,
@@ -165,6 +341,18 @@ class AnalysisStore:
         status: Optional[str] = None,
         limit: int = 50,
     ) -> list[AnalysisRecord]:
+        query, params = self.build_list_query(case_id, analysis_type, status, limit)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+            return self._load_records(conn, rows)
+
+    @staticmethod
+    def build_list_query(
+        case_id: str,
+        analysis_type: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: int = 50,
+    ) -> tuple[str, list[Any]]:
         query = "SELECT * FROM analyses WHERE case_id = ?"
         params: list[Any] = [case_id]
         if analysis_type:
@@ -175,39 +363,241 @@ class AnalysisStore:
             params.append(status)
         query += " ORDER BY created_at DESC LIMIT ?"
         params.append(limit)
-        with self._lock, self._connect() as conn:
-            rows = conn.execute(query, params).fetchall()
-        return [self._row_to_record(r) for r in rows]
+        return query, params
 
     def latest_completed_risk(self, case_id: str) -> Optional[AnalysisRecord]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(LATEST_COMPLETED_RISK_SQL, (case_id,)).fetchone()
+            if not row:
+                return None
+            return self._load_records(conn, [row])[0]
+
+    # --- Кеш результатов по содержимому входа -------------------------------------
+
+    def cache_lookup(self, key: str, analysis_type: str) -> Optional[Dict[str, Any]]:
+        """Возвращает {"ai_model": ...} для живой записи кеша или None; считает попадания."""
+
+        now = time.time()
         with self._lock, self._connect() as conn:
             row = conn.execute(
+                "SELECT ai_model FROM analysis_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE analysis_cache SET hits = hits + 1, last_used_at = ? WHERE key = ?",
+                    (now, key),
+                )
+            counters = self._cache_counters.setdefault(analysis_type, {"hits": 0, "misses": 0, "stores": 0})
+            counters["hits" if row else "misses"] += 1
+        return {"ai_model": row["ai_model"]} if row else None
+
+    def complete_from_cache(self, analysis_id: str, key: str, ai_model: Optional[str], processing_time_ms: int) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
                 """
-                SELECT * FROM analyses
-                WHERE case_id = ? AND analysis_type = 'risk_analysis' AND status = 'completed'
-                ORDER BY created_at DESC LIMIT 1
+                UPDATE analyses
+                SET status = 'completed', result = NULL, cache_key = ?, ai_model = ?,
+                    processing_time_ms = ?, error_message = NULL, updated_at = ?
+                WHERE id = ?
                 """,
-                (case_id,),
-            ).fetchone()
-        if not row:
-            return None
-        return self._row_to_record(row)
+                (key, ai_model, processing_time_ms, _utc_now(), analysis_id),
+            )
+
+    def cache_put(
+        self,
+        key: str,
+        analysis_type: str,
+        ai_model: Optional[str],
+        result: Dict[str, Any],
+        *,
+        ttl_seconds: float,
+        max_entries: int,
+        max_bytes: int,
+    ) -> int:
+        """Сохраняет результат в кеш и вытесняет устаревшие/давно не использованные записи.
+
+        Возвращает число вытесненных записей.
+        """
+
+        encoded = encode_json(result)
+        size = len(encoded.encode("utf-8")) if isinstance(encoded, str) else len(encoded)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO analysis_cache (
+                    key, analysis_type, ai_model, result, size_bytes, hits, created_at, expires_at, last_used_at
+                ) VALUES (?, ?, ?, ?, ?, 0, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    ai_model = excluded.ai_model, result = excluded.result, size_bytes = excluded.size_bytes,
+                    expires_at = excluded.expires_at, last_used_at = excluded.last_used_at
+                """,
+                (key, analysis_type, ai_model, encoded, size, _utc_now(), now + ttl_seconds, now),
+            )
+            counters = self._cache_counters.setdefault(analysis_type, {"hits": 0, "misses": 0, "stores": 0})
+            counters["stores"] += 1
+            return self._cache_evict(conn, now, max_entries, max_bytes)
+
+    def _cache_evict(self, conn: sqlite3.Connection, now: float, max_entries: int, max_bytes: int) -> int:
+        victims = [row[0] for row in conn.execute("SELECT key FROM analysis_cache WHERE expires_at <= ?", (now,))]
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM analysis_cache WHERE expires_at > ?",
+            (now,),
+        ).fetchone()
+        if count > max_entries or total > max_bytes:
+            for key, size in conn.execute(
+                "SELECT key, size_bytes FROM analysis_cache WHERE expires_at > ? ORDER BY last_used_at",
+                (now,),
+            ):
+                if count <= max_entries and total <= max_bytes:
+                    break
+                victims.append(key)
+                count -= 1
+                total -= size
+        for key in victims:
+            # Анализы, ссылающиеся на вытесняемую запись, получают собственную копию результата.
+            conn.execute(
+                """
+                UPDATE analyses
+                SET result = (SELECT result FROM analysis_cache WHERE key = ?), cache_key = NULL
+                WHERE cache_key = ?
+                """,
+                (key, key),
+            )
+            conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+        return len(victims)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT analysis_type, COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS bytes,
+                       COALESCE(SUM(hits), 0) AS hits
+                FROM analysis_cache GROUP BY analysis_type
+                """
+            ).fetchall()
+            counters = {k: dict(v) for k, v in self._cache_counters.items()}
+        types: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            types[row["analysis_type"]] = {
+                "entries": int(row["entries"]),
+                "bytes": int(row["bytes"]),
+                "total_hits": int(row["hits"]),
+            }
+        for analysis_type, counts in counters.items():
+            lookups = counts["hits"] + counts["misses"]
+            types.setdefault(analysis_type, {"entries": 0, "bytes": 0, "total_hits": 0}).update(
+                counts,
+                hit_rate=round(counts["hits"] / lookups, 4) if lookups else 0.0,
+            )
+        return {
+            "entries": sum(t["entries"] for t in types.values()),
+            "bytes": sum(t["bytes"] for t in types.values()),
+            "types": types,
+        }
+
+    # --- Частичные анализы документов дела ------------------------------------------
+
+    def load_material_partials(self, case_id: str, variant: str, doc_hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Частичные анализы документов дела по хешам: {doc_hash: {"ai_model", "parts"}}."""
+
+        hashes = sorted(set(doc_hashes))
+        if not hashes:
+            return {}
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT doc_hash, ai_model, parts FROM materials_partials
+                WHERE case_id = ? AND variant = ? AND doc_hash IN ({', '.join('?' * len(hashes))})
+                """,
+                (case_id, variant, *hashes),
+            ).fetchall()
+        return {row["doc_hash"]: {"ai_model": row["ai_model"], "parts": decode_json(row["parts"], "[]")} for row in rows}
+
+    def save_material_partial(
+        self,
+        case_id: str,
+        variant: str,
+        doc_hash: str,
+        name: Optional[str],
+        ai_model: Optional[str],
+        parts: list[Dict[str, Any]],
+    ) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO materials_partials (case_id, variant, doc_hash, name, ai_model, parts, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(case_id, variant, doc_hash) DO UPDATE SET
+                    name = excluded.name, ai_model = excluded.ai_model, parts = excluded.parts,
+                    created_at = excluded.created_at
+                """,
+                (case_id, variant, doc_hash, name, ai_model, encode_json(parts), _utc_now()),
+            )
+
+    def prune_material_partials(self, case_id: str, keep: Iterable[str]) -> int:
+        """Удаляет частичные анализы документов, которых нет в последнем наборе материалов дела."""
+
+        hashes = sorted(set(keep))
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM materials_partials WHERE case_id = ? AND doc_hash NOT IN ({', '.join('?' * len(hashes))})",
+                (case_id, *hashes),
+            )
+        return cursor.rowcount
+
+    def blob_owners(self, conn: sqlite3.Connection, rowids: list[int]) -> list[str]:
+        """Владельцы ссылок на блобы для строк, которые удаляет очистка (retention)."""
+
+        rows = conn.execute(
+            f"SELECT id FROM analyses WHERE rowid IN ({', '.join('?' * len(rowids))})",
+            rowids,
+        ).fetchall()
+        return [analysis_blob_owner(row["id"]) for row in rows]
+
+    def storage_stats(self) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            stats = {
+                "db_path": str(self._db_path),
+                "schema_version": self.schema_version,
+                **database_stats(conn),
+                "columns": column_stats(conn, "analyses", ("input_params", "result")),
+            }
+        stats["cache"] = self.cache_stats()
+        return stats
+
+    def _load_records(self, conn: sqlite3.Connection, rows: Iterable[sqlite3.Row]) -> list[AnalysisRecord]:
+        rows = list(rows)
+        keys = sorted({row["cache_key"] for row in rows if row["cache_key"]})
+        cached: Dict[str, Any] = {}
+        if keys:
+            cached = {
+                row["key"]: row["result"]
+                for row in conn.execute(
+                    f"SELECT key, result FROM analysis_cache WHERE key IN ({', '.join('?' * len(keys))})",
+                    keys,
+                )
+            }
+        return [self._row_to_record(row, cached.get(row["cache_key"])) for row in rows]
 
     @staticmethod
-    def _row_to_record(row: sqlite3.Row) -> AnalysisRecord:
+    def _row_to_record(row: sqlite3.Row, cached_result: Any = None) -> AnalysisRecord:
         return AnalysisRecord(
             id=row["id"],
             case_id=row["case_id"],
             analysis_type=row["analysis_type"],
             status=row["status"],
-            input_params=json.loads(row["input_params"] or "{}"),
-            result=json.loads(row["result"] or "{}"),
+            input_params=decode_json(row["input_params"], "{}"),
+            result=decode_json(cached_result if row["cache_key"] else row["result"], "{}"),
             error_message=row["error_message"],
             ai_model=row["ai_model"],
             processing_time_ms=row["processing_time_ms"],
             task_id=row["task_id"],
             created_at=row["created_at"],
             updated_at=row["updated_at"],
+            cache_key=row["cache_key"],
+            input_hash=row["input_hash"],
         )
 
 
@@ -0,0 +1,211 @@
+"""Онлайн-резервное копирование SQLite-хранилищ через sqlite3 backup API."""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from ...core.config import settings
+from .stores import get_stores
+
+logger = logging.getLogger(__name__)
+
+
+def _summarize_steps(step_ms: list[float]) -> Dict[str, Any]:
+    if not step_ms:
+        return {"count": 0}
+    ordered = sorted(step_ms)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        "count": len(ordered),
+        "min_ms": round(ordered[0], 3),
+        "avg_ms": round(sum(ordered) / len(ordered), 3),
+        "p95_ms": round(p95, 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+class _TooManyRestarts(Exception):
+    """Запись в источник из других соединений перезапускает копирование с начала."""
+
+
+class BackupJob:
+    """Копирует базы небольшими порциями страниц, отпуская источник между шагами.
+
+    Между шагами поток спит step_sleep_ms, поэтому запросы к базе не ждут всю копию.
+    Запись в базу между шагами перезапускает копирование; после max_restarts перезапусков
+    база копируется одним шагом (источник занят на всё копирование), а если и это не
+    удалось — копия базы в отчёте помечается ok=false.
+    Копия пишется во временный файл, проверяется PRAGMA quick_check и только потом
+    переименовывается в итоговое имя; старые копии сверх keep удаляются.
+    """
+
+    def __init__(
+        self,
+        *,
+        destination_dir: Path,
+        interval_seconds: int,
+        pages_per_step: int,
+        step_sleep_ms: int,
+        keep: int,
+        max_restarts: int = 3,
+    ):
+        self._destination = Path(destination_dir)
+        self._interval = max(1, interval_seconds)
+        self._pages = max(1, pages_per_step)
+        self._sleep = max(0, step_sleep_ms) / 1000
+        self._keep = max(1, keep)
+        self._max_restarts = max(0, max_restarts)
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_report: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="storage-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None,
+            "destination_dir": str(self._destination),
+            "interval_seconds": self._interval,
+            "pages_per_step": self._pages,
+            "step_sleep_ms": int(self._sleep * 1000),
+            "keep": self._keep,
+            "max_restarts": self._max_restarts,
+            "last_report": self._last_report,
+        }
+
+    def run_once(self) -> Dict[str, Any]:
+        with self._run_lock:
+            started = time.perf_counter()
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+            self._destination.mkdir(parents=True, exist_ok=True)
+            databases = {}
+            for name, store in get_stores().items():
+                try:
+                    databases[name] = self._backup_one(store.db_path, stamp)
+                except Exception as exc:
+                    logger.exception("Backup of %s failed", name)
+                    databases[name] = {"ok": False, "error": str(exc)}
+            report = {
+                "started_at": stamp,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+                "ok": all(item.get("ok") for item in databases.values()),
+                "databases": databases,
+            }
+            self._last_report = report
+            return report
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                report = self.run_once()
+                logger.info("Backup finished in %.1f ms, ok=%s", report["elapsed_ms"], report["ok"])
+            except Exception:
+                logger.exception("Backup run failed")
+
+    def _backup_one(self, db_path: Path, stamp: str) -> Dict[str, Any]:
+        target = self._destination / f"{db_path.stem}-{stamp}{db_path.suffix}"
+        partial = target.with_name(target.name + ".partial")
+        step_ms: list[float] = []
+        last_tick = time.perf_counter()
+        previous_remaining: Optional[int] = None
+        restarts = 0
+
+        def progress(_status: int, remaining: int, _total: int) -> None:
+            nonlocal last_tick, previous_remaining, restarts
+            now = time.perf_counter()
+            step_ms.append((now - last_tick) * 1000)
+            # Осталось больше страниц, чем на прошлом шаге, — копирование началось заново.
+            if previous_remaining is not None and remaining > previous_remaining:
+                restarts += 1
+                if restarts > self._max_restarts:
+                    raise _TooManyRestarts()
+            previous_remaining = remaining
+            if self._sleep:
+                time.sleep(self._sleep)
+            last_tick = time.perf_counter()
+
+        started = time.perf_counter()
+        single_step = False
+        source = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            destination = sqlite3.connect(partial)
+            try:
+                source.backup(destination, pages=self._pages, progress=progress)
+            except _TooManyRestarts:
+                logger.warning("Backup of %s restarted %d times, copying in one step", db_path.name, restarts)
+                destination.close()
+                partial.unlink(missing_ok=True)
+                single_step = True
+                destination = sqlite3.connect(partial)
+                source.backup(destination, pages=-1)
+            try:
+                check = destination.execute("PRAGMA quick_check").fetchone()[0]
+                page_count = destination.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                destination.close()
+        except Exception:
+            partial.unlink(missing_ok=True)
+            raise
+        finally:
+            source.close()
+
+        if check != "ok":
+            partial.unlink(missing_ok=True)
+            return {"ok": False, "error": f"quick_check: {check}", "steps": _summarize_steps(step_ms), "restarts": restarts}
+
+        partial.replace(target)
+        removed = self._prune(db_path)
+        return {
+            "ok": True,
+            "path": str(target),
+            "size_bytes": target.stat().st_size,
+            "pages": page_count,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+            "steps": _summarize_steps(step_ms),
+            "restarts": restarts,
+            "single_step": single_step,
+            "pruned": removed,
+        }
+
+    def _prune(self, db_path: Path) -> list[str]:
+        backups = sorted(self._destination.glob(f"{db_path.stem}-*{db_path.suffix}"))
+        removed = []
+        for old in backups[: -self._keep]:
+            old.unlink(missing_ok=True)
+            removed.append(old.name)
+        return removed
+
+
+_JOB: Optional[BackupJob] = None
+
+
+def get_backup_job() -> BackupJob:
+    global _JOB
+    if _JOB is None:
+        destination = settings.backup_dir or str(Path(settings.data_dir) / "backups")
+        _JOB = BackupJob(
+            destination_dir=Path(destination),
+            interval_seconds=settings.backup_interval_seconds,
+            pages_per_step=settings.backup_pages_per_step,
+            step_sleep_ms=settings.backup_step_sleep_ms,
+            keep=settings.backup_keep,
+            max_restarts=settings.backup_max_restarts,
+        )
+    return _JOB
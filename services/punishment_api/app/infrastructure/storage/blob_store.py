@@ -0,0 +1,342 @@
+"""Хранилище документов по содержимому (content-addressed) со счётчиками ссылок.
+
+Файл хранится один раз под своим sha256 в settings.data_dir/blobs; индекс и ссылки
+владельцев (например, "analysis:<id>") — в SQLite. Блоб без ссылок удаляется сборщиком
+мусора после периода ожидания, чтобы только что загруженный файл не пропал до того,
+как на него сошлётся анализ.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Container, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ...core.config import settings
+from .codec import database_stats
+from .migrations import Migration, apply_migrations
+
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="blob index and owner references",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size_bytes INTEGER NOT NULL,
+                refcount INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                touched_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(touched_at) WHERE refcount = 0",
+            """
+            CREATE TABLE IF NOT EXISTS blob_refs (
+                owner TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (owner, hash)
+            )
+            """,
+        ),
+    ),
+)
+
+# Значение параметра, вынесенное в хранилище: {"$blob": <sha256>, "size": <байт>}.
+# Такие ссылки создаёт только сервер (externalize, загрузка документов); во входе клиента
+# ключ $blob недопустим, иначе клиент прочитал бы чужой блоб или произвольный файл.
+BLOB_REF_KEY = "$blob"
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_CHUNK_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class BlobRef:
+    hash: str
+    size: int
+
+    def as_param(self) -> Dict[str, Any]:
+        return {BLOB_REF_KEY: self.hash, "size": self.size}
+
+
+class BlobRefError(ValueError):
+    """Ссылка на блоб, которую сервер не выдавал (или некорректный хеш)."""
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get(BLOB_REF_KEY), str)
+
+
+def check_blob_hash(blob_hash: str) -> str:
+    if not isinstance(blob_hash, str) or not _HASH_RE.match(blob_hash):
+        raise BlobRefError("Некорректный хеш блоба")
+    return blob_hash
+
+
+def check_blob_refs(value: Any, trusted: Container[str] = ()) -> None:
+    """BlobRefError, если во входе есть ключ $blob, кроме ссылок из trusted (выданных сервером)."""
+
+    if isinstance(value, dict):
+        if BLOB_REF_KEY in value:
+            if not is_blob_ref(value) or value[BLOB_REF_KEY] not in trusted:
+                raise BlobRefError(f"Ключ {BLOB_REF_KEY} зарезервирован для документов, загруженных на сервер")
+            return
+        for item in value.values():
+            check_blob_refs(item, trusted)
+    elif isinstance(value, list):
+        for item in value:
+            check_blob_refs(item, trusted)
+
+
+class BlobStore:
+    def __init__(self, root: Union[str, Path]):
+        self._root = Path(root)
+        self._db_path = self._root / "blobs.db"
+        self._tmp_dir = self._root / "tmp"
+        self._lock = threading.Lock()
+        self.schema_version = 0
+        self._ensure_db()
+
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_db(self) -> None:
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
+
+    def path_for(self, blob_hash: str) -> Path:
+        check_blob_hash(blob_hash)
+        return self._root / blob_hash[:2] / blob_hash[2:4] / blob_hash
+
+    # --- Запись -------------------------------------------------------------------
+
+    def put_bytes(self, data: bytes) -> BlobRef:
+        return self.put_stream([data])
+
+    def put_stream(self, source: Union[BinaryIO, Iterable[bytes]]) -> BlobRef:
+        """Сохраняет поток, считая sha256 по ходу записи; одинаковое содержимое хранится один раз."""
+
+        chunks: Iterable[bytes]
+        if hasattr(source, "read"):
+            chunks = iter(lambda: source.read(_CHUNK_SIZE), b"")  # type: ignore[union-attr]
+        else:
+            chunks = source
+        with self.writer() as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+            return writer.commit()
+
+    def writer(self) -> "BlobWriter":
+        """Пошаговая запись блоба: write(...) по частям, затем commit(); без commit файл удаляется."""
+
+        return BlobWriter(self)
+
+    def _commit(self, tmp_path: Path, blob_hash: str, size: int) -> BlobRef:
+        now = time.time()
+        target = self.path_for(blob_hash)
+        with self._lock, self._connect() as conn:
+            known = conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+            if not known or not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+            conn.execute(
+                """
+                INSERT INTO blobs (hash, size_bytes, refcount, created_at, touched_at)
+                VALUES (?, ?, 0, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET touched_at = excluded.touched_at
+                """,
+                (blob_hash, size, now, now),
+            )
+        return BlobRef(blob_hash, size)
+
+    # --- Чтение -------------------------------------------------------------------
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.path_for(blob_hash).exists()
+
+    def open(self, blob_hash: str) -> BinaryIO:
+        return self.path_for(blob_hash).open("rb")
+
+    def iter_chunks(self, blob_hash: str, chunk_size: int = _CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(blob_hash) as handle:
+            while chunk := handle.read(chunk_size):
+                yield chunk
+
+    def read_text(self, blob_hash: str) -> str:
+        return self.path_for(blob_hash).read_text(encoding="utf-8")
+
+    # --- Ссылки и сборка мусора -----------------------------------------------------
+
+    def add_refs(self, owner: str, hashes: Iterable[str]) -> int:
+        """Регистрирует ссылки владельца; повторная ссылка на тот же блоб не учитывается."""
+
+        added = 0
+        with self._lock, self._connect() as conn:
+            for blob_hash in sorted(set(hashes)):
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO blob_refs (owner, hash) VALUES (?, ?)",
+                    (owner, blob_hash),
+                )
+                if cursor.rowcount:
+                    conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?", (blob_hash,))
+                    added += 1
+        return added
+
+    def release(self, owners: Iterable[str]) -> int:
+        """Снимает все ссылки владельцев; блобы без ссылок удалит collect_garbage."""
+
+        released = 0
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for owner in owners:
+                rows = conn.execute("DELETE FROM blob_refs WHERE owner = ? RETURNING hash", (owner,)).fetchall()
+                for row in rows:
+                    conn.execute(
+                        "UPDATE blobs SET refcount = MAX(refcount - 1, 0), touched_at = ? WHERE hash = ?",
+                        (now, row["hash"]),
+                    )
+                released += len(rows)
+        return released
+
+    def collect_garbage(self, grace_seconds: float) -> Dict[str, int]:
+        """Удаляет блобы без ссылок, не использованные дольше grace_seconds."""
+
+        cutoff = time.time() - grace_seconds
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "DELETE FROM blobs WHERE refcount = 0 AND touched_at < ? RETURNING hash, size_bytes",
+                (cutoff,),
+            ).fetchall()
+            for row in rows:
+                self.path_for(row["hash"]).unlink(missing_ok=True)
+        return {"deleted": len(rows), "reclaimed_bytes": sum(int(row["size_bytes"]) for row in rows)}
+
+    def storage_stats(self) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT COUNT(*) AS blobs, COALESCE(SUM(size_bytes), 0) AS bytes,
+                       COALESCE(SUM(refcount), 0) AS refs,
+                       COALESCE(SUM(CASE WHEN refcount = 0 THEN 1 ELSE 0 END), 0) AS unreferenced,
+                       COALESCE(SUM(size_bytes * MAX(refcount - 1, 0)), 0) AS saved
+                FROM blobs
+                """
+            ).fetchone()
+            return {
+                "root": str(self._root),
+                "schema_version": self.schema_version,
+                "blobs": int(row["blobs"]),
+                "bytes": int(row["bytes"]),
+                "references": int(row["refs"]),
+                "unreferenced": int(row["unreferenced"]),
+                # Сколько байт заняли бы копии, если бы каждая ссылка хранила текст сама.
+                "deduplicated_bytes": int(row["saved"]),
+                "index": database_stats(conn),
+            }
+
+    # --- Параметры анализов ---------------------------------------------------------
+
+    def externalize(self, value: Any, *, min_bytes: int) -> Tuple[Any, List[str]]:
+        """Заменяет строки не короче min_bytes (в UTF-8) ссылками на блобы.
+
+        Возвращает новое значение и хеши блобов, на которые оно ссылается (включая уже
+        имевшиеся ссылки, например на загруженные потоком документы). Имеющиеся ссылки
+        должны быть проверены check_blob_refs до вызова.
+        """
+
+        hashes: List[str] = []
+
+        def walk(item: Any) -> Any:
+            if is_blob_ref(item):
+                hashes.append(item[BLOB_REF_KEY])
+                return item
+            if isinstance(item, dict):
+                return {k: walk(v) for k, v in item.items()}
+            if isinstance(item, list):
+                return [walk(v) for v in item]
+            if isinstance(item, str):
+                data = item.encode("utf-8")
+                if len(data) >= min_bytes:
+                    ref = self.put_bytes(data)
+                    hashes.append(ref.hash)
+                    return ref.as_param()
+            return item
+
+        return walk(value), hashes
+
+    def resolve(self, value: Any) -> Any:
+        """Обратная операция к externalize: подставляет тексты вместо ссылок."""
+
+        if is_blob_ref(value):
+            return self.read_text(value[BLOB_REF_KEY])
+        if isinstance(value, dict):
+            return {k: self.resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(v) for v in value]
+        return value
+
+
+class BlobWriter:
+    def __init__(self, store: BlobStore):
+        self._store = store
+        fd, name = tempfile.mkstemp(dir=store._tmp_dir, prefix="upload-")
+        self._path = Path(name)
+        self._file: Optional[BinaryIO] = os.fdopen(fd, "wb")
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if self._file is None:
+            raise ValueError("Запись блоба уже завершена")
+        self._digest.update(data)
+        self.size += len(data)
+        self._file.write(data)
+
+    def commit(self) -> BlobRef:
+        self._close()
+        try:
+            return self._store._commit(self._path, self._digest.hexdigest(), self.size)
+        finally:
+            self._path.unlink(missing_ok=True)
+
+    def abort(self) -> None:
+        self._close()
+        self._path.unlink(missing_ok=True)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "BlobWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.abort()
+
+
+_STORE: Optional[BlobStore] = None
+
+
+def get_blob_store(root: Optional[str] = None) -> BlobStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = BlobStore(root or Path(settings.data_dir) / "blobs")
+    return _STORE
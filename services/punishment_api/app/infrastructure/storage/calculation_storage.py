@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import atexit
 import json
+import logging
+import queue
 import sqlite3
 import threading
+import time
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -10,6 +14,67 @@ from pathlib import Path
 from typing import Any, Dict, Optional
 
 from ...core.config import settings
+from .codec import column_stats, database_stats, decode_json, encode_json
+from .migrations import INCREMENTAL_VACUUM_STATEMENTS, Migration, apply_migrations
+
+logger = logging.getLogger(__name__)
+
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="calculations table",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS calculations (
+                id TEXT PRIMARY KEY,
+                case_id TEXT,
+                article_code TEXT,
+                article_name TEXT,
+                min_months REAL,
+                max_months REAL,
+                formatted_result TEXT,
+                calculation_log TEXT,
+                modifiers_applied TEXT,
+                warnings TEXT,
+                created_at TEXT NOT NULL,
+                created_by TEXT,
+                payload TEXT,
+                result TEXT
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_calculations_case ON calculations(case_id)",
+            "CREATE INDEX IF NOT EXISTS idx_calculations_user ON calculations(created_by)",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="history pagination indexes ordered by created_at",
+        statements=(
+            """
+            CREATE INDEX IF NOT EXISTS idx_calculations_user_created
+            ON calculations(created_by, created_at)
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_calculations_created ON calculations(created_at)",
+            # Prefix of idx_calculations_user_created.
+            "DROP INDEX IF EXISTS idx_calculations_user",
+        ),
+    ),
+    Migration(
+        version=3,
+        description="incremental auto_vacuum",
+        statements=INCREMENTAL_VACUUM_STATEMENTS,
+        transactional=False,
+    ),
+)
+
+_INSERT_SQL = """
+    INSERT INTO calculations (
+        id, case_id, article_code, article_name, min_months, max_months,
+        formatted_result, calculation_log, modifiers_applied, warnings,
+        created_at, created_by, payload, result
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
 
 def _utc_now() -> str:
@@ -35,10 +100,32 @@ class CalculationRecord:
 
 
 class CalculationStore:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, *, write_behind: bool = False):
         self._db_path = Path(db_path)
         self._lock = threading.Lock()
+        self.schema_version = 0
         self._ensure_db()
+        self._writer: Optional[CalculationWriteBehind] = None
+        if write_behind:
+            self._writer = CalculationWriteBehind(
+                self,
+                queue_size=settings.calculation_write_queue_size,
+                batch_size=settings.calculation_write_batch_size,
+                max_latency_ms=settings.calculation_write_max_latency_ms,
+            )
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        if self._writer is None:
+            return True
+        return self._writer.flush(timeout)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
 
     def _connect(self) -> sqlite3.Connection:
         conn = sqlite3.connect(self._db_path, check_same_thread=False)
@@ -48,28 +135,7 @@ class CalculationStore:
     def _ensure_db(self) -> None:
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
         with self._connect() as conn:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS calculations (
-                    id TEXT PRIMARY KEY,
-                    case_id TEXT,
-                    article_code TEXT,
-                    article_name TEXT,
-                    min_months REAL,
-                    max_months REAL,
-                    formatted_result TEXT,
-                    calculation_log TEXT,
-                    modifiers_applied TEXT,
-                    warnings TEXT,
-                    created_at TEXT NOT NULL,
-                    created_by TEXT,
-                    payload TEXT,
-                    result TEXT
-                )
-                """
-            )
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_calculations_case ON calculations(case_id)")
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_calculations_user ON calculations(created_by)")
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
 
     def create_calculation(
         self,
@@ -95,36 +161,39 @@ class CalculationStore:
         payload = payload or {}
         result = result or {}
 
-        with self._lock, self._connect() as conn:
-            conn.execute(
-                """
-                INSERT INTO calculations (
-                    id, case_id, article_code, article_name, min_months, max_months,
-                    formatted_result, calculation_log, modifiers_applied, warnings,
-                    created_at, created_by, payload, result
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    calc_id,
-                    case_id,
-                    article_code,
-                    article_name,
-                    min_months,
-                    max_months,
-                    formatted_result,
-                    json.dumps(calculation_log, ensure_ascii=False),
-                    json.dumps(modifiers_applied, ensure_ascii=False),
-                    json.dumps(warnings, ensure_ascii=False),
-                    now,
-                    created_by,
-                    json.dumps(payload, ensure_ascii=False),
-                    json.dumps(result, ensure_ascii=False),
-                ),
-            )
+        record = CalculationRecord(
+            id=calc_id,
+            case_id=case_id,
+            article_code=article_code,
+            article_name=article_name,
+            min_months=min_months,
+            max_months=max_months,
+            formatted_result=formatted_result,
+            calculation_log=calculation_log,
+            modifiers_applied=modifiers_applied,
+            warnings=warnings,
+            created_at=now,
+            created_by=created_by,
+            payload=payload,
+            result=result,
+        )
+        if self._writer is not None:
+            self._writer.submit(record)
+            return record
 
+        self.insert_records([record])
         return self.get_calculation(calc_id)
 
+    def insert_records(self, records: list[CalculationRecord]) -> None:
+        rows = [self._record_to_row(r) for r in records]
+        with self._lock, self._connect() as conn:
+            conn.executemany(_INSERT_SQL, rows)
+
     def get_calculation(self, calc_id: str) -> Optional[CalculationRecord]:
+        if self._writer is not None:
+            pending = self._writer.pending(calc_id)
+            if pending is not None:
+                return pending
         with self._lock, self._connect() as conn:
             row = conn.execute(
                 "SELECT * FROM calculations WHERE id = ?",
@@ -156,6 +225,36 @@ class CalculationStore:
 
         return total, [self._row_to_record(r) for r in rows]
 
+    def storage_stats(self) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            stats = {
+                "db_path": str(self._db_path),
+                "schema_version": self.schema_version,
+                **database_stats(conn),
+                "columns": column_stats(conn, "calculations", ("payload", "result")),
+            }
+        stats["write_behind"] = self._writer.stats() if self._writer is not None else None
+        return stats
+
+    @staticmethod
+    def _record_to_row(record: CalculationRecord) -> tuple:
+        return (
+            record.id,
+            record.case_id,
+            record.article_code,
+            record.article_name,
+            record.min_months,
+            record.max_months,
+            record.formatted_result,
+            json.dumps(record.calculation_log, ensure_ascii=False),
+            json.dumps(record.modifiers_applied, ensure_ascii=False),
+            json.dumps(record.warnings, ensure_ascii=False),
+            record.created_at,
+            record.created_by,
+            encode_json(record.payload),
+            encode_json(record.result),
+        )
+
     @staticmethod
     def _row_to_record(row: sqlite3.Row) -> CalculationRecord:
         return CalculationRecord(
@@ -171,11 +270,191 @@ class CalculationStore:
             warnings=json.loads(row["warnings"] or "[]"),
             created_at=row["created_at"],
             created_by=row["created_by"],
-            payload=json.loads(row["payload"] or "{}"),
-            result=json.loads(row["result"] or "{}"),
+            payload=decode_json(row["payload"], "{}"),
+            result=decode_json(row["result"], "{}"),
         )
 
 
+class CalculationWriteBehind:
+    """Отложенная запись истории расчётов пачками в фоновом потоке.
+
+    Запрос кладёт запись в ограниченную очередь и сразу получает ответ; поток-писатель
+    коммитит накопленное одной транзакцией, когда набралось batch_size записей или
+    истекло max_latency_ms с момента первой. Пока запись не закоммичена, она видна
+    через get_calculation из карты pending. Пачка, не записанная за _MAX_ATTEMPTS
+    попыток, пишется по одной записи; не записанные и так попадают в журнал с ошибкой
+    и в счётчик dropped. После close() следующий submit снова запускает поток.
+    """
+
+    _MAX_ATTEMPTS = 3
+
+    def __init__(
+        self,
+        store: CalculationStore,
+        *,
+        queue_size: int,
+        batch_size: int,
+        max_latency_ms: int,
+    ):
+        self._store = store
+        self._queue: queue.Queue[CalculationRecord] = queue.Queue(maxsize=max(1, queue_size))
+        self._batch_size = max(1, batch_size)
+        self._max_latency = max(0, max_latency_ms) / 1000
+        self._pending: dict[str, CalculationRecord] = {}
+        self._pending_lock = threading.Lock()
+        self._drained = threading.Condition(self._pending_lock)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._atexit_registered = False
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "write_errors": 0,
+            "blocked_puts": 0,
+            "blocked_ms_total": 0.0,
+            "max_queue_depth": 0,
+            "last_batch_size": 0,
+            "last_commit_ms": 0.0,
+        }
+
+    def submit(self, record: CalculationRecord) -> None:
+        # Под тем же замком, что и close(): запись не попадёт в очередь после её
+        # последнего слива (поток записи при этом работает и освобождает место).
+        with self._start_lock:
+            self._ensure_started_locked()
+            with self._pending_lock:
+                self._pending[record.id] = record
+                self._stats["enqueued"] += 1
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                started = time.perf_counter()
+                self._queue.put(record)
+                blocked_ms = (time.perf_counter() - started) * 1000
+                with self._pending_lock:
+                    self._stats["blocked_puts"] += 1
+                    self._stats["blocked_ms_total"] += blocked_ms
+        depth = self._queue.qsize()
+        with self._pending_lock:
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+
+    def pending(self, calc_id: str) -> Optional[CalculationRecord]:
+        with self._pending_lock:
+            return self._pending.get(calc_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._drained:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+        return True
+
+    def close(self) -> None:
+        with self._start_lock:
+            self._stop.set()
+            thread = self._thread
+            if thread is not None:
+                thread.join()
+            # Поток мог не стартовать или выйти до прихода последних записей.
+            self._drain_remaining()
+            self._thread = None
+            self._stop.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["batch_size"] = self._batch_size
+        stats["max_latency_ms"] = int(self._max_latency * 1000)
+        return stats
+
+    def _ensure_started_locked(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="calculation-writer", daemon=True)
+        self._thread.start()
+        if not self._atexit_registered:
+            atexit.register(self.close)
+            self._atexit_registered = True
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self._max_latency
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _drain_remaining(self) -> None:
+        batch: list[CalculationRecord] = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self._batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: list[CalculationRecord]) -> None:
+        started = time.perf_counter()
+        lost: list[CalculationRecord] = []
+        for attempt in range(1, self._MAX_ATTEMPTS + 1):
+            try:
+                self._store.insert_records(batch)
+                break
+            except sqlite3.Error:
+                logger.exception("Calculation batch write failed (attempt %d)", attempt)
+                with self._pending_lock:
+                    self._stats["write_errors"] += 1
+                if attempt < self._MAX_ATTEMPTS:
+                    time.sleep(0.05 * attempt)
+        else:
+            # Пачка не проходит целиком: по одной записи, чтобы не терять соседей плохой строки.
+            for record in batch:
+                try:
+                    self._store.insert_records([record])
+                except sqlite3.Error:
+                    lost.append(record)
+            if lost:
+                logger.error(
+                    "Calculation records lost after %d attempts: %s",
+                    self._MAX_ATTEMPTS,
+                    ", ".join(record.id for record in lost),
+                )
+        commit_ms = (time.perf_counter() - started) * 1000
+        with self._drained:
+            for record in batch:
+                self._pending.pop(record.id, None)
+            self._stats["batches"] += 1
+            self._stats["written"] += len(batch) - len(lost)
+            self._stats["dropped"] += len(lost)
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_commit_ms"] = round(commit_ms, 3)
+            self._drained.notify_all()
+
+
 _STORE: Optional[CalculationStore] = None
 
 
@@ -184,5 +463,5 @@ def get_calculation_store(db_path: Optional[str] = None) -> CalculationStore:
     if _STORE is None:
         base_dir = Path(settings.data_dir)
         path = db_path or str(base_dir / "calculations.db")
-        _STORE = CalculationStore(path)
+        _STORE = CalculationStore(path, write_behind=settings.calculation_write_behind)
     return _STORE
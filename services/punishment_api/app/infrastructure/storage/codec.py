@@ -0,0 +1,132 @@
+"""Сериализация JSON-колонок с прозрачным zlib-сжатием крупных значений."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, Iterable, Optional, Union
+
+from ...core.config import settings
+
+# Сжатые значения хранятся как BLOB с этим префиксом; обычные — как TEXT.
+# Старые строки (TEXT без маркера) читаются без изменений.
+ZLIB_MARKER = b"zlib:"
+
+StoredJSON = Union[str, bytes]
+
+
+class _CodecCounters:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.values_encoded = 0
+        self.values_compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def add(self, raw_size: int, stored_size: int, compressed: bool) -> None:
+        with self._lock:
+            self.values_encoded += 1
+            self.values_compressed += int(compressed)
+            self.raw_bytes += raw_size
+            self.stored_bytes += stored_size
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "values_encoded": self.values_encoded,
+                "values_compressed": self.values_compressed,
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+            }
+
+
+_COUNTERS = _CodecCounters()
+
+
+def encode_json(value: Any) -> StoredJSON:
+    text = json.dumps(value, ensure_ascii=False)
+    if not settings.storage_compression_enabled:
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < settings.storage_compression_threshold:
+        _COUNTERS.add(len(raw), len(raw), False)
+        return text
+    packed = ZLIB_MARKER + zlib.compress(raw, settings.storage_compression_level)
+    if len(packed) >= len(raw):
+        _COUNTERS.add(len(raw), len(raw), False)
+        return text
+    _COUNTERS.add(len(raw), len(packed), True)
+    return packed
+
+
+def decode_json(stored: Any, default: str) -> Any:
+    if stored is None:
+        return json.loads(default)
+    if isinstance(stored, (bytes, memoryview)):
+        data = bytes(stored)
+        if data.startswith(ZLIB_MARKER):
+            data = zlib.decompress(data[len(ZLIB_MARKER):])
+        return json.loads(data.decode("utf-8") or default)
+    return json.loads(stored or default)
+
+
+def codec_stats() -> Dict[str, Any]:
+    return {
+        "enabled": settings.storage_compression_enabled,
+        "threshold_bytes": settings.storage_compression_threshold,
+        "level": settings.storage_compression_level,
+        **_COUNTERS.snapshot(),
+    }
+
+
+def column_stats(
+    conn: sqlite3.Connection, table: str, columns: Iterable[str], *, sample_rows: Optional[int] = None
+) -> Dict[str, Any]:
+    """Размер хранимых значений по колонкам: сжатые (BLOB) против обычных (TEXT).
+
+    Считается по последним ``sample_rows`` строкам (по rowid), чтобы статус не читал
+    всю таблицу под блокировкой хранилища; 0 — по всей таблице.
+    """
+
+    columns = tuple(columns)
+    limit = settings.storage_stats_sample_rows if sample_rows is None else int(sample_rows)
+    source = table
+    if limit > 0:
+        source = f"(SELECT {', '.join(columns)} FROM {table} ORDER BY rowid DESC LIMIT {limit})"
+    stats: Dict[str, Any] = {}
+    for column in columns:
+        row = conn.execute(
+            f"""
+            SELECT
+                COUNT({column}) AS rows,
+                SUM(typeof({column}) = 'blob') AS compressed_rows,
+                COALESCE(SUM(length(CAST({column} AS BLOB))), 0) AS stored_bytes,
+                COALESCE(SUM(CASE WHEN typeof({column}) = 'blob'
+                    THEN length({column}) ELSE 0 END), 0) AS compressed_bytes,
+                COUNT(*) AS sampled
+            FROM {source}
+            """
+        ).fetchone()
+        stats[column] = {
+            "rows": int(row[0] or 0),
+            "compressed_rows": int(row[1] or 0),
+            "stored_bytes": int(row[2] or 0),
+            "compressed_bytes": int(row[3] or 0),
+            # Сколько строк реально просмотрено (в маленькой таблице меньше лимита).
+            "sample_rows": int(row[4] or 0),
+        }
+    return stats
+
+
+def database_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "page_size": int(page_size),
+        "page_count": int(page_count),
+        "freelist_count": int(freelist),
+        "size_bytes": int(page_size) * int(page_count),
+    }
@@ -0,0 +1,134 @@
+"""Инвертированный индекс на диске: словарь, постинги и длины документов массивами .npy.
+
+Поколение индекса — каталог gen-<ns> с массивами (offsets, postings_docs, postings_tf,
+doc_len), отсортированным словарём terms.json и метаданными документов docs.json.
+Указатель current.json подменяется атомарно последним, поэтому читатель видит либо
+старое поколение, либо новое целиком; массивы открываются np.load(mmap_mode="r") и
+делятся воркерами через page cache. После переключения на диске остаётся и предыдущее
+поколение: воркер, успевший прочитать старый указатель, ещё откроет его файлы; более
+старые удаляются. Если указатель сменился дважды между чтением и открытием, load()
+перечитывает указатель.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+_CURRENT = "current.json"
+_LOAD_ATTEMPTS = 3
+_ARRAYS = ("offsets", "postings_docs", "postings_tf", "doc_len")
+
+
+@dataclass(frozen=True)
+class InvertedArrays:
+    """Постинги термина i — postings_docs/postings_tf[offsets[i]:offsets[i + 1]]."""
+
+    terms: Dict[str, int]
+    offsets: np.ndarray
+    postings_docs: np.ndarray
+    postings_tf: np.ndarray
+    doc_len: np.ndarray
+    docs: List[Dict[str, Any]]
+    meta: Dict[str, Any]
+
+    @property
+    def generation(self) -> int:
+        return int(self.meta.get("generation", 0))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(getattr(self, name).nbytes) for name in _ARRAYS)
+
+
+class InvertedIndexStore:
+    def __init__(self, root: Union[str, Path]):
+        self._root = Path(root)
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        path = self._root / _CURRENT
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def write(
+        self,
+        terms: Sequence[str],
+        offsets: np.ndarray,
+        postings_docs: np.ndarray,
+        postings_tf: np.ndarray,
+        doc_len: np.ndarray,
+        docs: Sequence[Dict[str, Any]],
+        meta: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Пишет новое поколение и переключает на него указатель; возвращает указатель."""
+
+        if len(offsets) != len(terms) + 1 or len(doc_len) != len(docs):
+            raise ValueError("Размеры массивов индекса не согласованы")
+        self._root.mkdir(parents=True, exist_ok=True)
+        previous = self.current()
+        generation = time.time_ns()
+        name = f"gen-{generation:x}"
+        target = self._root / name
+        target.mkdir()
+        arrays = {"offsets": offsets, "postings_docs": postings_docs, "postings_tf": postings_tf, "doc_len": doc_len}
+        for key, array in arrays.items():
+            np.save(target / f"{key}.npy", np.ascontiguousarray(array))
+        (target / "terms.json").write_text(json.dumps(list(terms), ensure_ascii=False), encoding="utf-8")
+        (target / "docs.json").write_text(json.dumps(list(docs), ensure_ascii=False), encoding="utf-8")
+        pointer = {**meta, "name": name, "generation": generation, "terms": len(terms), "docs": len(docs)}
+        tmp = self._root / f".{_CURRENT}.{uuid.uuid4().hex}"
+        tmp.write_text(json.dumps(pointer, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self._root / _CURRENT)
+        keep = {name, previous["name"] if previous else name}
+        for stale in self._root.glob("gen-*"):
+            if stale.name not in keep:
+                shutil.rmtree(stale, ignore_errors=True)
+        return pointer
+
+    def load(self) -> Optional[InvertedArrays]:
+        """Текущее поколение с массивами, отображёнными в память; None, если индекса нет."""
+
+        for attempt in range(_LOAD_ATTEMPTS):
+            pointer = self.current()
+            if pointer is None:
+                return None
+            try:
+                return self._open(pointer)
+            except FileNotFoundError:
+                # Поколение удалено после двух переключений подряд — берём новый указатель.
+                if attempt == _LOAD_ATTEMPTS - 1:
+                    raise
+        return None
+
+    def _open(self, pointer: Dict[str, Any]) -> InvertedArrays:
+        target = self._root / pointer["name"]
+        arrays = {key: np.load(target / f"{key}.npy", mmap_mode="r") for key in _ARRAYS}
+        terms = json.loads((target / "terms.json").read_text(encoding="utf-8"))
+        docs = json.loads((target / "docs.json").read_text(encoding="utf-8"))
+        return InvertedArrays(
+            terms={term: position for position, term in enumerate(terms)},
+            docs=docs,
+            meta=pointer,
+            **arrays,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        pointer = self.current()
+        if pointer is None:
+            return {"root": str(self._root), "generation": 0}
+        target = self._root / pointer["name"]
+        disk = sum(path.stat().st_size for path in target.iterdir() if path.is_file())
+        return {"root": str(self._root), **pointer, "disk_bytes": disk}
@@ -0,0 +1,332 @@
+"""Надёжная очередь фоновых задач на SQLite с арендой (lease) задач воркерами."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from ...core.config import settings
+from .codec import database_stats, decode_json, encode_json
+from .migrations import Migration, apply_migrations
+
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="jobs table",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                payload TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_available ON jobs(status, available_at)",
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_lease ON jobs(status, lease_expires_at)",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="WAL journal for concurrent worker processes",
+        statements=("PRAGMA journal_mode = WAL",),
+        transactional=False,
+    ),
+    Migration(
+        version=3,
+        description="job priority: claim higher classes first",
+        statements=(
+            "ALTER TABLE jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT 1",
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_priority_available ON jobs(status, priority, available_at)",
+            "DROP INDEX IF EXISTS idx_jobs_status_available",
+        ),
+    ),
+)
+
+# Статусы задачи: queued -> leased -> (удаляется при успехе) | queued (повтор) | failed.
+JOB_QUEUED = "queued"
+JOB_LEASED = "leased"
+JOB_FAILED = "failed"
+
+
+class JobDeferred(Exception):
+    """Обработчик не может начать задачу сейчас: она возвращается в очередь через delay секунд."""
+
+    def __init__(self, message: str, delay: float):
+        super().__init__(message)
+        self.delay = delay
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+@dataclass(frozen=True)
+class JobRecord:
+    id: str
+    kind: str
+    ref_id: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    available_at: float
+    lease_owner: Optional[str]
+    lease_expires_at: Optional[float]
+    last_error: Optional[str]
+    created_at: str
+    updated_at: str
+    priority: int = 1
+
+    @property
+    def is_last_attempt(self) -> bool:
+        return self.attempts >= self.max_attempts
+
+
+class JobStore:
+    def __init__(self, db_path: str):
+        self._db_path = Path(db_path)
+        self._lock = threading.Lock()
+        # Будит воркеры этого процесса сразу после enqueue; другие процессы опрашивают.
+        self._new_job = threading.Condition()
+        self.schema_version = 0
+        self._ensure_db()
+
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        # Очередь разделяют несколько процессов: ждём блокировку, а не падаем.
+        conn = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_db(self) -> None:
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
+
+    def enqueue(
+        self,
+        kind: str,
+        ref_id: str,
+        payload: Optional[Dict[str, Any]] = None,
+        *,
+        max_attempts: Optional[int] = None,
+        delay_seconds: float = 0.0,
+        priority: int = 1,
+    ) -> JobRecord:
+        """Добавляет задачу; меньшее значение priority забирается воркерами раньше."""
+
+        job_id = str(uuid.uuid4())
+        now = _utc_now()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO jobs (
+                    id, kind, ref_id, payload, status, attempts, max_attempts,
+                    available_at, lease_owner, lease_expires_at, last_error, created_at, updated_at,
+                    priority
+                ) VALUES (?, ?, ?, ?, ?, 0, ?, ?, NULL, NULL, NULL, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    kind,
+                    ref_id,
+                    encode_json(payload or {}),
+                    JOB_QUEUED,
+                    max_attempts or settings.job_max_attempts,
+                    time.time() + delay_seconds,
+                    now,
+                    now,
+                    priority,
+                ),
+            )
+        with self._new_job:
+            self._new_job.notify_all()
+        return self.get_job(job_id)
+
+    def wait_for_job(self, timeout: float) -> None:
+        with self._new_job:
+            self._new_job.wait(timeout)
+
+    def get_job(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            return None
+        return self._row_to_record(row)
+
+    def has_active(self, kind: str, ref_id: str) -> bool:
+        """Есть ли по объекту задача, ещё ждущая в очереди или выполняемая."""
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE kind = ? AND ref_id = ? AND status IN (?, ?) LIMIT 1",
+                (kind, ref_id, JOB_QUEUED, JOB_LEASED),
+            ).fetchone()
+        return row is not None
+
+    def claim(
+        self,
+        worker_id: str,
+        lease_seconds: float,
+        kinds: Optional[Iterable[str]] = None,
+    ) -> Optional[JobRecord]:
+        """Атомарно берёт в аренду самую приоритетную из готовых задач (среди равных — раннюю)."""
+
+        now = time.time()
+        query = "SELECT id FROM jobs WHERE status = ? AND available_at <= ?"
+        params: list[Any] = [JOB_QUEUED, now]
+        if kinds:
+            kinds = list(kinds)
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        query += " ORDER BY priority, available_at LIMIT 1"
+
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                f"""
+                UPDATE jobs
+                SET status = ?, lease_owner = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = ({query})
+                RETURNING *
+                """,
+                [JOB_LEASED, worker_id, now + lease_seconds, _utc_now(), *params],
+            ).fetchall()
+            conn.commit()
+        if not rows:
+            return None
+        return self._row_to_record(rows[0])
+
+    def extend_lease(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET lease_expires_at = ?, updated_at = ?
+                WHERE id = ? AND status = ? AND lease_owner = ?
+                """,
+                (time.time() + lease_seconds, _utc_now(), job_id, JOB_LEASED, worker_id),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE id = ? AND lease_owner = ?",
+                (job_id, worker_id),
+            )
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry_delay: Optional[float]) -> None:
+        """Возвращает задачу в очередь через retry_delay секунд или помечает failed (None)."""
+
+        if retry_delay is None:
+            status, available_at = JOB_FAILED, time.time()
+        else:
+            status, available_at = JOB_QUEUED, time.time() + retry_delay
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, available_at = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    last_error = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (status, available_at, error, _utc_now(), job_id, worker_id),
+            )
+
+    def defer(self, job_id: str, worker_id: str, delay: float) -> None:
+        """Возвращает задачу в очередь через delay секунд, не засчитывая попытку."""
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, available_at = ?, attempts = MAX(attempts - 1, 0),
+                    lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE id = ? AND lease_owner = ?
+                """,
+                (JOB_QUEUED, time.time() + delay, _utc_now(), job_id, worker_id),
+            )
+
+    def recover_expired_leases(self) -> int:
+        """Возвращает в очередь задачи, чья аренда истекла (воркер упал или был убит)."""
+
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ?
+                WHERE status = ? AND lease_expires_at < ?
+                """,
+                (JOB_QUEUED, _utc_now(), JOB_LEASED, time.time()),
+            )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT kind, status, COUNT(*) AS cnt FROM jobs GROUP BY kind, status").fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            counts.setdefault(row["kind"], {})[row["status"]] = int(row["cnt"])
+        return counts
+
+    def storage_stats(self) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            stats = {
+                "db_path": str(self._db_path),
+                "schema_version": self.schema_version,
+                **database_stats(conn),
+            }
+        stats["jobs"] = self.counts()
+        return stats
+
+    @staticmethod
+    def _row_to_record(row: sqlite3.Row) -> JobRecord:
+        return JobRecord(
+            id=row["id"],
+            kind=row["kind"],
+            ref_id=row["ref_id"],
+            payload=decode_json(row["payload"], "{}"),
+            status=row["status"],
+            attempts=int(row["attempts"]),
+            max_attempts=int(row["max_attempts"]),
+            available_at=float(row["available_at"]),
+            lease_owner=row["lease_owner"],
+            lease_expires_at=row["lease_expires_at"],
+            last_error=row["last_error"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            priority=int(row["priority"]),
+        )
+
+
+_STORE: Optional[JobStore] = None
+
+
+def get_job_store(db_path: Optional[str] = None) -> JobStore:
+    global _STORE
+    if _STORE is None:
+        base_dir = Path(settings.data_dir)
+        path = db_path or str(base_dir / "jobs.db")
+        _STORE = JobStore(path)
+    return _STORE
@@ -0,0 +1,90 @@
+"""Версионирование схемы SQLite-хранилищ через PRAGMA user_version."""
+
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterable
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    statements: tuple[str, ...]
+    # VACUUM и смена auto_vacuum не выполняются внутри транзакции.
+    transactional: bool = True
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("PRAGMA user_version").fetchone()
+    return int(row[0]) if row else 0
+
+
+def apply_migrations(conn: sqlite3.Connection, migrations: Iterable[Migration]) -> int:
+    """Применяет недостающие миграции по порядку, каждую в своей транзакции.
+
+    Базы, созданные до появления миграций, имеют user_version = 0, поэтому
+    первая миграция каждого хранилища должна быть идемпотентной (IF NOT EXISTS).
+    """
+
+    current = get_schema_version(conn)
+    if current == 0 and not conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+        # Пустая база получает режим до первой таблицы — без VACUUM.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= current:
+            continue
+        if not migration.transactional:
+            _apply_outside_transaction(conn, migration)
+            current = migration.version
+            continue
+        conn.execute("BEGIN")
+        try:
+            for statement in migration.statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        current = migration.version
+    return current
+
+
+def _apply_outside_transaction(conn: sqlite3.Connection, migration: Migration) -> None:
+    _apply_outside_transaction_statements(
+        conn,
+        (*migration.statements, f"PRAGMA user_version = {int(migration.version)}"),
+    )
+
+
+def _apply_outside_transaction_statements(conn: sqlite3.Connection, statements: Iterable[str]) -> None:
+    conn.commit()
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for statement in statements:
+            conn.execute(statement)
+    finally:
+        conn.isolation_level = isolation_level
+
+
+# Постраничный возврат свободного места (PRAGMA incremental_vacuum). У существующей
+# базы прагма лишь запоминается: режим включит полный VACUUM, который запускается
+# отдельно (enable_incremental_vacuum, app.storage_maintenance), а не при старте —
+# он блокирует базу на всё время копирования и требует вдвое больше места на диске.
+INCREMENTAL_VACUUM_STATEMENTS = ("PRAGMA auto_vacuum = INCREMENTAL",)
+
+
+def auto_vacuum_mode(conn: sqlite3.Connection) -> str:
+    return {0: "none", 1: "full", 2: "incremental"}.get(int(conn.execute("PRAGMA auto_vacuum").fetchone()[0]), "unknown")
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """Переводит базу в auto_vacuum = INCREMENTAL полным VACUUM; False — режим уже включён."""
+
+    if auto_vacuum_mode(conn) == "incremental":
+        return False
+    _apply_outside_transaction_statements(conn, ("PRAGMA auto_vacuum = INCREMENTAL", "VACUUM"))
+    return True
@@ -0,0 +1,240 @@
+"""Фоновая очистка SQLite-хранилищ по правилам хранения (retention)."""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from ...core.config import RetentionRule, settings
+from .blob_store import get_blob_store
+from .codec import database_stats
+from .stores import get_stores
+from .upload_sessions import get_upload_session_store
+
+logger = logging.getLogger(__name__)
+
+
+def archive_path_for(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}_archive{db_path.suffix}")
+
+
+class RetentionJob:
+    """Удаляет/архивирует устаревшие строки небольшими пачками и возвращает место.
+
+    Каждая пачка — отдельная короткая транзакция под блокировкой хранилища,
+    между пачками поток спит, чтобы запросы не ждали долгую блокировку записи.
+    После очистки свободные страницы отдаются ОС через PRAGMA incremental_vacuum.
+    """
+
+    def __init__(
+        self,
+        rules: Sequence[RetentionRule],
+        *,
+        interval_seconds: int,
+        batch_size: int,
+        batch_pause_ms: int,
+        vacuum_pages: int,
+    ):
+        self._rules = list(rules)
+        self._interval = max(1, interval_seconds)
+        self._batch_size = max(1, batch_size)
+        self._pause = max(0, batch_pause_ms) / 1000
+        self._vacuum_pages = max(1, vacuum_pages)
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_report: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        if self._thread is not None or not self._rules:
+            return
+        # После stop() флаг остаётся поднятым; новый запуск снова разрешает пачки.
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="storage-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._stop.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._thread is not None,
+            "interval_seconds": self._interval,
+            "rules": [rule.model_dump() for rule in self._rules],
+            "last_report": self._last_report,
+        }
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        with self._run_lock:
+            started = time.perf_counter()
+            now = now or datetime.now(timezone.utc)
+            stores = get_stores()
+            rule_reports = []
+            touched: Dict[str, Any] = {}
+            for rule in self._rules:
+                store = stores[rule.table]
+                rule_reports.append(self._apply_rule(store, rule, now))
+                touched[rule.table] = store
+            vacuum_reports = {table: self._vacuum(store) for table, store in touched.items()}
+            blobs = get_blob_store().collect_garbage(settings.blob_gc_grace_seconds)
+            expired_uploads = get_upload_session_store().purge_expired()
+            report = {
+                "started_at": now.isoformat(),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+                "rules": rule_reports,
+                "vacuum": vacuum_reports,
+                "blobs": blobs,
+                "expired_upload_sessions": expired_uploads,
+                "reclaimed_bytes": sum(v["reclaimed_bytes"] for v in vacuum_reports.values()) + blobs["reclaimed_bytes"],
+            }
+            self._last_report = report
+            return report
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._interval):
+            try:
+                report = self.run_once()
+                logger.info(
+                    "Retention: %d rows removed, %d bytes reclaimed",
+                    sum(r["deleted"] for r in report["rules"]),
+                    report["reclaimed_bytes"],
+                )
+            except Exception:
+                logger.exception("Retention run failed")
+
+    def _apply_rule(self, store: Any, rule: RetentionRule, now: datetime) -> Dict[str, Any]:
+        cutoff = (now - timedelta(days=rule.max_age_days)).isoformat()
+        table = rule.table
+        where = "created_at < ?"
+        params: list[Any] = [cutoff]
+        if rule.status:
+            where += " AND status = ?"
+            params.append(rule.status)
+        archive = rule.action == "archive"
+        # Удалённые строки снимают ссылки на блобы; архивные строки продолжают ссылаться.
+        blob_owners = None if archive else getattr(store, "blob_owners", None)
+
+        deleted = 0
+        batches = 0
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            with store._lock:
+                conn = store._connect()
+                try:
+                    if archive:
+                        conn.execute("ATTACH DATABASE ? AS archive", (str(archive_path_for(store.db_path)),))
+                        columns = _prepare_archive_table(conn, table)
+                    ids = [
+                        row[0]
+                        for row in conn.execute(
+                            f"SELECT rowid FROM main.{table} WHERE {where} ORDER BY created_at LIMIT ?",
+                            params + [self._batch_size],
+                        )
+                    ]
+                    owners: list[str] = []
+                    if ids:
+                        placeholders = ", ".join("?" * len(ids))
+                        if blob_owners is not None:
+                            owners = blob_owners(conn, ids)
+                        with conn:
+                            if archive:
+                                conn.execute(
+                                    f"INSERT INTO archive.{table} ({columns}) SELECT {columns} FROM main.{table} "
+                                    f"WHERE rowid IN ({placeholders})",
+                                    ids,
+                                )
+                            conn.execute(f"DELETE FROM main.{table} WHERE rowid IN ({placeholders})", ids)
+                finally:
+                    conn.close()
+            if owners:
+                get_blob_store().release(owners)
+            if not ids:
+                break
+            deleted += len(ids)
+            batches += 1
+            if len(ids) < self._batch_size:
+                break
+            time.sleep(self._pause)
+
+        return {
+            "table": table,
+            "status": rule.status,
+            "action": rule.action,
+            "cutoff": cutoff,
+            "deleted": deleted,
+            "archived": deleted if archive else 0,
+            "batches": batches,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def _vacuum(self, store: Any) -> Dict[str, Any]:
+        with store._lock:
+            conn = store._connect()
+            try:
+                before = database_stats(conn)
+            finally:
+                conn.close()
+        after = before
+        steps = 0
+        # Без auto_vacuum = INCREMENTAL прагма ничего не делает: выходим, когда
+        # список свободных страниц перестал сокращаться.
+        while after["freelist_count"] > 0 and not self._stop.is_set():
+            previous = after["freelist_count"]
+            with store._lock:
+                conn = store._connect()
+                try:
+                    conn.execute(f"PRAGMA incremental_vacuum({self._vacuum_pages})").fetchall()
+                    after = database_stats(conn)
+                finally:
+                    conn.close()
+            steps += 1
+            if after["freelist_count"] >= previous:
+                break
+            time.sleep(self._pause)
+        return {
+            "size_before_bytes": before["size_bytes"],
+            "size_after_bytes": after["size_bytes"],
+            "reclaimed_bytes": max(0, before["size_bytes"] - after["size_bytes"]),
+            "freelist_pages": after["freelist_count"],
+            "steps": steps,
+        }
+
+
+def _prepare_archive_table(conn: Any, table: str) -> str:
+    """Создаёт архивную таблицу или добавляет в неё столбцы, появившиеся в основной позже.
+
+    Возвращает список столбцов основной таблицы для INSERT ... SELECT: порядок и состав
+    столбцов архива после миграций может отличаться от основной.
+    """
+
+    conn.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+    main_columns = [(row[1], row[2]) for row in conn.execute(f"PRAGMA main.table_info({table})")]
+    archived = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")}
+    for name, declared in main_columns:
+        if name not in archived:
+            conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN "{name}" {declared}')
+    return ", ".join(f'"{name}"' for name, _ in main_columns)
+
+
+_JOB: Optional[RetentionJob] = None
+
+
+def get_retention_job() -> RetentionJob:
+    global _JOB
+    if _JOB is None:
+        _JOB = RetentionJob(
+            settings.retention_rules,
+            interval_seconds=settings.retention_interval_seconds,
+            batch_size=settings.retention_batch_size,
+            batch_pause_ms=settings.retention_batch_pause_ms,
+            vacuum_pages=settings.retention_vacuum_pages,
+        )
+    return _JOB
@@ -10,6 +10,58 @@ from pathlib import Path
 from typing import Any, Dict, Optional
 
 from ...core.config import settings
+from .codec import column_stats, database_stats, decode_json, encode_json
+from .migrations import INCREMENTAL_VACUUM_STATEMENTS, Migration, apply_migrations
+
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="speeches table",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS speeches (
+                id TEXT PRIMARY KEY,
+                case_id TEXT,
+                status TEXT NOT NULL,
+                versions TEXT,
+                error_message TEXT,
+                created_by TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_speeches_case ON speeches(case_id)",
+        ),
+    ),
+    Migration(
+        version=2,
+        description="retention scans by status and age",
+        statements=(
+            "CREATE INDEX IF NOT EXISTS idx_speeches_status_created ON speeches(status, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_speeches_created ON speeches(created_at)",
+        ),
+    ),
+    Migration(
+        version=3,
+        description="incremental auto_vacuum",
+        statements=INCREMENTAL_VACUUM_STATEMENTS,
+        transactional=False,
+    ),
+    Migration(
+        version=4,
+        description="input hash for single-flight deduplication",
+        statements=(
+            "ALTER TABLE speeches ADD COLUMN input_hash TEXT",
+            """
+            CREATE INDEX IF NOT EXISTS idx_speeches_input_hash_in_flight
+            ON speeches(input_hash) WHERE status IN ('pending', 'processing')
+            """,
+        ),
+    ),
+)
+
+IN_FLIGHT_STATUSES = ("pending", "processing")
 
 
 def _utc_now() -> str:
@@ -26,14 +78,20 @@ class SpeechRecord:
     created_by: Optional[str]
     created_at: str
     updated_at: str
+    input_hash: Optional[str] = None
 
 
 class SpeechStore:
     def __init__(self, db_path: str):
         self._db_path = Path(db_path)
         self._lock = threading.Lock()
+        self.schema_version = 0
         self._ensure_db()
 
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
     def _connect(self) -> sqlite3.Connection:
         conn = sqlite3.connect(self._db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
@@ -42,48 +100,85 @@ class SpeechStore:
     def _ensure_db(self) -> None:
         self._db_path.parent.mkdir(parents=True, exist_ok=True)
         with self._connect() as conn:
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS speeches (
-                    id TEXT PRIMARY KEY,
-                    case_id TEXT,
-                    status TEXT NOT NULL,
-                    versions TEXT,
-                    error_message TEXT,
-                    created_by TEXT,
-                    created_at TEXT NOT NULL,
-                    updated_at TEXT NOT NULL
-                )
-                """
-            )
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_speeches_case ON speeches(case_id)")
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
 
     def create_speech(
         self,
         case_id: Optional[str],
         created_by: Optional[str] = None,
+        input_hash: Optional[str] = None,
     ) -> SpeechRecord:
-        speech_id = str(uuid.uuid4())
-        now = _utc_now()
         with self._lock, self._connect() as conn:
-            conn.execute(
+            speech_id = self._insert(conn, case_id, created_by, input_hash)
+        return self.get_speech(speech_id)
+
+    def create_or_attach(
+        self,
+        case_id: Optional[str],
+        created_by: Optional[str],
+        input_hash: str,
+    ) -> tuple[SpeechRecord, bool]:
+        """Возвращает незавершённую речь с тем же входом или создаёт новую (True — присоединён)."""
+
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
                 """
-                INSERT INTO speeches (
-                    id, case_id, status, versions, error_message, created_by, created_at, updated_at
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                SELECT * FROM speeches
+                WHERE input_hash = ? AND status IN ('pending', 'processing')
+                ORDER BY created_at DESC LIMIT 1
+                """,
+                (input_hash,),
+            ).fetchone()
+            if row is None:
+                speech_id = self._insert(conn, case_id, created_by, input_hash)
+            conn.commit()
+        if row is not None:
+            return self._row_to_record(row), True
+        return self.get_speech(speech_id), False
+
+    def mark_processing(self, speech_id: str, *, takeover: bool = False) -> bool:
+        """Атомарно переводит pending -> processing; False, если речь уже генерирует другой."""
+
+        statuses = IN_FLIGHT_STATUSES if takeover else ("pending",)
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"""
+                UPDATE speeches SET status = 'processing', updated_at = ?
+                WHERE id = ? AND status IN ({', '.join('?' * len(statuses))})
                 """,
-                (
-                    speech_id,
-                    case_id,
-                    "pending",
-                    json.dumps([], ensure_ascii=False),
-                    None,
-                    created_by,
-                    now,
-                    now,
-                ),
+                (_utc_now(), speech_id, *statuses),
             )
-        return self.get_speech(speech_id)
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _insert(
+        conn: sqlite3.Connection,
+        case_id: Optional[str],
+        created_by: Optional[str],
+        input_hash: Optional[str],
+    ) -> str:
+        speech_id = str(uuid.uuid4())
+        now = _utc_now()
+        conn.execute(
+            """
+            INSERT INTO speeches (
+                id, case_id, status, versions, error_message, created_by, created_at, updated_at, input_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                speech_id,
+                case_id,
+                "pending",
+                json.dumps([], ensure_ascii=False),
+                None,
+                created_by,
+                now,
+                now,
+                input_hash,
+            ),
+        )
+        return speech_id
 
     def update_speech(
         self,
@@ -103,7 +198,7 @@ class SpeechStore:
             params.append(error_message)
         if versions is not None:
             updates.append("versions = ?")
-            params.append(json.dumps(versions, ensure_ascii=False))
+            params.append(encode_json(versions))
         updates.append("updated_at = ?")
         params.append(_utc_now())
         params.append(speech_id)
@@ -137,17 +232,27 @@ class SpeechStore:
         versions.append(version)
         self.update_speech(speech_id, versions=versions, status=status)
 
+    def storage_stats(self) -> Dict[str, Any]:
+        with self._lock, self._connect() as conn:
+            return {
+                "db_path": str(self._db_path),
+                "schema_version": self.schema_version,
+                **database_stats(conn),
+                "columns": column_stats(conn, "speeches", ("versions",)),
+            }
+
     @staticmethod
     def _row_to_record(row: sqlite3.Row) -> SpeechRecord:
         return SpeechRecord(
             id=row["id"],
             case_id=row["case_id"],
             status=row["status"],
-            versions=json.loads(row["versions"] or "[]"),
+            versions=decode_json(row["versions"], "[]"),
             error_message=row["error_message"],
             created_by=row["created_by"],
             created_at=row["created_at"],
             updated_at=row["updated_at"],
+            input_hash=row["input_hash"],
         )
 
 
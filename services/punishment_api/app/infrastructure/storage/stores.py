@@ -0,0 +1,21 @@
+"""Реестр SQLite-хранилищ сервиса для служебных задач (очистка, резервные копии)."""
+
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from .ai_analysis_storage import get_analysis_store
+from .calculation_storage import get_calculation_store
+from .job_queue import get_job_store
+from .speech_storage import get_speech_store
+
+
+def get_stores() -> Dict[str, Any]:
+    """Возвращает хранилища по имени таблицы."""
+
+    return {
+        "calculations": get_calculation_store(),
+        "analyses": get_analysis_store(),
+        "speeches": get_speech_store(),
+        "jobs": get_job_store(),
+    }
@@ -0,0 +1,275 @@
+"""Возобновляемые загрузки материалов по частям (upload sessions).
+
+Сессия описывает набор файлов и размер части; части каждого файла пишутся в отдельные
+файлы под settings.data_dir/uploads/<id>/ и могут приходить в любом порядке и повторно.
+Полученные части определяются по файлам на диске, метаданные сессии — в SQLite.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+from ...core.config import settings
+from .codec import decode_json, encode_json
+from .migrations import Migration, apply_migrations
+
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="upload sessions",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                id TEXT PRIMARY KEY,
+                case_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                chunk_size INTEGER NOT NULL,
+                files TEXT NOT NULL,
+                analysis_id TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_upload_sessions_expires ON upload_sessions(expires_at)",
+        ),
+    ),
+)
+
+# Статусы: open -> committing -> committed; при ошибке сборки сессия снова open.
+# Отменённая или просроченная сессия удаляется вместе с частями.
+SESSION_OPEN = "open"
+SESSION_COMMITTING = "committing"
+SESSION_COMMITTED = "committed"
+
+_CHUNK_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class UploadSession:
+    id: str
+    case_id: str
+    status: str
+    chunk_size: int
+    files: List[Dict[str, Any]]
+    analysis_id: Optional[str]
+    created_at: float
+    expires_at: float
+
+    def chunk_count(self, file_index: int) -> int:
+        size = int(self.files[file_index]["size"])
+        return max(1, -(-size // self.chunk_size))
+
+    def expected_chunk_size(self, file_index: int, chunk_index: int) -> int:
+        size = int(self.files[file_index]["size"])
+        return max(0, min(self.chunk_size, size - chunk_index * self.chunk_size))
+
+
+def received_ranges(indices: List[int]) -> List[List[int]]:
+    """Сворачивает номера частей в диапазоны [первая, последняя]."""
+
+    ranges: List[List[int]] = []
+    for index in sorted(indices):
+        if ranges and index == ranges[-1][1] + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ranges
+
+
+def missing_ranges(indices: List[int], count: int) -> List[List[int]]:
+    """Недостающие номера частей из range(count) диапазонами [первая, последняя]."""
+
+    ranges: List[List[int]] = []
+    start = 0
+    for first, last in received_ranges(indices):
+        if first > start:
+            ranges.append([start, first - 1])
+        start = max(start, last + 1)
+    if start < count:
+        ranges.append([start, count - 1])
+    return ranges
+
+
+class UploadSessionStore:
+    def __init__(self, root: str | Path):
+        self._root = Path(root)
+        self._db_path = self._root / "upload_sessions.db"
+        self._lock = threading.Lock()
+        self.schema_version = 0
+        self._ensure_db()
+
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_db(self) -> None:
+        self._root.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
+
+    def _session_dir(self, upload_id: str) -> Path:
+        directory = (self._root / upload_id).resolve()
+        # id приходит из URL: каталог сессии — строго дочерний каталог хранилища.
+        if directory.parent != self._root.resolve():
+            raise ValueError(f"Недопустимый id сессии загрузки: {upload_id!r}")
+        return directory
+
+    def _chunk_path(self, upload_id: str, file_index: int, chunk_index: int) -> Path:
+        return self._session_dir(upload_id) / str(file_index) / f"{chunk_index:06d}.part"
+
+    def create(self, case_id: str, files: List[Dict[str, Any]], chunk_size: int, ttl_seconds: float) -> UploadSession:
+        upload_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO upload_sessions (id, case_id, status, chunk_size, files, analysis_id, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, NULL, ?, ?)
+                """,
+                (upload_id, case_id, SESSION_OPEN, chunk_size, encode_json(files), now, now + ttl_seconds),
+            )
+        for index in range(len(files)):
+            (self._session_dir(upload_id) / str(index)).mkdir(parents=True, exist_ok=True)
+        return self.get(upload_id)  # type: ignore[return-value]
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT * FROM upload_sessions WHERE id = ?", (upload_id,)).fetchone()
+        if not row:
+            return None
+        return UploadSession(
+            id=row["id"],
+            case_id=row["case_id"],
+            status=row["status"],
+            chunk_size=int(row["chunk_size"]),
+            files=decode_json(row["files"], "[]"),
+            analysis_id=row["analysis_id"],
+            created_at=float(row["created_at"]),
+            expires_at=float(row["expires_at"]),
+        )
+
+    def chunk_writer(self, upload_id: str, file_index: int, chunk_index: int) -> "ChunkWriter":
+        return ChunkWriter(self._chunk_path(upload_id, file_index, chunk_index))
+
+    def received_chunks(self, upload_id: str, file_index: int) -> List[int]:
+        directory = self._session_dir(upload_id) / str(file_index)
+        if not directory.exists():
+            return []
+        return sorted(int(path.stem) for path in directory.glob("*.part"))
+
+    def iter_file(self, session: UploadSession, file_index: int) -> Iterator[bytes]:
+        """Содержимое файла сессии: части по порядку, порциями."""
+
+        for chunk_index in range(session.chunk_count(file_index)):
+            with self._chunk_path(session.id, file_index, chunk_index).open("rb") as handle:
+                while data := handle.read(_CHUNK_SIZE):
+                    yield data
+
+    def begin_commit(self, upload_id: str) -> bool:
+        """Переводит открытую сессию в committing; False, если её уже фиксирует другой запрос."""
+
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE upload_sessions SET status = ? WHERE id = ? AND status = ?",
+                (SESSION_COMMITTING, upload_id, SESSION_OPEN),
+            )
+        return cursor.rowcount == 1
+
+    def reopen(self, upload_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE upload_sessions SET status = ? WHERE id = ? AND status = ?",
+                (SESSION_OPEN, upload_id, SESSION_COMMITTING),
+            )
+
+    def mark_committed(self, upload_id: str, analysis_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE upload_sessions SET status = ?, analysis_id = ? WHERE id = ?",
+                (SESSION_COMMITTED, analysis_id, upload_id),
+            )
+        self.discard_chunks(upload_id)
+
+    def discard_chunks(self, upload_id: str) -> None:
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+
+    def delete(self, upload_id: str) -> bool:
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+        if cursor.rowcount != 1:
+            return False
+        self.discard_chunks(upload_id)
+        return True
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Удаляет просроченные сессии вместе с полученными частями."""
+
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "DELETE FROM upload_sessions WHERE expires_at < ? RETURNING id",
+                (now or time.time(),),
+            ).fetchall()
+        for row in rows:
+            self.discard_chunks(row["id"])
+        return len(rows)
+
+
+class ChunkWriter:
+    """Пишет часть во временный файл и атомарно подменяет ею прежнюю при commit()."""
+
+    def __init__(self, target: Path):
+        self._target = target
+        self._target.parent.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=target.parent, prefix=".chunk-")
+        self._tmp = Path(name)
+        self._file: Optional[BinaryIO] = os.fdopen(fd, "wb")
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        assert self._file is not None
+        self.size += len(data)
+        self._file.write(data)
+
+    def commit(self) -> None:
+        self._close()
+        os.replace(self._tmp, self._target)
+
+    def abort(self) -> None:
+        self._close()
+        self._tmp.unlink(missing_ok=True)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "ChunkWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.abort()
+
+
+_STORE: Optional[UploadSessionStore] = None
+
+
+def get_upload_session_store(root: Optional[str] = None) -> UploadSessionStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = UploadSessionStore(root or Path(settings.data_dir) / "uploads")
+    return _STORE
@@ -0,0 +1,448 @@
+"""Хранилище векторов корпуса приговоров на диске, отображаемое в память.
+
+Векторы лежат неизменяемыми сегментами: float16 или int8 с масштабом на строку (плюс код
+решения на строку), так что миллион векторов 768 измерений занимает ~1.5 ГБ/0.75 ГБ
+вместо 6 ГБ float64. Файлы открываются np.memmap только на чтение — все воркеры uvicorn
+делят одни и те же страницы через page cache ОС. Состав сегментов описывает
+manifest.json, который подменяется атомарно; идентификаторы и метаданные строк — в
+SQLite рядом (meta.db). Добавление пишет новый сегмент, слияние сводит сегменты в один;
+читатели со старым манифестом продолжают работать с уже открытыми файлами. Файлы
+сегментов, заменённых слиянием, остаются на диске до следующего слияния (список retired
+манифеста), чтобы процесс, прочитавший предыдущий манифест, успел их открыть; snapshot()
+перечитывает манифест, если файлы всё же исчезли.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from .codec import decode_json, encode_json
+from .migrations import Migration, apply_migrations
+
+try:  # межпроцессная блокировка писателя; на платформах без fcntl — только потоковая
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+_MIGRATIONS = (
+    Migration(
+        version=1,
+        description="vector rows metadata",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS vectors (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                decision TEXT,
+                payload BLOB NOT NULL
+            )
+            """,
+        ),
+    ),
+)
+
+VECTOR_DTYPES = ("float16", "int8", "float32")
+
+# Решение по приговору хранится кодом int8 рядом с вектором: индекс в DECISIONS или -1.
+DECISIONS = ("guilty", "acquittal", "return")
+UNKNOWN_DECISION = -1
+
+_MANIFEST = "manifest.json"
+_SNAPSHOT_ATTEMPTS = 3
+_BLOCK_ROWS = 2048
+
+
+def decision_codes(decisions: Sequence[Optional[str]]) -> np.ndarray:
+    return np.fromiter(
+        (DECISIONS.index(value) if value in DECISIONS else UNKNOWN_DECISION for value in decisions),
+        dtype=np.int8,
+        count=len(decisions),
+    )
+
+
+@dataclass(frozen=True)
+class Segment:
+    name: str
+    count: int
+
+    def files(self, root: Path) -> Dict[str, Path]:
+        return {
+            "vectors": root / f"{self.name}.vec",
+            "scales": root / f"{self.name}.scale",
+            "decisions": root / f"{self.name}.dec",
+        }
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Квантует float32-векторы; для int8 возвращает масштаб каждой строки."""
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    safe = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return np.rint(vectors / safe[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class QuantizedMatrix:
+    """Матрица из сегментов на диске, которую индекс читает как массив float32.
+
+    Поддерживает то, что нужно поиску: len/shape, срезы и выборку строк (возвращают
+    float32) и произведение на вектор (@), которое считается блоками без копии всей матрицы.
+    """
+
+    def __init__(self, parts: List[Tuple[np.ndarray, Optional[np.ndarray]]], dim: int):
+        self._parts = parts
+        self._starts = np.cumsum([0] + [len(vectors) for vectors, _ in parts])
+        self.shape = (int(self._starts[-1]), dim)
+        self.ndim = 2
+        self.dtype = np.dtype(np.float32)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes + (s.nbytes if s is not None else 0) for v, s in self._parts)
+
+    def __matmul__(self, query: np.ndarray) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32)
+        out = np.empty(len(self), dtype=np.float32)
+        for (vectors, scales), base in zip(self._parts, self._starts):
+            for start in range(0, len(vectors), _BLOCK_ROWS):
+                block = np.asarray(vectors[start : start + _BLOCK_ROWS], dtype=np.float32) @ query
+                if scales is not None:
+                    block *= scales[start : start + _BLOCK_ROWS]
+                out[base + start : base + start + len(block)] = block
+        return out
+
+    def __getitem__(self, key: Union[slice, np.ndarray, Sequence[int]]) -> np.ndarray:
+        if isinstance(key, slice):
+            rows = np.arange(len(self))[key]
+        else:
+            rows = np.asarray(key, dtype=np.int64)
+        out = np.empty((len(rows), self.shape[1]), dtype=np.float32)
+        part_of = np.searchsorted(self._starts, rows, side="right") - 1
+        for part in np.unique(part_of):
+            mask = part_of == part
+            local = rows[mask] - self._starts[part]
+            vectors, scales = self._parts[part]
+            block = np.asarray(vectors[local], dtype=np.float32)
+            if scales is not None:
+                block *= scales[local][:, None]
+            out[mask] = block
+        return out
+
+
+class MetadataTable:
+    """Метаданные строк из meta.db; индексируется номером строки, как список."""
+
+    def __init__(self, store: "VectorStore", count: int):
+        self._store = store
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        return self.get_many([row])[0]
+
+    def get_many(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        return self._store.metadata(rows)
+
+
+@dataclass(frozen=True)
+class StoreSnapshot:
+    """Согласованный срез хранилища по одному манифесту."""
+
+    generation: int
+    vector_model: str
+    dtype: str
+    vectors: QuantizedMatrix
+    decisions: np.ndarray
+    metadata: MetadataTable
+
+
+class VectorStore:
+    def __init__(self, root: Union[str, Path]):
+        self._root = Path(root)
+        self._db_path = self._root / "meta.db"
+        self._lock = threading.Lock()
+        self.schema_version = 0
+        self._ensure_db()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_db(self) -> None:
+        self._root.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.schema_version = apply_migrations(conn, _MIGRATIONS)
+
+    # --- Манифест -------------------------------------------------------------------
+
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        path = self._root / _MANIFEST
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        tmp = self._root / f".{_MANIFEST}.{uuid.uuid4().hex}"
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, self._root / _MANIFEST)
+
+    @contextmanager
+    def _writer(self) -> Iterator[None]:
+        """Один писатель: блокировка потоков процесса и файловая блокировка между процессами."""
+
+        with self._lock, (self._root / ".lock").open("a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    # --- Запись ---------------------------------------------------------------------
+
+    def append(
+        self,
+        vectors: np.ndarray,
+        metadata: Sequence[Dict[str, Any]],
+        *,
+        vector_model: str,
+        dtype: str = "float16",
+        max_segments: int = 0,
+    ) -> int:
+        """Добавляет сегмент; строки с уже известными id пропускаются. Возвращает число добавленных.
+
+        max_segments > 0 — слить сегменты, если их стало больше.
+        """
+
+        if len(vectors) != len(metadata):
+            raise ValueError("Число векторов и записей метаданных не совпадает")
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Неизвестный тип векторов: {dtype}")
+        with self._writer():
+            manifest = self.manifest() or {
+                "vector_model": vector_model,
+                "dtype": dtype,
+                "dim": int(vectors.shape[1]) if len(vectors) else 0,
+                "generation": 0,
+                "segments": [],
+            }
+            if manifest["vector_model"] != vector_model:
+                raise ValueError(f"Модель векторов {vector_model} не совпадает с моделью хранилища {manifest['vector_model']}")
+            if len(vectors) and manifest["segments"] and int(vectors.shape[1]) != manifest["dim"]:
+                raise ValueError(f"Размерность векторов {vectors.shape[1]} не совпадает с хранилищем ({manifest['dim']})")
+            base = sum(segment["count"] for segment in manifest["segments"])
+            with self._connect() as conn:
+                # Строки, записанные прерванным добавлением до смены манифеста, не существуют.
+                conn.execute("DELETE FROM vectors WHERE row >= ?", (base,))
+            ids = [str(item["id"]) for item in metadata]
+            fresh = self._new_rows(ids)
+            if not fresh:
+                return 0
+            keep = np.asarray(fresh, dtype=np.int64)
+            segment = Segment(name=f"seg-{time.time_ns():x}", count=len(fresh))
+            self._write_segment(
+                segment,
+                np.asarray(vectors, dtype=np.float32)[keep],
+                [metadata[i] for i in fresh],
+                manifest["dtype"],
+            )
+            with self._connect() as conn:
+                conn.executemany(
+                    "INSERT INTO vectors (row, id, decision, payload) VALUES (?, ?, ?, ?)",
+                    [
+                        (base + offset, ids[i], metadata[i].get("decision"), encode_json(metadata[i]))
+                        for offset, i in enumerate(fresh)
+                    ],
+                )
+            manifest["dim"] = int(vectors.shape[1])
+            manifest["segments"].append({"name": segment.name, "count": segment.count})
+            manifest["generation"] += 1
+            self._write_manifest(manifest)
+            if max_segments and len(manifest["segments"]) > max_segments:
+                self._merge_locked(manifest)
+            return len(fresh)
+
+    def known_ids(self, ids: Sequence[str]) -> Set[str]:
+        """Какие из ids уже есть в зафиксированных манифестом строках хранилища."""
+
+        manifest = self.manifest()
+        base = sum(segment["count"] for segment in manifest["segments"]) if manifest else 0
+        known: Set[str] = set()
+        with self._connect() as conn:
+            for start in range(0, len(ids), 500):
+                batch = list(ids[start : start + 500])
+                placeholders = ",".join("?" * len(batch))
+                query = f"SELECT id FROM vectors WHERE row < ? AND id IN ({placeholders})"
+                known.update(row["id"] for row in conn.execute(query, [base, *batch]))
+        return known
+
+    def _new_rows(self, ids: List[str]) -> List[int]:
+        known = self.known_ids(ids)
+        seen: set = set()
+        fresh = []
+        for position, item_id in enumerate(ids):
+            if item_id in known or item_id in seen:
+                continue
+            seen.add(item_id)
+            fresh.append(position)
+        return fresh
+
+    def _write_segment(self, segment: Segment, vectors: np.ndarray, metadata: Sequence[Dict[str, Any]], dtype: str) -> None:
+        files = segment.files(self._root)
+        quantized, scales = quantize(vectors, dtype)
+        self._write_array(files["vectors"], quantized)
+        if scales is not None:
+            self._write_array(files["scales"], scales)
+        self._write_array(files["decisions"], decision_codes([item.get("decision") for item in metadata]))
+
+    @staticmethod
+    def _write_array(path: Path, array: np.ndarray) -> None:
+        tmp = path.with_name(f".{path.name}.tmp")
+        with tmp.open("wb") as handle:
+            handle.write(np.ascontiguousarray(array).tobytes())
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, path)
+
+    def merge(self) -> Dict[str, Any]:
+        """Сливает все сегменты в один; номера строк и метаданные не меняются."""
+
+        with self._writer():
+            manifest = self.manifest()
+            if not manifest or len(manifest["segments"]) < 2:
+                return {"merged": 0}
+            return self._merge_locked(manifest)
+
+    def _merge_locked(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        old = [Segment(item["name"], item["count"]) for item in manifest["segments"]]
+        merged = Segment(name=f"seg-{time.time_ns():x}", count=sum(s.count for s in old))
+        target = merged.files(self._root)
+        for kind in ("vectors", "scales", "decisions"):
+            sources = [s.files(self._root)[kind] for s in old]
+            if not sources[0].exists():
+                continue
+            tmp = target[kind].with_name(f".{target[kind].name}.tmp")
+            with tmp.open("wb") as out:
+                for source in sources:
+                    with source.open("rb") as handle:
+                        while chunk := handle.read(1 << 20):
+                            out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, target[kind])
+        retired = manifest.get("retired") or []
+        manifest["segments"] = [{"name": merged.name, "count": merged.count}]
+        manifest["retired"] = [segment.name for segment in old]
+        manifest["generation"] += 1
+        self._write_manifest(manifest)
+        # Удаляются сегменты, заменённые предыдущим слиянием: манифест, который на них
+        # ссылался, устарел два слияния назад. Открытые отображения остаются действительными.
+        for name in retired:
+            for path in Segment(name, 0).files(self._root).values():
+                path.unlink(missing_ok=True)
+        return {"merged": len(old), "rows": merged.count, "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    # --- Чтение ---------------------------------------------------------------------
+
+    def snapshot(self) -> Optional[StoreSnapshot]:
+        """Открывает сегменты текущего манифеста через np.memmap (только чтение)."""
+
+        for attempt in range(_SNAPSHOT_ATTEMPTS):
+            manifest = self.manifest()
+            if not manifest or not manifest["segments"]:
+                return None
+            try:
+                return self._open(manifest)
+            except FileNotFoundError:
+                # Между чтением манифеста и открытием файлов прошло два слияния.
+                if attempt == _SNAPSHOT_ATTEMPTS - 1:
+                    raise
+        return None
+
+    def _open(self, manifest: Dict[str, Any]) -> StoreSnapshot:
+        dim, dtype = int(manifest["dim"]), manifest["dtype"]
+        parts: List[Tuple[np.ndarray, Optional[np.ndarray]]] = []
+        decisions: List[np.ndarray] = []
+        for item in manifest["segments"]:
+            segment = Segment(item["name"], item["count"])
+            files = segment.files(self._root)
+            vectors = np.memmap(files["vectors"], dtype=dtype, mode="r", shape=(segment.count, dim))
+            scales = np.memmap(files["scales"], dtype=np.float32, mode="r", shape=(segment.count,)) if dtype == "int8" else None
+            parts.append((vectors, scales))
+            decisions.append(np.fromfile(files["decisions"], dtype=np.int8, count=segment.count))
+        matrix = QuantizedMatrix(parts, dim)
+        return StoreSnapshot(
+            generation=int(manifest["generation"]),
+            vector_model=manifest["vector_model"],
+            dtype=dtype,
+            vectors=matrix,
+            decisions=np.concatenate(decisions),
+            metadata=MetadataTable(self, len(matrix)),
+        )
+
+    def metadata(self, rows: Sequence[int]) -> List[Dict[str, Any]]:
+        rows = [int(row) for row in rows]
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        with self._connect() as conn:
+            found = {
+                row["row"]: decode_json(row["payload"], "{}")
+                for row in conn.execute(f"SELECT row, payload FROM vectors WHERE row IN ({placeholders})", rows)
+            }
+        return [found[row] for row in rows]
+
+    def count(self) -> int:
+        manifest = self.manifest()
+        return sum(item["count"] for item in manifest["segments"]) if manifest else 0
+
+    def stats(self) -> Dict[str, Any]:
+        manifest = self.manifest() or {}
+        segments = manifest.get("segments") or []
+        live = {item["name"] for item in segments}
+        disk = retired = 0
+        for path in self._root.glob("seg-*"):
+            if path.is_file():
+                if path.stem in live:
+                    disk += path.stat().st_size
+                else:
+                    retired += path.stat().st_size
+        return {
+            "root": str(self._root),
+            "vector_model": manifest.get("vector_model"),
+            "dtype": manifest.get("dtype"),
+            "dim": manifest.get("dim"),
+            "generation": manifest.get("generation", 0),
+            "segments": len(segments),
+            "rows": sum(item["count"] for item in segments),
+            "disk_bytes": disk,
+            "retired_bytes": retired,
+        }
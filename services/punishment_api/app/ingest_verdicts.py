@@ -0,0 +1,60 @@
+"""Загрузка корпуса приговоров из каталога текстовых файлов в индекс похожих приговоров.
+
+Запуск: ``python -m services.punishment_api.app.ingest_verdicts /data/verdicts --workers 8``.
+Прерванную загрузку достаточно запустить повторно: она продолжится с контрольной точки.
+``--fit-idf 20000`` перед первой загрузкой считает IDF по выборке корпуса (idf.npy в
+data_dir/embeddings); HTTP-процессы читают его при старте, их нужно перезапустить.
+Запущенные HTTP-процессы увидят новые сегменты без перезапуска (VERDICT_INDEX_AUTORELOAD).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from pathlib import Path
+
+from .core.config import settings
+from .core.logging import setup_logging
+from .domain.services.vector_index import get_verdict_store
+from .domain.services.verdict_ingest import fit_corpus_idf, ingest_corpus, use_idf
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Punishment API verdict corpus ingest")
+    parser.add_argument("source", type=Path, help="каталог с текстами приговоров (*.txt, рекурсивно)")
+    parser.add_argument("--workers", type=int, default=settings.verdict_ingest_workers, help="число процессов (0 — по числу CPU)")
+    parser.add_argument("--files-per-task", type=int, default=64, help="файлов в одной задаче процесса")
+    parser.add_argument("--write-batch", type=int, default=settings.verdict_ingest_write_batch, help="строк в одном сегменте")
+    parser.add_argument("--chunk-chars", type=int, default=settings.verdict_ingest_chunk_chars, help="длина куска текста")
+    parser.add_argument("--dtype", choices=["float16", "int8", "float32"], default=settings.vector_store_dtype)
+    parser.add_argument("--restart", action="store_true", help="игнорировать контрольную точку")
+    parser.add_argument("--fit-idf", type=int, default=0, metavar="N", help="посчитать IDF по N файлам корпуса до загрузки")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    store = get_verdict_store()
+    if args.fit_idf:
+        try:
+            use_idf(fit_corpus_idf(args.source, sample=args.fit_idf), store)
+        except ValueError as exc:
+            parser.error(str(exc))
+    logger.info("Ingesting %s into %s", args.source, store.root)
+    report = ingest_corpus(
+        args.source,
+        store,
+        workers=args.workers,
+        files_per_task=args.files_per_task,
+        write_batch=args.write_batch,
+        chunk_chars=args.chunk_chars,
+        dtype=args.dtype,
+        max_segments=settings.vector_store_max_segments,
+        restart=args.restart,
+    )
+    print(json.dumps({**report.as_dict(), "store": store.stats()}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator
 
 import uvicorn
 from fastapi import FastAPI
@@ -12,6 +14,11 @@ from .api.v1.router import router as v1_router
 from .core.config import get_settings
 from .core.logging import setup_logging
 from .core.tags import OPENAPI_TAGS
+from .domain.services.ai_analysis_provider import close_ai_provider
+from .domain.services.job_worker import get_worker_pool
+from .infrastructure.storage.backup import get_backup_job
+from .infrastructure.storage.calculation_storage import get_calculation_store
+from .infrastructure.storage.retention import get_retention_job
 
 setup_logging()
 logger = logging.getLogger(__name__)
@@ -34,6 +41,23 @@ def _ensure_runtime_paths(reference_file_path: str, data_dir: str) -> None:
             probe.unlink()
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    get_worker_pool().start()
+    if settings.retention_enabled:
+        get_retention_job().start()
+    if settings.backup_enabled:
+        get_backup_job().start()
+    yield
+    get_backup_job().stop()
+    get_retention_job().stop()
+    get_worker_pool().stop()
+    close_ai_provider()
+    # Дописать отложенную историю расчётов до остановки процесса.
+    get_calculation_store().close()
+
+
 def create_app() -> FastAPI:
     settings = get_settings()
     _ensure_runtime_paths(settings.reference_file_path, settings.data_dir)
@@ -42,6 +66,7 @@ def create_app() -> FastAPI:
         title=settings.api_title,
         version=settings.api_version,
         openapi_tags=OPENAPI_TAGS,
+        lifespan=lifespan,
     )
     fastapi_app.include_router(v1_router)
     return fastapi_app
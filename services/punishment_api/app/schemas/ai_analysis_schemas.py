@@ -32,6 +32,10 @@ class AnalyzeMaterialsResponse(BaseModel):
     status: str
     poll_url: Optional[str] = None
     result: Optional[Dict[str, Any]] = None
+    # Загрузка файлами: по каждому файлу кодировка, размеры, sha256 текста и время обработки.
+    files: Optional[List[Dict[str, Any]]] = None
+    # Пропущенные файлы (например, нетекстовые члены архива) с причиной.
+    warnings: Optional[List[Dict[str, Any]]] = None
 
 
 class AnalyzeRisksRequest(BaseModel):
@@ -108,6 +112,13 @@ class AnalysisStatusResponse(BaseModel):
     error_message: Optional[str] = None
 
 
+class AnalysisSchedulerResponse(BaseModel):
+    success: bool = True
+    scheduler: Dict[str, Any]
+    queue: Dict[str, Dict[str, int]]
+    provider: Optional[Dict[str, Any]] = None
+
+
 class AnalysisListItem(BaseModel):
     id: str
     analysis_type: str
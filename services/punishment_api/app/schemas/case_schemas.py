@@ -74,6 +74,7 @@ class NormativeDecree(BaseModel):
     subtitle: str
     relevance: Literal["high", "medium", "low"] = "medium"
     summary: Optional[str] = None
+    score: Optional[float] = None
 
 
 class NormsSearchRequest(BaseModel):
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import date
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field, field_validator
 
@@ -125,9 +125,28 @@ class ReferenceStatusResponse(BaseModel):
     file_path: str
 
 
+class StorageStatusResponse(BaseModel):
+    success: bool = True
+    compression: Dict[str, Any]
+    stores: Dict[str, Dict[str, Any]]
+    retention: Optional[Dict[str, Any]] = None
+    backup: Optional[Dict[str, Any]] = None
+    blobs: Optional[Dict[str, Any]] = None
+
+
+class RetentionRunResponse(BaseModel):
+    success: bool = True
+    report: Dict[str, Any]
+
+
+class BackupRunResponse(BaseModel):
+    success: bool = True
+    report: Dict[str, Any]
+
+
 class VectorizeRequest(BaseModel):
     report_text: str = Field(description="Текст справки по делу")
-    vector_model: Optional[str] = Field(default="mock-embedding-v1")
+    vector_model: Optional[str] = Field(default=None, description="Игнорируется: используется локальная модель")
 
 
 class VectorizeResponse(BaseModel):
@@ -136,6 +155,26 @@ class VectorizeResponse(BaseModel):
     vector: List[float]
 
 
+class VectorizeBatchRequest(BaseModel):
+    reports: List[str] = Field(description="Тексты справок")
+    vector_model: Optional[str] = Field(default=None, description="Игнорируется: используется локальная модель")
+
+
+class VectorizeBatchResponse(BaseModel):
+    success: bool = True
+    vector_model: str
+    dim: int
+    vectors: List[List[float]]
+    cached: int = Field(description="Сколько векторов взято из кеша по хешу текста")
+    elapsed_ms: float
+
+
+class VerdictIndexStatusResponse(BaseModel):
+    success: bool = True
+    loaded: bool
+    index: Optional[Dict[str, Any]] = None
+
+
 class ArticleInfo(BaseModel):
     code: str
     name: str
@@ -152,6 +191,79 @@ class ArticleInfoResponse(BaseModel):
     article: ArticleInfo
 
 
+class ArticleBulkRequest(BaseModel):
+    queries: List[str] = Field(description="Статьи в любом виде, который понимает GET /api/article/")
+
+
+class ArticleBulkItem(BaseModel):
+    query: str
+    found: bool
+    article: Optional[ArticleInfo] = None
+    error: Optional[str] = None
+
+
+class ArticleBulkResponse(BaseModel):
+    success: bool = True
+    count: int
+    found: int
+    items: List[ArticleBulkItem]
+
+
+class ArticleCatalogResponse(BaseModel):
+    success: bool = True
+    version: str = Field(description="Версия справочника (хеш файла); она же ETag")
+    count: int
+    articles: List[ArticleInfo]
+
+
+class ArticleSanctionsQuery(BaseModel):
+    where: Optional[Dict[str, Any]] = Field(
+        default=None,
+        description='Условие {"field", "op", "value"} или {"and": [...]}, {"or": [...]}, {"not": {...}}',
+    )
+    include_excluded: bool = Field(default=False, description="Включать исключённые статьи")
+    order_by: str = Field(default="code", description="code или числовое поле условия")
+    descending: bool = False
+    offset: int = Field(default=0, ge=0)
+    limit: Optional[int] = Field(default=None, ge=1)
+
+
+class ArticleSanctions(ArticleInfo):
+    title: str
+    prest: str
+    punishments: List[str]
+    additional_mandatory: List[str]
+    additional_optional: List[str]
+    limits: Dict[str, Optional[float]]
+
+
+class ArticleSanctionsResponse(BaseModel):
+    success: bool = True
+    version: str
+    total: int
+    offset: int
+    count: int
+    elapsed_ms: float
+    articles: List[ArticleSanctions]
+
+
+class ArticleSuggestion(BaseModel):
+    code: str
+    stat: str
+    name: str
+    article: str
+    part: Optional[str] = None
+    match: Literal["code", "name"]
+    score: float
+
+
+class ArticleSuggestResponse(BaseModel):
+    success: bool = True
+    query: str
+    count: int
+    items: List[ArticleSuggestion]
+
+
 class ErrorResponse(BaseModel):
     success: bool = False
     error: str
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class UploadFileSpec(BaseModel):
+    name: str = Field(description="Имя файла (.txt или один zip/tar архив)")
+    size: int = Field(ge=0, description="Размер файла в байтах")
+    sha256: Optional[str] = Field(default=None, description="sha256 файла; проверяется при commit")
+
+
+class UploadSessionCreateRequest(BaseModel):
+    files: List[UploadFileSpec]
+    chunk_size: Optional[int] = Field(default=None, description="Размер части в байтах (по умолчанию из настроек)")
+
+
+class UploadFileProgress(BaseModel):
+    index: int
+    name: str
+    size: int
+    chunk_count: int
+    received: List[List[int]] = Field(description="Полученные части диапазонами [первая, последняя]")
+    missing: List[List[int]] = Field(description="Недостающие части диапазонами [первая, последняя]")
+    missing_count: int
+    received_bytes: int
+
+
+class UploadSessionResponse(BaseModel):
+    success: bool = True
+    upload_id: str
+    case_id: str
+    status: str
+    chunk_size: int
+    expires_at: str
+    files: List[UploadFileProgress]
+    complete: bool
+    analysis_id: Optional[str] = None
+    poll_url: Optional[str] = None
+
+
+class UploadChunkResponse(BaseModel):
+    success: bool = True
+    upload_id: str
+    file_index: int
+    chunk_index: int
+    size: int
+    sha256: str
+
+
+class UploadSessionDeletedResponse(BaseModel):
+    success: bool = True
+    upload_id: str
@@ -0,0 +1,60 @@
+"""Обслуживание SQLite-хранилищ вне обработки запросов.
+
+Запуск: ``python -m services.punishment_api.app.storage_maintenance --incremental-vacuum``.
+Без флагов печатает режим auto_vacuum и размер баз. ``--incremental-vacuum`` переводит
+базы, созданные до появления режима, в auto_vacuum = INCREMENTAL полным VACUUM: база
+копируется целиком (нужно примерно вдвое больше свободного места), запись в неё на это
+время ждёт, поэтому команду запускают в окно обслуживания.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+
+from .core.logging import setup_logging
+from .infrastructure.storage.codec import database_stats
+from .infrastructure.storage.migrations import auto_vacuum_mode, enable_incremental_vacuum
+from .infrastructure.storage.stores import get_stores
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: list[str] | None = None) -> None:
+    stores = get_stores()
+    parser = argparse.ArgumentParser(description="Punishment API storage maintenance")
+    parser.add_argument("--incremental-vacuum", action="store_true", help="включить auto_vacuum = INCREMENTAL (полный VACUUM)")
+    parser.add_argument("--store", action="append", choices=sorted(stores), help="хранилище (по умолчанию все)")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    for name in args.store or sorted(stores):
+        store = stores[name]
+        started = time.perf_counter()
+        with store._lock:
+            conn = store._connect()
+            try:
+                before = database_stats(conn)
+                vacuumed = False
+                if args.incremental_vacuum:
+                    logger.info("VACUUM %s (%d bytes)", name, before["size_bytes"])
+                    vacuumed = enable_incremental_vacuum(conn)
+                after = database_stats(conn)
+                mode = auto_vacuum_mode(conn)
+            finally:
+                conn.close()
+        report = {
+            "store": name,
+            "auto_vacuum": mode,
+            "vacuumed": vacuumed,
+            "size_before_bytes": before["size_bytes"],
+            "size_after_bytes": after["size_bytes"],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Отдельный процесс-воркер очереди фоновых задач.
+
+Запуск: ``python -m services.punishment_api.app.worker --workers 4``.
+HTTP-процессы при этом можно запускать с ``JOB_WORKERS=0``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import signal
+import threading
+
+from .core.logging import setup_logging
+from .domain.services.job_worker import get_worker_pool
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Punishment API job worker")
+    parser.add_argument("--workers", type=int, default=None, help="число потоков (по умолчанию JOB_WORKERS)")
+    parser.add_argument("--once", action="store_true", help="выполнить готовые задачи и выйти")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    pool = get_worker_pool(workers=args.workers)
+    if args.once:
+        logger.info("Processed %d jobs", pool.run_pending())
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    pool.start()
+    logger.info("Job worker started: %s", pool.stats())
+    stop.wait()
+    pool.stop()
+    logger.info("Job worker stopped: %s", pool.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Локальные стенды и бенчмарки Punishment API
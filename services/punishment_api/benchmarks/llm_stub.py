@@ -0,0 +1,134 @@
+"""Локальная замена LLM-сервера (OpenAI-совместимый POST /v1/chat/completions).
+
+Отвечает эвристиками MockAIProvider с заданной задержкой и долей ошибок, чтобы
+тестировать и мерить HTTP-провайдер против медленного и нестабильного upstream.
+
+Запуск: ``python -m services.punishment_api.benchmarks.llm_stub --port 8090 --latency-ms 800 --failure-rate 0.1``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from ..app.domain.services.ai_analysis_provider import MockAIProvider
+
+
+def _mock_content(analysis_type: str) -> Dict[str, Any]:
+    provider = MockAIProvider()
+    if analysis_type == "materials":
+        return provider.analyze_materials([]).content
+    if analysis_type == "risk_analysis":
+        return provider.analyze_risks().content
+    if analysis_type == "similar_verdicts":
+        return provider.analyze_similar_verdicts([]).content
+    if analysis_type == "verdict_analysis":
+        return provider.analyze_verdict("").content
+    return {"summary": "stub"}
+
+
+def create_stub_app(
+    *,
+    latency_ms: float = 200.0,
+    jitter_ms: float = 50.0,
+    failure_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    seed: int = 0,
+) -> FastAPI:
+    """Приложение-заглушка; счётчики запросов — в app.state.stats.
+
+    failure_rate — доля ответов 503, throttle_rate — доля ответов 429 с Retry-After.
+    """
+
+    app = FastAPI(title="LLM stub")
+    rng = random.Random(seed)
+    app.state.stats = {"requests": 0, "ok": 0, "errors": 0, "throttled": 0, "in_flight": 0, "max_in_flight": 0}
+    app.state.config = {"failure_rate": failure_rate, "throttle_rate": throttle_rate}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> JSONResponse:
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+            roll = rng.random()
+            if roll < app.state.config["failure_rate"]:
+                stats["errors"] += 1
+                return JSONResponse(status_code=503, content={"error": "upstream overloaded"})
+            if roll < app.state.config["failure_rate"] + app.state.config["throttle_rate"]:
+                stats["throttled"] += 1
+                return JSONResponse(status_code=429, content={"error": "rate limited"}, headers={"Retry-After": "0"})
+            analysis_type = (body.get("metadata") or {}).get("analysis_type", "")
+            prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+            content = json.dumps(_mock_content(analysis_type), ensure_ascii=False)
+            stats["ok"] += 1
+            return JSONResponse(
+                content={
+                    "id": f"stub-{stats['requests']}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    # Грубая оценка: ~4 символа на токен.
+                    "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4},
+                }
+            )
+        finally:
+            stats["in_flight"] -= 1
+
+    return app
+
+
+@contextmanager
+def run_stub_server(app: FastAPI, host: str = "127.0.0.1", port: int = 0) -> Iterator[str]:
+    """Запускает заглушку в фоновом потоке; отдаёт base_url вида http://host:port/v1."""
+
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, name="llm-stub", daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("LLM stub server did not start")
+        time.sleep(0.01)
+    bound_port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{bound_port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(10)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    app = create_stub_app(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        failure_rate=args.failure_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Бенчмарк поиска НПА: построение BM25-индекса и задержка запроса справкой.
+
+Запуск: ``python -m services.punishment_api.benchmarks.norms_bench --sizes 10000 50000``.
+Корпус — синтетические «постановления» из псевдослов с распределением Ципфа, запросы —
+фрагменты документов корпуса с примесью случайных слов (как справка по делу). Печатает
+время построения, объём массивов и перцентили задержки top-k.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ..app.domain.services.norms_index import NormsIndex
+from ..app.infrastructure.storage.inverted_index import InvertedIndexStore
+from .vector_bench import _percentile
+
+_SYLLABLES = [c + v for c in "бвгджзклмнпрстфхцчшщ" for v in "аеиоуыэюя"]
+
+
+def synthetic_words(count: int, rng: np.random.Generator) -> List[str]:
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(_SYLLABLES, rng.integers(2, 5))))
+    return sorted(words)
+
+
+def synthetic_decrees(size: int, doc_words: int, vocabulary: List[str], rng: np.random.Generator) -> List[Dict[str, Any]]:
+    ranks = np.arange(1, len(vocabulary) + 1)
+    weights = 1 / ranks
+    weights /= weights.sum()
+    picks = rng.choice(len(vocabulary), (size, doc_words), p=weights)
+    decrees = []
+    for number, words in enumerate(picks.tolist()):
+        text = " ".join(vocabulary[i] for i in words)
+        decrees.append({"id": str(number), "title": f"НП ВС РК №{number}", "subtitle": text[:80], "text": text})
+    return decrees
+
+
+def run_benchmark(*, size: int, doc_words: int, vocabulary: int, queries: int, query_words: int, k: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(5)
+    words = synthetic_words(vocabulary, rng)
+    decrees = synthetic_decrees(size, doc_words, words, rng)
+    with tempfile.TemporaryDirectory(prefix="norms-bench-") as tmp:
+        started = time.perf_counter()
+        index = NormsIndex.build(decrees, InvertedIndexStore(tmp))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        latencies: List[float] = []
+        hits = 0
+        for _ in range(queries):
+            target = int(rng.integers(0, size))
+            source = decrees[target]["text"].split()
+            start = int(rng.integers(0, max(1, len(source) - query_words)))
+            noise = [words[i] for i in rng.integers(0, len(words), query_words // 4)]
+            text = " ".join(source[start : start + query_words] + noise)
+            started = time.perf_counter()
+            found = index.search(text, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += any(row == target for row, _ in found)
+        return {
+            **index.stats(),
+            "build_ms": round(build_ms, 1),
+            "p50_ms": _percentile(latencies, 0.5),
+            "p95_ms": _percentile(latencies, 0.95),
+            f"source_in_top_{k}": round(hits / queries, 4),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000])
+    parser.add_argument("--doc-words", type=int, default=300)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-words", type=int, default=150)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    for size in args.sizes:
+        report = run_benchmark(
+            size=size,
+            doc_words=args.doc_words,
+            vocabulary=args.vocabulary,
+            queries=args.queries,
+            query_words=args.query_words,
+            k=args.k,
+        )
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Бенчмарк HTTP-провайдера против локальной заглушки LLM.
+
+Запуск: ``python -m services.punishment_api.benchmarks.provider_bench --calls 200 --latency-ms 300 --failure-rate 0.1``.
+Печатает пропускную способность, перцентили задержки, число повторов и состояние автомата.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import time
+from typing import Any, Dict
+
+from ..app.domain.prompts import PROMPT_BUILDERS
+from ..app.domain.services.http_provider import HttpAIProvider
+from .llm_stub import create_stub_app, run_stub_server
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3) if ordered else 0.0
+
+
+def run_benchmark(
+    *,
+    calls: int,
+    latency_ms: float,
+    failure_rate: float,
+    throttle_rate: float,
+    max_concurrency: int,
+    max_connections: int,
+    rate_per_second: float,
+    max_attempts: int,
+    timeout_seconds: float,
+) -> Dict[str, Any]:
+    app = create_stub_app(latency_ms=latency_ms, failure_rate=failure_rate, throttle_rate=throttle_rate, seed=42)
+    prompt = PROMPT_BUILDERS["risk_analysis"]("Справка по делу.", "Сводка приговоров.", "Сводка НПА.")
+    with run_stub_server(app) as base_url:
+        provider = HttpAIProvider(
+            base_url=base_url,
+            model="stub",
+            timeout_seconds=timeout_seconds,
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            rate_per_second=rate_per_second,
+            burst=max_concurrency,
+            max_concurrency=max_concurrency,
+            max_attempts=max_attempts,
+            backoff_base_seconds=0.05,
+            backoff_max_seconds=1.0,
+            breaker_threshold=max(10, max_concurrency * 2),
+            breaker_cooldown_seconds=1.0,
+        )
+        latencies: list[float] = []
+        errors = 0
+        started = time.perf_counter()
+        submitted = []
+        for _ in range(calls):
+            submitted.append((time.perf_counter(), provider.submit(prompt, analysis_type="risk_analysis")))
+        for submitted_at, future in submitted:
+            try:
+                future.result()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - submitted_at) * 1000)
+        elapsed = time.perf_counter() - started
+        provider_stats = provider.stats()
+        provider.close()
+
+    return {
+        "calls": calls,
+        "ok": calls - errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(calls / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {"p50": _percentile(latencies, 0.5), "p95": _percentile(latencies, 0.95), "max": _percentile(latencies, 1.0)},
+        "provider": provider_stats,
+        "upstream": dict(app.state.stats),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="HTTP provider benchmark")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--throttle-rate", type=float, default=0.05)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--max-connections", type=int, default=16)
+    parser.add_argument("--rate-per-second", type=float, default=0.0)
+    parser.add_argument("--max-attempts", type=int, default=4)
+    parser.add_argument("--timeout-seconds", type=float, default=30.0)
+    args = parser.parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = run_benchmark(
+        calls=args.calls,
+        latency_ms=args.latency_ms,
+        failure_rate=args.failure_rate,
+        throttle_rate=args.throttle_rate,
+        max_concurrency=args.max_concurrency,
+        max_connections=args.max_connections,
+        rate_per_second=args.rate_per_second,
+        max_attempts=args.max_attempts,
+        timeout_seconds=args.timeout_seconds,
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
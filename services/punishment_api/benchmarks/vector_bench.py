@@ -0,0 +1,93 @@
+"""Бенчмарк индекса похожих приговоров: точный перебор против IVF.
+
+Запуск: ``python -m services.punishment_api.benchmarks.vector_bench --sizes 10000 100000 1000000``.
+Корпус — синтетические кластеризованные векторы (смесь гауссиан на сфере), запросы —
+зашумлённые векторы корпуса. Печатает время построения, перцентили задержки поиска,
+recall@k IVF относительно точного поиска и объём матрицы.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ..app.domain.services.vector_index import SearchQuery, VerdictIndex, normalize_rows
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3) if ordered else 0.0
+
+
+def synthetic_corpus(size: int, dim: int, clusters: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = normalize_rows(rng.standard_normal((clusters, dim), dtype=np.float32))
+    vectors = np.empty((size, dim), dtype=np.float32)
+    block = 1 << 16
+    for start in range(0, size, block):
+        count = min(block, size - start)
+        labels = rng.integers(0, clusters, count)
+        vectors[start : start + count] = centers[labels] + 0.35 * rng.standard_normal((count, dim), dtype=np.float32) / np.sqrt(dim)
+    return normalize_rows(vectors)
+
+
+def _timed_search(index: VerdictIndex, queries: np.ndarray, query: SearchQuery) -> tuple[List[float], List[List[str]]]:
+    latencies: List[float] = []
+    results: List[List[str]] = []
+    for vector in queries:
+        started = time.perf_counter()
+        found = index.search(vector, query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([item["id"] for item in found])
+    return latencies, results
+
+
+def run_benchmark(*, size: int, dim: int, queries: int, k: int, nprobe: int, nlist: int) -> Dict[str, Any]:
+    vectors = synthetic_corpus(size, dim, clusters=max(16, size // 2000))
+    metadata = [{"id": str(row), "decision": "guilty" if row % 3 else "acquittal"} for row in range(size)]
+    rng = np.random.default_rng(11)
+    picks = rng.integers(0, size, queries)
+    probes = normalize_rows(vectors[picks] + 0.05 * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim))
+    query = SearchQuery(limit=k, limit_guilty=k, limit_acquittal=k // 2)
+
+    report: Dict[str, Any] = {"size": size, "dim": dim, "queries": queries, "k": k, "matrix_mb": round(vectors.nbytes / 2**20, 1)}
+    exact = VerdictIndex(vectors, metadata, vector_model="bench", mode="exact")
+    exact_latencies, truth = _timed_search(exact, probes, query)
+    report["exact"] = {"p50_ms": _percentile(exact_latencies, 0.5), "p95_ms": _percentile(exact_latencies, 0.95)}
+
+    started = time.perf_counter()
+    ivf = VerdictIndex(vectors, metadata, vector_model="bench", mode="ivf", nlist=nlist, nprobe=nprobe)
+    build_ms = (time.perf_counter() - started) * 1000
+    ivf_latencies, approx = _timed_search(ivf, probes, query)
+    hits = sum(len(set(a) & set(t)) for a, t in zip(approx, truth))
+    total = sum(len(t) for t in truth) or 1
+    report["ivf"] = {
+        **ivf.stats(),
+        "build_ms": round(build_ms, 3),
+        "p50_ms": _percentile(ivf_latencies, 0.5),
+        "p95_ms": _percentile(ivf_latencies, 0.95),
+        f"recall_at_{k}": round(hits / total, 4),
+    }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--nlist", type=int, default=0)
+    args = parser.parse_args()
+    for size in args.sizes:
+        report = run_benchmark(size=size, dim=args.dim, queries=args.queries, k=args.k, nprobe=args.nprobe, nlist=args.nlist)
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Бенчмарк хранилища векторов: точность и скорость float16/int8 относительно float32.
+
+Запуск: ``python -m services.punishment_api.benchmarks.vector_store_bench --size 100000 --dim 768``.
+Корпус пишется сегментами во временный каталог, поиск идёт по отображённым в память
+файлам. Печатает объём на диске, задержку точного поиска, recall@k относительно float32 и
+среднюю/максимальную ошибку близости.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from ..app.domain.services.vector_index import SearchQuery, VerdictIndex, normalize_rows
+from ..app.infrastructure.storage.vector_store import VectorStore
+from .vector_bench import _percentile, synthetic_corpus
+
+
+def run_benchmark(*, size: int, dim: int, queries: int, k: int, segments: int, dtypes: List[str]) -> List[Dict[str, Any]]:
+    vectors = synthetic_corpus(size, dim, clusters=max(16, size // 2000))
+    metadata = [{"id": str(row), "decision": "guilty" if row % 3 else "acquittal"} for row in range(size)]
+    rng = np.random.default_rng(11)
+    probes = normalize_rows(vectors[rng.integers(0, size, queries)] + 0.05 * rng.standard_normal((queries, dim), dtype=np.float32) / np.sqrt(dim))
+    query = SearchQuery(limit=k)
+    reference = VerdictIndex(vectors, metadata, vector_model="bench", mode="exact")
+    truth = [reference.search(q, query) for q in probes]
+
+    reports = []
+    for dtype in ["float32", *dtypes]:
+        with tempfile.TemporaryDirectory(prefix="vector-store-bench-") as tmp:
+            store = VectorStore(Path(tmp))
+            started = time.perf_counter()
+            step = -(-size // segments)
+            for start in range(0, size, step):
+                store.append(vectors[start : start + step], metadata[start : start + step], vector_model="bench", dtype=dtype)
+            append_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            merge = store.merge()
+            merge_ms = (time.perf_counter() - started) * 1000
+            index = VerdictIndex.from_store(store, mode="exact")
+            assert index is not None
+            latencies: List[float] = []
+            hits = 0
+            errors: List[float] = []
+            for q, expected in zip(probes, truth):
+                started = time.perf_counter()
+                found = index.search(q, query)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len({item["id"] for item in found} & {item["id"] for item in expected})
+                exact_scores = {item["id"]: item["similarity"] for item in expected}
+                errors.extend(abs(item["similarity"] - exact_scores[item["id"]]) for item in found if item["id"] in exact_scores)
+            reports.append(
+                {
+                    "dtype": dtype,
+                    "size": size,
+                    "dim": dim,
+                    "disk_mb": round(store.stats()["disk_bytes"] / 2**20, 1),
+                    "append_ms": round(append_ms, 1),
+                    "merge_ms": round(merge_ms, 1),
+                    "merged_segments": merge.get("merged", 0),
+                    "p50_ms": _percentile(latencies, 0.5),
+                    "p95_ms": _percentile(latencies, 0.95),
+                    f"recall_at_{k}": round(hits / (len(truth) * k), 4),
+                    "similarity_error_mean": round(float(np.mean(errors)), 5) if errors else 0.0,
+                    "similarity_error_max": round(float(np.max(errors)), 5) if errors else 0.0,
+                }
+            )
+    return reports
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--dtypes", nargs="+", default=["float16", "int8"])
+    args = parser.parse_args()
+    for report in run_benchmark(size=args.size, dim=args.dim, queries=args.queries, k=args.k, segments=args.segments, dtypes=args.dtypes):
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -44,6 +44,11 @@ def test_health_and_reference():
     r = client.post("/reference/reload")
     assert r.status_code == 200
 
+    r = client.get("/storage/status")
+    assert r.status_code == 200
+    stores = r.json()["stores"]
+    assert set(stores) >= {"calculations", "analyses", "speeches"}
+
 
 def test_article_and_calculate_and_history():
     client = _client()
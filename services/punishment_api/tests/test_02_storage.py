@@ -0,0 +1,515 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app.core.config import settings  # noqa: E402
+from services.punishment_api.app.infrastructure.storage.ai_analysis_storage import (  # noqa: E402
+    LATEST_COMPLETED_RISK_SQL,
+    AnalysisStore,
+)
+
+
+def _query_plan(store: AnalysisStore, query: str, params) -> str:
+    with store._connect() as conn:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return "\n".join(row["detail"] for row in rows)
+
+
+def _seed(store: AnalysisStore) -> None:
+    # Много дел и мало статусов — как в рабочей базе.
+    for i in range(300):
+        case_id = f"0123456789012{i % 100:02d}"
+        record = store.create_analysis(case_id, ["materials", "risk_analysis"][i % 2], {"n": i})
+        store.update_analysis(record.id, status=["completed", "failed", "pending"][i % 3])
+    with store._connect() as conn:
+        conn.execute("ANALYZE")
+
+
+def test_migrations_upgrade_legacy_schema(tmp_path):
+    db_path = tmp_path / "ai_analysis.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE analyses (id TEXT PRIMARY KEY, case_id TEXT NOT NULL, analysis_type TEXT NOT NULL,"
+            " status TEXT NOT NULL, input_params TEXT, result TEXT, error_message TEXT, ai_model TEXT,"
+            " processing_time_ms INTEGER, task_id TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX idx_analyses_case ON analyses(case_id)")
+
+    store = AnalysisStore(str(db_path))
+    assert store.schema_version >= 2
+    with store._connect() as conn:
+        indexes = {row["name"] for row in conn.execute("PRAGMA index_list(analyses)")}
+    assert "idx_analyses_case_type_status_created" in indexes
+    assert "idx_analyses_case_created" in indexes
+    assert "idx_analyses_case" not in indexes
+
+    # Повторное открытие не должно ничего менять.
+    assert AnalysisStore(str(db_path)).schema_version == store.schema_version
+
+
+def test_latest_lookups_use_composite_index(tmp_path):
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    _seed(store)
+
+    plan = _query_plan(store, LATEST_COMPLETED_RISK_SQL, ("012345678901200",))
+    assert "idx_analyses_case_type_status_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+    query, params = store.build_list_query("012345678901200", analysis_type="materials", status="completed", limit=1)
+    plan = _query_plan(store, query, params)
+    assert "idx_analyses_case_type_status_created" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_case_listing_uses_case_created_index(tmp_path):
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    _seed(store)
+
+    for status in (None, "failed"):
+        query, params = store.build_list_query("012345678901201", status=status, limit=50)
+        plan = _query_plan(store, query, params)
+        assert "idx_analyses_case_created" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+def test_large_json_columns_are_compressed_and_readable(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "storage_compression_enabled", True)
+    monkeypatch.setattr(settings, "storage_compression_threshold", 256)
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+
+    documents = [{"name": f"doc{i}.txt", "text": "Протокол допроса свидетеля. " * 200} for i in range(3)]
+    record = store.create_analysis("012345678901234", "materials", {"documents": documents})
+    store.update_analysis(record.id, status="completed", result={"summary": "Кратко"})
+
+    loaded = store.get_analysis(record.id)
+    assert loaded.input_params["documents"] == documents
+    assert loaded.result == {"summary": "Кратко"}
+
+    columns = store.storage_stats()["columns"]
+    assert columns["input_params"]["compressed_rows"] == 1
+    assert columns["input_params"]["sample_rows"] == 1
+    assert columns["input_params"]["stored_bytes"] < len("Протокол допроса свидетеля. ".encode("utf-8")) * 200
+    assert columns["result"]["compressed_rows"] == 0
+
+    # Статус считает только последние строки: крупная старая строка в выборку не попадает.
+    store.create_analysis("012345678901234", "materials", {"documents": []})
+    monkeypatch.setattr(settings, "storage_stats_sample_rows", 1)
+    columns = store.storage_stats()["columns"]
+    assert columns["input_params"]["rows"] == 1 and columns["input_params"]["compressed_rows"] == 0
+    assert columns["input_params"]["sample_rows"] == 1
+
+
+def test_uncompressed_legacy_rows_remain_readable(tmp_path, monkeypatch):
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    record = store.create_analysis("012345678901234", "materials", {"documents": [{"name": "a", "text": "б"}]})
+
+    monkeypatch.setattr(settings, "storage_compression_enabled", True)
+    monkeypatch.setattr(settings, "storage_compression_threshold", 1)
+    store.update_analysis(record.id, status="completed", result={"summary": "Текст " * 50})
+
+    loaded = store.get_analysis(record.id)
+    assert loaded.input_params == {"documents": [{"name": "a", "text": "б"}]}
+    assert loaded.result == {"summary": "Текст " * 50}
+
+
+def test_calculation_write_behind_batches_and_reads_pending(tmp_path):
+    from services.punishment_api.app.infrastructure.storage.calculation_storage import CalculationStore
+
+    store = CalculationStore(str(tmp_path / "calculations.db"), write_behind=True)
+    records = [
+        store.create_calculation(
+            case_id="case-1",
+            article_code="0990001",
+            article_name="Убийство",
+            min_months=1.0,
+            max_months=12.0,
+            formatted_result="от 1 до 12 мес.",
+            created_by="user-1",
+            payload={"n": i},
+            result={"aNakaz": []},
+        )
+        for i in range(20)
+    ]
+    # Чтение своей записи работает сразу, до коммита.
+    assert store.get_calculation(records[0].id).payload == {"n": 0}
+
+    assert store.flush(timeout=5)
+    total, items = store.list_calculations(user_id="user-1", limit=50, offset=0)
+    assert total == 20
+    assert {c.id for c in items} == {r.id for r in records}
+
+    stats = store.storage_stats()["write_behind"]
+    assert stats["written"] == 20
+    assert stats["pending"] == 0
+    assert stats["batches"] <= 20
+    store.close()
+
+    # После close (перезапуск lifespan) запись снова идёт через поток-писатель.
+    again = store.create_calculation(
+        case_id="case-1",
+        article_code=None,
+        article_name=None,
+        min_months=None,
+        max_months=None,
+        formatted_result=None,
+        created_by="user-1",
+    )
+    assert store.flush(timeout=5)
+    assert store.get_calculation(again.id) is not None
+    store.close()
+
+    # Запись, пришедшая во время close() после последнего слива, не остаётся в очереди без потока.
+    import threading
+
+    writer = store._writer
+    drain = writer._drain_remaining
+    late = {}
+
+    def submit_late():
+        late["record"] = store.create_calculation(
+            case_id="case-1",
+            article_code=None,
+            article_name=None,
+            min_months=None,
+            max_months=None,
+            formatted_result=None,
+            created_by="user-1",
+        )
+
+    def drain_then_submit():
+        drain()
+        late["thread"] = threading.Thread(target=submit_late)
+        late["thread"].start()
+        late["thread"].join(0.2)
+
+    submit_late()
+    assert store.flush(timeout=5)
+    writer._drain_remaining = drain_then_submit
+    store.close()
+    writer._drain_remaining = drain
+    late["thread"].join(5)
+    assert store.flush(timeout=2)
+    assert store.get_calculation(late["record"].id) is not None
+    store.close()
+
+
+def test_calculation_write_behind_falls_back_to_single_rows(tmp_path, caplog):
+    import sqlite3
+
+    from services.punishment_api.app.infrastructure.storage.calculation_storage import CalculationStore
+
+    store = CalculationStore(str(tmp_path / "calculations.db"), write_behind=True)
+    insert = store.insert_records
+
+    def flaky(records):
+        if any(record.payload.get("bad") for record in records):
+            raise sqlite3.OperationalError("disk I/O error")
+        insert(records)
+
+    store.insert_records = flaky
+    records = [
+        store.create_calculation(
+            case_id="case-2",
+            article_code="0990001",
+            article_name="Убийство",
+            min_months=1.0,
+            max_months=12.0,
+            formatted_result="",
+            created_by="user-2",
+            payload={"bad": i == 3},
+        )
+        for i in range(6)
+    ]
+    store.close()
+    stats = store.storage_stats()["write_behind"]
+    assert stats["written"] == 5 and stats["dropped"] == 1
+    assert store.get_calculation(records[3].id) is None
+    assert store.get_calculation(records[4].id) is not None
+    assert records[3].id in caplog.text
+
+
+def test_retention_deletes_and_archives_in_batches(tmp_path, monkeypatch):
+    from datetime import datetime, timedelta, timezone
+
+    from services.punishment_api.app.core.config import RetentionRule
+    from services.punishment_api.app.infrastructure.storage import retention
+    from services.punishment_api.app.infrastructure.storage.calculation_storage import CalculationStore
+
+    analyses = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    calculations = CalculationStore(str(tmp_path / "calculations.db"))
+    monkeypatch.setattr(
+        retention,
+        "get_stores",
+        lambda: {"analyses": analyses, "calculations": calculations},
+    )
+
+    for i in range(25):
+        record = analyses.create_analysis("012345678901234", "materials", {"text": "x" * 2000})
+        analyses.update_analysis(record.id, status="failed" if i % 5 else "completed")
+        calculations.create_calculation(
+            case_id=None,
+            article_code="0990001",
+            article_name="",
+            min_months=None,
+            max_months=None,
+            formatted_result="",
+            payload={"i": i},
+        )
+
+    job = retention.RetentionJob(
+        [
+            RetentionRule(table="analyses", status="failed", max_age_days=1),
+            RetentionRule(table="calculations", max_age_days=30, action="archive"),
+        ],
+        interval_seconds=3600,
+        batch_size=7,
+        batch_pause_ms=0,
+        vacuum_pages=10,
+    )
+    report = job.run_once(now=datetime.now(timezone.utc) + timedelta(days=60))
+
+    analyses_report, calculations_report = report["rules"]
+    assert analyses_report["deleted"] == 20
+    assert analyses_report["batches"] == 3
+    assert calculations_report["archived"] == 25
+    assert report["vacuum"]["analyses"]["reclaimed_bytes"] > 0
+
+    assert [r.status for r in analyses.list_analyses("012345678901234")] == ["completed"] * 5
+    assert calculations.list_calculations(user_id=None, limit=10, offset=0)[0] == 0
+    archive = sqlite3.connect(retention.archive_path_for(calculations.db_path))
+    assert archive.execute("SELECT COUNT(*) FROM calculations").fetchone()[0] == 25
+    archive.close()
+
+
+def test_online_backup_copies_and_verifies(tmp_path, monkeypatch):
+    from services.punishment_api.app.infrastructure.storage import backup
+
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    for i in range(50):
+        store.create_analysis("012345678901234", "materials", {"text": f"Документ {i} " * 100})
+    monkeypatch.setattr(backup, "get_stores", lambda: {"analyses": store})
+
+    job = backup.BackupJob(
+        destination_dir=tmp_path / "backups",
+        interval_seconds=3600,
+        pages_per_step=4,
+        step_sleep_ms=0,
+        keep=1,
+    )
+    first = job.run_once()
+    assert first["ok"]
+    assert first["databases"]["analyses"]["steps"]["count"] > 1
+
+    second = job.run_once()
+    copy = second["databases"]["analyses"]
+    assert copy["pruned"] == [Path(first["databases"]["analyses"]["path"]).name]
+    assert sorted(p.name for p in (tmp_path / "backups").iterdir()) == [Path(copy["path"]).name]
+    assert len(AnalysisStore(copy["path"]).list_analyses("012345678901234", limit=100)) == 50
+
+
+def test_online_backup_bounds_restarts_under_writes(tmp_path, monkeypatch):
+    import time
+    from types import SimpleNamespace
+
+    from services.punishment_api.app.infrastructure.storage import backup
+
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    for i in range(50):
+        store.create_analysis("012345678901234", "materials", {"text": f"Документ {i} " * 100})
+    monkeypatch.setattr(backup, "get_stores", lambda: {"analyses": store})
+
+    # Запись между каждыми шагами: без ограничения копирование перезапускалось бы вечно.
+    def write_between_steps(_seconds):
+        store.create_analysis("012345678901234", "materials", {"text": "Новый документ"})
+
+    monkeypatch.setattr(backup, "time", SimpleNamespace(perf_counter=time.perf_counter, sleep=write_between_steps))
+    job = backup.BackupJob(destination_dir=tmp_path / "backups", interval_seconds=3600, pages_per_step=4, step_sleep_ms=1, keep=1, max_restarts=2)
+    report = job.run_once()
+    copy = report["databases"]["analyses"]
+    assert report["ok"] and copy["single_step"] and copy["restarts"] == 3
+    # Одношаговая копия совпадает с базой: после неё записей уже не было.
+    written = len(store.list_analyses("012345678901234", limit=1000))
+    assert written > 50 + 3 and len(AnalysisStore(copy["path"]).list_analyses("012345678901234", limit=1000)) == written
+    assert [p.name for p in (tmp_path / "backups").iterdir()] == [Path(copy["path"]).name]
+
+
+def test_analysis_cache_references_result_until_evicted(tmp_path):
+    store = AnalysisStore(str(tmp_path / "ai_analysis.db"))
+    limits = {"ttl_seconds": 3600, "max_entries": 1, "max_bytes": 10**6}
+
+    first = store.create_analysis("012345678901234", "risk_analysis", {"report_text": "a"})
+    store.update_analysis(first.id, status="completed", result={"risk": "high"}, ai_model="mock/heuristic-v1")
+    store.cache_put("key-a", "risk_analysis", "mock/heuristic-v1", {"risk": "high"}, **limits)
+
+    assert store.cache_lookup("key-b", "risk_analysis") is None
+    hit = store.cache_lookup("key-a", "risk_analysis")
+    second = store.create_analysis("012345678901234", "risk_analysis", {"report_text": "a"})
+    store.complete_from_cache(second.id, "key-a", hit["ai_model"], 0)
+
+    loaded = store.get_analysis(second.id)
+    assert loaded.status == "completed" and loaded.cache_key == "key-a"
+    assert loaded.result == {"risk": "high"}
+    assert store.list_analyses("012345678901234", status="completed")[0].result == {"risk": "high"}
+
+    # Вытеснение по размеру кеша отдаёт ссылающемуся анализу собственную копию.
+    assert store.cache_put("key-c", "materials", "mock/heuristic-v1", {"summary": "b"}, **limits) == 1
+    loaded = store.get_analysis(second.id)
+    assert loaded.cache_key is None and loaded.result == {"risk": "high"}
+
+    stats = store.cache_stats()
+    assert stats["entries"] == 1
+    assert stats["types"]["risk_analysis"]["hits"] == 1
+    assert stats["types"]["risk_analysis"]["hit_rate"] == 0.5
+
+
+def test_blob_store_deduplicates_streams_and_collects_unreferenced(tmp_path):
+    import io
+
+    from services.punishment_api.app.infrastructure.storage.blob_store import BlobStore
+
+    store = BlobStore(tmp_path / "blobs")
+    data = ("Протокол осмотра места происшествия. " * 5000).encode("utf-8")
+    first = store.put_stream(io.BytesIO(data))
+    second = store.put_stream(data[i : i + 1000] for i in range(0, len(data), 1000))
+    assert first == second and first.size == len(data)
+    assert b"".join(store.iter_chunks(first.hash, 4096)) == data
+    assert store.storage_stats()["blobs"] == 1
+
+    assert store.add_refs("analysis:a", [first.hash]) == 1
+    assert store.add_refs("analysis:a", [first.hash]) == 0
+    store.add_refs("analysis:b", [first.hash])
+    assert store.storage_stats()["deduplicated_bytes"] == len(data)
+
+    store.release(["analysis:a"])
+    assert store.collect_garbage(0)["deleted"] == 0
+    store.release(["analysis:b"])
+    # Свежий блоб без ссылок переживает период ожидания.
+    assert store.collect_garbage(3600)["deleted"] == 0
+    assert store.collect_garbage(0) == {"deleted": 1, "reclaimed_bytes": len(data)}
+    assert not store.exists(first.hash)
+
+
+def test_analysis_rows_reference_documents_in_blob_store():
+    import uuid
+
+    from services.punishment_api.app.domain.services.ai_analysis_service import run_analysis, start_analysis
+    from services.punishment_api.app.infrastructure.storage.ai_analysis_storage import (
+        analysis_blob_owner,
+        get_analysis_store,
+    )
+    from services.punishment_api.app.infrastructure.storage.blob_store import get_blob_store
+
+    erdr = "012345678901234"
+    shared = f"Протокол допроса {uuid.uuid4()}. " + "Показания свидетеля. " * 400
+    extra = f"Заключение эксперта {uuid.uuid4()}. " + "Выводы. " * 400
+    first = start_analysis(erdr, "materials", {"erdr_number": erdr, "documents": [{"name": "a", "text": shared}]})
+    second = start_analysis(
+        erdr,
+        "materials",
+        {"erdr_number": erdr, "documents": [{"name": "a", "text": shared}, {"name": "b", "text": extra}]},
+    )
+
+    store = get_analysis_store()
+    with store._connect() as conn:
+        raw = conn.execute("SELECT input_params FROM analyses WHERE id = ?", (second.id,)).fetchone()[0]
+    assert shared not in str(raw) and len(raw) < 500
+    ref = store.get_analysis(first.id).input_params["documents"][0]["text"]
+    blobs = get_blob_store()
+    assert blobs.read_text(ref["$blob"]) == shared
+    with blobs._connect() as conn:
+        refcount = conn.execute("SELECT refcount FROM blobs WHERE hash = ?", (ref["$blob"],)).fetchone()[0]
+    assert refcount == 2
+
+    run_analysis(second.id)
+    record = store.get_analysis(second.id)
+    assert record.status == "completed" and record.result["documents_analyzed"] == 2
+    with blobs._connect() as conn:
+        owners = {row[0] for row in conn.execute("SELECT owner FROM blob_refs WHERE hash = ?", (ref["$blob"],))}
+    assert owners == {analysis_blob_owner(first.id), analysis_blob_owner(second.id)}
+
+
+def test_client_payload_cannot_reference_blobs(tmp_path):
+    import pytest
+    from fastapi.testclient import TestClient
+
+    from services.punishment_api.app import app
+    from services.punishment_api.app.infrastructure.storage.blob_store import BlobRefError, BlobStore, check_blob_refs
+
+    store = BlobStore(tmp_path / "blobs")
+    secret = tmp_path / "secret.txt"
+    secret.write_text("секрет", encoding="utf-8")
+    for bad in ("../../secret.txt", "A" * 64, "abc"):
+        with pytest.raises(BlobRefError):
+            store.resolve({"note": {"$blob": bad}})
+    ref = store.put_bytes("документ".encode("utf-8"))
+    check_blob_refs({"documents": [{"text": ref.as_param()}]}, {ref.hash})
+    with pytest.raises(BlobRefError):
+        check_blob_refs({"documents": [{"text": ref.as_param()}]})
+
+    client = TestClient(app)
+    for note in ({"$blob": "../../../../../../tmp/rv/secret.txt"}, {"$blob": ref.hash, "size": ref.size}, {"$blob": 1}):
+        r = client.post(
+            "/api/case/012345678901234/verdict/analyze/",
+            json={"verdict_text": "Приговор", "original_request": {"note": note}},
+        )
+        assert r.status_code == 400 and "$blob" in r.json()["error"]
+
+
+def test_retention_archive_follows_new_columns_and_restarts(tmp_path, monkeypatch):
+    from datetime import datetime, timedelta, timezone
+
+    from services.punishment_api.app.core.config import RetentionRule
+    from services.punishment_api.app.infrastructure.storage import retention
+    from services.punishment_api.app.infrastructure.storage.calculation_storage import CalculationStore
+    from services.punishment_api.app.infrastructure.storage.migrations import auto_vacuum_mode, enable_incremental_vacuum
+
+    calculations = CalculationStore(str(tmp_path / "calculations.db"))
+    monkeypatch.setattr(retention, "get_stores", lambda: {"calculations": calculations})
+    job = retention.RetentionJob(
+        [RetentionRule(table="calculations", max_age_days=30, action="archive")],
+        interval_seconds=3600,
+        batch_size=10,
+        batch_pause_ms=0,
+        vacuum_pages=10,
+    )
+
+    def add(count):
+        for _ in range(count):
+            calculations.create_calculation(
+                case_id=None, article_code="0990001", article_name="", min_months=None, max_months=None, formatted_result=""
+            )
+
+    later = datetime.now(timezone.utc) + timedelta(days=60)
+    add(3)
+    assert job.run_once(now=later)["rules"][0]["archived"] == 3
+
+    # Более поздняя миграция добавила столбец: архив дополняется, а не ломается.
+    with calculations._connect() as conn:
+        conn.execute("ALTER TABLE calculations ADD COLUMN reviewer TEXT")
+        conn.execute("UPDATE calculations SET reviewer = 'r'")
+    add(2)
+    with calculations._connect() as conn:
+        conn.execute("UPDATE calculations SET reviewer = 'r'")
+
+    job.start()
+    job.stop()
+    assert job.run_once(now=later)["rules"][0]["archived"] == 2
+    archive = sqlite3.connect(retention.archive_path_for(calculations.db_path))
+    assert archive.execute("SELECT COUNT(*), COUNT(reviewer) FROM calculations").fetchone() == (5, 2)
+    archive.close()
+
+    # Новая база сразу в incremental; старую переводит только явный вызов.
+    legacy = sqlite3.connect(tmp_path / "legacy.db")
+    legacy.execute("CREATE TABLE t (x)")
+    legacy.commit()
+    assert auto_vacuum_mode(legacy) == "none"
+    assert enable_incremental_vacuum(legacy) and auto_vacuum_mode(legacy) == "incremental"
+    assert not enable_incremental_vacuum(legacy)
+    legacy.close()
+    with calculations._connect() as conn:
+        assert auto_vacuum_mode(conn) == "incremental"
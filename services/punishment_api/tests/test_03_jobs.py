@@ -0,0 +1,287 @@
+import sys
+import time
+import uuid
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app.domain.services.job_worker import JobWorkerPool  # noqa: E402
+from services.punishment_api.app.infrastructure.storage.job_queue import (  # noqa: E402
+    JOB_FAILED,
+    JOB_LEASED,
+    JOB_QUEUED,
+    JobStore,
+)
+
+
+def _pool(store: JobStore, handlers, **kwargs) -> JobWorkerPool:
+    options = {
+        "workers": 2,
+        "lease_seconds": 30,
+        "poll_interval_ms": 10,
+        "backoff_base_seconds": 0.0,
+        "backoff_max_seconds": 0.0,
+    }
+    options.update(kwargs)
+    return JobWorkerPool(store, handlers=handlers, **options)
+
+
+def test_claim_is_exclusive_and_expired_leases_are_recovered(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = store.enqueue("analysis", "a-1", {"analysis_id": "a-1"})
+    assert job.status == JOB_QUEUED
+
+    leased = store.claim("worker-1", lease_seconds=0.01)
+    assert leased.id == job.id and leased.status == JOB_LEASED and leased.attempts == 1
+    assert store.claim("worker-2", lease_seconds=30) is None
+
+    time.sleep(0.05)
+    assert store.recover_expired_leases() == 1
+    again = store.claim("worker-2", lease_seconds=30)
+    assert again.id == job.id and again.attempts == 2
+
+    # Упавший воркер не может завершить чужую задачу.
+    store.complete(job.id, "worker-1")
+    assert store.get_job(job.id) is not None
+    store.complete(job.id, "worker-2")
+    assert store.get_job(job.id) is None
+
+
+def test_failed_jobs_are_retried_then_marked_failed(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    calls = []
+
+    def flaky(job):
+        calls.append(job.attempts)
+        raise RuntimeError("upstream unavailable")
+
+    job = store.enqueue("analysis", "a-1", max_attempts=3)
+    pool = _pool(store, {"analysis": flaky})
+    assert pool.run_pending() == 3
+    assert calls == [1, 2, 3]
+
+    record = store.get_job(job.id)
+    assert record.status == JOB_FAILED
+    assert record.last_error == "upstream unavailable"
+    assert pool.stats()["retried"] == 2 and pool.stats()["failed"] == 1
+
+
+def test_worker_threads_drain_queue(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    done = []
+    for i in range(20):
+        store.enqueue("speech", f"s-{i}")
+
+    pool = _pool(store, {"speech": lambda job: done.append(job.ref_id)}, workers=4)
+    pool.start()
+    deadline = time.monotonic() + 5
+    while len(done) < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.stop()
+
+    assert sorted(done) == sorted(f"s-{i}" for i in range(20))
+    assert store.counts() == {}
+
+
+def test_async_analysis_is_executed_by_worker():
+    from fastapi.testclient import TestClient
+
+    from services.punishment_api.app import app
+    from services.punishment_api.app.infrastructure.storage.job_queue import get_job_store
+
+    client = TestClient(app)
+    erdr = "012345678901234"
+    # Уникальный текст: одинаковый вход был бы сразу завершён из кеша результатов.
+    text = f"Протокол осмотра места происшествия {uuid.uuid4()}."
+    r = client.post(
+        f"/api/case/{erdr}/analyze-materials/",
+        json={"documents": [{"name": "doc.txt", "text": text}], "mode": "async"},
+    )
+    assert r.status_code == 200
+    analysis_id = r.json()["analysis_id"]
+    assert client.get(f"/api/analysis/{analysis_id}/status/").json()["status"] == "pending"
+
+    from services.punishment_api.app.domain.services.job_worker import JOB_HANDLERS
+
+    _pool(get_job_store(), JOB_HANDLERS, workers=0).run_pending()
+    first = client.get(f"/api/analysis/{analysis_id}/status/").json()
+    assert first["status"] == "completed"
+
+    # Повторная отправка тех же материалов завершается сразу, без очереди и провайдера.
+    r = client.post(
+        f"/api/case/{erdr}/analyze-materials/",
+        json={"documents": [{"name": "doc.txt", "text": f"  {text}\r\n"}], "mode": "async"},
+    )
+    assert r.json()["status"] == "completed"
+    second = client.get(f"/api/analysis/{r.json()['analysis_id']}/status/").json()
+    assert second["result"] == first["result"]
+
+
+def _start_waiter(scheduler, order, analysis_type, priority, case_id, label):
+    import threading
+
+    def run():
+        with scheduler.slot(analysis_type, priority, case_id):
+            order.append(label)
+
+    before = scheduler.stats()["classes"][priority]["waiting"]
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while scheduler.stats()["classes"][priority]["waiting"] == before and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return thread
+
+
+def test_scheduler_prefers_interactive_and_rotates_cases():
+    from services.punishment_api.app.domain.services.ai_analysis_service import AnalysisScheduler
+
+    scheduler = AnalysisScheduler(max_concurrency=1)
+    order: list[str] = []
+    with scheduler.slot("materials", "batch", "case-0"):
+        threads = [
+            _start_waiter(scheduler, order, "materials", "batch", "case-1", "batch"),
+            _start_waiter(scheduler, order, "risk_analysis", "async", "case-a", "a1"),
+            _start_waiter(scheduler, order, "risk_analysis", "async", "case-a", "a2"),
+            _start_waiter(scheduler, order, "risk_analysis", "async", "case-b", "b1"),
+            _start_waiter(scheduler, order, "verdict_analysis", "interactive", "case-c", "sync"),
+        ]
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["sync", "a1", "b1", "a2", "batch"]
+    stats = scheduler.stats()["classes"]
+    assert stats["interactive"]["admitted"] == 1 and stats["interactive"]["waiting"] == 0
+    assert stats["async"]["max_waiting"] == 3
+    assert stats["batch"]["wait_ms_max"] >= stats["interactive"]["wait_ms_max"]
+
+
+def test_scheduler_type_limit_lets_other_types_through():
+    from services.punishment_api.app.domain.services.ai_analysis_service import AnalysisScheduler
+
+    scheduler = AnalysisScheduler(max_concurrency=3, type_limits={"materials": 1}, interactive_reserved=1)
+    order: list[str] = []
+    with scheduler.slot("materials", "async", "case-1"):
+        blocked = _start_waiter(scheduler, order, "materials", "async", "case-2", "materials")
+        _start_waiter(scheduler, order, "risk_analysis", "async", "case-3", "risk").join(5)
+        assert order == ["risk"]
+        assert scheduler.stats()["classes"]["async"]["waiting"] == 1
+    blocked.join(5)
+    assert order == ["risk", "materials"]
+
+
+def test_busy_batch_slot_defers_job_and_frees_worker(tmp_path):
+    import pytest
+
+    from services.punishment_api.app.domain.services.ai_analysis_service import AnalysisScheduler, SchedulerBusy
+    from services.punishment_api.app.infrastructure.storage.job_queue import JobDeferred
+
+    scheduler = AnalysisScheduler(max_concurrency=4, interactive_reserved=1, batch_concurrency=1)
+    with scheduler.slot("materials", "batch", "case-0"):
+        with pytest.raises(SchedulerBusy):
+            with scheduler.slot("materials", "batch", "case-1", blocking=False):
+                pass
+        with scheduler.slot("risk_analysis", "async", "case-2", blocking=False):
+            pass
+        assert scheduler.stats()["classes"]["batch"]["waiting"] == 0
+
+    # Занятый слот не тратит попытку и не держит воркер: следующая задача берётся сразу.
+    store = JobStore(str(tmp_path / "jobs.db"))
+    done = []
+
+    def handler(job):
+        if job.ref_id == "a-batch":
+            raise JobDeferred("busy", 60)
+        done.append(job.ref_id)
+
+    batch = store.enqueue("analysis", "a-batch", priority=2, max_attempts=1)
+    store.enqueue("analysis", "a-async", priority=1)
+    store.enqueue("analysis", "a-late", priority=2)
+    pool = _pool(store, {"analysis": handler})
+    assert pool.run_pending() == 3
+    assert done == ["a-async", "a-late"]
+    record = store.get_job(batch.id)
+    assert record.status == JOB_QUEUED and record.attempts == 0 and record.available_at > time.time() + 30
+    assert pool.stats()["deferred"] == 1 and pool.stats()["failed"] == 0
+
+
+def test_jobs_are_claimed_by_priority(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    batch = store.enqueue("analysis", "a-batch", priority=2)
+    regular = store.enqueue("analysis", "a-async", priority=1)
+    assert store.claim("worker-1", lease_seconds=30).id == regular.id
+    assert store.claim("worker-1", lease_seconds=30).id == batch.id
+
+
+def test_identical_concurrent_analyses_share_one_execution(monkeypatch):
+    import threading
+
+    from services.punishment_api.app.core.config import settings
+    from services.punishment_api.app.domain.services import ai_analysis_service as service
+    from services.punishment_api.app.infrastructure.storage.job_queue import get_job_store
+
+    monkeypatch.setattr(settings, "analysis_cache_enabled", False)
+    calls = []
+    real_execute = service._execute_provider
+
+    def slow_execute(provider, record, store):
+        calls.append(record.id)
+        time.sleep(0.2)
+        return real_execute(provider, record, store)
+
+    monkeypatch.setattr(service, "_execute_provider", slow_execute)
+    params = {"report_text": f"Справка {uuid.uuid4()}", "similar_verdicts_summary": "s", "norms_summary": "n"}
+
+    # Асинхронный двойной клик: один анализ и одна задача в очереди.
+    first = service.start_analysis("012345678901234", "risk_analysis", dict(params, mode="async"))
+    second = service.start_analysis("012345678901234", "risk_analysis", dict(params, mode="async"))
+    assert first.id == second.id and first.task_id == second.task_id
+    queued = get_job_store().counts().get("analysis", {}).get("queued", 0)
+    service.enqueue_analysis(first.id)
+    service.enqueue_analysis(second.id)
+    assert get_job_store().counts()["analysis"]["queued"] == queued + 1
+
+    # Синхронные вызовы одновременно: провайдер вызывается один раз, результат общий.
+    statuses = []
+
+    def sync_call():
+        record = service.start_analysis("012345678901234", "risk_analysis", dict(params, mode="sync"))
+        service.run_analysis(record.id)
+        statuses.append(service.get_analysis_store().get_analysis(record.id).status)
+
+    threads = [threading.Thread(target=sync_call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert calls == [first.id]
+    assert statuses == ["completed"] * 4
+
+    # Задача из очереди видит готовый анализ и ничего не выполняет.
+    from services.punishment_api.app.domain.services.job_worker import JOB_HANDLERS
+
+    _pool(get_job_store(), JOB_HANDLERS, workers=0).run_pending()
+    assert calls == [first.id]
+
+
+def test_identical_speech_requests_attach_to_pending_speech():
+    from services.punishment_api.app.domain.services import speech_service
+    from services.punishment_api.app.infrastructure.storage.job_queue import get_job_store
+
+    payload = {"erdr_number": "012345678901234", "fio": f"Иванов {uuid.uuid4()}", "mode": "async"}
+    first = speech_service.start_speech("012345678901234", payload, created_by="user-1")
+    speech_service.enqueue_speech(first, payload)
+    second = speech_service.start_speech("012345678901234", dict(payload, mode="sync"), created_by="user-2")
+    assert second == first
+    assert get_job_store().has_active("speech", first)
+
+    speech_service.run_speech(second, payload)
+    record = speech_service.get_speech_store().get_speech(first)
+    assert record.status == "draft" and len(record.versions) == 1
+
+    third = speech_service.start_speech("012345678901234", payload, created_by="user-1")
+    assert third != first
@@ -0,0 +1,128 @@
+import asyncio
+import concurrent.futures
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app.domain.prompts import PROMPT_BUILDERS  # noqa: E402
+from services.punishment_api.app.domain.services.http_provider import (  # noqa: E402
+    HttpAIProvider,
+    ProviderError,
+    ProviderUnavailableError,
+)
+from services.punishment_api.benchmarks.llm_stub import create_stub_app, run_stub_server  # noqa: E402
+
+
+def _provider(base_url: str, **kwargs) -> HttpAIProvider:
+    options = {
+        "model": "stub",
+        "timeout_seconds": 10,
+        "backoff_base_seconds": 0.01,
+        "backoff_max_seconds": 0.05,
+    }
+    options.update(kwargs)
+    return HttpAIProvider(base_url=base_url, **options)
+
+
+def test_http_provider_retries_flaky_upstream_over_pooled_connections():
+    app = create_stub_app(latency_ms=20, jitter_ms=5, failure_rate=0.3, throttle_rate=0.1, seed=7)
+    with run_stub_server(app) as base_url:
+        provider = _provider(base_url, max_attempts=8, max_concurrency=4, breaker_threshold=50)
+        try:
+            futures = [
+                provider.submit(PROMPT_BUILDERS["risk_analysis"](f"Справка {i}", "s", "n"), analysis_type="risk_analysis")
+                for i in range(20)
+            ]
+            results = [f.result() for f in futures]
+
+            direct = provider.analyze_verdict("Текст приговора", {"draft_type": "appeal"})
+            stats = provider.stats()
+        finally:
+            provider.close()
+
+    assert all(r.model == "http/stub" and "risk_assessment" in r.content for r in results)
+    assert "draft_document" in direct.content
+    assert stats["succeeded"] == 21 and stats["failed"] == 0
+    assert stats["retries"] > 0
+    assert app.state.stats["max_in_flight"] <= 4
+
+
+def test_circuit_breaker_opens_and_rejects_without_calling_upstream():
+    app = create_stub_app(latency_ms=1, jitter_ms=0, failure_rate=1.0)
+    with run_stub_server(app) as base_url:
+        provider = _provider(base_url, max_attempts=2, breaker_threshold=3, breaker_cooldown_seconds=60)
+        prompt = PROMPT_BUILDERS["norms"]("Справка", None)
+        try:
+            with pytest.raises(ProviderError):
+                provider.complete(prompt, analysis_type="norms")
+            # Третья ошибка подряд размыкает автомат, второй повтор уже не отправляется.
+            with pytest.raises(ProviderUnavailableError):
+                provider.complete(prompt, analysis_type="norms")
+            requests_when_opened = app.state.stats["requests"]
+            with pytest.raises(ProviderUnavailableError):
+                provider.complete(prompt, analysis_type="norms")
+            stats = provider.stats()
+        finally:
+            provider.close()
+
+    assert requests_when_opened == 3
+    assert app.state.stats["requests"] == 3
+    assert stats["circuit"]["state"] == "open" and stats["rejected_open_circuit"] == 2
+
+
+def test_interrupted_half_open_probe_releases_circuit():
+    errors = [asyncio.CancelledError(), ValueError("неожиданная ошибка")]
+
+    async def handler(request):
+        raise errors.pop(0)
+
+    provider = _provider(
+        "http://upstream.test", max_attempts=1, breaker_threshold=1, breaker_cooldown_seconds=0, transport=httpx.MockTransport(handler)
+    )
+    prompt = PROMPT_BUILDERS["norms"]("Справка", None)
+    try:
+        provider._breaker.record_failure()
+        for expected in (concurrent.futures.CancelledError, ValueError):
+            with pytest.raises(expected):
+                provider.complete(prompt, analysis_type="norms")
+            # Прерванная проба не держит автомат: следующая попытка снова допускается.
+            assert provider.stats()["circuit"]["state"] == "half_open"
+            assert provider._breaker.allow()
+            provider._breaker.release()
+    finally:
+        provider.close()
+
+
+def test_token_bucket_and_deadline_bound_calls():
+    app = create_stub_app(latency_ms=1, jitter_ms=0)
+    with run_stub_server(app) as base_url:
+        provider = _provider(base_url, rate_per_second=20, burst=1)
+        prompt = PROMPT_BUILDERS["norms"]("Справка", None)
+        try:
+            started = time.perf_counter()
+            for future in [provider.submit(prompt, analysis_type="norms") for _ in range(6)]:
+                future.result()
+            elapsed = time.perf_counter() - started
+        finally:
+            provider.close()
+    # 1 запрос сразу, остальные 5 — по одному каждые 50 мс.
+    assert elapsed >= 0.2
+
+    slow = create_stub_app(latency_ms=2000, jitter_ms=0)
+    with run_stub_server(slow) as base_url:
+        provider = _provider(base_url, timeout_seconds=0.3, max_attempts=3)
+        try:
+            started = time.perf_counter()
+            with pytest.raises(ProviderError):
+                provider.complete(PROMPT_BUILDERS["norms"]("Справка", None), analysis_type="norms")
+            assert time.perf_counter() - started < 1.5
+        finally:
+            provider.close()
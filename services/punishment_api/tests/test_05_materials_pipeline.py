@@ -0,0 +1,179 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app.domain.services.ai_analysis_provider import MockAIProvider  # noqa: E402
+from services.punishment_api.app.domain.services.materials_pipeline import (  # noqa: E402
+    build_chunks,
+    estimate_tokens,
+    run_materials_pipeline,
+    split_text,
+)
+
+
+class _SlowProvider(MockAIProvider):
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def analyze_materials(self, documents_text, case_info=None):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.calls.append(list(documents_text))
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return super().analyze_materials(documents_text, case_info)
+
+
+def test_split_text_respects_limit_and_keeps_content():
+    text = "\n\n".join(f"Абзац {i} " + "слово " * 30 for i in range(20)) + "\n\n" + "x" * 500
+    pieces = split_text(text, 200)
+    assert all(len(piece) <= 200 for piece in pieces)
+    assert "".join(pieces).replace("\n", "") == text.replace("\n", "")
+
+
+def test_build_chunks_splits_documents_and_applies_token_cap():
+    documents = [{"name": f"doc{i}", "text": f"{i}" + "а" * 700} for i in range(5)]
+    documents.append({"name": "big", "text": "б" * 5000})
+    documents.append({"name": "copy", "text": "0" + "а" * 700})
+    chunks, skipped = build_chunks(documents, chunk_tokens=500, max_tokens=100000, chars_per_token=3.5)
+    assert skipped == []
+    assert all(chunk.tokens <= 500 for chunk in chunks)
+    names = [chunk.name for chunk in chunks]
+    assert names[:5] == [f"doc{i}" for i in range(5)]
+    assert names[5:] == ["big (часть 1/3)", "big (часть 2/3)", "big (часть 3/3)"]
+
+    chunks, skipped = build_chunks(documents, chunk_tokens=500, max_tokens=700, chars_per_token=3.5)
+    assert skipped == ["doc3", "doc4", "big"]
+    assert sum(chunk.tokens for chunk in chunks) <= 700
+
+
+def test_pipeline_maps_chunks_in_parallel_and_reduces():
+    provider = _SlowProvider(delay=0.1)
+    documents = [{"name": f"doc{i}", "text": f"Протокол допроса {i}. " * 100} for i in range(8)]
+    started = time.perf_counter()
+    result = run_materials_pipeline(
+        provider,
+        documents,
+        {"erdr_number": "012345678901234"},
+        chunk_tokens=700,
+        max_tokens=100000,
+        concurrency=4,
+        chars_per_token=3.5,
+    )
+    elapsed = time.perf_counter() - started
+    pipeline = result["content"]["pipeline"]
+    assert pipeline["chunk_count"] == 8
+    assert provider.max_active == 4
+    assert len(provider.calls) == 9
+    assert elapsed < 0.8
+    assert result["content"]["documents_analyzed"] == 8
+    assert [chunk["document"] for chunk in pipeline["chunks"]] == [f"doc{i}" for i in range(8)]
+    assert all(chunk["elapsed_ms"] >= 100 for chunk in pipeline["chunks"])
+    assert pipeline["truncated"] is False
+    assert result["content"]["summary"]
+
+
+def test_pipeline_reduce_respects_token_cap():
+    provider = _SlowProvider(delay=0)
+    documents = [{"name": f"doc{i}", "text": f"Протокол допроса {i}. " * 5} for i in range(12)]
+    result = run_materials_pipeline(provider, documents, None, chunk_tokens=700, max_tokens=400, concurrency=4, chars_per_token=3.5)
+    pipeline = result["content"]["pipeline"]
+    assert pipeline["truncated"] is False and result["content"]["documents_analyzed"] == 12
+    # Справки всех документов не помещаются в один вызов: сводка идёт по уровням.
+    assert pipeline["reduce_levels"] >= 2
+    assert len(provider.calls) > 12 + 1
+    assert all(sum(estimate_tokens(text, 3.5) for text in call) <= 400 for call in provider.calls)
+
+
+def test_pipeline_failed_chunk_cancels_pending_chunks():
+    import pytest
+
+    class _FailingProvider(_SlowProvider):
+        def analyze_materials(self, documents_text, case_info=None):
+            super().analyze_materials(documents_text, case_info)
+            raise RuntimeError("upstream error")
+
+    provider = _FailingProvider(delay=0.05)
+    documents = [{"name": f"doc{i}", "text": f"Протокол допроса {i}. " * 100} for i in range(8)]
+    with pytest.raises(RuntimeError):
+        run_materials_pipeline(provider, documents, None, chunk_tokens=700, max_tokens=100000, concurrency=2, chars_per_token=3.5)
+    # Выполнялись только чанки, начатые до первой ошибки.
+    assert len(provider.calls) <= 4
+
+
+def test_pipeline_single_chunk_skips_reduce():
+    provider = _SlowProvider(delay=0)
+    result = run_materials_pipeline(
+        provider,
+        [{"name": "a", "text": "Короткий документ"}],
+        None,
+        chunk_tokens=6000,
+        max_tokens=200000,
+        concurrency=4,
+        chars_per_token=3.5,
+    )
+    assert provider.calls == [["Короткий документ"]]
+    assert result["content"]["pipeline"]["reduce_ms"] == 0
+    assert result["content"]["documents_analyzed"] == 1
+
+
+def test_pipeline_reanalyzes_only_new_and_changed_documents():
+    options = dict(chunk_tokens=6000, max_tokens=200000, concurrency=4, chars_per_token=3.5)
+    documents = [{"name": f"doc{i}", "text": f"Протокол {i}"} for i in range(5)]
+    saved = {}
+
+    def on_document(doc_hash, name, model, parts):
+        saved[doc_hash] = {"ai_model": model, "parts": parts}
+
+    first = _SlowProvider(delay=0)
+    run_materials_pipeline(first, documents, None, on_document=on_document, **options)
+    assert len(first.calls) == 6 and len(saved) == 5
+
+    # Переслали дело целиком: один протокол исправлен (только CRLF — не изменение), два добавлены.
+    updated = [dict(doc) for doc in documents]
+    updated[1]["text"] = "Протокол 1 (исправленный)"
+    updated[2]["text"] = "Протокол 2\r\n"
+    updated += [{"name": "doc5", "text": "Протокол 5"}, {"name": "doc6", "text": "Протокол 6"}]
+    second = _SlowProvider(delay=0)
+    result = run_materials_pipeline(second, updated, None, known_partials=dict(saved), **options)
+    pipeline = result["content"]["pipeline"]
+    assert sorted(call[0] for call in second.calls[:-1]) == ["Протокол 1 (исправленный)", "Протокол 5", "Протокол 6"]
+    assert len(second.calls[-1]) == 7
+    assert (pipeline["new_documents"], pipeline["reused_documents"]) == (3, 4)
+    assert result["content"]["documents_analyzed"] == 7
+
+
+def test_materials_analysis_reuses_partials_between_uploads():
+    import uuid
+
+    from services.punishment_api.app.domain.services.ai_analysis_service import (
+        get_analysis_store,
+        run_analysis,
+        start_analysis,
+    )
+
+    erdr = "012345678901234"
+    marker = uuid.uuid4()
+    documents = [{"name": f"doc{i}", "text": f"Протокол {i} {marker}"} for i in range(3)]
+    first = start_analysis(erdr, "materials", {"erdr_number": erdr, "documents": documents})
+    run_analysis(first.id)
+    documents.append({"name": "doc3", "text": f"Протокол 3 {marker}"})
+    second = start_analysis(erdr, "materials", {"erdr_number": erdr, "documents": documents})
+    run_analysis(second.id)
+    record = get_analysis_store().get_analysis(second.id)
+    assert record.status == "completed"
+    pipeline = record.result["pipeline"]
+    assert (pipeline["new_documents"], pipeline["reused_documents"]) == (1, 3)
+    assert record.result["documents_analyzed"] == 4
@@ -0,0 +1,372 @@
+import asyncio
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app import app  # noqa: E402
+from services.punishment_api.app.core.config import settings  # noqa: E402
+from services.punishment_api.app.domain.services.document_ingest import (  # noqa: E402
+    IngestError,
+    IngestLimits,
+    MultipartUploadReceiver,
+    TextNormalizer,
+    decode_to_blob,
+    ingest_spools,
+)
+from services.punishment_api.app.infrastructure.storage.blob_store import BlobStore  # noqa: E402
+
+ERDR = "012345678901234"
+
+
+def _client() -> TestClient:
+    return TestClient(app)
+
+
+def _multipart(files, boundary="test-boundary"):
+    body = b""
+    for name, data, content_type in files:
+        body += (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{name}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode() + data + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    return f"multipart/form-data; boundary={boundary}", body
+
+
+async def _stream(body: bytes, size: int = 1000):
+    for i in range(0, len(body), size):
+        yield body[i : i + size]
+
+
+def _limits(**kwargs) -> IngestLimits:
+    options = dict(max_files=10, max_file_bytes=1 << 20, max_request_bytes=4 << 20, spool_threshold_bytes=4096)
+    options.update(kwargs)
+    return IngestLimits(**options)
+
+
+def test_receiver_spools_large_files_and_decodes_incrementally(tmp_path):
+    utf8 = ("Протокол допроса свидетеля. " * 2000).encode("utf-8")
+    cp1251 = ("Постановление о возбуждении дела. " * 10).encode("cp1251")
+    content_type, body = _multipart([("a.txt", utf8, "text/plain"), ("b.txt", cp1251, "text/plain")])
+    receiver = MultipartUploadReceiver(content_type, _limits())
+    spools = asyncio.run(receiver.receive(_stream(body)))
+    try:
+        assert [spool.name for spool in spools] == ["a.txt", "b.txt"]
+        assert spools[0].on_disk and not spools[1].on_disk
+        store = BlobStore(tmp_path / "blobs")
+        docs = [decode_to_blob(spool, store) for spool in spools]
+    finally:
+        receiver.close()
+    assert [doc.encoding for doc in docs] == ["utf-8", "cp1251"]
+    assert store.read_text(docs[0].blob.hash) == utf8.decode("utf-8").rstrip()
+    assert store.read_text(docs[1].blob.hash) == cp1251.decode("cp1251").rstrip()
+    assert docs[0].raw_bytes == len(utf8)
+
+
+def test_receiver_enforces_limits_while_streaming():
+    content_type, body = _multipart([("a.txt", b"x" * 5000, "text/plain"), ("b.txt", b"y" * 10, "text/plain")])
+    seen = []
+
+    async def tracked():
+        async for chunk in _stream(body):
+            seen.append(len(chunk))
+            yield chunk
+
+    with pytest.raises(IngestError) as exc:
+        asyncio.run(MultipartUploadReceiver(content_type, _limits(max_file_bytes=2000)).receive(tracked()))
+    assert exc.value.status_code == 413
+    # Приём оборвался на первом файле, не дочитав запрос.
+    assert sum(seen) < len(body)
+
+    with pytest.raises(IngestError) as exc:
+        asyncio.run(MultipartUploadReceiver(content_type, _limits(max_files=1)).receive(_stream(body)))
+    assert str(exc.value) == "Слишком много документов"
+
+    with pytest.raises(IngestError) as exc:
+        asyncio.run(MultipartUploadReceiver(content_type, _limits(max_request_bytes=3000)).receive(_stream(body)))
+    assert exc.value.status_code == 413
+
+
+def test_upload_endpoint_stores_documents_as_blob_references(monkeypatch):
+    client = _client()
+    text = f"Протокол осмотра {uuid.uuid4()}. " + "Описание. " * 300
+    files = [
+        ("files", ("a.txt", text.encode("cp1251"), "text/plain")),
+        ("files", ("b.txt", "Справка".encode("utf-8"), "text/plain")),
+    ]
+    r = client.post(f"/api/case/{ERDR}/analyze-materials/upload/?mode=sync", files=files)
+    assert r.status_code == 200, r.text
+    assert r.json()["result"]["documents_analyzed"] == 2
+    files_report = r.json()["files"]
+    assert [f["name"] for f in files_report] == ["a.txt", "b.txt"]
+    assert files_report[0]["encoding"] == "cp1251" and files_report[0]["elapsed_ms"] >= 0
+
+    from services.punishment_api.app.infrastructure.storage.ai_analysis_storage import get_analysis_store
+
+    record = get_analysis_store().get_analysis(r.json()["analysis_id"])
+    assert all("$blob" in doc["text"] for doc in record.input_params["documents"])
+
+    monkeypatch.setattr(settings, "upload_max_file_bytes", 100)
+    r = client.post(f"/api/case/{ERDR}/analyze-materials/upload/?mode=async", files=files)
+    assert r.status_code == 413
+    assert r.json()["success"] is False
+
+    r = client.post(f"/api/case/{ERDR}/analyze-materials/upload/", data={"mode": "sync"})
+    assert r.status_code == 400
+
+
+def test_normalizer_handles_boundaries_between_chunks():
+    text = "Строка 1  \r\nСтрока\x002\t \rСтрока\u00a03\u200b \n\n  отступ\x0cконец   "
+    expected = "Строка 1\nСтрока2\nСтрока 3\n\n  отступ\nконец"
+    for size in (1, 2, 3, 7, len(text)):
+        normalizer = TextNormalizer()
+        out = "".join(normalizer.feed(text[i : i + size]) for i in range(0, len(text), size))
+        assert out + normalizer.finish() == expected, size
+
+
+def test_ingest_spools_runs_in_parallel_and_reports_per_file(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    from services.punishment_api.app.domain.services import document_ingest
+
+    files = [(f"doc{i}.txt", f"Документ {i}\r\n".encode("utf-8") * 50, "text/plain") for i in range(6)]
+    files.insert(3, ("bad.txt", b"\x98\x98 not text", "text/plain"))
+    content_type, body = _multipart(files)
+    receiver = MultipartUploadReceiver(content_type, _limits())
+    spools = asyncio.run(receiver.receive(_stream(body)))
+
+    active, peak = [0], [0]
+    lock = threading.Lock()
+    real_decode = document_ingest.decode_to_blob
+
+    def slow_decode(spool, store):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        try:
+            return real_decode(spool, store)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    monkeypatch.setattr(document_ingest, "decode_to_blob", slow_decode)
+    try:
+        results = ingest_spools(spools, BlobStore(tmp_path / "blobs"))
+    finally:
+        receiver.close()
+    assert peak[0] > 1
+    reports = [result.report() for result in results]
+    assert [r["name"] for r in reports] == [name for name, _, _ in files]
+    assert [r["ok"] for r in reports] == [True, True, True, False, True, True, True]
+    assert reports[3]["error"] == "Недопустимый формат документа, требуется текст"
+
+
+def _zip_archive(entries) -> bytes:
+    import io
+    import zipfile
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in entries:
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _tar_archive(entries) -> bytes:
+    import io
+    import tarfile
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, data in entries:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_archive_ingestion_extracts_text_members_and_warns_about_others(tmp_path):
+    from services.punishment_api.app.domain.services.document_ingest import ArchiveLimits, RawSpool, ingest_archive
+
+    marker = uuid.uuid4()
+    entries = [(f"protocols/{i:03d}.txt", f"Протокол {i} {marker}\r\n".encode("cp1251") * 20) for i in range(30)]
+    entries.insert(5, ("scan.pdf", b"%PDF-1.4"))
+    entries.append(("big.txt", b"x" * 5000))
+    limits = ArchiveLimits(
+        max_archive_bytes=1 << 20,
+        max_entries=100,
+        max_documents=100,
+        max_uncompressed_bytes=1 << 20,
+        max_member_bytes=4096,
+        spool_threshold_bytes=1024,
+    )
+    store = BlobStore(tmp_path / "blobs")
+    for payload in (_zip_archive(entries), _tar_archive(entries)):
+        spool = RawSpool("case.bin", _limits())
+        spool.write(payload)
+        documents, warnings = ingest_archive(spool, store, limits)
+        spool.close()
+        assert [doc.name for doc in documents] == [f"protocols/{i:03d}.txt" for i in range(30)]
+        assert documents[0].encoding == "cp1251"
+        assert store.read_text(documents[0].blob.hash).startswith(f"Протокол 0 {marker}\n")
+        assert [w["name"] for w in warnings] == ["scan.pdf", "big.txt"]
+
+    spool = RawSpool("case.zip", _limits())
+    spool.write(_zip_archive(entries))
+    with pytest.raises(IngestError) as exc:
+        ingest_archive(spool, store, ArchiveLimits(**{**limits.__dict__, "max_entries": 10}))
+    assert exc.value.status_code == 413
+    spool.close()
+
+
+def test_archive_endpoint_starts_materials_analysis():
+    client = _client()
+    marker = uuid.uuid4()
+    archive = _zip_archive([(f"{i}.txt", f"Протокол {i} {marker}".encode("utf-8")) for i in range(3)] + [("a.jpg", b"\xff\xd8")])
+    r = client.post(
+        f"/api/case/{ERDR}/analyze-materials/archive/?mode=sync",
+        files=[("file", ("case.zip", archive, "application/zip"))],
+    )
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["result"]["documents_analyzed"] == 3
+    assert [f["name"] for f in body["files"]] == ["0.txt", "1.txt", "2.txt"]
+    assert body["warnings"] == [{"name": "a.jpg", "warning": "Пропущен: не текстовый файл"}]
+
+    r = client.post(
+        f"/api/case/{ERDR}/analyze-materials/archive/",
+        files=[("file", ("case.zip", b"not an archive", "application/zip"))],
+    )
+    assert r.status_code == 400
+
+
+def test_upload_session_resumes_chunks_and_commits_analysis():
+    import hashlib
+
+    client = _client()
+    first = f"Протокол допроса {uuid.uuid4()}. ".encode("utf-8") * 40
+    second = "Справка о судимости".encode("cp1251")
+    spec = [
+        {"name": "a.txt", "size": len(first), "sha256": hashlib.sha256(first).hexdigest()},
+        {"name": "b.txt", "size": len(second)},
+    ]
+    # Мелкий chunk_size дал бы миллионы частей и огромный статус.
+    r = client.post(f"/api/case/{ERDR}/uploads/", json={"files": [{"name": "a.txt", "size": 5_000_000}], "chunk_size": 1})
+    assert r.status_code == 400 and "chunk_size" in r.json()["error"]
+    r = client.post(f"/api/case/{ERDR}/uploads/", json={"files": spec, "chunk_size": 500})
+    assert r.status_code == 200, r.text
+    session = r.json()
+    upload_id = session["upload_id"]
+    chunks = [first[i : i + 500] for i in range(0, len(first), 500)]
+    assert session["files"][0]["chunk_count"] == len(chunks) and session["complete"] is False
+
+    def put(file_index, chunk_index, data, **headers):
+        return client.put(
+            f"/api/uploads/{upload_id}/files/{file_index}/chunks/{chunk_index}",
+            content=data,
+            headers=headers,
+        )
+
+    # Части приходят не по порядку; обрыв посередине — часть 1 ещё не получена.
+    for index in [0, 2, 3]:
+        assert put(0, index, chunks[index]).status_code == 200
+    assert put(0, 1, chunks[1][:10]).status_code == 400
+    assert put(0, 1, chunks[1], **{"X-Chunk-SHA256": "0" * 64}).status_code == 400
+    assert put(0, 99, b"x").status_code == 404
+
+    progress = client.get(f"/api/uploads/{upload_id}/").json()
+    assert progress["files"][0]["received"][:2] == [[0, 0], [2, 3]]
+    assert progress["files"][0]["missing"][0] == [1, 1]
+    assert progress["files"][0]["missing_count"] == len(chunks) - 3
+
+    r = client.post(f"/api/uploads/{upload_id}/commit/?mode=sync")
+    assert r.status_code == 409
+    assert "1" in r.json()["missing"]
+
+    for index, chunk in enumerate(chunks):
+        r = put(0, index, chunk, **{"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest()})
+        assert r.status_code == 200, r.text
+    assert put(1, 0, second).status_code == 200
+    assert client.get(f"/api/uploads/{upload_id}/").json()["complete"] is True
+
+    r = client.post(f"/api/uploads/{upload_id}/commit/?mode=sync")
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["result"]["documents_analyzed"] == 2
+    assert [f["encoding"] for f in body["files"]] == ["utf-8", "cp1251"]
+
+    again = client.post(f"/api/uploads/{upload_id}/commit/?mode=sync")
+    assert again.status_code == 200 and again.json()["analysis_id"] == body["analysis_id"]
+    assert put(0, 0, chunks[0]).status_code == 409
+    assert client.get(f"/api/uploads/{upload_id}/").json()["status"] == "committed"
+
+
+def test_upload_session_validates_files_and_accepts_archive(monkeypatch):
+    client = _client()
+    r = client.post(f"/api/case/{ERDR}/uploads/", json={"files": [{"name": "a.jpg", "size": 10}]})
+    assert r.status_code == 400
+    monkeypatch.setattr(settings, "upload_session_max_bytes", 100)
+    r = client.post(f"/api/case/{ERDR}/uploads/", json={"files": [{"name": "a.txt", "size": 1000}]})
+    assert r.status_code == 413
+    monkeypatch.undo()
+
+    marker = uuid.uuid4()
+    archive = _tar_archive([(f"{i}.txt", f"Рапорт {i} {marker}".encode("utf-8")) for i in range(2)])
+    r = client.post(f"/api/case/{ERDR}/uploads/", json={"files": [{"name": "case.tar", "size": len(archive)}], "chunk_size": 4096})
+    upload_id = r.json()["upload_id"]
+    for index in range(0, len(archive), 4096):
+        r = client.put(f"/api/uploads/{upload_id}/files/0/chunks/{index // 4096}", content=archive[index : index + 4096])
+        assert r.status_code == 200, r.text
+    r = client.post(f"/api/uploads/{upload_id}/commit/?mode=sync")
+    assert r.status_code == 200, r.text
+    assert r.json()["result"]["documents_analyzed"] == 2
+
+    r = client.post(f"/api/case/{ERDR}/uploads/", json={"files": [{"name": "a.txt", "size": 5}]})
+    upload_id = r.json()["upload_id"]
+    assert client.delete(f"/api/uploads/{upload_id}/").status_code == 200
+    assert client.get(f"/api/uploads/{upload_id}/").status_code == 404
+
+
+def test_upload_session_ids_cannot_escape_store_and_failed_commit_reopens(monkeypatch):
+    from services.punishment_api.app.api.v1 import routes
+    from services.punishment_api.app.infrastructure.storage.upload_sessions import get_upload_session_store
+
+    client = _client()
+    store = get_upload_session_store()
+    sentinel = Path(settings.data_dir) / f"sentinel-{uuid.uuid4().hex}.txt"
+    sentinel.write_text("keep", encoding="utf-8")
+    for upload_id in ("%2E%2E", "..", "not-a-uuid"):
+        assert client.delete(f"/api/uploads/{upload_id}/").status_code == 404
+    assert store.delete("..") is False
+    with pytest.raises(ValueError):
+        store.discard_chunks("..")
+    assert sentinel.exists() and store.db_path.exists()
+    sentinel.unlink()
+
+    data = b"protocol " * 20
+    upload_id = client.post(f"/api/case/{ERDR}/uploads/", json={"files": [{"name": "a.txt", "size": len(data)}]}).json()["upload_id"]
+    assert client.put(f"/api/uploads/{upload_id}/files/0/chunks/0", content=data).status_code == 200
+
+    assert store.begin_commit(upload_id)
+    assert client.put(f"/api/uploads/{upload_id}/files/0/chunks/0", content=data).status_code == 409
+    store.reopen(upload_id)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("blob store unavailable")
+
+    monkeypatch.setattr(routes, "ingest_spools", broken)
+    with pytest.raises(RuntimeError):
+        client.post(f"/api/uploads/{upload_id}/commit/?mode=sync")
+    assert client.get(f"/api/uploads/{upload_id}/").json()["status"] == "open"
+    monkeypatch.undo()
+    assert client.post(f"/api/uploads/{upload_id}/commit/?mode=sync").status_code == 200
@@ -0,0 +1,296 @@
+import sys
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app import app  # noqa: E402
+from services.punishment_api.app.domain.services.embeddings import HashingVectorizer  # noqa: E402
+
+
+def _client() -> TestClient:
+    return TestClient(app)
+
+
+def test_hashing_vectorizer_is_deterministic_and_topical():
+    vectorizer = HashingVectorizer(128)
+    texts = [
+        "Кража имущества потерпевшего с проникновением в жилище",
+        "кража имущества у потерпевшего, проникновение в ЖИЛИЩЕ",
+        "Мошенничество в крупном размере путём обмана",
+        "",
+    ]
+    matrix = vectorizer.transform(texts)
+    assert matrix.shape == (4, 128) and matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix[:3], axis=1), 1.0, atol=1e-5)
+    assert not matrix[3].any()
+    similarity = matrix[:3] @ matrix[:3].T
+    assert similarity[0, 1] > 0.7 > similarity[0, 2]
+
+    # Результат не зависит от состава пакета и от процесса.
+    assert np.allclose(HashingVectorizer(128).transform([texts[2]])[0], matrix[2])
+
+    weighted = vectorizer.fit_idf(texts[:3] * 3)
+    assert weighted.model != vectorizer.model
+    assert weighted.transform(texts[:1]).shape == (1, 128)
+
+
+def test_vectorize_batch_endpoint_uses_cache():
+    client = _client()
+    marker = str(uuid.uuid4())
+    reports = [f"Справка {marker} по делу о краже {i}" for i in range(5)]
+    r = client.post("/api/vectorize/batch/", json={"reports": reports + reports[:2]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["dim"] == 128 and len(body["vectors"]) == 7
+    assert body["cached"] == 0
+    assert body["vectors"][5] == body["vectors"][0]
+
+    single = client.post("/api/vectorize/", json={"report_text": reports[3]}).json()
+    assert single["vector"] == body["vectors"][3]
+    assert single["vector_model"] == body["vector_model"]
+
+    again = client.post("/api/vectorize/batch/", json={"reports": reports}).json()
+    assert again["cached"] == 5
+
+    assert client.post("/api/vectorize/batch/", json={"reports": ["ok", " "]}).status_code == 400
+    assert client.post("/api/vectorize/batch/", json={"reports": []}).status_code == 400
+
+
+def _verdict_records():
+    topics = {
+        "кража": "Подсудимый тайно похитил имущество потерпевшего, совершив кражу из жилища",
+        "мошенничество": "Подсудимый путём обмана завладел денежными средствами, мошенничество в крупном размере",
+        "побои": "Подсудимый нанёс потерпевшему побои, причинив физическую боль",
+    }
+    records = []
+    for number in range(60):
+        topic = list(topics)[number % 3]
+        records.append(
+            {
+                "id": f"verdict-{number}",
+                "file_name": f"verdict_{number}.txt",
+                "mime": "text/plain",
+                "source": "vector-index",
+                "decision": "guilty" if number % 2 else "acquittal",
+                "text": f"{topics[topic]}. Приговор № {number}.",
+            }
+        )
+    return records
+
+
+def test_vector_index_exact_and_ivf_respect_decision_quotas(tmp_path):
+    from services.punishment_api.app.domain.services.vector_index import SearchQuery, VerdictIndex
+
+    vectorizer = HashingVectorizer(128)
+    records = _verdict_records()
+    exact = VerdictIndex.build(records, vectorizer, mode="exact")
+    query = vectorizer.transform(["Кража имущества из жилища потерпевшего"])[0]
+
+    found = exact.search(query, SearchQuery(limit=5))
+    assert len(found) == 5
+    assert all("кражу" in item["text"] for item in found)
+    assert [item["similarity"] for item in found] == sorted((item["similarity"] for item in found), reverse=True)
+
+    found = exact.search(query, SearchQuery(limit=4, limit_guilty=1, limit_acquittal=2))
+    assert [item["decision"] for item in found].count("guilty") == 1
+    assert [item["decision"] for item in found].count("acquittal") == 2
+    assert exact.search(query, SearchQuery(limit=3, decision="guilty"))[0]["decision"] == "guilty"
+    assert exact.search(query, SearchQuery(limit=3, min_similarity=0.99)) == []
+
+    ivf = VerdictIndex(exact.vectors, records, vector_model=vectorizer.model, mode="ivf", nlist=3, nprobe=3)
+    assert [item["id"] for item in ivf.search(query, SearchQuery(limit=5))] == [item["id"] for item in exact.search(query, SearchQuery(limit=5))]
+
+
+
+def test_similar_verdicts_endpoint_searches_index():
+    from services.punishment_api.app.domain.services import vector_index
+    from services.punishment_api.app.domain.services.embeddings import get_vectorizer
+
+    client = _client()
+    index = vector_index.VerdictIndex.build(_verdict_records(), get_vectorizer(), mode="exact")
+    vector_index.set_verdict_index(index)
+    try:
+        vector = client.post("/api/vectorize/", json={"report_text": "Мошенничество, обман, денежные средства"}).json()
+        r = client.post(
+            "/api/case/case-uuid-007/verdicts/similar/",
+            json={
+                "erdr_number": "012345678901234",
+                "case_vector": vector["vector"],
+                "vector_model": vector["vector_model"],
+                "limit": 3,
+                "limit_guilty": 2,
+                "limit_acquittal": 2,
+            },
+        )
+        assert r.status_code == 200, r.text
+        verdicts = r.json()["verdicts"]
+        assert len(verdicts) == 3 and all("мошенничество" in v["text"] for v in verdicts)
+
+        r = client.post(
+            "/api/case/case-uuid-007/verdicts/similar/",
+            json={"erdr_number": "012345678901234", "case_vector": [0.1, 0.2]},
+        )
+        assert r.status_code == 400
+        assert client.get("/api/verdicts/index/").json()["index"]["size"] == 60
+    finally:
+        vector_index.set_verdict_index(None)
+
+
+def test_vector_store_segments_quantization_and_merge(tmp_path):
+    from services.punishment_api.app.domain.services.vector_index import SearchQuery, VerdictIndex
+    from services.punishment_api.app.infrastructure.storage.vector_store import VectorStore
+
+    vectorizer = HashingVectorizer(128)
+    records = _verdict_records()
+    vectors = vectorizer.transform([item["text"] for item in records])
+    query = vectorizer.transform(["Кража имущества из жилища потерпевшего"])[0]
+    expected = VerdictIndex(vectors, records, vector_model=vectorizer.model, mode="exact").search(query, SearchQuery(limit=5))
+
+    for dtype in ("float16", "int8"):
+        store = VectorStore(tmp_path / dtype)
+        assert store.append(vectors[:40], records[:40], vector_model=vectorizer.model, dtype=dtype) == 40
+        # Повтор уже добавленных id пропускается: загрузку можно возобновить с любого места.
+        assert store.append(vectors[30:], records[30:], vector_model=vectorizer.model, dtype=dtype) == 20
+        assert store.stats()["segments"] == 2 and store.count() == 60
+
+        index = VerdictIndex.from_store(store, mode="exact")
+        found = index.search(query, SearchQuery(limit=5))
+        assert [item["id"] for item in found] == [item["id"] for item in expected]
+        assert all(abs(a["similarity"] - b["similarity"]) < 0.02 for a, b in zip(found, expected))
+        assert index.search(query, SearchQuery(limit=3, decision="guilty"))[0]["decision"] == "guilty"
+
+        assert store.merge()["merged"] == 2
+        assert store.stats()["segments"] == 1
+        # Уже открытый снимок продолжает работать после слияния; новый видит тот же корпус.
+        assert [item["id"] for item in index.search(query, SearchQuery(limit=5))] == [item["id"] for item in expected]
+        merged = VerdictIndex.from_store(store, mode="ivf", nlist=3, nprobe=3)
+        assert merged.generation > index.generation
+        assert [item["id"] for item in merged.search(query, SearchQuery(limit=5))] == [item["id"] for item in expected]
+
+        # Сегменты до слияния ещё на диске для читателей старого манифеста; их удаляет следующее.
+        retired = store.manifest()["retired"]
+        assert len(retired) == 2 and all((tmp_path / dtype / f"{name}.vec").exists() for name in retired)
+        store.append(vectors[:1], [{"id": "extra", "decision": "guilty"}], vector_model=vectorizer.model, dtype=dtype)
+        assert store.merge()["merged"] == 2
+        assert not any((tmp_path / dtype / f"{name}.vec").exists() for name in retired)
+    assert store.stats()["disk_bytes"] < vectors.nbytes / 3
+
+
+def test_verdict_index_autoreload_rebuilds_in_background(tmp_path, monkeypatch):
+    from services.punishment_api.app.core.config import settings
+    from services.punishment_api.app.domain.services import vector_index
+    from services.punishment_api.app.infrastructure.storage.vector_store import VectorStore
+
+    vectorizer = HashingVectorizer(128)
+    records = _verdict_records()
+    vectors = vectorizer.transform([item["text"] for item in records])
+    store = VectorStore(tmp_path / "verdicts")
+    store.append(vectors[:30], records[:30], vector_model=vectorizer.model)
+    monkeypatch.setattr(vector_index, "_STORE", store)
+    monkeypatch.setattr(vector_index, "_NEXT_CHECK", 0.0)
+    monkeypatch.setattr(settings, "verdict_index_mode", "exact")
+    monkeypatch.setattr(settings, "verdict_index_autoreload", True)
+    monkeypatch.setattr(settings, "verdict_index_autoreload_interval_seconds", 0.0)
+    vector_index.set_verdict_index(vector_index.load_verdict_index())
+    try:
+        old = vector_index.get_verdict_index()
+        assert old.size == 30
+        store.append(vectors[30:], records[30:], vector_model=vectorizer.model)
+        # Запрос не ждёт перестройки: она идёт в фоне, до подмены отвечает прежний индекс.
+        assert vector_index.get_verdict_index().size in (30, 60)
+        vector_index.wait_verdict_reload(10)
+        assert vector_index.get_verdict_index().size == 60
+
+        # Между проверками манифест не читается: смена поколения видна после интервала.
+        monkeypatch.setattr(settings, "verdict_index_autoreload_interval_seconds", 3600.0)
+        vector_index.get_verdict_index()
+        store.merge()
+        vector_index.get_verdict_index()
+        vector_index.wait_verdict_reload(10)
+        assert vector_index.get_verdict_index().generation < store.manifest()["generation"]
+    finally:
+        vector_index.set_verdict_index(None)
+
+
+def test_verdict_corpus_ingest_extracts_metadata_and_resumes(tmp_path):
+    from services.punishment_api.app.domain.services import verdict_ingest
+    from services.punishment_api.app.domain.services.vector_index import SearchQuery, VerdictIndex
+    from services.punishment_api.app.infrastructure.storage.vector_store import VectorStore
+
+    assert verdict_ingest.extract_article("осуждён по ч. 2 ст. 188 УК РК") == "188 ч.2"
+    assert verdict_ingest.extract_article("по статье 190 части 3 УК") == "190 ч.3"
+    assert verdict_ingest.extract_date("г. Астана 5 марта 2024 года") == "2024-03-05"
+    assert verdict_ingest.extract_date("дата 31.13.2024, приговор от 07.02.2023") == "2023-02-07"
+
+    source = tmp_path / "corpus"
+    (source / "2024").mkdir(parents=True)
+    endings = ["Признать виновным и назначить наказание.", "Подсудимого оправдать.", "Возвратить уголовное дело прокурору."]
+    for number in range(12):
+        text = f"Приговор от 1{number % 9}.01.2024\n\nОбвиняется по ч. 2 ст. 188 УК. Кража имущества № {number}.\n\n{endings[number % 3]}"
+        (source / "2024" / f"v{number:02d}.txt").write_bytes(text.replace("\n", "\r\n").encode("cp1251" if number % 2 else "utf-8"))
+    (source / "empty.txt").write_text("")
+
+    store = VectorStore(tmp_path / "store")
+    report = verdict_ingest.ingest_corpus(source, store, workers=2, files_per_task=3, write_batch=5)
+    assert report.added == 12 and report.skipped == 1
+    assert report.decisions == {"guilty": 4, "acquittal": 4, "return": 4}
+    assert report.segments_written >= 2 and store.count() == 12
+
+    (source / "2024" / "v99.txt").write_text("Приговор. ст. 190 УК. Мошенничество. Признать виновным.", encoding="utf-8")
+    again = verdict_ingest.ingest_corpus(source, store, workers=1)
+    assert again.already_indexed == 12 and again.added == 1 and again.resumed_after is None
+
+    index = VerdictIndex.from_store(store, mode="exact")
+    found = index.search(HashingVectorizer(128).transform(["Мошенничество"])[0], SearchQuery(limit=1))[0]
+    assert found["id"] == "corpus:2024/v99.txt" and found["article"] == "190" and found["decision"] == "guilty"
+    acquitted = index.search(index.vectors[[1]][0], SearchQuery(limit=1, decision="acquittal"))[0]
+    assert acquitted["date"] == "2024-01-11" and "\r" not in acquitted["text"]
+
+    # Прерванная загрузка продолжается после последнего записанного файла.
+    verdict_ingest.save_checkpoint(store, source, "2024/v05.txt", verdict_ingest.IngestReport())
+    resumed = verdict_ingest.ingest_corpus(source, store, workers=1)
+    assert resumed.resumed_after == "2024/v05.txt" and resumed.added == 0 and resumed.processed == 1
+
+
+def test_corpus_idf_fit_and_batch_limits(tmp_path, monkeypatch):
+    from services.punishment_api.app.core.config import settings
+    from services.punishment_api.app.domain.services import embeddings, verdict_ingest
+    from services.punishment_api.app.infrastructure.storage.vector_store import VectorStore
+
+    source = tmp_path / "corpus"
+    source.mkdir()
+    for number in range(10):
+        (source / f"v{number}.txt").write_text(f"Приговор № {number}. Кража имущества, признать виновным.", encoding="utf-8")
+    fitted = verdict_ingest.fit_corpus_idf(source, sample=6, batch=4)
+    assert fitted.idf is not None and fitted.model != HashingVectorizer(128).model
+    # Частоты по пачкам складываются в тот же IDF, что и по всей выборке сразу.
+    texts = [verdict_ingest.read_text_file(source / path) for path in verdict_ingest.list_corpus_files(source)]
+    sample = [texts[int(i)] for i in np.linspace(0, 9, 6)]
+    assert np.allclose(fitted.idf, HashingVectorizer(128).fit_idf(sample).idf)
+
+    monkeypatch.setattr(verdict_ingest, "idf_path", lambda: tmp_path / "embeddings" / "idf.npy")
+    used = VectorStore(tmp_path / "used")
+    used.append(HashingVectorizer(128).transform(["x"]), [{"id": "a"}], vector_model=HashingVectorizer(128).model)
+    with pytest.raises(ValueError):
+        verdict_ingest.use_idf(fitted, used)
+    try:
+        verdict_ingest.use_idf(fitted, VectorStore(tmp_path / "fresh"))
+        assert (tmp_path / "embeddings" / "idf.npy").exists()
+        assert embeddings.get_vectorizer().model == fitted.model
+        vectors, _ = embeddings.embed_texts([f"справка {uuid.uuid4()}"])
+        cached = next(reversed(embeddings.get_vector_cache()._items.values()))
+        assert cached.base is None and np.allclose(cached, vectors[0])
+    finally:
+        embeddings.set_vectorizer(None)
+
+    monkeypatch.setattr(settings, "vectorize_batch_max_bytes", 100)
+    r = _client().post("/api/vectorize/batch/", json={"reports": ["ж" * 40, "ж" * 40]})
+    assert r.status_code == 413
@@ -0,0 +1,93 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app import app  # noqa: E402
+from services.punishment_api.app.domain.services import norms_index  # noqa: E402
+from services.punishment_api.app.infrastructure.storage.inverted_index import InvertedIndexStore  # noqa: E402
+
+DECREES = [
+    {
+        "title": "НП ВС РК №7 от 11.07.2003",
+        "subtitle": "О судебной практике по делам о хищениях",
+        "summary": "Квалификация кражи, мошенничества и оценка ущерба.",
+        "text": "Хищение чужого имущества. Кража из жилища, кражи с проникновением. Размер ущерба.",
+    },
+    {
+        "title": "НП ВС РК №4 от 25.06.2015",
+        "subtitle": "О назначении уголовного наказания",
+        "text": "Индивидуализация наказания, смягчающие и отягчающие обстоятельства, ст. 55 УК.",
+    },
+    {
+        "title": "НП ВС РК №1 от 20.04.2018",
+        "subtitle": "О практике назначения условного осуждения",
+        "text": "Условное осуждение назначается с учётом личности осуждённого и испытательного срока.",
+    },
+    {
+        "title": "НП ВС РК №11 от 21.06.2001",
+        "subtitle": "О практике по делам о дорожно-транспортных происшествиях",
+        "text": "Нарушение правил дорожного движения, транспортные средства, ст. 345 УК.",
+    },
+]
+
+
+def test_tokenizer_stems_russian_inflections():
+    assert norms_index.tokenize("Хищениях, хищение и ХИЩЕНИЯ") == ["хищен", "хищен", "хищен"]
+    assert norms_index.tokenize("кража по ч. 2 ст. 188") == ["краж", "2", "ст", "188"]
+
+
+def test_bm25_index_persists_and_serves_norms_endpoint(tmp_path):
+    store = InvertedIndexStore(tmp_path / "norms")
+    index = norms_index.NormsIndex.build(DECREES, store)
+    found = index.find("Подозревается в краже имущества из жилища, ущерб значительный")
+    assert found[0]["title"] == "НП ВС РК №7 от 11.07.2003" and found[0]["relevance"] == "high"
+    assert "text" not in found[0]
+    assert index.search("совершенно посторонние слова") == []
+
+    # Поколение на диске открывается заново с теми же результатами, постинги — memmap.
+    reopened = norms_index.NormsIndex(store.load())
+    assert isinstance(reopened.arrays.postings_docs, np.memmap)
+    assert reopened.search("условное осуждение") == index.search("условное осуждение")
+    rebuilt = norms_index.NormsIndex.build(DECREES[:2], store)
+    assert rebuilt.generation > index.generation and len(list((tmp_path / "norms").glob("gen-*"))) == 2
+    # Предыдущее поколение ещё открывается по старому указателю, третье сборка удаляет.
+    assert (tmp_path / "norms" / index.arrays.meta["name"] / "offsets.npy").exists()
+    norms_index.NormsIndex.build(DECREES[:3], store)
+    assert not (tmp_path / "norms" / index.arrays.meta["name"]).exists()
+
+    client = TestClient(app)
+    norms_index.set_norms_index(index)
+    try:
+        r = client.post(
+            "/api/case/012345678901234/norms/",
+            json={"report_text": "ДТП: нарушение правил дорожного движения", "similar_verdicts_summary": "наказание"},
+        )
+        assert r.status_code == 200, r.text
+        norms = r.json()["norms"]
+        assert norms[0]["subtitle"].endswith("происшествиях") and norms[0]["relevance"] == "high"
+        assert {n["relevance"] for n in norms} <= {"high", "medium"}
+        assert [n["score"] for n in norms] == sorted((n["score"] for n in norms), reverse=True)
+    finally:
+        norms_index.set_norms_index(None)
+
+
+def test_decree_without_subtitle_is_served(tmp_path):
+    decrees = [{"title": "НП ВС РК №9 от 01.01.2020", "text": "Вымогательство и угрозы"}, *DECREES]
+    index = norms_index.NormsIndex.build(decrees, InvertedIndexStore(tmp_path / "norms"))
+    norms_index.set_norms_index(index)
+    try:
+        r = TestClient(app).post(
+            "/api/case/012345678901234/norms/",
+            json={"report_text": "вымогательство с угрозами", "similar_verdicts_summary": ""},
+        )
+        assert r.status_code == 200, r.text
+        assert r.json()["norms"][0] == {**r.json()["norms"][0], "title": "НП ВС РК №9 от 01.01.2020", "subtitle": ""}
+    finally:
+        norms_index.set_norms_index(None)
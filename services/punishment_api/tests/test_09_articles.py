@@ -0,0 +1,157 @@
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+
+ROOT = Path(__file__).resolve().parents[3]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services.punishment_api.app import app  # noqa: E402
+from services.punishment_api.app.domain.services.article_search import get_article_search  # noqa: E402
+
+
+def _client() -> TestClient:
+    return TestClient(app)
+
+
+def test_article_suggest_by_code_prefix_and_name():
+    client = _client()
+    r = client.get("/api/articles/suggest/", params={"q": "ст. 188 ч.2"})
+    assert r.status_code == 200, r.text
+    items = r.json()["items"]
+    assert [item["code"] for item in items] == ["1880002", "1880102"]
+    assert items[0]["name"] == "Кража" and items[0]["match"] == "code"
+
+    items = client.get("/api/articles/suggest/", params={"q": "1880", "limit": 3}).json()["items"]
+    assert [item["stat"] for item in items] == ["ст.188 ч.1", "ст.188 ч.2", "ст.188 ч.3"]
+
+    items = client.get("/api/articles/suggest/", params={"q": "краж"}).json()["items"]
+    assert items[0]["article"] == "188" and items[0]["match"] == "name" and items[0]["score"] == 1.0
+    assert {item["name"] for item in client.get("/api/articles/suggest/", params={"q": "мошенничество"}).json()["items"]} == {"Мошенничество"}
+
+    # Исключённые статьи в подсказки не попадают (ст. 108 исключена, ст. 108-1 действует).
+    items = client.get("/api/articles/suggest/", params={"q": "ст.108", "limit": 50}).json()["items"]
+    assert items and all(item["article"] == "108-1" for item in items)
+
+    assert client.get("/api/articles/suggest/", params={"q": "ст. 999"}).json()["count"] == 0
+
+    # Список узла ограничен ёмкостью; фильтр по части добирает записи из поддерева.
+    index = get_article_search()
+    unbounded = type(index)(index.entries, node_capacity=len(index.entries))
+    items = client.get("/api/articles/suggest/", params={"q": "ст. 1 ч. 2", "limit": 50}).json()["items"]
+    assert len(items) == 50 and all(item["part"].startswith("2") for item in items)
+    assert [item["code"] for item in items] == [item["code"] for item in unbounded.search("ст. 1 ч. 2", 50)]
+    assert client.get("/api/articles/suggest/", params={"q": " "}).status_code == 400
+    assert client.get("/api/articles/suggest/", params={"q": "кража", "limit": 500}).status_code == 400
+
+
+def test_article_suggest_index_is_rebuilt_only_on_reference_change():
+    client = _client()
+    index = get_article_search()
+    assert client.post("/reference/reload").status_code == 200
+    # Тот же файл — та же версия справочника, индекс не перестраивается.
+    assert get_article_search() is index and index.version
+
+
+def test_articles_bulk_matches_single_lookup():
+    client = _client()
+    single = client.get("/api/article/", params={"q": "188 ч.2"}).json()["article"]
+    r = client.post("/api/articles/bulk/", json={"queries": ["188 ч.2", "ст. 999999", "", "188 ч.2"]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["count"] == 4 and body["found"] == 2
+    items = body["items"]
+    assert items[0]["article"] == single and items[3] == items[0]
+    assert not items[1]["found"] and "не найдена" in items[1]["error"]
+    assert not items[2]["found"]
+
+    assert client.post("/api/articles/bulk/", json={"queries": []}).status_code == 400
+
+
+def test_articles_catalog_gzip_and_etag():
+    client = _client()
+    r = client.get("/api/articles/catalog/", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200, r.text
+    assert r.headers["content-encoding"] == "gzip"
+    body = r.json()
+    codes = {article["code"]: article for article in body["articles"]}
+    assert body["count"] == len(codes) > 1000
+    assert codes["1880002"]["severity"] == client.get("/api/article/", params={"q": "188 ч.2"}).json()["article"]["severity"]
+    etag = r.headers["etag"]
+    assert body["version"] in etag
+
+    plain = client.get("/api/articles/catalog/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.headers["etag"] != etag
+    assert plain.json() == body
+
+    cached = client.get("/api/articles/catalog/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    # Тег сжатого представления не подходит для несжатого и наоборот.
+    other = client.get("/api/articles/catalog/", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert other.status_code == 200 and other.json() == body
+    plain_etag = plain.headers["etag"]
+    assert client.get("/api/articles/catalog/", headers={"Accept-Encoding": "identity", "If-None-Match": f"W/{plain_etag}"}).status_code == 304
+    assert client.get("/api/articles/catalog/", headers={"Accept-Encoding": "gzip", "If-None-Match": plain_etag}).status_code == 200
+    assert client.get("/api/articles/catalog/", headers={"If-None-Match": '"stale"'}).status_code == 200
+
+
+def test_articles_sanctions_query_combines_predicates_and_pages():
+    client = _client()
+    where = {
+        "and": [
+            {"field": "imprisonment_max", "op": "le", "value": 5},
+            {"field": "punishments", "op": "has", "value": "fine"},
+        ]
+    }
+    r = client.post("/api/articles/sanctions/", json={"where": where, "limit": 20})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["total"] > 20 and body["count"] == 20
+    for article in body["articles"]:
+        assert article["limits"]["imprisonment_max"] <= 5 and "fine" in article["punishments"]
+        assert not article["is_excluded"]
+
+    page = client.post("/api/articles/sanctions/", json={"where": where, "offset": 20, "limit": 20}).json()
+    assert page["total"] == body["total"]
+    assert not {a["code"] for a in page["articles"]} & {a["code"] for a in body["articles"]}
+
+    grave = {
+        "and": [
+            {"field": "severity", "op": "ge", "value": "SERIOUS"},
+            {"or": [{"field": "additional", "op": "has", "value": "confiscation"}, {"not": {"field": "prest", "op": "eq", "value": 1}}]},
+        ]
+    }
+    r = client.post("/api/articles/sanctions/", json={"where": grave, "order_by": "imprisonment_max", "descending": True})
+    articles = r.json()["articles"]
+    assert articles and all(a["severity"] in {"SERIOUS", "ESPECIALLY_SERIOUS"} for a in articles)
+    maxima = [a["limits"]["imprisonment_max"] for a in articles if a["limits"]["imprisonment_max"] is not None]
+    assert maxima == sorted(maxima, reverse=True)
+
+    bad = client.post("/api/articles/sanctions/", json={"where": {"field": "punishments", "op": "has", "value": "exile"}})
+    assert bad.status_code == 400 and "exile" in bad.json()["error"]
+    assert client.post("/api/articles/sanctions/", json={"where": {"field": "nope", "op": "eq", "value": 1}}).status_code == 400
+    for value in ("NaN", "Infinity", "-Infinity", "1e400"):
+        body = '{"where": {"field": "imprisonment_max", "op": "le", "value": %s}}' % value
+        r = client.post("/api/articles/sanctions/", content=body, headers={"Content-Type": "application/json"})
+        assert r.status_code == 400, (value, r.text)
+    for leaf in ({"field": ["severity"], "op": "eq", "value": 1}, {"field": {"a": 1}, "op": "eq", "value": 1}, {"field": "prest", "op": ["eq"], "value": 1}):
+        assert client.post("/api/articles/sanctions/", json={"where": leaf}).status_code == 400
+
+
+def test_sanction_index_keeps_blank_severity_out_of_comparisons():
+    from dataclasses import fields
+
+    from services.punishment_api.app.domain.services.article_sanctions import SanctionIndex
+    from services.punishment_api.app.infrastructure.loaders.reference_loader import ArticleRecord
+
+    def record(code: str, hard: str) -> ArticleRecord:
+        values = {field.name: "" for field in fields(ArticleRecord)}
+        values.update(stat=f"Статья {code}", article_code=code, hard=hard, d_izm=None)
+        return ArticleRecord(**values)
+
+    index = SanctionIndex.build("test", {"0010": [record("0010", "")], "0020": [record("0020", "0")], "0030": [record("0030", "7")]})
+    assert [a["code"] for a in index.query({"field": "severity", "op": "eq", "value": "MINOR"})[1]] == ["0020"]
+    assert [a["code"] for a in index.query({"field": "severity", "op": "le", "value": 4})[1]] == ["0020", "0030"]
+    assert index.query({"field": "severity", "op": "ne", "value": 0})[0] == 1